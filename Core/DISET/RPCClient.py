@@ -3,6 +3,7 @@
 
 __RCSID__ = "$Id$"
 
+from DIRAC.Core.Utilities.ReturnValues import S_ERROR
 from DIRAC.Core.DISET.private.InnerRPCClient import InnerRPCClient
 
 class _MagicMethod( object ):
@@ -20,6 +21,56 @@ class _MagicMethod( object ):
   def __str__( self ):
     return "<RPCClient method %s>" % self.__remoteFuncName
 
+class RPCBatch( object ):
+  """
+  Collect RPC calls to execute them all at once. Each call returns its position
+  in the batch, and once executed results holds the result of each call:
+
+    with rpcClient.batch() as batch:
+      for jobID in jobIDs:
+        batch.getJobParameter( jobID, 'CPUNormalizationFactor' )
+    for jobID, result in zip( jobIDs, batch.results ):
+      ...
+
+  If the batch itself fails, all the results are the batch error
+  """
+
+  def __init__( self, innerRPCClient ):
+    self.__innerRPCClient = innerRPCClient
+    self.__calls = []
+    self.result = S_ERROR( "RPC batch has not been executed" )
+    self.results = []
+
+  def __addCall( self, sFunctionName, args ):
+    self.__calls.append( ( sFunctionName, args ) )
+    return len( self.__calls ) - 1
+
+  def __getattr__( self, attrName ):
+    return _MagicMethod( self.__addCall, attrName )
+
+  def __len__( self ):
+    return len( self.__calls )
+
+  def execute( self ):
+    """
+    Send the collected calls in a single action
+    """
+    self.result = self.__innerRPCClient.executeRPCBatch( self.__calls )
+    if self.result[ 'OK' ]:
+      self.results = self.result[ 'Value' ]
+    else:
+      self.results = [ self.result ] * len( self.__calls )
+    self.__calls = []
+    return self.result
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, excType, excValue, traceback ):
+    if excType is None:
+      self.execute()
+    return False
+
 class RPCClient( object ):
 
   def __init__( self, *args, **kwargs ):
@@ -35,6 +86,12 @@ class RPCClient( object ):
     retVal = self.__innerRPCClient.executeRPC( sFunctionName, args )
     return retVal
 
+  def batch( self ):
+    """
+    Get a RPCBatch to send several calls to the service in one go
+    """
+    return RPCBatch( self.__innerRPCClient )
+
   def __getattr__( self, attrName ):
     """
     Function for emulating the existance of functions
@@ -10,10 +10,12 @@ import time
 import DIRAC
 
 from DIRAC.Core.DISET.private.FileHelper import FileHelper
+from DIRAC.Core.DISET.private.ConnectionPool import getConnectionPoolStats
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR, isReturnStructure
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
-from DIRAC.Core.Utilities import Time
+from DIRAC.Core.Utilities import Time, Compression
+from DIRAC.Core.Security import Properties
 
 def getServiceOption( serviceInfo, optionName, defaultValue ):
   """ Get service option resolving default values from the master service
@@ -52,6 +54,8 @@ class RequestHandler( object ):
     handlerInitDict.update( self.__srvInfoDict )
     self.serviceInfoDict = handlerInitDict
     self.__trid = trid
+    #Times and arguments of the executed action
+    self.__actionInfo = {}
 
   def initialize( self ):
     """Initialize this instance of the handler (to be overwritten)
@@ -119,8 +123,10 @@ class RequestHandler( object ):
     try:
       if actionType == "RPC":
         retVal = self.__doRPC( actionTuple[1] )
+      elif actionType == "RPCBatch":
+        retVal = self.__doRPCBatch( actionTuple[1] )
       elif actionType == "FileTransfer":
-        retVal = self.__doFileTransfer( actionTuple[1] )
+        retVal = self.__doFileTransfer( actionTuple[1], proposalTuple )
       elif actionType == "Connection":
         retVal = self.__doConnection( actionTuple[1] )
       else:
@@ -132,11 +138,23 @@ class RequestHandler( object ):
       message = "Method %s for action %s does not return a S_OK/S_ERROR!" % ( actionTuple[1], actionTuple[0] )
       gLogger.error( message )
       retVal = S_ERROR( message )
-    self.__logRemoteQueryResponse( retVal, time.time() - startTime )
+    executionTime = time.time() - startTime
+    self.__logRemoteQueryResponse( retVal, executionTime )
+    self.__actionInfo[ 'Execution' ] = executionTime
+    self.__actionInfo[ 'OK' ] = retVal[ 'OK' ]
+    startTime = time.time()
     result = self.__trPool.send( self.__trid, retVal ) #this will delete the value from the S_OK(value)
+    self.__actionInfo[ 'Serialization' ] = time.time() - startTime
     del retVal
     retVal = None
     return result
+
+  def _rh_getActionInfo( self ):
+    """
+    Get the execution and serialization times of the last action, if it
+    succeeded and its arguments as they are logged
+    """
+    return self.__actionInfo
     
 #####
 #
@@ -144,12 +162,14 @@ class RequestHandler( object ):
 #
 #####
 
-  def __doFileTransfer( self, sDirection ):
+  def __doFileTransfer( self, sDirection, proposalTuple ):
     """
     Execute a file transfer action
 
     :type sDirection: string
     :param sDirection: Direction of the transfer
+    :type proposalTuple: tuple
+    :param proposalTuple: Proposal of the client, with its connection options if any
     :return: S_OK/S_ERROR
     """
     retVal = self.__trPool.receive( self.__trid )
@@ -161,7 +181,19 @@ class RequestHandler( object ):
     if "transfer_%s" % sDirection not in dir( self ):
       self.__trPool.send( self.__trid, S_ERROR( "Service can't transfer files %s" % sDirection ) )
       return
-    retVal = self.__trPool.send( self.__trid, S_OK( "Accepted" ) )
+    acceptMsg = S_OK( "Accepted" )
+    #Raw transfers are used if the client proposes them
+    rawTransfer = False
+    #Codecs the client can read, None for clients that don't negotiate them
+    peerCodecs = None
+    if len( proposalTuple ) > 3 and type( proposalTuple[3] ) == types.DictType:
+      rawTransfer = proposalTuple[3].get( 'rawTransfer', False ) and self.srv_getCSOption( "RawFileTransfer", True )
+      peerCodecs = proposalTuple[3].get( 'codecs' )
+    if rawTransfer:
+      acceptMsg[ 'rawTransfer' ] = True
+    if peerCodecs is not None:
+      acceptMsg[ 'codecs' ] = self.srv_getCSOption( "BulkCodecs", Compression.getAvailableCodecs() )
+    retVal = self.__trPool.send( self.__trid, acceptMsg )
     if not retVal[ 'OK' ]:
       return retVal
     self.__logRemoteQuery( "FileTransfer/%s" % sDirection, fileInfo )
@@ -170,6 +202,9 @@ class RequestHandler( object ):
     try:
       try:
         fileHelper = FileHelper( self.__trPool.get( self.__trid ) )
+        fileHelper.setRawTransfer( rawTransfer )
+        if peerCodecs is not None:
+          fileHelper.setPeerCodecs( [ codec for codec in peerCodecs if codec in acceptMsg[ 'codecs' ] ] )
         if sDirection == "fromClient":
           fileHelper.setDirection( "fromClient" )
           uRetVal = self.transfer_fromClient( fileInfo[0], fileInfo[1], fileInfo[2], fileHelper )
@@ -237,6 +272,41 @@ class RequestHandler( object ):
     self.__logRemoteQuery( "RPC/%s" % method, args )
     return self.__RPCCallFunction( method, args )
 
+  def __doRPCBatch( self, methods ):
+    """
+    Execute a batch of RPC calls, one after the other
+
+    :type methods: string
+    :param methods: Comma separated names of the methods in the batch
+    :return: S_OK( list of S_OK/S_ERROR, one per call )
+    """
+    retVal = self.__trPool.receive( self.__trid )
+    if not retVal[ 'OK' ]:
+      raise RequestHandler.ConnectionError( "Error while receiving arguments %s %s" % ( self.srv_getFormattedRemoteCredentials(),
+                                                                         retVal[ 'Message' ] ) )
+    calls = retVal[ 'Value' ]
+    if type( calls ) not in ( types.ListType, types.TupleType ):
+      return S_ERROR( "RPC batch has to be a list of ( method, args )" )
+    validMethods = methods.split( "," )
+    self.__logRemoteQuery( "RPCBatch/%s" % methods, calls )
+    results = []
+    for call in calls:
+      try:
+        method, args = call
+      except ( TypeError, ValueError ):
+        results.append( S_ERROR( "Invalid RPC call in batch: %s" % str( call )[:50] ) )
+        continue
+      #Only the methods authorized in the proposal can be called
+      if method not in validMethods:
+        results.append( S_ERROR( "Method %s was not proposed for this batch" % method ) )
+        continue
+      self.serviceInfoDict[ 'actionTuple' ] = ( 'RPC', method )
+      retVal = self.__RPCCallFunction( method, args )
+      if not isReturnStructure( retVal ):
+        retVal = S_ERROR( "Method %s does not return a S_OK/S_ERROR!" % method )
+      results.append( retVal )
+    return S_OK( results )
+
   def __RPCCallFunction( self, method, args ):
     realMethod = "export_%s" % method
     gLogger.debug( "RPC to %s" % realMethod )
@@ -416,8 +486,11 @@ class RequestHandler( object ):
     """
     if self.srv_getCSOption( "MaskRequestParams", True ):
       argsString = "<masked>"
+      self.__actionInfo[ 'Args' ] = argsString
     else:
-      argsString = "\n\t%s\n" % ",\n\t".join( [ str( arg )[:50] for arg in args ] )
+      args = [ str( arg )[:50] for arg in args ]
+      argsString = "\n\t%s\n" % ",\n\t".join( args )
+      self.__actionInfo[ 'Args' ] = ", ".join( args )
     gLogger.notice( "Executing action", "%s %s(%s)" % ( self.srv_getFormattedRemoteCredentials(),
                                                       method,
                                                       argsString ) )
@@ -479,6 +552,24 @@ class RequestHandler( object ):
 
     return S_OK( dInfo )
 
+  types_getActionStats = []
+  auth_getActionStats = [ Properties.SERVICE_ADMINISTRATOR ]
+  def export_getActionStats( self ):
+    """
+    Latency histograms of the actions served since the service started,
+    split in queueing, handshake, authorization, execution and serialization
+    """
+    return S_OK( self.serviceInfoDict[ 'actionStats' ].getStats() )
+
+  types_getConnectionPoolStats = []
+  auth_getConnectionPoolStats = [ Properties.SERVICE_ADMINISTRATOR ]
+  def export_getConnectionPoolStats( self ):
+    """
+    Hits, misses, evictions and handshake times of the pool of the connections
+    the service opens to other services, empty if the pool is not enabled
+    """
+    return S_OK( getConnectionPoolStats() )
+
 ####
 #
 #  Utilities methods
@@ -18,6 +18,7 @@
 import select
 import time
 import socket
+import threading
 
 try:
   import multiprocessing
@@ -31,6 +32,7 @@ from DIRAC.Core.DISET.RequestHandler import RequestHandler
 from DIRAC.Core.Utilities import Time
 from DIRAC.Core.Base.private.ModuleLoader import ModuleLoader
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
 from DIRAC.ConfigurationSystem.Client.Helpers import Registry
 from DIRAC.ConfigurationSystem.Client import PathFinder
 
@@ -38,7 +40,8 @@ class ServiceReactor( object ):
 
   __transportExtraKeywords = { 'SSLSessionTimeout' : False, 
                                'IgnoreCRLs': False, 
-                               'PacketTimeout': 'timeout' }
+                               'PacketTimeout': 'timeout',
+                               'PeerCredentialsCacheTime': 'peerCredentialsCacheTime' }
 
   def __init__( self ):
     self.__services = {}
@@ -50,6 +53,11 @@ class ServiceReactor( object ):
     self.__maxFD = 0
     self.__listeningConnections = {}
     self.__stats = ReactorStats()
+    #Event loop mode
+    self.__poller = None
+    self.__listeningFDs = {}
+    self.__idleConnections = {}
+    self.__idleLock = threading.Lock()
 
   def initialize( self, servicesList ):
     try:
@@ -131,6 +139,9 @@ class ServiceReactor( object ):
           p = multiprocessing.Process( target = self.__startCloneProcess, args = ( svcName, i ) )
           p.start()
           gLogger.always( "Started clone process %s for %s" % ( i, svcName ) )
+    if self.__useEventLoop():
+      self.__serveEventLoop()
+      return S_OK()
     while self.__alive:
       self.__acceptIncomingConnection()
 
@@ -167,28 +178,170 @@ class ServiceReactor( object ):
               clientTransport = retVal[ 'Value' ]
       except socket.error:
         return
-      self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
-      #Is it banned?
-      clientIP = clientTransport.getRemoteAddress()[0]
-      if clientIP in Registry.getBannedIPs():
-        gLogger.warn( "Client connected from banned ip %s" % clientIP )
-        clientTransport.close()
+      self.__handleNewConnection( svcName, clientTransport )
+      if self.__renewServerContexts():
+        sockets = self.__getListeningSocketsList()
+
+  def __handleNewConnection( self, svcName, clientTransport ):
+    self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
+    #Is it banned?
+    clientIP = clientTransport.getRemoteAddress()[0]
+    if clientIP in Registry.getBannedIPs():
+      gLogger.warn( "Client connected from banned ip %s" % clientIP )
+      clientTransport.close()
+      return
+    #Handle connection
+    self.__stats.connectionStablished()
+    service = self.__services[ svcName ]
+    if self.__poller and service.getConfig().getMaxIdleConnectionTime() > 0:
+      #Wait until the client sends something before taking a thread
+      self.__parkConnection( service, clientTransport )
+    else:
+      service.handleConnection( clientTransport )
+
+  def __renewServerContexts( self ):
+    #Renew context?
+    now = time.time()
+    renewed = False
+    for svcName in self.__listeningConnections:
+      tr = self.__listeningConnections[ svcName ][ 'transport' ]
+      if now - tr.latestServerRenewTime() > self.__services[ svcName ].getConfig().getContextLifeTime():
+        result = tr.renewServerContext()
+        if result[ 'OK' ]:
+          renewed = True
+          self.__listeningConnections[ svcName ][ 'socket' ] = tr.getSocket()
+    return renewed
+
+  #
+  # Event loop mode
+  #
+
+  def __useEventLoop( self ):
+    """
+    The event loop is used if epoll is available and all the services ask for it
+    with EventLoop = epoll. Otherwise connections are accepted with select
+    """
+    if not hasattr( select, 'epoll' ):
+      return False
+    for svcName in self.__services:
+      if self.__services[ svcName ].getConfig().getEventLoop() != "epoll":
+        return False
+    return True
+
+  def __serveEventLoop( self ):
+    """
+    Serve using epoll. New connections and connections waiting for their next
+    request are kept in the poller, and are only handed to the service thread
+    pools once the client has sent something
+    """
+    gLogger.info( "Serving with epoll event loop" )
+    self.__poller = select.epoll()
+    self.__registerListeners()
+    for svcName in self.__services:
+      service = self.__services[ svcName ]
+      if service.getConfig().getMaxIdleConnectionTime() > 0:
+        service.setIdleConnectionCallback( self.__parkConnection )
+    lastIdleCheck = time.time()
+    while self.__alive:
+      try:
+        events = self.__poller.poll( 1 )
+      except IOError:
+        #Interrupted system call
         continue
-      #Handle connection
-      self.__stats.connectionStablished()
-      self.__services[ svcName ].handleConnection( clientTransport )
-      #Renew context?
+      for fd, event in events:
+        if fd in self.__listeningFDs:
+          self.__acceptEventLoopConnection( self.__listeningFDs[ fd ] )
+        else:
+          self.__wakeUpConnection( fd, event )
       now = time.time()
-      renewed = False
-      for svcName in self.__listeningConnections:
-        tr = self.__listeningConnections[ svcName ][ 'transport' ]
-        if now - tr.latestServerRenewTime() > self.__services[ svcName ].getConfig().getContextLifeTime():
-          result = tr.renewServerContext()
-          if result[ 'OK' ]:
-            renewed = True
-      if renewed:
-        sockets = self.__getListeningSocketsList()
+      if now - lastIdleCheck > 1:
+        lastIdleCheck = now
+        self.__closeIdleConnections( now )
+        if self.__renewServerContexts():
+          self.__registerListeners()
 
+  def __registerListeners( self ):
+    for fd in self.__listeningFDs:
+      try:
+        self.__poller.unregister( fd )
+      except ( IOError, ValueError ):
+        pass
+    self.__listeningFDs = {}
+    for svcName in self.__listeningConnections:
+      fd = self.__listeningConnections[ svcName ][ 'socket' ].fileno()
+      self.__listeningFDs[ fd ] = svcName
+      self.__poller.register( fd, select.EPOLLIN )
+
+  def __acceptEventLoopConnection( self, svcName ):
+    try:
+      retVal = self.__listeningConnections[ svcName ][ 'transport' ].acceptConnection()
+    except socket.error as e:
+      gLogger.warn( "Error while accepting a connection: ", str( e ) )
+      return
+    if not retVal[ 'OK' ]:
+      gLogger.warn( "Error while accepting a connection: ", retVal[ 'Message' ] )
+      return
+    self.__handleNewConnection( svcName, retVal[ 'Value' ] )
+
+  def __parkConnection( self, service, clientTransport, trid = None ):
+    """
+    Keep a connection in the poller until there's something to read from it.
+    trid is the id in the transport pool of connections already established
+    """
+    if clientTransport.byteStream:
+      #There's already received data waiting to be processed
+      service.handleConnection( clientTransport, trid )
+      return
+    fd = clientTransport.oSocket.fileno()
+    maxIdleTime = service.getConfig().getMaxIdleConnectionTime()
+    self.__idleLock.acquire()
+    try:
+      self.__idleConnections[ fd ] = ( service, clientTransport, trid, time.time() + maxIdleTime )
+      self.__poller.register( fd, select.EPOLLIN | select.EPOLLRDHUP )
+    finally:
+      self.__idleLock.release()
+
+  def __unparkConnection( self, fd ):
+    self.__idleLock.acquire()
+    try:
+      idleConnection = self.__idleConnections.pop( fd, None )
+      if idleConnection:
+        self.__poller.unregister( fd )
+      return idleConnection
+    finally:
+      self.__idleLock.release()
+
+  def __wakeUpConnection( self, fd, event ):
+    idleConnection = self.__unparkConnection( fd )
+    if not idleConnection:
+      return
+    service, clientTransport, trid = idleConnection[:3]
+    if event & ( select.EPOLLHUP | select.EPOLLERR ) or ( trid and event & select.EPOLLRDHUP ):
+      #Clients don't half close connections with pending requests
+      self.__closeConnection( clientTransport, trid )
+      return
+    service.handleConnection( clientTransport, trid )
+
+  def __closeIdleConnections( self, now ):
+    self.__idleLock.acquire()
+    try:
+      expired = [ fd for fd in self.__idleConnections if self.__idleConnections[ fd ][3] < now ]
+    finally:
+      self.__idleLock.release()
+    for fd in expired:
+      idleConnection = self.__unparkConnection( fd )
+      if idleConnection:
+        gLogger.debug( "Closing idle connection", str( idleConnection[1].getRemoteAddress() ) )
+        self.__closeConnection( idleConnection[1], idleConnection[2] )
+
+  def __closeConnection( self, clientTransport, trid ):
+    try:
+      if trid:
+        getGlobalTransportPool().close( trid )
+      else:
+        clientTransport.close()
+    except Exception as e:
+      gLogger.debug( "Error while closing connection", str( e ) )
 
   def __closeListeningConnections( self ):
     for svcName in self.__listeningConnections:
@@ -5,11 +5,11 @@ import os
 from DIRAC.Core.DISET.private.BaseClient import BaseClient
 from DIRAC.Core.DISET.private.FileHelper import FileHelper
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
-from DIRAC.Core.Utilities import File
+from DIRAC.Core.Utilities import File, Compression
 
 class TransferClient( BaseClient ):
 
-  def _sendTransferHeader( self, actionName, fileInfo ):
+  def _sendTransferHeader( self, actionName, fileInfo, rawTransfer = False ):
     """
     Send the header of the transfer
 
@@ -17,7 +17,10 @@ class TransferClient( BaseClient ):
     :param actionName: Action to execute
     :type fileInfo: tuple
     :param fileInfo: Information of the target file/bulk
-    :return: S_OK/S_ERROR
+    :type rawTransfer: boolean
+    :param rawTransfer: Propose a raw transfer to the server
+    :return: S_OK/S_ERROR, with rawTransfer set if the server accepted it and
+             codecs set to the compression codecs of the server if it sent them
     """
     retVal = self._connect()
     if not retVal[ 'OK' ]:
@@ -25,7 +28,15 @@ class TransferClient( BaseClient ):
     trid, transport = retVal[ 'Value' ]
     try:
       #FFC -> File from Client
-      retVal = self._proposeAction( transport, ( "FileTransfer", actionName ) )
+      connectionOptions = {}
+      if rawTransfer:
+        connectionOptions[ 'rawTransfer' ] = True
+      #Tell the server which codecs can be used for the bulks
+      if actionName in ( "BulkFromClient", "BulkToClient" ):
+        connectionOptions[ 'codecs' ] = Compression.getAvailableCodecs()
+      if not connectionOptions:
+        connectionOptions = None
+      retVal = self._proposeAction( transport, ( "FileTransfer", actionName ), connectionOptions )
       if not retVal[ 'OK' ]:
         return retVal
       retVal = transport.sendData( S_OK( fileInfo ) )
@@ -34,7 +45,10 @@ class TransferClient( BaseClient ):
       retVal = transport.receiveData()
       if not retVal[ 'OK' ]:
         return retVal
-      return S_OK( ( trid, transport ) )
+      result = S_OK( ( trid, transport ) )
+      result[ 'rawTransfer' ] = rawTransfer and retVal.get( 'rawTransfer', False )
+      result[ 'codecs' ] = retVal.get( 'codecs' )
+      return result
     except Exception as e:
       self._disconnect( trid )
       return S_ERROR( "Cound not request transfer: %s" % str( e ) )
@@ -58,16 +72,18 @@ class TransferClient( BaseClient ):
     if not retVal[ 'OK' ]:
       return retVal
     fd = retVal[ 'Value' ]
-    retVal = self._sendTransferHeader( "FromClient", ( fileId, token, File.getSize( filename ) ) )
+    retVal = self._sendTransferHeader( "FromClient", ( fileId, token, File.getSize( filename ) ), rawTransfer = True )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
+    rawTransfer = retVal[ 'rawTransfer' ]
     try:
       fileHelper.setTransport( transport )
+      fileHelper.setRawTransfer( rawTransfer )
       retVal = fileHelper.FDToNetwork( fd )
       if not retVal[ 'OK' ]:
         return retVal
-      retVal = transport.receiveData()
+      retVal = fileHelper.receiveResult()
       return retVal
     finally:
       self._disconnect( trid )
@@ -92,12 +108,14 @@ class TransferClient( BaseClient ):
       return retVal
     dS = retVal[ 'Value' ]
     closeAfterUse = retVal[ 'closeAfterUse' ]
-    retVal = self._sendTransferHeader( "ToClient", ( fileId, token ) )
+    retVal = self._sendTransferHeader( "ToClient", ( fileId, token ), rawTransfer = True )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
+    rawTransfer = retVal[ 'rawTransfer' ]
     try:
       fileHelper.setTransport( transport )
+      fileHelper.setRawTransfer( rawTransfer )
       retVal = fileHelper.networkToDataSink( dS )
       if not retVal[ 'OK' ]:
         return retVal
@@ -126,7 +144,8 @@ class TransferClient( BaseClient ):
     :type token : string
     :param token : Token for the bulk
     :type compress : boolean
-    :param compress : Enable compression for the bulk. By default its True
+    :param compress : Enable compression for the bulk. By default its True. The codec
+                      is chosen among the ones known by the server
     :type bulkSize : integer
     :param bulkSize : Optional size of the bulk
     :return : S_OK/S_ERROR
@@ -134,20 +153,26 @@ class TransferClient( BaseClient ):
     bogusEntries = self.__checkFileList( fileList )
     if bogusEntries:
       return S_ERROR( "Some files or directories don't exist :\n\t%s" % "\n\t".join( bogusEntries ) )
+    #The codec is only chosen once the server has answered with its codecs. The extension of the id
+    #is the one of the servers that don't negotiate them, the others get the codec from the data
     if compress:
       bulkId = "%s.tar.bz2" % bulkId
     else:
       bulkId = "%s.tar" % bulkId
-    retVal = self._sendTransferHeader( "BulkFromClient", ( bulkId, token, bulkSize ) )
+    retVal = self._sendTransferHeader( "BulkFromClient", ( bulkId, token, bulkSize ), rawTransfer = True )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
+    rawTransfer = retVal[ 'rawTransfer' ]
     try:
       fileHelper = FileHelper( transport )
+      fileHelper.setRawTransfer( rawTransfer )
+      fileHelper.setPeerCodecs( retVal[ 'codecs' ] )
       retVal = fileHelper.bulkToNetwork( fileList, compress, onthefly )
       if not retVal[ 'OK' ]:
         return retVal
-      retVal = transport.receiveData()      return retVal
+      retVal = fileHelper.receiveResult()
+      return retVal
     finally:
       self._disconnect( trid )
 
@@ -171,12 +196,14 @@ class TransferClient( BaseClient ):
       bulkId = "%s.tar.bz2" % bulkId
     else:
       bulkId = "%s.tar" % bulkId
-    retVal = self._sendTransferHeader( "BulkToClient", ( bulkId, token ) )
+    retVal = self._sendTransferHeader( "BulkToClient", ( bulkId, token ), rawTransfer = True )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
+    rawTransfer = retVal[ 'rawTransfer' ]
     try:
       fileHelper = FileHelper( transport )
+      fileHelper.setRawTransfer( rawTransfer )
       retVal = fileHelper.networkToBulk( destDir, compress )
       if not retVal[ 'OK' ]:
         return retVal
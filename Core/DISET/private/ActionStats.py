@@ -0,0 +1,110 @@
+""" Latency statistics of the actions served by a service
+
+    The time of each call is split in the phases it goes through in the
+    service, and a histogram of each phase is kept for every action
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import bisect
+import threading
+
+class ActionStats( object ):
+
+  #Time waiting in the thread pool, establishing the connection, checking the
+  #authorization, running the handler and sending the result
+  PHASES = ( 'Queue', 'Handshake', 'Authorization', 'Execution', 'Serialization', 'Total' )
+  #Upper limits in seconds of the histogram buckets, the last bucket takes the slower ones
+  BUCKETS = ( 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60. )
+
+  def __init__( self ):
+    self.__lock = threading.Lock()
+    self.__actions = {}
+    self.__since = time.time()
+
+  def __newAction( self ):
+    actionStats = { 'Calls' : 0, 'Errors' : 0 }
+    for phase in ActionStats.PHASES:
+      actionStats[ phase ] = { 'Count' : 0,
+                               'Sum' : 0.,
+                               'Max' : 0.,
+                               'Histogram' : [ 0 ] * ( len( ActionStats.BUCKETS ) + 1 ) }
+    return actionStats
+
+  def record( self, action, phaseTimes, failed = False ):
+    """
+    Account a call
+
+    :type action: string
+    :param action: Action name, ie RPC/getJobs
+    :type phaseTimes: dictionary
+    :param phaseTimes: Seconds spent in each phase, the ones missing didn't happen
+    :type failed: boolean
+    :param failed: The call returned an error
+    """
+    self.__lock.acquire()
+    try:
+      actionStats = self.__actions.get( action )
+      if not actionStats:
+        actionStats = self.__newAction()
+        self.__actions[ action ] = actionStats
+      actionStats[ 'Calls' ] += 1
+      if failed:
+        actionStats[ 'Errors' ] += 1
+      for phase in phaseTimes:
+        if phase not in actionStats:
+          continue
+        phaseTime = phaseTimes[ phase ]
+        phaseStats = actionStats[ phase ]
+        phaseStats[ 'Count' ] += 1
+        phaseStats[ 'Sum' ] += phaseTime
+        phaseStats[ 'Max' ] = max( phaseStats[ 'Max' ], phaseTime )
+        phaseStats[ 'Histogram' ][ bisect.bisect_left( ActionStats.BUCKETS, phaseTime ) ] += 1
+    finally:
+      self.__lock.release()
+
+  def getStats( self ):
+    """
+    Get the statistics of all the actions, with the mean and an estimation
+    of the 50 and 95 percentiles of each phase
+    """
+    self.__lock.acquire()
+    try:
+      actions = {}
+      for action in self.__actions:
+        actionStats = dict( self.__actions[ action ] )
+        for phase in ActionStats.PHASES:
+          phaseStats = dict( actionStats[ phase ] )
+          phaseStats[ 'Histogram' ] = list( phaseStats[ 'Histogram' ] )
+          phaseStats[ 'Mean' ] = phaseStats[ 'Sum' ] / phaseStats[ 'Count' ] if phaseStats[ 'Count' ] else 0.
+          phaseStats[ 'P50' ] = self.__getPercentile( phaseStats, 0.5 )
+          phaseStats[ 'P95' ] = self.__getPercentile( phaseStats, 0.95 )
+          actionStats[ phase ] = phaseStats
+        actions[ action ] = actionStats
+    finally:
+      self.__lock.release()
+    return { 'Actions' : actions,
+             'Buckets' : list( ActionStats.BUCKETS ),
+             'Since' : self.__since }
+
+  def __getPercentile( self, phaseStats, fraction ):
+    """
+    Upper limit of the bucket containing the percentile, the max for the last one
+    """
+    count = 0
+    for bucket, bucketCount in enumerate( phaseStats[ 'Histogram' ] ):
+      count += bucketCount
+      if count and count >= fraction * phaseStats[ 'Count' ]:
+        if bucket < len( ActionStats.BUCKETS ):
+          return min( ActionStats.BUCKETS[ bucket ], phaseStats[ 'Max' ] )
+        return phaseStats[ 'Max' ]
+    return 0.
+
+  def reset( self ):
+    self.__lock.acquire()
+    try:
+      self.__actions = {}
+      self.__since = time.time()
+    finally:
+      self.__lock.release()
@@ -1,8 +1,10 @@
 __RCSID__ = "$Id$"
 
+import os
 import time
 import types
 import thread
+from hashlib import md5
 import DIRAC
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -12,6 +14,7 @@ from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.PathFinder import getServiceURL
 from DIRAC.Core.Security import CS
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.ConnectionPool import getGlobalConnectionPool
 from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
 
 class BaseClient:
@@ -31,6 +34,7 @@ class BaseClient:
   KW_PROXY_CHAIN = "proxyChain"
   KW_SKIP_CA_CHECK = "skipCACheck"
   KW_KEEP_ALIVE_LAPSE = "keepAliveLapse"
+  KW_PERSISTENT_CONNECTION = "persistentConnection"
 
   __threadConfig = ThreadConfig()
 
@@ -51,10 +55,13 @@ class BaseClient:
     self.__nbOfRetry = 3 # by default we try try times
     self.__retryCounter = 1
     self.__bannedUrls = []
+    self.__persistentConnection = False
+    self.__connectionKey = None
+    self.__persistentTransports = set()
     for initFunc in ( self.__discoverSetup, self.__discoverVO, self.__discoverTimeout,
                       self.__discoverURL, self.__discoverCredentialsToUse,
                       self.__checkTransportSanity,
-                      self.__setKeepAliveLapse ):
+                      self.__setKeepAliveLapse, self.__discoverPersistentConnection ):
       result = initFunc()
       if not result[ 'OK' ] and self.__initStatus[ 'OK' ]:
         self.__initStatus = result
@@ -145,6 +152,33 @@ class BaseClient:
         return S_ERROR( "Invalid proxy chain specified on instantiation" )
     return S_OK()
 
+  def __discoverPersistentConnection( self ):
+    #Reuse connections between calls?
+    if self.KW_PERSISTENT_CONNECTION in self.kwargs:
+      persistent = self.kwargs[ self.KW_PERSISTENT_CONNECTION ]
+    else:
+      persistent = gConfig.getValue( "/DIRAC/ConnectionPool/Enabled", False )
+    if type( persistent ) in types.StringTypes:
+      persistent = persistent.lower() in ( "y", "yes", "true", "1" )
+    self.__persistentConnection = bool( persistent )
+    return S_OK()
+
+  def __getConnectionKey( self ):
+    """
+    Connections can only be reused by clients with the same URL, credentials
+    and transport settings
+    """
+    credentials = [ str( self.kwargs.get( kw ) ) for kw in ( self.KW_USE_CERTIFICATES,
+                                                             self.KW_PROXY_LOCATION,
+                                                             self.KW_PROXY_STRING,
+                                                             self.KW_SKIP_CA_CHECK,
+                                                             self.KW_DELEGATED_DN,
+                                                             self.KW_DELEGATED_GROUP ) ]
+    for envVar in ( "X509_USER_PROXY", "X509_USER_CERT", "X509_USER_KEY" ):
+      credentials.append( os.environ.get( envVar, "" ) )
+    settings = "%s|%s" % ( self.kwargs.get( self.KW_TIMEOUT ), self.kwargs.get( self.KW_KEEP_ALIVE_LAPSE ) )
+    return ( self.serviceURL, md5( "|".join( credentials ) ).hexdigest(), str( self.__extraCredentials ), settings )
+
   def __discoverExtraCredentials( self ):
     #Wich extra credentials to use?
     if self.useCertificates:
@@ -290,12 +324,22 @@ and this is thread %s
       return self.__initStatus
     if self.__enableThreadCheck:
       self.__checkThreadID()
+    if self.__persistentConnection:
+      self.__connectionKey = self.__getConnectionKey()
+      transport = getGlobalConnectionPool().get( self.__connectionKey )
+      if transport:
+        gLogger.debug( "Reusing connection to: %s" % self.serviceURL )
+        trid = getGlobalTransportPool().add( transport )
+        return S_OK( ( trid, transport ) )
     gLogger.debug( "Connecting to: %s" % self.serviceURL )
     try:
       transport = gProtocolDict[ self.__URLTuple[0] ][ 'transport' ]( self.__URLTuple[1:3], **self.kwargs )
       #the socket timeout is the default value which is 1.
       #later we increase to 5
+      connectStart = time.time()
       retVal = transport.initAsClient()
+      if retVal[ 'OK' ]:
+        getGlobalConnectionPool().addHandshake( time.time() - connectStart )
       if not retVal[ 'OK' ]:
         if self.__retry < self.__nbOfRetry * self.__nbOfUrls - 1:
           url = "%s://%s:%d/%s" % ( self.__URLTuple[0], self.__URLTuple[1], int( self.__URLTuple[2] ), self.__URLTuple[3] )
@@ -321,15 +365,32 @@ and this is thread %s
     trid = getGlobalTransportPool().add( transport )
     return S_OK( ( trid, transport ) )
 
-  def _disconnect( self, trid ):
+  def _disconnect( self, trid, reusable = False ):
+    """
+    Close the connection, or give it back to the connection pool if the call
+    finished cleanly and the server keeps it open
+    """
+    transport = getGlobalTransportPool().get( trid )
+    if transport in self.__persistentTransports:
+      self.__persistentTransports.discard( transport )
+      if reusable:
+        getGlobalTransportPool().remove( trid )
+        getGlobalConnectionPool().release( self.__connectionKey, transport )
+        return
     getGlobalTransportPool().close( trid )
 
-  def _proposeAction( self, transport, action ):
+  def _proposeAction( self, transport, action, connectionOptions = None ):
     if not self.__initStatus[ 'OK' ]:
       return self.__initStatus
     stConnectionInfo = ( ( self.__URLTuple[3], self.setup, self.vo ),
                          action,
                          self.__extraCredentials )
+    connectionOptions = dict( connectionOptions or {} )
+    persistent = self.__persistentConnection and action[0] in ( "RPC", "RPCBatch" )
+    if persistent:
+      connectionOptions[ 'persistent' ] = True
+    if connectionOptions:
+      stConnectionInfo += ( connectionOptions, )
     retVal = transport.sendData( S_OK( stConnectionInfo ) )
     if not retVal[ 'OK' ]:
       return retVal
@@ -341,6 +402,8 @@ and this is thread %s
       if 'delegate' in serverRequirements:
         gLogger.debug( "A delegation is requested" )
         serverReturn = self.__delegateCredentials( transport, serverRequirements[ 'delegate' ] )
+    if persistent and serverReturn[ 'OK' ] and serverReturn.get( 'persistent' ):
+      self.__persistentTransports.add( transport )
     return serverReturn
 
   def __delegateCredentials( self, transport, delegationRequest ):
@@ -0,0 +1,160 @@
+""" Pool of established client connections, to reuse them for several calls
+    to the same service instead of doing a new connection and handshake each time
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import select
+import threading
+from DIRAC import gLogger, gConfig
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+
+class ConnectionPool( object ):
+
+  def __init__( self, maxIdleTime = 30, maxPerHost = 10 ):
+    """
+    Idle connections are closed after maxIdleTime seconds, and no more than
+    maxPerHost idle connections are kept for the same server
+    """
+    self.__maxIdleTime = maxIdleTime
+    self.__maxPerHost = maxPerHost
+    self.__modLock = threading.Lock()
+    #key -> list of ( transport, idle since )
+    self.__idleConnections = {}
+    #server address -> number of idle connections
+    self.__hostConnections = {}
+    self.__stats = { 'Hits' : 0,
+                     'Misses' : 0,
+                     'Evictions' : 0,
+                     'Handshakes' : 0,
+                     'HandshakeTime' : 0.0 }
+    result = gThreadScheduler.addPeriodicTask( 10, self.__evictIdleConnections )
+    if not result[ 'OK' ]:
+      gLogger.fatal( "Cannot add task to thread scheduler", result[ 'Message' ] )
+
+  def get( self, key ):
+    """
+    Get an idle connection for key, or None if there's no usable one
+    """
+    while True:
+      self.__modLock.acquire()
+      try:
+        connections = self.__idleConnections.get( key )
+        if not connections:
+          self.__stats[ 'Misses' ] += 1
+          return None
+        #Most recently used first, it's the least likely to have been closed by the server
+        transport, idleSince = connections.pop()
+        if not connections:
+          del self.__idleConnections[ key ]
+        self.__removeFromHost( transport )
+      finally:
+        self.__modLock.release()
+      if time.time() - idleSince < self.__maxIdleTime and self.__isHealthy( transport ):
+        self.__count( 'Hits' )
+        return transport
+      self.__close( transport )
+
+  def release( self, key, transport ):
+    """
+    Give back a connection after a call, to be reused for key
+    """
+    address = transport.stServerAddress
+    self.__modLock.acquire()
+    try:
+      if self.__hostConnections.get( address, 0 ) < self.__maxPerHost:
+        self.__idleConnections.setdefault( key, [] ).append( ( transport, time.time() ) )
+        self.__hostConnections[ address ] = self.__hostConnections.get( address, 0 ) + 1
+        return
+    finally:
+      self.__modLock.release()
+    self.__close( transport )
+
+  def addHandshake( self, handshakeTime ):
+    """
+    Account a new connection
+    """
+    self.__count( 'Handshakes' )
+    self.__count( 'HandshakeTime', handshakeTime )
+
+  def getStats( self ):
+    """
+    Get the hit/miss counters and the time spent establishing new connections
+    """
+    stats = dict( self.__stats )
+    stats[ 'IdleConnections' ] = sum( self.__hostConnections.values() )
+    requests = stats[ 'Hits' ] + stats[ 'Misses' ]
+    stats[ 'HitRate' ] = float( stats[ 'Hits' ] ) / requests if requests else 0.
+    stats[ 'MeanHandshakeTime' ] = stats[ 'HandshakeTime' ] / stats[ 'Handshakes' ] if stats[ 'Handshakes' ] else 0.
+    return stats
+
+  def __count( self, counter, value = 1 ):
+    self.__modLock.acquire()
+    try:
+      self.__stats[ counter ] += value
+    finally:
+      self.__modLock.release()
+
+  def __removeFromHost( self, transport ):
+    address = transport.stServerAddress
+    self.__hostConnections[ address ] -= 1
+    if not self.__hostConnections[ address ]:
+      del self.__hostConnections[ address ]
+
+  def __isHealthy( self, transport ):
+    """
+    There must be nothing to read from an idle connection. If there's something
+    the server has closed it
+    """
+    if transport.byteStream:
+      return False
+    try:
+      readable = select.select( [ transport.getSocket() ], [], [], 0 )[0]
+    except Exception:
+      return False
+    return not readable
+
+  def __close( self, transport ):
+    self.__count( 'Evictions' )
+    try:
+      transport.close()
+    except Exception as e:
+      gLogger.debug( "Error while closing pooled connection", str( e ) )
+
+  def __evictIdleConnections( self ):
+    limit = time.time() - self.__maxIdleTime
+    expired = []
+    self.__modLock.acquire()
+    try:
+      for key in list( self.__idleConnections ):
+        connections = self.__idleConnections[ key ]
+        for connection in list( connections ):
+          if connection[1] < limit:
+            connections.remove( connection )
+            self.__removeFromHost( connection[0] )
+            expired.append( connection[0] )
+        if not connections:
+          del self.__idleConnections[ key ]
+    finally:
+      self.__modLock.release()
+    for transport in expired:
+      self.__close( transport )
+
+
+gConnectionPool = None
+
+def getConnectionPoolStats():
+  """
+  Get the statistics of the global connection pool, empty if it has not been used
+  """
+  if not gConnectionPool:
+    return {}
+  return gConnectionPool.getStats()
+
+def getGlobalConnectionPool():
+  global gConnectionPool
+  if not gConnectionPool:
+    gConnectionPool = ConnectionPool( gConfig.getValue( "/DIRAC/ConnectionPool/MaxIdleTime", 30 ),
+                                      gConfig.getValue( "/DIRAC/ConnectionPool/MaxPerHost", 10 ) )
+  return gConnectionPool
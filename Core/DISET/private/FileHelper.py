@@ -8,19 +8,69 @@ try:
 except:
   import md5
 import types
+import Queue
+import select
 import threading
 import cStringIO
 import tarfile
 import tempfile
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
+from DIRAC.Core.Utilities import Compression
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
 
 gLogger = gLogger.getSubLogger( "FileTransmissionHelper" )
 
+class ChecksumThread( object ):
+  """
+  MD5 of a stream of buffers, computed in a separate thread so it runs
+  at the same time as the network and disk I/O
+  """
+
+  def __init__( self, maxPending = 4 ):
+    self.__oMD5 = md5.md5()
+    self.__queue = Queue.Queue( maxPending )
+    self.__thread = None
+
+  def update( self, data, doneCallback = None ):
+    """
+    Add data to the checksum. doneCallback is called once data has been used,
+    so the buffer can be reused
+    """
+    if not self.__thread:
+      self.__thread = threading.Thread( target = self.__run )
+      self.__thread.setDaemon( 1 )
+      self.__thread.start()
+    self.__queue.put( ( data, doneCallback ) )
+
+  def __run( self ):
+    while True:
+      data, doneCallback = self.__queue.get()
+      if data is None:
+        return
+      self.__oMD5.update( data )
+      if doneCallback:
+        doneCallback()
+
+  def stop( self ):
+    """
+    Wait for the data already given to be used and stop the thread
+    """
+    if self.__thread and self.__thread.isAlive():
+      self.__queue.put( ( None, None ) )
+      self.__thread.join()
+    self.__thread = None
+
+  def hexdigest( self ):
+    self.stop()
+    return self.__oMD5.hexdigest()
+
 class FileHelper:
 
   __validDirections = ( "toClient", "fromClient", 'receive', 'send' )
   __directionsMapping = { 'toClient' : 'send', 'fromClient' : 'receive' }
+  #Packet size and number of reused buffers for raw transfers
+  RAW_PACKET_SIZE = 4194304
+  RAW_BUFFERS = 3
 
   def __init__( self, oTransport = None, checkSum = True ):
     self.oTransport = oTransport
@@ -31,13 +81,53 @@ class FileHelper:
     self.direction = False
     self.packetSize = 1048576
     self.__fileBytes = 0
+    self.__rawTransfer = False
+    #Raw receptions are accepted when the receiver starts reading the data
+    self.__rawAccepted = False
+    self.__peerCodecs = None
     self.__log = gLogger.getSubLogger( "FileHelper" )
 
   def disableCheckSum( self ):
     self.__checkMD5 = False
+    self.__oMD5 = self.__newChecksum()
 
   def enableCheckSum( self ):
     self.__checkMD5 = True
+    self.__oMD5 = self.__newChecksum()
+
+  def setRawTransfer( self, rawTransfer = True ):
+    """
+    In raw transfers the data is sent as it is after a small header instead of
+    being encoded in a message, and without waiting for an acknowledgement of
+    each packet. Both ends have to agree to use it.
+
+    The receiver sends one control message, before the first packet is sent, to
+    accept the data or to abort the transfer. It can also abort while the data
+    is coming, the sender looks for that message between packets. After an abort
+    the sender sends the end of the transmission and the receiver reads until it
+    """
+    self.__rawTransfer = rawTransfer
+    if rawTransfer:
+      self.packetSize = FileHelper.RAW_PACKET_SIZE
+    self.__oMD5 = self.__newChecksum()
+
+  def isRawTransfer( self ):
+    return self.__rawTransfer
+
+  def setPeerCodecs( self, peerCodecs ):
+    """
+    Compression codecs the other end can read. Bulks sent to peers that
+    didn't say which ones they know are compressed with bz2
+    """
+    self.__peerCodecs = peerCodecs
+
+  def getPeerCodecs( self ):
+    return self.__peerCodecs
+
+  def __newChecksum( self ):
+    if self.__rawTransfer and self.__checkMD5:
+      return ChecksumThread()
+    return md5.md5()
 
   def setTransport( self, oTransport ):
     self.oTransport = oTransport
@@ -56,6 +146,8 @@ class FileHelper:
     return self.__fileBytes
 
   def sendData( self, sBuffer ):
+    if self.__rawTransfer:
+      return self.__sendRawData( sBuffer )
     if self.__checkMD5:
       self.__oMD5.update( sBuffer )
     retVal = self.oTransport.sendData( S_OK( ( True, sBuffer ) ) )
@@ -64,6 +156,61 @@ class FileHelper:
     retVal = self.oTransport.receiveData()
     return retVal
 
+  def __sendRawData( self, sBuffer, doneCallback = None ):
+    retVal = self.__receiveRawControl( wait = not self.__rawAccepted )
+    if not retVal[ 'OK' ] or retVal.get( 'AbortTransfer' ):
+      if doneCallback:
+        doneCallback()
+      return retVal
+    self.__rawAccepted = True
+    if self.__checkMD5:
+      self.__oMD5.update( sBuffer, doneCallback )
+    retVal = self.oTransport.sendData( S_OK( ( True, len( sBuffer ) ) ) )
+    if not retVal[ 'OK' ]:
+      return retVal
+    retVal = self.oTransport.sendRawData( sBuffer )
+    if not self.__checkMD5 and doneCallback:
+      doneCallback()
+    return retVal
+
+  def __receiveRawControl( self, wait ):
+    """
+    Receive the control message of the receiver of a raw transfer, if there is
+    one or wait is set. If it aborts the transfer, its end is sent
+    """
+    if not wait and not self.__isControlPending():
+      return S_OK()
+    retVal = self.oTransport.receiveData()
+    if retVal[ 'OK' ] and not retVal.get( 'AbortTransfer' ):
+      return S_OK()
+    if not retVal[ 'OK' ]:
+      self.__log.verbose( "Transfer refused", retVal[ 'Message' ] )
+    else:
+      self.__log.verbose( "Transfer aborted" )
+    result = self.sendEOF()
+    if not result[ 'OK' ]:
+      return result
+    return retVal
+
+  def __isControlPending( self ):
+    if self.oTransport.byteStream or self.oTransport.receivedMessages:
+      return True
+    try:
+      return bool( select.select( [ self.oTransport.getSocket() ], [], [], 0 )[0] )
+    except Exception:
+      return True
+
+  def receiveResult( self ):
+    """
+    Receive the result of the transfer the peer sends after the data. A raw
+    receiver may have aborted after the end of the data was sent, its
+    control message is skipped
+    """
+    retVal = self.oTransport.receiveData()
+    if self.__rawTransfer and retVal.get( 'TransferControl' ):
+      retVal = self.oTransport.receiveData()
+    return retVal
+
   def sendEOF( self ):
     retVal = self.oTransport.sendData( S_OK( ( False, self.__oMD5.hexdigest() ) ) )
     if not retVal[ 'OK' ]:
@@ -72,13 +219,78 @@ class FileHelper:
     return S_OK()
 
   def sendError( self, errorMsg ):
+    if self.__rawTransfer and self.direction != "send":
+      return self.__abortRawReception( S_ERROR( errorMsg ) )
     retVal = self.oTransport.sendData( S_ERROR( errorMsg ) )
     if not retVal[ 'OK' ]:
       return retVal
     self.__finishedTransmission()
     return S_OK()
 
+  def __acceptRawReception( self ):
+    """
+    Tell the sender of a raw transfer to send the data
+    """
+    if self.__rawAccepted:
+      return S_OK()
+    self.__rawAccepted = True
+    acceptMsg = S_OK()
+    acceptMsg[ 'TransferControl' ] = True
+    return self.oTransport.sendData( acceptMsg )
+
+  def __abortRawReception( self, controlMsg = None, pendingBytes = 0 ):
+    """
+    Tell the sender of a raw transfer to stop, and read what it sent until
+    the end of the transmission
+
+    :param int pendingBytes: size of the packet whose header has already been read
+    """
+    if self.bFinishedTransmission:
+      return S_OK()
+    if controlMsg is None:
+      controlMsg = S_OK()
+      controlMsg[ 'AbortTransfer' ] = True
+    controlMsg[ 'TransferControl' ] = True
+    self.__rawAccepted = True
+    retVal = self.oTransport.sendData( controlMsg )
+    if not retVal[ 'OK' ]:
+      self.__finishedTransmission()
+      return retVal
+    dataBuffer = bytearray( self.packetSize )
+    packetSize = pendingBytes
+    while not self.bFinishedTransmission:
+      if not packetSize:
+        retVal = self.__receiveRawHeader()
+        if not retVal[ 'OK' ]:
+          self.__finishedTransmission()
+          return retVal
+        packetSize = retVal[ 'Value' ]
+        if not packetSize:
+          break
+      if len( dataBuffer ) < packetSize:
+        dataBuffer = bytearray( packetSize )
+      retVal = self.oTransport.receiveRawData( dataBuffer, packetSize )
+      if not retVal[ 'OK' ]:
+        self.__finishedTransmission()
+        return retVal
+      packetSize = 0
+    return S_OK()
+
   def receiveData( self, maxBufferSize = 0 ):
+    if self.__rawTransfer:
+      retVal = self.__acceptRawReception()
+      if not retVal[ 'OK' ]:
+        return retVal
+      retVal = self.__receiveRawHeader( maxBufferSize )
+      if not retVal[ 'OK' ] or not retVal[ 'Value' ]:
+        return S_OK( '' ) if retVal[ 'OK' ] else retVal
+      dataBuffer = bytearray( retVal[ 'Value' ] )
+      retVal = self.oTransport.receiveRawData( dataBuffer, len( dataBuffer ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+      if self.__checkMD5:
+        self.__oMD5.update( dataBuffer )
+      return S_OK( str( dataBuffer ) )
     retVal = self.oTransport.receiveData( maxBufferSize = maxBufferSize )
     if 'AbortTransfer' in retVal and retVal[ 'AbortTransfer' ]:
       self.oTransport.sendData( S_OK() )
@@ -100,12 +312,38 @@ class FileHelper:
       return S_OK( "" )
     return S_OK( stBuffer[1] )
 
+  def __receiveRawHeader( self, maxBufferSize = 0 ):
+    """
+    Receive the header of the next raw packet. Returns the size of the packet,
+    or 0 if the transmission has finished
+    """
+    retVal = self.oTransport.receiveData( maxBufferSize = maxBufferSize )
+    if 'AbortTransfer' in retVal and retVal[ 'AbortTransfer' ]:
+      self.oTransport.sendData( S_OK() )
+      self.__finishedTransmission()
+      self.bReceivedEOF = True
+      return S_OK( 0 )
+    if not retVal[ 'OK' ]:
+      return retVal
+    stBuffer = retVal[ 'Value' ]
+    if stBuffer[0]:
+      if maxBufferSize > 0 and stBuffer[1] > maxBufferSize:
+        return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+      return S_OK( stBuffer[1] )
+    self.bReceivedEOF = True
+    if self.__checkMD5 and not self.__oMD5.hexdigest() == stBuffer[1]:
+      self.bErrorInMD5 = True
+    self.__finishedTransmission()
+    return S_OK( 0 )
+
   def receivedEOF( self ):
     return self.bReceivedEOF
 
   def markAsTransferred( self ):
     if not self.bFinishedTransmission:
-      if self.direction == "receive":
+      if self.direction == "receive" and self.__rawTransfer:
+        self.__abortRawReception()
+      elif self.direction == "receive":
         self.oTransport.receiveData()
         abortTrans = S_OK()
         abortTrans[ 'AbortTransfer' ] = True
@@ -121,6 +359,9 @@ class FileHelper:
 
   def __finishedTransmission( self ):
     self.bFinishedTransmission = True
+    #The checksum of the data has been used or won't be
+    if isinstance( self.__oMD5, ChecksumThread ):
+      self.__oMD5.stop()
 
   def finishedTransmission( self ):
     return self.bFinishedTransmission
@@ -151,9 +392,11 @@ class FileHelper:
   def networkToDataSink( self, dataSink, maxFileSize = 0 ):
     if "write" not in dir( dataSink ):
       return S_ERROR( "%s data sink object does not have a write method" % str( dataSink ) )
-    self.__oMD5 = md5.md5()
+    self.__oMD5 = self.__newChecksum()
     self.bReceivedEOF = False
     self.bErrorInMD5 = False
+    if self.__rawTransfer:
+      return self.__rawNetworkToDataSink( dataSink, maxFileSize )
     receivedBytes = 0
     try:
       result = self.receiveData( maxBufferSize = maxFileSize )
@@ -180,6 +423,93 @@ class FileHelper:
     self.__fileBytes = receivedBytes
     return S_OK()
 
+  def __rawNetworkToDataSink( self, dataSink, maxFileSize ):
+    """
+    Receive the raw packets in reused buffers, written to the sink while
+    the checksum of the previous ones is computed
+    """
+    freeBuffers = self.__getBufferQueue()
+    receivedBytes = 0
+    result = self.__acceptRawReception()
+    if not result[ 'OK' ]:
+      return result
+    try:
+      while True:
+        result = self.__receiveRawHeader()
+        if not result[ 'OK' ]:
+          return result
+        packetSize = result[ 'Value' ]
+        if not packetSize:
+          break
+        receivedBytes += packetSize
+        if maxFileSize > 0 and receivedBytes > maxFileSize:
+          #The data of the packet whose header was read comes first
+          self.__abortRawReception( S_ERROR( "Exceeded maximum file size" ), pendingBytes = packetSize )
+          return S_ERROR( "Received file exceeded maximum size of %s bytes" % ( maxFileSize ) )
+        dataBuffer = freeBuffers.get()
+        if len( dataBuffer ) < packetSize:
+          dataBuffer = bytearray( packetSize )
+        result = self.oTransport.receiveRawData( dataBuffer, packetSize )
+        if not result[ 'OK' ]:
+          return result
+        #Files only take buffer objects, not memoryviews
+        packetView = buffer( dataBuffer, 0, packetSize )
+        dataSink.write( packetView )
+        if self.__checkMD5:
+          self.__oMD5.update( packetView, lambda dataBuffer = dataBuffer : freeBuffers.put( dataBuffer ) )
+        else:
+          freeBuffers.put( dataBuffer )
+    except Exception as e:
+      return S_ERROR( "Error while receiving file, %s" % str( e ) )
+    finally:
+      self.__stopChecksum()
+    if self.errorInTransmission():
+      return S_ERROR( "Error in the file CRC" )
+    self.__fileBytes = receivedBytes
+    return S_OK()
+
+  def __stopChecksum( self ):
+    """
+    Stop the checksum thread of a raw transfer, whatever the way it ended
+    """
+    if isinstance( self.__oMD5, ChecksumThread ):
+      self.__oMD5.stop()
+
+  def __getBufferQueue( self ):
+    freeBuffers = Queue.Queue()
+    for _i in range( FileHelper.RAW_BUFFERS ):
+      freeBuffers.put( bytearray( self.packetSize ) )
+    return freeBuffers
+
+  def __rawReaderToNetwork( self, readInto ):
+    """
+    Send the data read by readInto( buffer ) -> number of bytes, in reused buffers
+    """
+    freeBuffers = self.__getBufferQueue()
+    sentBytes = 0
+    try:
+      while True:
+        dataBuffer = freeBuffers.get()
+        readBytes = readInto( dataBuffer )
+        if not readBytes:
+          break
+        dRetVal = self.__sendRawData( memoryview( dataBuffer )[ :readBytes ],
+                                      lambda dataBuffer = dataBuffer : freeBuffers.put( dataBuffer ) )
+        if not dRetVal[ 'OK' ]:
+          return dRetVal
+        if dRetVal.get( 'AbortTransfer' ):
+          return S_OK()
+        sentBytes += readBytes
+      #Even empty files wait for the receiver to accept them
+      dRetVal = self.__receiveRawControl( wait = not self.__rawAccepted )
+      if not dRetVal[ 'OK' ] or dRetVal.get( 'AbortTransfer' ):
+        return S_OK() if dRetVal[ 'OK' ] else dRetVal
+      self.sendEOF()
+    finally:
+      self.__stopChecksum()
+    self.__fileBytes = sentBytes
+    return S_OK()
+
   def stringToNetwork( self, stringVal ):
     """ Send a given string to the DISET client over the network
     """
@@ -189,6 +519,9 @@ class FileHelper:
     iPacketSize = self.packetSize
     ioffset = 0
     strlen = len( stringVal )
+    if self.__rawTransfer:
+      #No copies, send slices of the string
+      stringVal = memoryview( stringVal )
     try:
       while ( ioffset ) < strlen:
         if ( ioffset + iPacketSize ) < strlen:
@@ -201,9 +534,15 @@ class FileHelper:
           self.__log.verbose( "Transfer aborted" )
           return S_OK()
         ioffset += iPacketSize
+      if self.__rawTransfer:
+        result = self.__receiveRawControl( wait = not self.__rawAccepted )
+        if not result[ 'OK' ] or result.get( 'AbortTransfer' ):
+          return S_OK() if result[ 'OK' ] else result
       self.sendEOF()
     except Exception as e:
       return S_ERROR( "Error while sending string: %s" % str( e ) )
+    finally:
+      self.__stopChecksum()
     try:
       stringIO.close()
     except:
@@ -211,10 +550,20 @@ class FileHelper:
     return S_OK()
 
   def FDToNetwork( self, iFD ):
-    self.__oMD5 = md5.md5()
+    self.__oMD5 = self.__newChecksum()
     iPacketSize = self.packetSize
     self.__fileBytes = 0
     sentBytes = 0
+    if self.__rawTransfer:
+      try:
+        dataSource = os.fdopen( os.dup( iFD ), "rb", 0 )
+        try:
+          return self.__rawReaderToNetwork( dataSource.readinto )
+        finally:
+          dataSource.close()
+      except Exception as e:
+        gLogger.exception( "Error while sending file" )
+        return S_ERROR( "Error while sending file: %s" % str( e ) )
     try:
       sBuffer = os.read( iFD, iPacketSize )
       while len( sBuffer ) > 0:
@@ -243,10 +592,16 @@ class FileHelper:
   def DataSourceToNetwork( self, dataSource ):
     if "read" not in dir( dataSource ):
       return S_ERROR( "%s data source object does not have a read method" % str( dataSource ) )
-    self.__oMD5 = md5.md5()
+    self.__oMD5 = self.__newChecksum()
     iPacketSize = self.packetSize
     self.__fileBytes = 0
     sentBytes = 0
+    if self.__rawTransfer and "readinto" in dir( dataSource ):
+      try:
+        return self.__rawReaderToNetwork( dataSource.readinto )
+      except Exception as e:
+        gLogger.exception( "Error while sending file" )
+        return S_ERROR( "Error while sending file: %s" % str( e ) )
     try:
       sBuffer = dataSource.read( iPacketSize )
       while len( sBuffer ) > 0:
@@ -306,32 +661,40 @@ class FileHelper:
     result[ 'closeAfterUse' ] = closeAfter
     return result
 
-  def __createTar( self, fileList, wPipe, compress, autoClose = True ):
+  def __createTar( self, fileList, wPipe, codec, level = None, autoClose = True ):
     if 'write' in dir( wPipe ):
       filePipe = wPipe
     else:
       filePipe = os.fdopen( wPipe, "w" )
-    tarMode = "w|"
-    if compress:
-      tarMode = "w|bz2"
-
-    tar = tarfile.open( name = "Pipe", mode = tarMode, fileobj = filePipe )
+    writer = Compression.getCompressedWriter( filePipe, codec, level )
+    tar = tarfile.open( name = "Pipe", mode = "w|", fileobj = writer )
     for entry in fileList:
       tar.add( os.path.realpath( entry ), os.path.basename( entry ), recursive = True )
     tar.close()
+    writer.close()
     if autoClose:
       try:
         filePipe.close()
       except:
         pass
 
-  def bulkToNetwork( self, fileList, compress = True, onthefly = True ):
+  def bulkToNetwork( self, fileList, compress = True, onthefly = True, codec = None ):
+    """
+    Send a tar of the files. If compress is set the codec is chosen from the
+    files and the codecs of the peer unless one is given
+    """
+    level = None
+    if not compress:
+      codec = 'none'
+    elif not codec:
+      codec, level = Compression.chooseCodec( fileList, self.__peerCodecs )
+    self.__log.debug( "Sending bulk with codec %s" % codec )
     if not onthefly:
       try:
         filePipe, filePath = tempfile.mkstemp()
       except Exception as e:
         return S_ERROR( "Can't create temporary file to pregenerate the bulk: %s" % str( e ) )
-      self.__createTar( fileList, filePipe, compress )
+      self.__createTar( fileList, filePipe, codec, level )
       try:
         fo = file( filePath, 'rb' )
       except Exception as e:
@@ -345,7 +708,7 @@ class FileHelper:
       return result
     else:
       rPipe, wPipe = os.pipe()
-      thrd = threading.Thread( target = self.__createTar, args = ( fileList, wPipe, compress ) )
+      thrd = threading.Thread( target = self.__createTar, args = ( fileList, wPipe, codec, level ) )
       thrd.start()
       response = self.FDToNetwork( rPipe )
       try:
@@ -354,12 +717,10 @@ class FileHelper:
         pass
       return response
 
-  def __extractTar( self, destDir, rPipe, compress ):
+  def __extractTar( self, destDir, rPipe ):
     filePipe = os.fdopen( rPipe, "r" )
-    tarMode = "r|*"
-    if compress:
-      tarMode = "r|bz2"
-    tar = tarfile.open( mode = tarMode, fileobj = filePipe )
+    #The codec is detected from the data
+    tar = tarfile.open( mode = "r|*", fileobj = Compression.getDecompressedReader( filePipe ) )
     for tarInfo in tar:
       tar.extract( tarInfo, destDir )
     tar.close()
@@ -369,19 +730,20 @@ class FileHelper:
       pass
 
   def __receiveToPipe( self, wPipe, retList, maxFileSize ):
+    #networkToFD closes the pipe, closing it again could close a reused descriptor
     retList.append( self.networkToFD( wPipe, maxFileSize = maxFileSize ) )
-    try:
-      os.close( wPipe )
-    except:
-      pass
 
   def networkToBulk( self, destDir, compress = True, maxFileSize = 0 ):
+    """
+    Extract a received tar in destDir. Compress is kept for compatibility,
+    the codec is detected from the data
+    """
     retList = []
     rPipe, wPipe = os.pipe()
     thrd = threading.Thread( target = self.__receiveToPipe, args = ( wPipe, retList, maxFileSize ) )
     thrd.start()
     try:
-      self.__extractTar( destDir, rPipe, compress )
+      self.__extractTar( destDir, rPipe )
     except Exception as e:
       return S_ERROR( "Error while extracting bulk: %s" % e )
     thrd.join()
@@ -390,11 +752,8 @@ class FileHelper:
   def bulkListToNetwork( self, iFD, compress = True ):
     filePipe = os.fdopen( iFD, "r" )
     try:
-      tarMode = "r|"
-      if compress:
-        tarMode = "r|bz2"
       entries = []
-      tar = tarfile.open( mode = tarMode, fileobj = filePipe )
+      tar = tarfile.open( mode = "r|*", fileobj = Compression.getDecompressedReader( filePipe ) )
       for tarInfo in tar:
         entries.append( tarInfo.name )
       tar.close()
@@ -50,16 +50,21 @@ class GatewayService( Service ):
     return S_OK()
 
   #Threaded process function
-  def _processInThread( self, clientTransport ):
-    #Handshake
-    try:
-      clientTransport.handshake()
-    except:
-      return
-    #Add to the transport pool
-    trid = self._transportPool.add( clientTransport )
+  def _processInThread( self, clientTransport, trid = None, queuedTime = None ):
     if not trid:
-      return
+      #Handshake
+      try:
+        result = clientTransport.handshake()
+        if not result[ 'OK' ]:
+          clientTransport.close()
+          return
+      except:
+        clientTransport.close()
+        return
+      #Add to the transport pool
+      trid = self._transportPool.add( clientTransport )
+      if not trid:
+        return
     #Receive and check proposal
     result = self._receiveAndCheckProposal( trid )
     if not result[ 'OK' ]:
@@ -188,6 +193,9 @@ class GatewayService( Service ):
     elif actionType == "RPC":
       gLogger.info( "Forwarding %s/%s action to %s for %s" % ( actionType, actionMethod, targetService, idString ) )
       retVal = self.__forwardRPCCall( targetService, clientInitArgs, actionMethod, retVal[ 'Value' ] )
+    elif actionType == "RPCBatch":
+      gLogger.info( "Forwarding %s/%s action to %s for %s" % ( actionType, actionMethod, targetService, idString ) )
+      retVal = RPCClient( targetService, **clientInitArgs ).executeRPCBatch( retVal[ 'Value' ] )
     elif actionType == "Connection" and actionMethod == "new":
       gLogger.info( "Initiating a messaging connection to %s for %s" % ( targetService, idString ) )
       retVal = self._msgForwarder.addClient( trid, targetService, clientInitArgs, retVal[ 'Value' ] )
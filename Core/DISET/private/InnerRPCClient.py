@@ -1,9 +1,14 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import time
 import types
+import random
 from DIRAC.Core.DISET.private.BaseClient import BaseClient
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
+from DIRAC.Core.Utilities.DEncode import StreamDecoder
+from DIRAC.Core.Utilities import DErrno
+from DIRAC.Core.Utilities.DErrno import cmpError
 
 
 class InnerRPCClient( BaseClient ):
@@ -17,6 +22,7 @@ class InnerRPCClient( BaseClient ):
       retVal[ 'rpcStub' ] = stub
       return retVal
     trid, transport = retVal[ 'Value' ]
+    reusable = False
     try:
       retVal = self._proposeAction( transport, ( "RPC", functionName ) )
       if not retVal['OK']:
@@ -26,6 +32,9 @@ class InnerRPCClient( BaseClient ):
         else:  # we have network problem or the service is not responding  
           if self.__retry < 3:
             self.__retry += 1
+            if cmpError( retVal, DErrno.ESERVICEBUSY ):
+              #The service rejected the query because it's overloaded, give it some time
+              time.sleep( random.uniform( 0.5, 1.5 ) * self.__retry )
             return self.executeRPC( functionName, args )
           else:
             retVal[ 'rpcStub' ] = stub
@@ -35,9 +44,103 @@ class InnerRPCClient( BaseClient ):
       if not retVal[ 'OK' ]:
         return retVal
       receivedData = transport.receiveData()
+      #Error replies of the service leave the connection usable, only reuse it if the
+      #whole reply was received
+      reusable = transport.lastReceiveComplete
       if type( receivedData ) == types.DictType:
         receivedData[ 'rpcStub' ] = stub
       return receivedData
     finally:
-      self._disconnect( trid )
+      self._disconnect( trid, reusable )
 
+  def executeRPCBatch( self, calls ):
+    """
+    Execute several RPC calls in one action. calls is a list of ( functionName, args ).
+    Returns S_OK with the list of results of the calls in the same order
+    """
+    calls = [ ( functionName, tuple( args ) ) for functionName, args in calls ]
+    if not calls:
+      return S_OK( [] )
+    stub = ( self._getBaseStub(), "executeRPCBatch", ( calls, ) )
+    retVal = self._connect()
+    if not retVal[ 'OK' ]:
+      retVal[ 'rpcStub' ] = stub
+      return retVal
+    trid, transport = retVal[ 'Value' ]
+    reusable = False
+    try:
+      methods = ",".join( sorted( set( [ call[0] for call in calls ] ) ) )
+      retVal = self._proposeAction( transport, ( "RPCBatch", methods ) )
+      if not retVal[ 'OK' ]:
+        retVal[ 'rpcStub' ] = stub
+        return retVal
+      retVal = transport.sendData( S_OK( calls ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+      receivedData = transport.receiveData()
+      reusable = transport.lastReceiveComplete
+      if type( receivedData ) == types.DictType:
+        receivedData[ 'rpcStub' ] = stub
+      return receivedData
+    finally:
+      self._disconnect( trid, reusable )
+
+  def executeRPCStream( self, functionName, args, streamPath = ( 'Value', ) ):
+    """
+    Execute a RPC call whose result is decoded while it is received. Iterating over
+    the returned RPCStream yields the items of the container at streamPath in the
+    result (see DEncode.StreamDecoder), the rest of the result is in its result
+    attribute once the iteration is over
+    """
+    return RPCStream( self, functionName, args, streamPath )
+
+
+class RPCStream( object ):
+
+  def __init__( self, rpcClient, functionName, args, streamPath ):
+    self.__rpcClient = rpcClient
+    self.__functionName = functionName
+    self.__args = args
+    self.__streamPath = streamPath
+    self.result = S_ERROR( "RPC stream has not been read" )
+
+  def __iter__( self ):
+    rpcClient = self.__rpcClient
+    stub = ( rpcClient._getBaseStub(), self.__functionName, self.__args )
+    retVal = rpcClient._connect()
+    if not retVal[ 'OK' ]:
+      retVal[ 'rpcStub' ] = stub
+      self.result = retVal
+      return
+    trid, transport = retVal[ 'Value' ]
+    reusable = False
+    try:
+      retVal = rpcClient._proposeAction( transport, ( "RPC", self.__functionName ) )
+      if not retVal[ 'OK' ]:
+        retVal[ 'rpcStub' ] = stub
+        self.result = retVal
+        return
+      retVal = transport.sendData( S_OK( self.__args ) )
+      if not retVal[ 'OK' ]:
+        self.result = retVal
+        return
+      decoder = StreamDecoder( self.__streamPath )
+      try:
+        for retVal in transport.receiveDataChunks():
+          if not retVal[ 'OK' ]:
+            self.result = retVal
+            return
+          for item in decoder.feed( retVal[ 'Value' ] ):
+            yield item
+        for item in decoder.finish():
+          yield item
+      except ValueError as e:
+        self.result = S_ERROR( "Could not decode received data: %s" % str( e ) )
+        return
+      self.result = decoder.getEnvelope()
+      #The whole reply has been received and decoded
+      reusable = True
+      if type( self.result ) == types.DictType:
+        self.result[ 'rpcStub' ] = stub
+    finally:
+      rpcClient._disconnect( trid, reusable )
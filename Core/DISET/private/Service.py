@@ -5,12 +5,14 @@ import DIRAC
 import threading
 from DIRAC import gConfig, gLogger, S_OK, S_ERROR
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
-from DIRAC.Core.Utilities import Time, MemStat
+from DIRAC.Core.Utilities import Time, MemStat, DErrno
 from DIRAC.Core.DISET.private.LockManager import LockManager
 from DIRAC.FrameworkSystem.Client.MonitoringClient import MonitoringClient
 from DIRAC.Core.DISET.private.ServiceConfiguration import ServiceConfiguration
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.ConnectionPool import getConnectionPoolStats
 from DIRAC.Core.DISET.private.MessageBroker import MessageBroker, MessageSender
+from DIRAC.Core.DISET.private.ActionStats import ActionStats
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC.Core.Utilities.ThreadPool import ThreadPool
 from DIRAC.Core.Utilities.ReturnValues import isReturnStructure
@@ -24,6 +26,10 @@ class Service( object ):
                         'FileTransfer': 'transfer',
                         'Message' : 'msg',
                         'Connection' : 'Message' }
+  #Several RPC calls in one action, each of them authorized as a RPC
+  SVC_BATCH_ACTION = 'RPCBatch'
+  #Priority classes of the actions, the first ones are served first
+  SVC_PRIORITY_CLASSES = ( 'High', 'Normal', 'Low' )
   SVC_SECLOG_CLIENT = SecurityLogClient()
 
   def __init__( self, serviceData ):
@@ -44,6 +50,11 @@ class Service( object ):
     self._transportPool = getGlobalTransportPool()
     self.__cloneId = 0
     self.__maxFD = 0
+    self.__idleConnectionCallback = None
+    self._actionStats = ActionStats()
+    #Number of actions waiting in the queue of each priority class
+    self.__queuedActions = [ 0 ] * len( Service.SVC_PRIORITY_CLASSES )
+    self.__queueLock = threading.Lock()
 
   def setCloneProcessId( self, cloneId ):
     self.__cloneId = cloneId
@@ -80,6 +91,7 @@ class Service( object ):
                               'URL' : self._cfg.getURL(),
                               'messageSender' : MessageSender( self._name, self._msgBroker ),
                               'validNames' : self._validNames,
+                              'actionStats' : self._actionStats,
                               'csPaths' : [ PathFinder.getServiceSection( svcName ) for svcName in self._validNames ]
                              }
     #Call static initialization function
@@ -222,6 +234,15 @@ class Service( object ):
     self._monitor.registerActivity( 'ActiveQueries', "Active queries", 'Framework', 'threads', MonitoringClient.OP_MEAN )
     self._monitor.registerActivity( 'RunningThreads', "Running threads", 'Framework', 'threads', MonitoringClient.OP_MEAN )
     self._monitor.registerActivity( 'MaxFD', "Max File Descriptors", 'Framework', 'fd', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'RejectedQueries', "Queries rejected", "Framework", "queries", MonitoringClient.OP_RATE )
+    for priorityClass in Service.SVC_PRIORITY_CLASSES:
+      self._monitor.registerActivity( 'Pending%sQueries' % priorityClass, "Pending %s priority queries" % priorityClass.lower(),
+                                      'Framework', 'queries', MonitoringClient.OP_MEAN )
+    #Connections of the clients used by the service
+    self._monitor.registerActivity( 'PooledConnections', "Idle pooled client connections", 'Framework',
+                                    'connections', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'PoolHitRate', "Client connection pool hit rate", 'Framework',
+                                    '%', MonitoringClient.OP_MEAN )
 
     self._monitor.setComponentExtraParam( 'DIRACVersion', DIRAC.version )
     self._monitor.setComponentExtraParam( 'platform', DIRAC.platform )
@@ -244,22 +265,50 @@ class Service( object ):
     self._monitor.addMark( 'ActiveQueries', self._threadPool.numWorkingThreads() )
     self._monitor.addMark( 'RunningThreads', threading.activeCount() )
     self._monitor.addMark( 'MaxFD', self.__maxFD )
+    for priority, priorityClass in enumerate( Service.SVC_PRIORITY_CLASSES ):
+      self._monitor.addMark( 'Pending%sQueries' % priorityClass, self.__queuedActions[ priority ] )
+    poolStats = getConnectionPoolStats()
+    if poolStats:
+      self._monitor.addMark( 'PooledConnections', poolStats[ 'IdleConnections' ] )
+      self._monitor.addMark( 'PoolHitRate', 100. * poolStats[ 'HitRate' ] )
     self.__maxFD = 0
 
 
   def getConfig( self ):
     return self._cfg
 
+  def setIdleConnectionCallback( self, idleConnectionCallback ):
+    """
+    Set the function used to give back connections that wait for another request.
+    It is called as idleConnectionCallback( service, clientTransport, trid ).
+    Without it connections are closed after serving one request
+    """
+    self.__idleConnectionCallback = idleConnectionCallback
+
   #End of initialization functions
 
-  def handleConnection( self, clientTransport ):
+  def handleConnection( self, clientTransport, trid = None ):
+    """
+    Process a connection in the thread pool. If trid is given the connection
+    has already been established and is waiting for a new request
+    """
     self._stats[ 'connections' ] += 1
     self._monitor.setComponentExtraParam( 'queries', self._stats[ 'connections' ] )
+    #New connections wait with the priority of the Handshake class, so that they
+    #don't overtake the queued actions of the Normal and Low classes
     self._threadPool.generateJobAndQueueIt( self._processInThread,
-                                             args = ( clientTransport, ) )
+                                             args = ( clientTransport, trid, time.time() ),
+                                             iPriority = self.__getHandshakePriority() )
 
   #Threaded process function
-  def _processInThread( self, clientTransport ):
+  def _processInThread( self, clientTransport, trid = None, queuedTime = None ):
+    startTime = time.time()
+    #Time spent in each phase of the request
+    phaseTimes = {}
+    if queuedTime:
+      phaseTimes[ 'Queue' ] = startTime - queuedTime
+    else:
+      queuedTime = startTime
     self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
     self._lockManager.lockGlobal()
     try:
@@ -267,43 +316,127 @@ class Service( object ):
     except Exception:
       monReport = False
     try:
-      #Handshake
-      try:
-        result = clientTransport.handshake()
-        if not result[ 'OK' ]:
-          clientTransport.close()
-          return
-      except:
-        return
-      #Add to the transport pool
-      trid = self._transportPool.add( clientTransport )
       if not trid:
-        return
+        #Handshake
+        try:
+          result = clientTransport.handshake()
+          if not result[ 'OK' ]:
+            clientTransport.close()
+            return
+        except:
+          return
+        phaseTimes[ 'Handshake' ] = time.time() - startTime
+        #Add to the transport pool
+        trid = self._transportPool.add( clientTransport )
+        if not trid:
+          return
       #Receive and check proposal
       result = self._receiveAndCheckProposal( trid )
       if not result[ 'OK' ]:
         self._transportPool.sendAndClose( trid, result )
         return
       proposalTuple = result[ 'Value' ]
+      phaseTimes[ 'Authorization' ] = result[ 'authorizationTime' ]
       #Instantiate handler
       result = self._instantiateHandler( trid, proposalTuple )
       if not result[ 'OK' ]:
         self._transportPool.sendAndClose( trid, result )
         return
       handlerObj = result[ 'Value' ]
-      #Execute the action
-      result = self._processProposal( trid, proposalTuple, handlerObj )
-      #Close the connection if required
-      if result[ 'closeTransport' ] or not result[ 'OK' ]:
+      actionArgs = ( clientTransport, trid, proposalTuple, handlerObj, phaseTimes, queuedTime )
+      #If other requests are waiting the action goes to the queue of its priority class,
+      #unless that queue is full
+      if self._threadPool.pendingJobs():
+        result = self.__queueAction( actionArgs )
         if not result[ 'OK' ]:
-          gLogger.error( "Error processing proposal", result[ 'Message' ] )
-        self._transportPool.close( trid )
-      return result
+          self._monitor.addMark( 'RejectedQueries' )
+          gLogger.warn( "Rejected query", "%s: %s" % ( "/".join( proposalTuple[1] ), result[ 'Message' ] ) )
+          self._transportPool.sendAndClose( trid, result )
+        return result
+      return self.__executeAction( *actionArgs )
     finally:
       self._lockManager.unlockGlobal()
       if monReport:
         self.__endReportToMonitoring( *monReport )
 
+  def __getHandshakePriority( self ):
+    """
+    Priority class of the reception of new requests, Normal by default
+    """
+    priorityClass = self._cfg.getHandshakePriority()
+    if priorityClass not in Service.SVC_PRIORITY_CLASSES:
+      return Service.SVC_PRIORITY_CLASSES.index( 'Normal' )
+    return Service.SVC_PRIORITY_CLASSES.index( priorityClass )
+
+  def __getActionPriority( self, actionTuple ):
+    """
+    Priority class of an action, the highest one of its methods for batches
+    """
+    if actionTuple[0] == Service.SVC_BATCH_ACTION:
+      return min( [ self.__getActionPriority( ( 'RPC', method ) ) for method in actionTuple[1].split( "," ) ] )
+    priorityClass = self._cfg.getActionPriority( actionTuple[0], actionTuple[1] )
+    if priorityClass not in Service.SVC_PRIORITY_CLASSES:
+      return Service.SVC_PRIORITY_CLASSES.index( 'Normal' )
+    return Service.SVC_PRIORITY_CLASSES.index( priorityClass )
+
+  def __queueAction( self, actionArgs ):
+    """
+    Queue the execution of an action with the priority of its class. It fails
+    with a retryable error if there are too many actions of its class waiting
+    """
+    priority = self.__getActionPriority( actionArgs[2][1] )
+    priorityClass = Service.SVC_PRIORITY_CLASSES[ priority ]
+    self.__queueLock.acquire()
+    try:
+      if self.__queuedActions[ priority ] >= self._cfg.getMaxQueuedActions( priorityClass ):
+        return S_ERROR( DErrno.ESERVICEBUSY, "Too many %s priority queries waiting" % priorityClass )
+      self.__queuedActions[ priority ] += 1
+    finally:
+      self.__queueLock.release()
+    result = self._threadPool.generateJobAndQueueIt( self._executeInThread,
+                                                     args = ( priority, time.time(), actionArgs ),
+                                                     blocking = False,
+                                                     iPriority = priority )
+    if not result[ 'OK' ]:
+      self.__dequeueAction( priority )
+      return S_ERROR( DErrno.ESERVICEBUSY, "Too many queries waiting" )
+    return S_OK()
+
+  def __dequeueAction( self, priority ):
+    self.__queueLock.acquire()
+    try:
+      self.__queuedActions[ priority ] -= 1
+    finally:
+      self.__queueLock.release()
+
+  def _executeInThread( self, priority, queuedTime, actionArgs ):
+    """
+    Execute an action that waited in the queue of its priority class
+    """
+    self.__dequeueAction( priority )
+    phaseTimes = actionArgs[4]
+    phaseTimes[ 'Queue' ] = phaseTimes.get( 'Queue', 0 ) + time.time() - queuedTime
+    self._lockManager.lockGlobal()
+    try:
+      return self.__executeAction( *actionArgs )
+    finally:
+      self._lockManager.unlockGlobal()
+
+  def __executeAction( self, clientTransport, trid, proposalTuple, handlerObj, phaseTimes, queuedTime ):
+    #Execute the action
+    result = self._processProposal( trid, proposalTuple, handlerObj )
+    self.__recordAction( proposalTuple, handlerObj, phaseTimes, time.time() - queuedTime )
+    #Close the connection if required
+    if result[ 'closeTransport' ] or not result[ 'OK' ]:
+      if not result[ 'OK' ]:
+        gLogger.error( "Error processing proposal", result[ 'Message' ] )
+      if result[ 'OK' ] and self.__isPersistentProposal( proposalTuple ):
+        #Wait for the next request from the client
+        self.__idleConnectionCallback( self, clientTransport, trid )
+      else:
+        self._transportPool.close( trid )
+    return result
+
 
   def _createIdentityString( self, credDict, clientTransport = None ):
     if 'username' in credDict:
@@ -343,16 +476,55 @@ class Service( object ):
       return S_ERROR( "%s is not up in this server" % requestedService )
     #Check if the action is valid
     requestedActionType = proposalTuple[1][0]
-    if requestedActionType not in Service.SVC_VALID_ACTIONS:
+    if requestedActionType not in Service.SVC_VALID_ACTIONS and requestedActionType != Service.SVC_BATCH_ACTION:
       return S_ERROR( "%s is not a known action type" % requestedActionType )
     #Check if it's authorized
+    startTime = time.time()
     result = self._authorizeProposal( proposalTuple[1], trid, credDict )
     if not result[ 'OK' ]:
       return result
     #Proposal is OK
-    return S_OK( proposalTuple )
+    result = S_OK( proposalTuple )
+    result[ 'authorizationTime' ] = time.time() - startTime
+    return result
+
+  def __recordAction( self, proposalTuple, handlerObj, phaseTimes, totalTime ):
+    """
+    Account the times of a request, and log it if it was too slow
+    """
+    actionInfo = handlerObj._rh_getActionInfo()
+    phaseTimes[ 'Total' ] = totalTime
+    for phase in ( 'Execution', 'Serialization' ):
+      if phase in actionInfo:
+        phaseTimes[ phase ] = actionInfo[ phase ]
+    action = "/".join( proposalTuple[1] )
+    self._actionStats.record( action, phaseTimes, not actionInfo.get( 'OK', True ) )
+    if totalTime > self._cfg.getSlowCallThreshold():
+      phasesString = ", ".join( [ "%s %.2f s" % ( phase.lower(), phaseTimes[ phase ] )
+                                  for phase in ActionStats.PHASES[:-1] if phase in phaseTimes ] )
+      gLogger.warn( "Slow call", "%s(%s) took %.2f s: %s" % ( action, actionInfo.get( 'Args', '' ),
+                                                             totalTime, phasesString ) )
+
+  def __isPersistentProposal( self, proposalTuple ):
+    """
+    Clients can ask to keep the connection open after a RPC action
+    to send more requests, in the connection options of the proposal
+    """
+    if not self.__idleConnectionCallback or proposalTuple[1][0] not in ( 'RPC', Service.SVC_BATCH_ACTION ):
+      return False
+    try:
+      return bool( proposalTuple[3].get( 'persistent' ) )
+    except ( IndexError, AttributeError ):
+      return False
 
   def _authorizeProposal( self, actionTuple, trid, credDict ):
+    if actionTuple[0] == Service.SVC_BATCH_ACTION:
+      #The batch is authorized if all the methods it contains are
+      for method in actionTuple[1].split( "," ):
+        result = self._authorizeProposal( ( 'RPC', method ), trid, credDict )
+        if not result[ 'OK' ]:
+          return result
+      return S_OK()
     #Find CS path for the Auth rules
     referedAction = self._isMetaAction( actionTuple[0] )
     if referedAction:
@@ -431,7 +603,10 @@ class Service( object ):
 
   def _processProposal( self, trid, proposalTuple, handlerObj ):
     #Notify the client we're ready to execute the action
-    retVal = self._transportPool.send( trid, S_OK() )
+    readyMsg = S_OK()
+    if self.__isPersistentProposal( proposalTuple ):
+      readyMsg[ 'persistent' ] = True
+    retVal = self._transportPool.send( trid, readyMsg )
     if not retVal[ 'OK' ]:
       return retVal
 
@@ -80,6 +80,43 @@ class ServiceConfiguration:
     except:
       return 15
 
+  def getActionPriority( self, actionType, method ):
+    optionValue = self.getOption( "Priority/%s/%s" % ( actionType, method ) )
+    if optionValue:
+      return optionValue
+    return "Normal"
+
+  def getHandshakePriority( self ):
+    optionValue = self.getOption( "Priority/Handshake" )
+    if optionValue:
+      return optionValue
+    return "Normal"
+
+  def getMaxQueuedActions( self, priorityClass ):
+    try:
+      return int( self.getOption( "MaxQueuedQueries/%s" % priorityClass ) )
+    except:
+      #By default low priority queries are rejected earlier
+      return int( self.getMaxWaitingPetitions() * { 'High' : 1., 'Normal' : 0.5 }.get( priorityClass, 0.1 ) )
+
+  def getEventLoop( self ):
+    optionValue = self.getOption( "EventLoop" )
+    if optionValue:
+      return optionValue.lower()
+    return "select"
+
+  def getMaxIdleConnectionTime( self ):
+    try:
+      return int( self.getOption( "MaxIdleConnectionTime" ) )
+    except:
+      return 60
+
+  def getSlowCallThreshold( self ):
+    try:
+      return float( self.getOption( "SlowCallThreshold" ) )
+    except:
+      return 10.
+
   def getCloneProcesses( self ):
     try:
       return int( self.getOption( "CloneProcesses" ) )
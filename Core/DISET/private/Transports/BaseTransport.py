@@ -28,6 +28,8 @@ class BaseTransport( object ):
     self.startedKeepAlives = set()
     self.keepAliveId = md5( str( stServerAddress ) + str( bServerMode ) ).hexdigest()
     self.receivedMessages = []
+    #Whether the last receiveData got a whole message, even if it is an error reply
+    self.lastReceiveComplete = False
     self.sentKeepAlives = 0
     self.waitingForKeepAlivePong = False
     self.__keepAliveLapse = 0
@@ -138,7 +140,9 @@ class BaseTransport( object ):
 
   def receiveData( self, maxBufferSize = 0, blockAfterKeepAlive = True, idleReceive = False ):
     self.__updateLastActionTimestamp()
+    self.lastReceiveComplete = False
     if self.receivedMessages:
+      self.lastReceiveComplete = True
       return self.receivedMessages.pop( 0 )
     #Buffer size can't be less than 0
     maxBufferSize = max( maxBufferSize, 0 )
@@ -207,6 +211,7 @@ class BaseTransport( object ):
         data = DEncode.decode( data )[0]
       except Exception as e:
         return S_ERROR( "Could not decode received data: %s" % str( e ) )
+      self.lastReceiveComplete = True
       if idleReceive:
         self.receivedMessages.append( data )
         return S_OK()
@@ -215,6 +220,127 @@ class BaseTransport( object ):
       gLogger.exception( "Network error while receiving data" )
       return S_ERROR( "Network error while receiving data: %s" % str( e ) )
 
+  def sendRawData( self, data ):
+    """
+    Send data as it is, without encoding it in a message. Only for protocols where
+    the peer knows how many bytes to expect, like raw file transfers
+    """
+    dataView = memoryview( data )
+    sentBytes = 0
+    while sentBytes < len( dataView ):
+      self.__updateLastActionTimestamp()
+      try:
+        result = self._writeRaw( dataView[ sentBytes : sentBytes + self.packetSize ] )
+        if not result[ 'OK' ]:
+          return result
+      except Exception as e:
+        return S_ERROR( "Exception while sending data: %s" % e )
+      if result[ 'Value' ] == 0:
+        return S_ERROR( "Connection closed by peer" )
+      sentBytes += result[ 'Value' ]
+    return S_OK()
+
+  def receiveRawData( self, dataBuffer, size ):
+    """
+    Receive size bytes sent with sendRawData into the dataBuffer bytearray
+    """
+    bufferView = memoryview( dataBuffer )
+    readSize = min( len( self.byteStream ), size )
+    if readSize:
+      bufferView[ :readSize ] = self.byteStream[ :readSize ]
+      self.byteStream = self.byteStream[ readSize: ]
+    while readSize < size:
+      self.__updateLastActionTimestamp()
+      retVal = self._readInto( bufferView[ readSize : size ] )
+      if not retVal[ 'OK' ]:
+        return retVal
+      if not retVal[ 'Value' ]:
+        return S_ERROR( "Peer closed connection" )
+      readSize += retVal[ 'Value' ]
+    return S_OK( size )
+
+  def _writeRaw( self, dataView ):
+    return self._write( dataView.tobytes() )
+
+  def _readInto( self, bufferView ):
+    retVal = self._read( min( len( bufferView ), self.packetSize ), skipReadyCheck = True )
+    if not retVal[ 'OK' ]:
+      return retVal
+    data = retVal[ 'Value' ]
+    bufferView[ :len( data ) ] = data
+    return S_OK( len( data ) )
+
+  def receiveDataChunks( self, maxBufferSize = 0 ):
+    """
+    Generator version of receiveData. Yields S_OK( chunk ) with the encoded data of
+    the next message as it arrives instead of buffering and decoding it, so it can be
+    fed to a DEncode.StreamDecoder. In case of error it yields a S_ERROR and stops
+    """
+    self.__updateLastActionTimestamp()
+    if self.receivedMessages:
+      yield S_OK( DEncode.encode( self.receivedMessages.pop( 0 ) ) )
+      return
+    maxBufferSize = max( maxBufferSize, 0 )
+    keepAliveMagicLen = len( BaseTransport.keepAliveMagic )
+    try:
+      #Look either for message length of keep alive magic string
+      while True:
+        if self.byteStream.find( BaseTransport.keepAliveMagic, 0, keepAliveMagicLen ) == 0:
+          self.byteStream = self.byteStream[ keepAliveMagicLen: ]
+          result = self.__processKeepAlive( maxBufferSize, blockAfterKeepAlive = False )
+          if not result[ 'OK' ]:
+            yield result
+            return
+          continue
+        iSeparatorPosition = self.byteStream.find( ":", 0, 10 )
+        if iSeparatorPosition > -1:
+          break
+        if maxBufferSize and len( self.byteStream ) > maxBufferSize:
+          yield S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+          return
+        retVal = self._read( 16384 )
+        if not retVal[ 'OK' ]:
+          yield retVal
+          return
+        if not retVal[ 'Value' ]:
+          yield S_ERROR( "Peer closed connection" )
+          return
+        self.byteStream += retVal[ 'Value' ]
+      pkgSize = int( self.byteStream[ :iSeparatorPosition ] )
+      pkgData = self.byteStream[ iSeparatorPosition + 1: ]
+      if len( pkgData ) >= pkgSize:
+        self.byteStream = pkgData[ pkgSize: ]
+        yield S_OK( pkgData[ :pkgSize ] )
+        return
+      self.byteStream = ""
+      readSize = len( pkgData )
+      if pkgData:
+        yield S_OK( pkgData )
+      del pkgData
+      #Hand over the data as it is received
+      while readSize < pkgSize:
+        retVal = self._read( min( pkgSize - readSize, self.packetSize ), skipReadyCheck = True )
+        if not retVal[ 'OK' ]:
+          yield retVal
+          return
+        rcvData = retVal[ 'Value' ]
+        if not rcvData:
+          yield S_ERROR( "Peer closed connection" )
+          return
+        readSize += len( rcvData )
+        if readSize > pkgSize:
+          extraSize = readSize - pkgSize
+          self.byteStream = rcvData[ -extraSize: ]
+          rcvData = rcvData[ :-extraSize ]
+        if maxBufferSize and readSize > maxBufferSize:
+          yield S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+          return
+        self.__updateLastActionTimestamp()
+        yield S_OK( rcvData )
+    except Exception as e:
+      gLogger.exception( "Network error while receiving data" )
+      yield S_ERROR( "Network error while receiving data: %s" % str( e ) )
+
   def __processKeepAlive( self, maxBufferSize, blockAfterKeepAlive = True ):
     gLogger.debug( "Received Keep Alive" )
     #Next message down the stream will be the ka data
@@ -15,7 +15,7 @@ class PlainTransport( BaseTransport ):
     if 'timeout' in self.extraArgsDict:
       timeout = self.extraArgsDict[ 'timeout' ]
     try:
-      self.oSocket.create_connection( self.stServerAddress, timeout )
+      self.oSocket = socket.create_connection( self.stServerAddress, timeout )
     except socket.error , e:
       if e.args[0] != 115:
         return S_ERROR( "Can't connect: %s" % str( e ) )
@@ -83,6 +83,29 @@ class PlainTransport( BaseTransport ):
       except Exception as e:
         return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
 
+  def _readInto( self, bufferView ):
+    start = time.time()
+    timeout = False
+    if 'timeout' in self.extraArgsDict:
+      timeout = self.extraArgsDict[ 'timeout' ]
+    while True:
+      if timeout:
+        if time.time() - start > timeout:
+          return S_ERROR( "Socket read timeout exceeded" )
+      try:
+        return S_OK( self.oSocket.recv_into( bufferView ) )
+      except socket.error, e:
+        if e[0] == 11:
+          time.sleep( 0.001 )
+        else:
+          return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+      except Exception as e:
+        return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+
+  def _writeRaw( self, dataView ):
+    #Sockets can send from the buffer without copying it
+    return self._write( dataView )
+
   def _write( self, buffer ):
     sentBytes = 0
     timeout = False
@@ -1,28 +1,58 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import threading
 import GSI
 
 class SessionManager:
 
-  def __init__( self ):
+  def __init__( self, maxSessions = 1000 ):
     self.sessionsDict = {}
+    self.__maxSessions = maxSessions
+    self.__lock = threading.Lock()
 
   def __generateSession( self ):
     return GSI.SSL.Session()
 
   def get( self, sessionId ):
-    if sessionId not in self.sessionsDict:
-      self.sessionsDict[ sessionId ] = self.__generateSession()
-    return self.sessionsDict[ sessionId ]
+    self.__lock.acquire()
+    try:
+      if sessionId not in self.sessionsDict:
+        self.sessionsDict[ sessionId ] = self.__generateSession()
+      return self.sessionsDict[ sessionId ]
+    finally:
+      self.__lock.release()
 
   def isValid( self, sessionId ):
-    return sessionId in self.sessionsDict and self.sessionsDict[ sessionId ].valid()
+    self.__lock.acquire()
+    try:
+      return sessionId in self.sessionsDict and self.sessionsDict[ sessionId ].valid()
+    finally:
+      self.__lock.release()
 
   def free( self, sessionId ):
-    self.sessionsDict[ sessionId ].free()
+    self.__lock.acquire()
+    try:
+      self.sessionsDict.pop( sessionId ).free()
+    finally:
+      self.__lock.release()
 
   def set( self, sessionId, sessionObject ):
-    self.sessionsDict[ sessionId ] = sessionObject
-
-gSessionManager = SessionManager()
\ No newline at end of file
+    self.__lock.acquire()
+    try:
+      if sessionId not in self.sessionsDict and len( self.sessionsDict ) >= self.__maxSessions:
+        self.__purge()
+      self.sessionsDict[ sessionId ] = sessionObject
+    finally:
+      self.__lock.release()
+
+  def __purge( self ):
+    """
+    Make room for a new session, expired sessions go first
+    """
+    for sessionId in [ sId for sId in self.sessionsDict if not self.sessionsDict[ sId ].valid() ]:
+      del self.sessionsDict[ sessionId ]
+    while len( self.sessionsDict ) >= self.__maxSessions:
+      self.sessionsDict.popitem()
+
+gSessionManager = SessionManager()
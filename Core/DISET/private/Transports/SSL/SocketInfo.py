@@ -4,10 +4,12 @@ __RCSID__ = "$Id$"
 import time
 import copy
 import os.path
+import hashlib
 import GSI
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
 from DIRAC.Core.Utilities.Network import checkHostsMatch
 from DIRAC.Core.Utilities.LockRing import LockRing
+from DIRAC.Core.Utilities.DictCache import DictCache
 from DIRAC.Core.Security import Locations
 from DIRAC.Core.Security.X509Chain import X509Chain
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -19,6 +21,8 @@ class SocketInfo:
   __cachedCAsCRLs = False
   __cachedCAsCRLsLastLoaded = 0
   __cachedCAsCRLsLoadLock = LockRing().getLock()
+  #Credentials of the already seen peer chains, by chain fingerprint
+  __peerCredentialsCache = DictCache()
 
 
   def __init__( self, infoDict, sslContext = None ):
@@ -55,6 +59,35 @@ class SocketInfo:
     #Servers don't receive the whole chain, the last cert comes alone
     if not self.infoDict[ 'clientMode' ]:
       certList.insert( 0, self.sslSocket.get_peer_certificate() )
+      #The same proxies connect again and again, don't analyze them each time
+      cacheTime = int( self.__getValue( 'peerCredentialsCacheTime', 300 ) )
+      if cacheTime > 0:
+        fingerprint = self.__getChainFingerprint( certList )
+        credDict = SocketInfo.__peerCredentialsCache.get( fingerprint )
+        if not credDict:
+          credDict = self.__analyzePeerChain( certList )
+          retVal = credDict[ 'x509Chain' ].getRemainingSecs()
+          #Without the expiration of the chain it can't be known for how long they are valid
+          if not retVal[ 'OK' ]:
+            gLogger.warn( "Can't get the remaining time of the peer chain, not caching it", retVal[ 'Message' ] )
+          elif retVal[ 'Value' ] > 0:
+            validSecs = min( cacheTime, retVal[ 'Value' ] )
+            SocketInfo.__peerCredentialsCache.add( fingerprint, validSecs, credDict )
+        #The credentials dict gets modified by the transport and the authorization
+        credDict = dict( credDict )
+        self.infoDict[ 'peerCredentials' ] = credDict
+        return credDict
+    credDict = self.__analyzePeerChain( certList )
+    self.infoDict[ 'peerCredentials' ] = credDict
+    return credDict
+
+  def __getChainFingerprint( self, certList ):
+    sha1 = hashlib.sha1()
+    for cert in certList:
+      sha1.update( GSI.crypto.dump_certificate( GSI.crypto.FILETYPE_PEM, cert ) )
+    return sha1.hexdigest()
+
+  def __analyzePeerChain( self, certList ):
     peerChain = X509Chain( certList = certList )
     isProxyChain = peerChain.isProxy()['Value']
     isLimitedProxyChain = peerChain.isLimitedProxy()['Value']
@@ -73,7 +106,6 @@ class SocketInfo:
     diracGroup = peerChain.getDIRACGroup()
     if diracGroup[ 'OK' ] and diracGroup[ 'Value' ]:
       credDict[ 'group' ] = diracGroup[ 'Value' ]
-    self.infoDict[ 'peerCredentials' ] = credDict
     return credDict
 
   def setSSLSocket( self, sslSocket ):
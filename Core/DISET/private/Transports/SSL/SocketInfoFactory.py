@@ -95,15 +95,11 @@ class SocketInfoFactory:
         return S_ERROR( "Can't connect: %s" % str( ( errno, os.strerror( errno ) ) ) )
     return S_OK( osSocket )
 
-  def __connect( self, socketInfo, hostAddress ):
-    #Connect baby!
-    result = self.__socketConnect( hostAddress, socketInfo.infoDict[ 'timeout' ] )
-    if not result[ 'OK' ]:
-      return result
-    osSocket = result[ 'Value' ]
-    #SSL MAGIC
-    sslSocket = GSI.SSL.Connection( socketInfo.getSSLContext(), osSocket )
-    #Generate sessionId
+  def __getSessionId( self, socketInfo, hostAddress ):
+    """
+    A session can only be resumed when connecting to the same server with
+    the same local credentials
+    """
     sessionHash = md5.md5()
     sessionHash.update( str( hostAddress ) )
     sessionHash.update( "|%s" % str( socketInfo.getLocalCredentialsLocation() ) )
@@ -112,10 +108,22 @@ class SocketInfoFactory:
         sessionHash.update( "|%s" % str( socketInfo.infoDict[ key ] ) )
     if 'proxyChain' in socketInfo.infoDict:
       sessionHash.update( "|%s" % socketInfo.infoDict[ 'proxyChain' ].dumpAllToString()[ 'Value' ] )
-    sessionId = sessionHash.hexdigest()
+    return sessionHash.hexdigest()
+
+  def __connect( self, socketInfo, hostAddress ):
+    #Connect baby!
+    result = self.__socketConnect( hostAddress, socketInfo.infoDict[ 'timeout' ] )
+    if not result[ 'OK' ]:
+      return result
+    osSocket = result[ 'Value' ]
+    #SSL MAGIC
+    sslSocket = GSI.SSL.Connection( socketInfo.getSSLContext(), osSocket )
+    sessionId = self.__getSessionId( socketInfo, hostAddress )
+    socketInfo.infoDict[ 'sessionId' ] = sessionId
     socketInfo.sslContext.set_session_id( str( hash( sessionId ) ) )
     socketInfo.setSSLSocket( sslSocket )
-    if gSessionManager.isValid( sessionId ):
+    #Resume the previous session to this server with the same credentials
+    if socketInfo.infoDict[ 'enableSessions' ] and gSessionManager.isValid( sessionId ):
       sslSocket.set_session( gSessionManager.get( sessionId ) )
     #Set the real timeout
     if socketInfo.infoDict[ 'timeout' ]:
@@ -154,9 +162,9 @@ class SocketInfoFactory:
     #Did the auth or the connection fail?
     if not retVal['OK']:
       return retVal
-    if 'enableSessions' in kwargs and kwargs[ 'enableSessions' ]:
-      sessionId = hash( hostAddress )
-      gSessionManager.set( sessionId, sslSocket.get_session() )
+    if socketInfo.infoDict[ 'enableSessions' ] and not sslSocket.session_reused():
+      #Store it under the same id it will be looked for in the next connection
+      gSessionManager.set( socketInfo.infoDict[ 'sessionId' ], sslSocket.get_session() )
     return S_OK( socketInfo )
 
   def getListeningSocket( self, hostAddress, listeningQueueSize = 5, reuseAddress = True, **kwargs ):
@@ -0,0 +1,49 @@
+""" Test cases for DIRAC.Core.DISET.private.ActionStats
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC.Core.DISET.private.ActionStats import ActionStats
+
+class ActionStatsTestCase( unittest.TestCase ):
+  """ Accounting of the call times
+  """
+
+  def testRecord( self ):
+    """ phases are accounted in their histogram bucket
+    """
+    actionStats = ActionStats()
+    for i in xrange( 100 ):
+      actionStats.record( "RPC/getJobs", { 'Queue' : 0.0005, 'Execution' : 0.02 if i < 90 else 3., 'Total' : 3.5 },
+                          failed = i < 10 )
+    actionStats.record( "RPC/ping", { 'Execution' : 100. } )
+    stats = actionStats.getStats()
+    self.assertEqual( stats[ 'Buckets' ], list( ActionStats.BUCKETS ) )
+    getJobs = stats[ 'Actions' ][ 'RPC/getJobs' ]
+    self.assertEqual( ( getJobs[ 'Calls' ], getJobs[ 'Errors' ] ), ( 100, 10 ) )
+    self.assertEqual( getJobs[ 'Queue' ][ 'Histogram' ][0], 100 )
+    self.assertEqual( getJobs[ 'Handshake' ][ 'Count' ], 0 )
+    execution = getJobs[ 'Execution' ]
+    self.assertEqual( execution[ 'Histogram' ][ ActionStats.BUCKETS.index( 0.025 ) ], 90 )
+    self.assertEqual( execution[ 'Histogram' ][ ActionStats.BUCKETS.index( 5. ) ], 10 )
+    self.assertAlmostEqual( execution[ 'Mean' ], ( 90 * 0.02 + 10 * 3. ) / 100 )
+    self.assertEqual( ( execution[ 'P50' ], execution[ 'P95' ], execution[ 'Max' ] ), ( 0.025, 3., 3. ) )
+    ping = stats[ 'Actions' ][ 'RPC/ping' ][ 'Execution' ]
+    self.assertEqual( ( ping[ 'Histogram' ][-1], ping[ 'P95' ] ), ( 1, 100. ) )
+
+  def testReset( self ):
+    """ the stats are a copy, reset clears them
+    """
+    actionStats = ActionStats()
+    actionStats.record( "RPC/ping", { 'Total' : 1. } )
+    stats = actionStats.getStats()
+    stats[ 'Actions' ][ 'RPC/ping' ][ 'Total' ][ 'Histogram' ][0] = 5
+    self.assertEqual( actionStats.getStats()[ 'Actions' ][ 'RPC/ping' ][ 'Total' ][ 'Histogram' ][0], 0 )
+    actionStats.reset()
+    self.assertEqual( actionStats.getStats()[ 'Actions' ], {} )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ActionStatsTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
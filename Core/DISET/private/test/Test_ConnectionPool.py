@@ -0,0 +1,83 @@
+""" Test cases for DIRAC.Core.DISET.private.ConnectionPool
+"""
+
+__RCSID__ = "$Id$"
+
+import socket
+import unittest
+
+from DIRAC.Core.DISET.private.ConnectionPool import ConnectionPool
+from DIRAC import S_ERROR
+from DIRAC.Core.Utilities import DEncode
+from DIRAC.Core.DISET.private.Transports.BaseTransport import BaseTransport
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+class ConnectionPoolTestCase( unittest.TestCase ):
+  """ Test case for the client connection pool
+  """
+
+  def setUp( self ):
+    self.pool = ConnectionPool( maxIdleTime = 30, maxPerHost = 2 )
+    self.peers = []
+
+  def tearDown( self ):
+    for peer in self.peers:
+      peer.close()
+
+  def __getTransport( self, address = ( 'server.cern.ch', 9135 ) ):
+    """ transport connected to a local socket
+    """
+    localSocket, peerSocket = socket.socketpair()
+    transport = BaseTransport( address )
+    transport.oSocket = localSocket
+    self.peers.append( peerSocket )
+    return transport
+
+  def testReuse( self ):
+    """ released connections are given back for the same key only
+    """
+    transport = self.__getTransport()
+    self.assertEqual( self.pool.get( 'key' ), None )
+    self.pool.release( 'key', transport )
+    self.assertEqual( self.pool.get( 'otherKey' ), None )
+    self.assertTrue( self.pool.get( 'key' ) is transport )
+    self.assertEqual( self.pool.get( 'key' ), None )
+    stats = self.pool.getStats()
+    self.assertEqual( ( stats[ 'Hits' ], stats[ 'Misses' ] ), ( 1, 3 ) )
+
+  def testMaxPerHost( self ):
+    """ no more than maxPerHost idle connections to the same server
+    """
+    for _i in range( 3 ):
+      self.pool.release( 'key', self.__getTransport() )
+    self.pool.release( 'key', self.__getTransport( ( 'other.cern.ch', 9135 ) ) )
+    stats = self.pool.getStats()
+    self.assertEqual( ( stats[ 'IdleConnections' ], stats[ 'Evictions' ] ), ( 3, 1 ) )
+
+  def testHealthCheck( self ):
+    """ connections closed by the server are discarded
+    """
+    self.pool.release( 'key', self.__getTransport() )
+    self.peers[0].close()
+    self.assertEqual( self.pool.get( 'key' ), None )
+    self.assertEqual( self.pool.getStats()[ 'Evictions' ], 1 )
+
+  def testCompleteReceive( self ):
+    """ error replies leave the connection reusable, unlike interrupted ones
+    """
+    localSocket, peerSocket = socket.socketpair()
+    self.peers.append( peerSocket )
+    transport = PlainTransport( ( 'server.cern.ch', 9135 ) )
+    transport.oSocket = localSocket
+    data = DEncode.encode( S_ERROR( "No such job" ) )
+    peerSocket.sendall( "%s:%s" % ( len( data ), data ) )
+    self.assertFalse( transport.receiveData()[ 'OK' ] )
+    self.assertTrue( transport.lastReceiveComplete )
+    peerSocket.sendall( "%s:%s" % ( len( data ), data[:-1] ) )
+    peerSocket.close()
+    self.assertFalse( transport.receiveData()[ 'OK' ] )
+    self.assertFalse( transport.lastReceiveComplete )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ConnectionPoolTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
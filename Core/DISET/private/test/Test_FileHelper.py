@@ -0,0 +1,168 @@
+""" Test cases for DIRAC.Core.DISET.private.FileHelper transfers
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import socket
+import shutil
+import hashlib
+import tempfile
+import unittest
+import threading
+import cStringIO
+
+from DIRAC.Core.DISET.private.FileHelper import FileHelper
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+class FileHelperTestCase( unittest.TestCase ):
+  """ Transfers between two FileHelpers connected by a socket pair
+  """
+
+  def setUp( self ):
+    senderSocket, receiverSocket = socket.socketpair()
+    self.senderTransport = PlainTransport( 'sender' )
+    self.senderTransport.setClientSocket( senderSocket )
+    self.receiverTransport = PlainTransport( 'receiver' )
+    self.receiverTransport.setClientSocket( receiverSocket )
+    self.data = os.urandom( 3 * 1048576 + 12345 )
+
+  def tearDown( self ):
+    self.senderTransport.close()
+    self.receiverTransport.close()
+
+  def __getHelpers( self, rawTransfer, checkSum = True ):
+    sender = FileHelper( self.senderTransport, checkSum )
+    sender.setRawTransfer( rawTransfer )
+    sender.packetSize = 1048576
+    receiver = FileHelper( self.receiverTransport, checkSum )
+    receiver.setRawTransfer( rawTransfer )
+    return sender, receiver
+
+  def __transfer( self, sendFunction, receiveFunction ):
+    """ send in a thread and receive in this one
+    """
+    sendResult = []
+    sender = threading.Thread( target = lambda: sendResult.append( sendFunction() ) )
+    sender.start()
+    result = receiveFunction()
+    sender.join()
+    return sendResult[0], result
+
+  def testStringTransfer( self ):
+    """ strings sent in both modes, with and without checksum
+    """
+    for rawTransfer in ( False, True ):
+      for checkSum in ( True, False ):
+        sender, receiver = self.__getHelpers( rawTransfer, checkSum )
+        sendResult, result = self.__transfer( lambda: sender.stringToNetwork( self.data ), receiver.networkToString )
+        self.assertTrue( sendResult[ 'OK' ], sendResult )
+        self.assertTrue( result[ 'OK' ], result )
+        self.assertEqual( result[ 'Value' ], self.data )
+        self.assertTrue( receiver.finishedTransmission() )
+
+  def testFileTransfer( self ):
+    """ raw transfer from a file descriptor, with the checksum of the data
+    """
+    fd, path = tempfile.mkstemp()
+    try:
+      os.write( fd, self.data )
+      os.lseek( fd, 0, os.SEEK_SET )
+      sender, receiver = self.__getHelpers( True )
+      sink = tempfile.TemporaryFile()
+      sendResult, result = self.__transfer( lambda: sender.FDToNetwork( fd ),
+                                            lambda: receiver.networkToDataSink( sink ) )
+      self.assertTrue( sendResult[ 'OK' ], sendResult )
+      self.assertTrue( result[ 'OK' ], result )
+      sink.seek( 0 )
+      self.assertEqual( sink.read(), self.data )
+      self.assertEqual( receiver.getTransferedBytes(), len( self.data ) )
+      self.assertEqual( receiver.getHash(), hashlib.md5( self.data ).hexdigest() )
+      self.assertEqual( sender.getHash(), receiver.getHash() )
+    finally:
+      os.close( fd )
+      os.unlink( path )
+
+  def testMaxFileSize( self ):
+    """ the receiver stops when the data is bigger than allowed
+    """
+    sender, receiver = self.__getHelpers( True )
+    sender.packetSize = 65536
+    _sendResult, result = self.__transfer( lambda: sender.stringToNetwork( self.data[ :150000 ] ),
+                                           lambda: receiver.networkToDataSink( cStringIO.StringIO(),
+                                                                               maxFileSize = 100000 ) )
+    self.assertFalse( result[ 'OK' ] )
+    self.assertTrue( receiver.finishedTransmission() )
+    #The sender stops or skips the late error, and gets the result of the transfer
+    self.receiverTransport.sendData( { 'OK' : True, 'Value' : 'Result' } )
+    self.assertEqual( sender.receiveResult(), { 'OK' : True, 'Value' : 'Result' } )
+
+  def testAbortBeforeData( self ):
+    """ a receiver refusing the transfer stops the sender before the data is sent
+    """
+    sender, receiver = self.__getHelpers( True )
+    receiver.setDirection( "receive" )
+    sendResult, _result = self.__transfer( lambda: sender.stringToNetwork( self.data ), receiver.markAsTransferred )
+    self.assertTrue( sendResult[ 'OK' ], sendResult )
+    self.assertTrue( receiver.finishedTransmission() )
+    self.assertTrue( sender.finishedTransmission() )
+    #Nothing but the end of the transmission has been sent
+    self.assertEqual( self.receiverTransport.byteStream, "" )
+
+  def testChecksumThreadStopped( self ):
+    """ failed raw transfers don't leave their checksum thread behind
+    """
+    threadCount = threading.activeCount()
+    for _i in range( 3 ):
+      sender, receiver = self.__getHelpers( True )
+      sendResult, result = self.__transfer( lambda: sender.stringToNetwork( self.data ),
+                                            lambda: receiver.networkToDataSink( cStringIO.StringIO(),
+                                                                                maxFileSize = 100000 ) )
+      self.assertFalse( result[ 'OK' ] )
+    self.assertEqual( threading.activeCount(), threadCount )
+
+  def testMarkAsTransferred( self ):
+    """ the receiver can skip the data, the transport is usable after that
+    """
+    sender, receiver = self.__getHelpers( True )
+    def sendAll():
+      result = sender.stringToNetwork( self.data )
+      if not result[ 'OK' ]:
+        return result
+      return self.senderTransport.sendData( { 'OK' : True, 'Value' : 'Next' } )
+    receiver.setDirection( "receive" )
+    def skipData():
+      receiver.markAsTransferred()
+      return self.receiverTransport.receiveData()
+    sendResult, result = self.__transfer( sendAll, skipData )
+    self.assertTrue( sendResult[ 'OK' ], sendResult )
+    self.assertEqual( result, { 'OK' : True, 'Value' : 'Next' } )
+
+  def testBulkTransfer( self ):
+    """ bulks are extracted whatever codec the sender chose
+    """
+    srcDir = tempfile.mkdtemp()
+    try:
+      with open( os.path.join( srcDir, "log.txt" ), "w" ) as fd:
+        fd.write( "some log line\n" * 100000 )
+      for peerCodecs in ( None, [ 'gz', 'none' ], [ 'none' ] ):
+        for compress in ( True, False ):
+          destDir = tempfile.mkdtemp()
+          try:
+            sender, receiver = self.__getHelpers( True )
+            sender.setPeerCodecs( peerCodecs )
+            sendResult, result = self.__transfer( lambda: sender.bulkToNetwork( [ os.path.join( srcDir, "log.txt" ) ],
+                                                                                 compress ),
+                                                  lambda: receiver.networkToBulk( destDir ) )
+            self.assertTrue( sendResult[ 'OK' ], sendResult )
+            self.assertTrue( result[ 'OK' ], result )
+            with open( os.path.join( destDir, "log.txt" ) ) as fd:
+              self.assertEqual( fd.read(), "some log line\n" * 100000 )
+          finally:
+            shutil.rmtree( destDir )
+    finally:
+      shutil.rmtree( srcDir )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileHelperTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,70 @@
+""" Test cases for DIRAC.Core.DISET.private.GatewayService
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.DISET.private.GatewayService import GatewayService
+
+class GatewayServiceTestCase( unittest.TestCase ):
+  """ Connections queued by the reactor and served by the gateway
+  """
+
+  def setUp( self ):
+    #The gateway is built by the reactor from the configuration, only what serving uses is set
+    self.gateway = GatewayService.__new__( GatewayService )
+    self.gateway._stats = { 'queries' : 0, 'connections' : 0 }
+    self.gateway._monitor = MagicMock()
+    self.gateway._Service__idleConnectionCallback = None
+    self.gateway._cfg = MagicMock()
+    self.gateway._cfg.getHandshakePriority.return_value = 'Normal'
+    self.gateway._threadPool = MagicMock()
+    self.gateway._threadPool.generateJobAndQueueIt.side_effect = lambda function, args, iPriority = 0: function( *args )
+    self.gateway._transportPool = MagicMock()
+    self.gateway._transportPool.add.return_value = 'trid'
+    self.gateway._transportPool.send.return_value = S_OK()
+    self.transport = MagicMock()
+    self.transport.handshake.return_value = S_OK()
+    self.transport.getConnectingCredentials.return_value = {}
+    self.gateway._transportPool.get.return_value = self.transport
+
+  def testForwardRPC( self ):
+    """ a RPC call is forwarded and the connection closed
+    """
+    proposal = ( ( 'WorkloadManagement/JobMonitoring', 'Production', 'vo' ), ( 'RPC', 'getJobStatus' ), '' )
+    self.transport.receiveData.side_effect = [ S_OK( proposal ), S_OK( ( 1, ) ) ]
+    forwardRPC = MagicMock( return_value = S_OK( 'Done' ) )
+    self.gateway._GatewayService__forwardRPCCall = forwardRPC
+    self.gateway.handleConnection( self.transport )
+    forwardRPC.assert_called_with( 'WorkloadManagement/JobMonitoring', None, 'getJobStatus', ( 1, ) )
+    self.assertEqual( self.transport.sendData.call_args[0][0][ 'Value' ], 'Done' )
+    self.gateway._transportPool.close.assert_called_with( 'trid' )
+
+  def testFailedHandshake( self ):
+    """ the socket of a client failing the handshake is closed
+    """
+    self.transport.handshake.return_value = S_ERROR( "Bad certificate" )
+    self.gateway.handleConnection( self.transport )
+    self.assertTrue( self.transport.close.called )
+    self.assertFalse( self.gateway._transportPool.add.called )
+
+  def testHandshakePriority( self ):
+    """ new connections wait in the queue with the priority of the Normal class by default
+    """
+    self.transport.handshake.return_value = S_ERROR( "Bad certificate" )
+    self.gateway.handleConnection( self.transport )
+    self.assertEqual( self.gateway._threadPool.generateJobAndQueueIt.call_args[1][ 'iPriority' ], 1 )
+    self.gateway._cfg.getHandshakePriority.return_value = 'Low'
+    self.gateway.handleConnection( self.transport )
+    self.assertEqual( self.gateway._threadPool.generateJobAndQueueIt.call_args[1][ 'iPriority' ], 2 )
+    self.gateway._cfg.getHandshakePriority.return_value = 'Unknown'
+    self.gateway.handleConnection( self.transport )
+    self.assertEqual( self.gateway._threadPool.generateJobAndQueueIt.call_args[1][ 'iPriority' ], 1 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( GatewayServiceTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,349 @@
+""" Compression codecs for tar streams
+
+    The codecs a peer knows are negotiated when a bulk transfer starts, and the
+    one used for each transfer is chosen from the kind and size of the files:
+
+      * none: plain tar, for data that is already compressed
+      * gz: gzip, compressed in parallel blocks by several threads
+      * bz2: the historic format, the only one understood by old peers
+      * lz4, zst: only if the lz4 or zstandard modules are installed
+
+    Readers detect the codec from the data, so no negotiation is needed for them.
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import bz2
+import zlib
+import time
+import struct
+import collections
+from multiprocessing.pool import ThreadPool
+
+try:
+  import lz4.frame as lz4frame
+except ImportError:
+  lz4frame = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+#Codec -> extension of the tar files
+CODEC_EXTENSIONS = { 'none' : '.tar',
+                     'gz' : '.tar.gz',
+                     'bz2' : '.tar.bz2',
+                     'lz4' : '.tar.lz4',
+                     'zst' : '.tar.zst' }
+DEFAULT_LEVELS = { 'none' : 0, 'gz' : 6, 'bz2' : 9, 'lz4' : 0, 'zst' : 3 }
+#Extensions of files that don't get smaller when compressed again
+COMPRESSED_EXTENSIONS = ( '.gz', '.tgz', '.bz2', '.xz', '.zip', '.lz4', '.zst', '.7z',
+                          '.root', '.jpg', '.jpeg', '.png', '.gif', '.mp4' )
+#Bulks smaller than this get the best ratio, bigger ones the fastest codec
+SMALL_BULK_SIZE = 4194304
+#Size of the blocks compressed in parallel
+BLOCK_SIZE = 1048576
+
+LZ4_MAGIC = '\x04\x22\x4d\x18'
+ZSTD_MAGIC = '\x28\xb5\x2f\xfd'
+GZIP_MAGIC = '\x1f\x8b'
+BZ2_MAGIC = 'BZh'
+
+def getAvailableCodecs():
+  """ Codecs this installation can write and read, the best first
+  """
+  codecs = []
+  if zstandard:
+    codecs.append( 'zst' )
+  if lz4frame:
+    codecs.append( 'lz4' )
+  codecs.extend( [ 'gz', 'bz2', 'none' ] )
+  return codecs
+
+def getCodecExtension( codec ):
+  """ Extension of a tar file compressed with codec
+  """
+  return CODEC_EXTENSIONS[ codec ]
+
+def detectCodec( magic ):
+  """ Codec of a compressed stream from its first 4 bytes, 'none' if it is not compressed
+  """
+  for codec, codecMagic in ( ( 'zst', ZSTD_MAGIC ), ( 'lz4', LZ4_MAGIC ),
+                             ( 'gz', GZIP_MAGIC ), ( 'bz2', BZ2_MAGIC ) ):
+    if magic.startswith( codecMagic ):
+      return codec
+  return 'none'
+
+def getFileCodec( filePath ):
+  """ Codec of a compressed tar file, from its data whatever its name is
+  """
+  with open( filePath, "rb" ) as fd:
+    return detectCodec( fd.read( 4 ) )
+
+def getCPUCount():
+  try:
+    import multiprocessing
+    return multiprocessing.cpu_count()
+  except NotImplementedError:
+    return 1
+
+def _getEntrySizes( entry ):
+  """ Size of the compressible and already compressed data in an entry
+  """
+  sizes = [ 0, 0 ]
+  if isinstance( entry, basestring ):
+    paths = [ entry ]
+    if os.path.isdir( entry ):
+      paths = []
+      for dirPath, _dirNames, fileNames in os.walk( entry ):
+        paths.extend( [ os.path.join( dirPath, fileName ) for fileName in fileNames ] )
+    for path in paths:
+      try:
+        size = os.path.getsize( path )
+      except OSError:
+        continue
+      sizes[ path.lower().endswith( COMPRESSED_EXTENSIONS ) ] += size
+  elif hasattr( entry, 'getvalue' ):
+    sizes[0] += len( entry.getvalue() )
+  return sizes
+
+def chooseCodec( fileList, peerCodecs = None ):
+  """ Choose the codec to compress a bulk of files sent to a peer
+
+  :type fileList: list
+  :param fileList: Paths of the files and directories, or file like objects, of the bulk
+  :type peerCodecs: list
+  :param peerCodecs: Codecs known by the peer, None if it didn't say which ones
+  :return: ( codec, level )
+  """
+  #Peers that don't negotiate only understand bz2
+  if peerCodecs is None:
+    return 'bz2', DEFAULT_LEVELS[ 'bz2' ]
+  codecs = [ codec for codec in getAvailableCodecs() if codec in peerCodecs ]
+  if not codecs:
+    return 'none', 0
+  compressible = 0
+  compressed = 0
+  for entry in fileList:
+    entrySizes = _getEntrySizes( entry )
+    compressible += entrySizes[0]
+    compressed += entrySizes[1]
+  if 'none' in codecs and compressed >= 4 * compressible:
+    return 'none', 0
+  if compressible <= SMALL_BULK_SIZE:
+    for codec in ( 'gz', 'bz2', 'zst' ):
+      if codec in codecs:
+        return codec, DEFAULT_LEVELS[ codec ]
+  #Big bulks: the fastest codec, gzip at a low level with all the cores
+  for codec, level in ( ( 'zst', 3 ), ( 'lz4', 0 ), ( 'gz', 1 ), ( 'bz2', 9 ) ):
+    if codec in codecs:
+      return codec, level
+  return codecs[0], DEFAULT_LEVELS[ codecs[0] ]
+
+class ParallelGzipWriter( object ):
+  """ File like object writing a gzip stream. The data is cut in blocks that
+      are deflated independently by a pool of threads, zlib releases the GIL
+      while it works. The result is a single gzip member any gzip reader understands
+  """
+
+  def __init__( self, fileObj, level = 6, threads = 0, blockSize = BLOCK_SIZE ):
+    self.__fileObj = fileObj
+    self.__level = level
+    self.__blockSize = blockSize
+    self.__buffer = []
+    self.__bufferSize = 0
+    self.__crc = zlib.crc32( "" )
+    self.__size = 0
+    self.__pending = collections.deque()
+    if not threads:
+      threads = getCPUCount()
+    self.__threads = threads
+    self.__pool = None
+    if threads > 1:
+      self.__pool = ThreadPool( threads )
+    #Header: magic, deflate, no flags, mtime, no extra flags, unknown OS
+    self.__fileObj.write( "\x1f\x8b\x08\x00%s\x00\xff" % struct.pack( "<I", int( time.time() ) ) )
+
+  def __compressBlock( self, data ):
+    compressor = zlib.compressobj( self.__level, zlib.DEFLATED, -zlib.MAX_WBITS )
+    #Sync flushing ends the block on a byte boundary, so blocks can be concatenated
+    return compressor.compress( data ) + compressor.flush( zlib.Z_SYNC_FLUSH )
+
+  def __submitBlock( self ):
+    data = "".join( self.__buffer )
+    self.__buffer = []
+    self.__bufferSize = 0
+    self.__crc = zlib.crc32( data, self.__crc )
+    self.__size += len( data )
+    if not self.__pool:
+      self.__fileObj.write( self.__compressBlock( data ) )
+      return
+    self.__pending.append( self.__pool.apply_async( self.__compressBlock, ( data, ) ) )
+    #Write the blocks in order, keeping only a few in memory
+    while len( self.__pending ) > 2 * self.__threads:
+      self.__fileObj.write( self.__pending.popleft().get() )
+
+  def write( self, data ):
+    self.__buffer.append( data )
+    self.__bufferSize += len( data )
+    if self.__bufferSize >= self.__blockSize:
+      self.__submitBlock()
+
+  def flush( self ):
+    pass
+
+  def close( self ):
+    if self.__bufferSize:
+      self.__submitBlock()
+    try:
+      while self.__pending:
+        self.__fileObj.write( self.__pending.popleft().get() )
+    finally:
+      if self.__pool:
+        self.__pool.close()
+        self.__pool.join()
+        self.__pool = None
+    #An empty final block ends the deflate stream
+    compressor = zlib.compressobj( self.__level, zlib.DEFLATED, -zlib.MAX_WBITS )
+    self.__fileObj.write( compressor.flush( zlib.Z_FINISH ) )
+    self.__fileObj.write( struct.pack( "<II", self.__crc & 0xffffffff, self.__size & 0xffffffff ) )
+
+class CompressorWriter( object ):
+  """ File like object writing through a compressor object
+  """
+
+  def __init__( self, fileObj, compressor, header = "" ):
+    self.__fileObj = fileObj
+    self.__compressor = compressor
+    if header:
+      self.__fileObj.write( header )
+
+  def write( self, data ):
+    data = self.__compressor.compress( data )
+    if data:
+      self.__fileObj.write( data )
+
+  def flush( self ):
+    pass
+
+  def close( self ):
+    self.__fileObj.write( self.__compressor.flush() )
+
+class PlainWriter( object ):
+  """ File like object writing the data as it is
+  """
+
+  def __init__( self, fileObj ):
+    self.write = fileObj.write
+
+  def flush( self ):
+    pass
+
+  def close( self ):
+    pass
+
+def getCompressedWriter( fileObj, codec, level = None, threads = 0 ):
+  """ Get a file like object compressing what is written to fileObj. It has to be
+      closed to write the end of the stream, fileObj is not closed
+
+  :type codec: string
+  :param codec: One of getAvailableCodecs()
+  :type level: int
+  :param level: Compression level, the default of the codec if None
+  :type threads: int
+  :param threads: Threads used by the codecs that support it, 0 for the number of cores
+  """
+  if level is None:
+    level = DEFAULT_LEVELS.get( codec, 0 )
+  if codec == 'none':
+    return PlainWriter( fileObj )
+  if codec == 'gz':
+    return ParallelGzipWriter( fileObj, level, threads )
+  if codec == 'bz2':
+    return CompressorWriter( fileObj, bz2.BZ2Compressor( level ) )
+  if codec == 'lz4' and lz4frame:
+    compressor = lz4frame.LZ4FrameCompressor()
+    return CompressorWriter( fileObj, compressor, compressor.begin() )
+  if codec == 'zst' and zstandard:
+    if not threads:
+      threads = getCPUCount()
+    return CompressorWriter( fileObj, zstandard.ZstdCompressor( level = level, threads = threads ).compressobj() )
+  raise ValueError( "Unknown compression codec %s" % codec )
+
+class DecompressorReader( object ):
+  """ File like object reading through a decompressor object
+  """
+
+  def __init__( self, fileObj, decompressor, data = "", chunkSize = BLOCK_SIZE ):
+    self.__fileObj = fileObj
+    self.__decompressor = decompressor
+    self.__chunkSize = chunkSize
+    self.__buffer = decompressor.decompress( data ) if data else ""
+    self.__eof = False
+
+  def read( self, size = -1 ):
+    chunks = [ self.__buffer ]
+    available = len( self.__buffer )
+    while not self.__eof and ( size < 0 or available < size ):
+      data = self.__fileObj.read( self.__chunkSize )
+      if not data:
+        self.__eof = True
+        break
+      data = self.__decompressor.decompress( data )
+      chunks.append( data )
+      available += len( data )
+    data = "".join( chunks )
+    if size < 0:
+      size = len( data )
+    self.__buffer = data[ size: ]
+    return data[ :size ]
+
+  def close( self ):
+    pass
+
+class PrefixedReader( object ):
+  """ File like object giving back the data already read from fileObj before the rest
+  """
+
+  def __init__( self, fileObj, data ):
+    self.__fileObj = fileObj
+    self.__data = data
+
+  def read( self, size = -1 ):
+    if not self.__data:
+      return self.__fileObj.read( size )
+    data = self.__data
+    if size < 0:
+      self.__data = ""
+      return data + self.__fileObj.read()
+    if len( data ) < size:
+      self.__data = ""
+      return data + self.__fileObj.read( size - len( data ) )
+    self.__data = data[ size: ]
+    return data[ :size ]
+
+  def close( self ):
+    pass
+
+def getDecompressedReader( fileObj ):
+  """ Get a file like object to read a tar stream from fileObj, whatever codec it uses.
+      The tar stream has to be opened with the "r|*" mode, which detects gzip and bz2
+  """
+  magic = ""
+  while len( magic ) < 4:
+    data = fileObj.read( 4 - len( magic ) )
+    if not data:
+      break
+    magic += data
+  codec = detectCodec( magic )
+  if codec == 'zst':
+    if not zstandard:
+      raise IOError( "zstd compressed stream but the zstandard module is not installed" )
+    return DecompressorReader( fileObj, zstandard.ZstdDecompressor().decompressobj(), magic )
+  if codec == 'lz4':
+    if not lz4frame:
+      raise IOError( "lz4 compressed stream but the lz4 module is not installed" )
+    return DecompressorReader( fileObj, lz4frame.LZ4FrameDecompressor(), magic )
+  return PrefixedReader( fileObj, magic )
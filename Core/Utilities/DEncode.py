@@ -21,6 +21,8 @@ _dateTimeObject = datetime.datetime.utcnow()
 _dateTimeType = type( _dateTimeObject )
 _dateType = type( _dateTimeObject.date() )
 _timeType = type( _dateTimeObject.time() )
+_strType = types.StringType
+_intType = types.IntType
 
 g_dEncodeFunctions = {}
 g_dDecodeFunctions = {}
@@ -169,19 +171,43 @@ def decodeNone( data, i ):
 g_dEncodeFunctions[ types.NoneType ] = encodeNone
 g_dDecodeFunctions[ 'n' ] = decodeNone
 
+#Strings and ints are by far the most common items in RPC payloads so the
+#container codecs below handle them inline instead of going through the
+#dispatch tables
+
 #Encode and decode a list
-def encodeList( lValue, eList ):
-  eList.append( "l" )
+def encodeList( lValue, eList, seqType = "l" ):
+  extend = eList.extend
+  eList.append( seqType )
   for uObject in lValue:
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+    oType = type( uObject )
+    if oType is _strType:
+      extend( ( "s", str( len( uObject ) ), ":", uObject ) )
+    elif oType is _intType:
+      extend( ( "i", str( uObject ), "e" ) )
+    else:
+      g_dEncodeFunctions[ oType ]( uObject, eList )
   eList.append( "e" )
 
 def decodeList( data, i ):
   oL = []
+  append = oL.append
+  index = data.index
   i += 1
-  while data[ i ] != "e":
-    ob, i = g_dDecodeFunctions[ data[ i ] ]( data, i )
-    oL.append( ob )
+  dataType = data[ i ]
+  while dataType != "e":
+    if dataType == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      append( data[ colon + 1 : i ] )
+    elif dataType == "i":
+      end = index( "e", i + 1 )
+      append( int( data[ i + 1 : end ] ) )
+      i = end + 1
+    else:
+      ob, i = g_dDecodeFunctions[ dataType ]( data, i )
+      append( ob )
+    dataType = data[ i ]
   return( oL, i + 1 )
 
 g_dEncodeFunctions[ types.ListType ] = encodeList
@@ -189,10 +215,7 @@ g_dDecodeFunctions[ "l" ] = decodeList
 
 #Encode and decode a tuple
 def encodeTuple( lValue, eList ):
-  eList.append( "t" )
-  for uObject in lValue:
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
-  eList.append( "e" )
+  encodeList( lValue, eList, "t" )
 
 def decodeTuple( data, i ):
   oL, i = decodeList( data, i )
@@ -203,18 +226,54 @@ g_dDecodeFunctions[ "t" ] = decodeTuple
 
 #Encode and decode a dictionary
 def encodeDict( dValue, eList ):
+  extend = eList.extend
   eList.append( "d" )
   for key in sorted( dValue ):
-    g_dEncodeFunctions[ type( key ) ]( key, eList )
-    g_dEncodeFunctions[ type( dValue[key] ) ]( dValue[key], eList )
+    kType = type( key )
+    if kType is _strType:
+      extend( ( "s", str( len( key ) ), ":", key ) )
+    elif kType is _intType:
+      extend( ( "i", str( key ), "e" ) )
+    else:
+      g_dEncodeFunctions[ kType ]( key, eList )
+    uObject = dValue[ key ]
+    oType = type( uObject )
+    if oType is _strType:
+      extend( ( "s", str( len( uObject ) ), ":", uObject ) )
+    elif oType is _intType:
+      extend( ( "i", str( uObject ), "e" ) )
+    else:
+      g_dEncodeFunctions[ oType ]( uObject, eList )
   eList.append( "e" )
 
 def decodeDict( data, i ):
   oD = {}
+  index = data.index
   i += 1
-  while data[ i ] != "e":
-    k, i = g_dDecodeFunctions[ data[ i ] ]( data, i )
-    oD[ k ], i = g_dDecodeFunctions[ data[ i ] ]( data, i )
+  dataType = data[ i ]
+  while dataType != "e":
+    if dataType == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      key = data[ colon + 1 : i ]
+    elif dataType == "i":
+      end = index( "e", i + 1 )
+      key = int( data[ i + 1 : end ] )
+      i = end + 1
+    else:
+      key, i = g_dDecodeFunctions[ dataType ]( data, i )
+    dataType = data[ i ]
+    if dataType == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      oD[ key ] = data[ colon + 1 : i ]
+    elif dataType == "i":
+      end = index( "e", i + 1 )
+      oD[ key ] = int( data[ i + 1 : end ] )
+      i = end + 1
+    else:
+      oD[ key ], i = g_dDecodeFunctions[ dataType ]( data, i )
+    dataType = data[ i ]
   return ( oD, i + 1 )
 
 g_dEncodeFunctions[ types.DictType ] = encodeDict
@@ -241,6 +300,144 @@ def decode( data ):
     raise
 
 
+class StreamDecoder( object ):
+  """
+  Incremental decoder for big encoded containers. The encoded data is given in
+  chunks with feed() and the items of the container found following streamPath
+  (a sequence of dictionary keys, the empty path being the top level object) are
+  returned as soon as they are complete: ( key, value ) tuples for a dictionary,
+  plain values for a list. Everything else goes to the envelope, available with
+  getEnvelope() once finish() has been called, where the streamed container is
+  left empty.
+  """
+
+  def __init__( self, streamPath = () ):
+    self.__streamPath = tuple( streamPath )
+    self.__data = ""
+    self.__pos = 0
+    self.__pending = []
+    self.__pendingLen = 0
+    #Don't try again to decode an incomplete item until this much data is buffered
+    self.__retryLen = 0
+    #Containers being decoded, each entry is [ type, container ]
+    self.__stack = []
+    self.__envelope = None
+    self.__finished = False
+
+  def __decodeItem( self, pos ):
+    """
+    Decode the item starting at pos. Return None if it is not complete yet
+    """
+    data = self.__data
+    try:
+      value, end = g_dDecodeFunctions[ data[ pos ] ]( data, pos )
+    except ( IndexError, ValueError ):
+      return None
+    #Items are always followed by the end of their container, if there's nothing
+    #after the item it may be truncated
+    if end >= len( data ):
+      return None
+    return ( value, end )
+
+  def feed( self, data ):
+    """
+    Add a chunk of encoded data and return the list of the streamed items completed
+    """
+    if self.__finished:
+      if data:
+        raise ValueError( "Received data after the end of the encoded object" )
+      return []
+    self.__pending.append( data )
+    self.__pendingLen += len( data )
+    if len( self.__data ) - self.__pos + self.__pendingLen < self.__retryLen:
+      return []
+    self.__data = "".join( [ self.__data[ self.__pos: ] ] + self.__pending )
+    self.__pos = 0
+    self.__pending = []
+    self.__pendingLen = 0
+    self.__retryLen = 0
+    return self.__process()
+
+  def __process( self ):
+    items = []
+    data = self.__data
+    pos = self.__pos
+    stack = self.__stack
+    while pos < len( data ):
+      if not stack:
+        if self.__envelope is not None or data[ pos ] not in "dl":
+          #The whole object is a single value, it will be decoded in finish
+          break
+        self.__envelope = {} if data[ pos ] == "d" else []
+        stack.append( [ data[ pos ], self.__envelope ] )
+        pos += 1
+        continue
+      if data[ pos ] == "e":
+        stack.pop()
+        pos += 1
+        if not stack:
+          self.__finished = True
+          break
+        continue
+      containerType, container = stack[ -1 ]
+      streamed = len( stack ) > len( self.__streamPath )
+      if containerType == "l":
+        result = self.__decodeItem( pos )
+        if not result:
+          break
+        if streamed:
+          items.append( result[0] )
+        else:
+          container.append( result[0] )
+        pos = result[1]
+        continue
+      result = self.__decodeItem( pos )
+      if not result:
+        break
+      key, valuePos = result
+      if not streamed and key == self.__streamPath[ len( stack ) - 1 ] and data[ valuePos ] in "dl":
+        container[ key ] = {} if data[ valuePos ] == "d" else []
+        stack.append( [ data[ valuePos ], container[ key ] ] )
+        pos = valuePos + 1
+        continue
+      result = self.__decodeItem( valuePos )
+      if not result:
+        break
+      if streamed:
+        items.append( ( key, result[0] ) )
+      else:
+        container[ key ] = result[0]
+      pos = result[1]
+    if pos < len( data ) and not self.__finished:
+      self.__retryLen = 2 * ( len( data ) - pos )
+    self.__pos = pos
+    return items
+
+  def finish( self ):
+    """
+    Signal the end of the data, return the last streamed items
+    """
+    self.__retryLen = 0
+    items = self.feed( "" )
+    if not self.__finished and not self.__stack and self.__envelope is None and self.__data:
+      self.__envelope, end = decode( self.__data )
+      self.__pos = end
+      self.__finished = True
+    if not self.__finished:
+      raise ValueError( "Encoded data is truncated" )
+    if self.__pos < len( self.__data ):
+      raise ValueError( "Unexpected data after the end of the encoded object" )
+    return items
+
+  def getEnvelope( self ):
+    """
+    Get the decoded object without the streamed items
+    """
+    if not self.__finished:
+      raise ValueError( "Encoded data has not been completely decoded" )
+    return self.__envelope
+
+
 if __name__ == "__main__":
   gObject = {2:"3", True : ( 3, None ), 2.0 * 10 ** 20 : 2.0 * 10 ** -10 }
   print "Initial: %s" % gObject
@@ -81,6 +81,7 @@ ENOCHAIN = 1106
 ENOPKEY = 1107
 # DISET: 1X
 EDISET = 1110
+ESERVICEBUSY = 1111
 # 3rd party security: 2X
 E3RDPARTY = 1120
 EVOMS = 1121
@@ -126,6 +127,7 @@ dErrorCode = {
                1107 : 'ENOPKEY',
                # 111X: DISET
                1110 : 'EDISET',
+               1111 : 'ESERVICEBUSY',
                # 112X: 3rd party security
                1120 : 'E3RDPARTY',
                1121 : 'EVOMS',
@@ -170,6 +172,7 @@ dStrError = {
               ENOPKEY : "No private key loaded",
               # 111X: DISET
               EDISET : "DISET Error",
+              ESERVICEBUSY : "Service busy, retry later",
               # 112X: 3rd party security
               E3RDPARTY: "3rd party security service error",
               EVOMS : "VOMS Error",
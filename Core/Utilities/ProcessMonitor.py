@@ -6,14 +6,16 @@
 """ The Process Monitor utility allows to calculate cumulative CPU time and memory 
     for a given PID and it's process group.  This is only implemented for linux /proc 
     file systems but could feasibly be extended in the future.
+
+    The whole process tree is sampled in one pass over /proc, without spawning
+    any command, reading the stat files in a buffer reused between the samples.
 """
 
 from DIRAC import gLogger, S_OK, S_ERROR
-from DIRAC.Core.Utilities.Subprocess import shellCall
 
 __RCSID__ = "$Id$"
 
-import os, re, platform
+import io, os, re, platform
 
 class ProcessMonitor( object ):
 
@@ -23,6 +25,10 @@ class ProcessMonitor( object ):
     """
     self.log = gLogger.getSubLogger( 'ProcessMonitor' )
     self.osType = platform.uname()
+    self.pageSize = os.sysconf( 'SC_PAGESIZE' )
+    self.clockTicks = float( os.sysconf( 'SC_CLK_TCK' ) )
+    #Buffer the stat files are read in, longer ones are truncated after the fields used
+    self.__statBuffer = bytearray( 4096 )
 
   #############################################################################
   def getCPUConsumed( self, pid ):
@@ -45,21 +51,25 @@ class ProcessMonitor( object ):
       self.log.warn( 'Platform %s is not supported' % ( currentOS ) )
       return S_ERROR( 'Unsupported platform' )  
 
+  def getResourceConsumed( self, pid ):
+    """Returns the CPU and memory consumed for supported platforms when supplied a PID,
+       from a single sample of the process tree.
+    """
+    currentOS = self.__checkCurrentOS()
+    if currentOS.lower() == 'linux':
+      return self.getResourceConsumedLinux( pid )
+    else:
+      self.log.warn( 'Platform %s is not supported' % ( currentOS ) )
+      return S_ERROR( 'Unsupported platform' )
+
   def getResourceConsumedLinux( self, pid ):
     """Returns the CPU consumed given a PID assuming a proc file system exists.
     """
-    pid = str( pid )
-    masterProcPath = '/proc/%s/stat' % ( pid )
-    if not os.path.exists( masterProcPath ):
+    pid = int( pid )
+    procStats = self.__getProcStatsLinux()
+    if pid not in procStats:
       return S_ERROR( 'Process %s does not exist' % ( pid ) )
-
-    #Get the current process list
-    pidListResult = self.__getProcListLinux()
-    if not pidListResult['OK']:
-      return pidListResult
-
-    pidList = pidListResult['Value']
-    return self.__getChildResourceConsumedLinux( pid, pidList )
+    return self.__getChildResourceConsumedLinux( pid, procStats )
 
   #############################################################################
   def getCPUConsumedLinux( self, pid ):
@@ -87,92 +97,65 @@ class ProcessMonitor( object ):
  
 
   #############################################################################
-  def __getProcListLinux( self ):
-    """Gets list of process IDs from /proc/*.
+  def __getProcStatsLinux( self ):
+    """Reads the stat of all the processes of /proc in one pass.
+       Returns a dictionary PID -> ( PPID, PGRP, CPU seconds, Vsize bytes, RSS bytes ).
     """
-    result = shellCall( 10, 'ls -d /proc/[0-9]*' )
-
-    if not result['OK']:
-      if not 'Value' in result:
-        return result
-    procList = result['Value'][1].replace( '/proc/', '' ).split( '\n' )
-
-    return S_OK( procList )
+    procStats = {}
+    for entry in os.listdir( '/proc' ):
+      if not entry.isdigit():
+        continue
+      stat = self.__readProcStatLinux( entry )
+      if stat:
+        procStats[int( entry )] = stat
+    return procStats
 
   #############################################################################
-  def __getChildResourceConsumedLinux( self, pid, pidList, infoDict = None ):
-    """Adds contributions to CPU total from child processes recursively.
+  def __getChildResourceConsumedLinux( self, pid, procStats ):
+    """Adds the contributions of the process, of all its descendants and of the
+       orphan processes of its process group.
     """
-    childCPU = 0
-    vsize = 0
-    rss = 0
-    pageSize = os.sysconf('SC_PAGESIZE')
-    if not infoDict:
-      infoDict = {}
-      for pidCheck in pidList:
-        info = self.__getProcInfoLinux( pidCheck )
-        if info['OK']:
-          infoDict[pidCheck] = info['Value']
-
-    procGroup = self.__getProcGroupLinux( pid )
-    if not procGroup['OK']:
-      return procGroup
-
-    procGroup = procGroup['Value'].strip()
-
-    for pidCheck, info in infoDict.items():
-      if pidCheck in infoDict and info[3] == pid:
-        contribution = float( info[13] ) / 100 + float( info[14] ) / 100 + float( info[15] ) / 100 + float( info[16] ) / 100
-        childCPU += contribution
-        vsize += float( info[22] )
-        rss += float( info[23] ) * pageSize
-        self.log.debug( 'Added %s to CPU total (now %s) from child PID %s %s' % ( contribution, childCPU, info[0], info[1] ) )
-        del infoDict[pidCheck]
-        result = self.__getChildResourceConsumedLinux( pidCheck, pidList, infoDict )
-        if result['OK']:
-          childCPU += result['Value']['CPU']
-          vsize += result['Value']['Vsize']
-          rss += result['Value']['RSS'] 
-
-
-    #Next add any contributions from orphan processes in same process group
-    for pidCheck, info in infoDict.items():
-      if pidCheck in infoDict and info[3] == 1 and info[4] == procGroup:
-        contribution = float( info[13] ) / 100 + float( info[14] ) / 100 + float( info[15] ) / 100 + float( info[16] ) / 100
-        childCPU += contribution
-        vsize += float( info[22] )
-        rss += float( info[23] ) * pageSize
-        self.log.debug( 'Added %s to CPU total (now %s) from orphan PID %s %s' % ( contribution, childCPU, info[0], info[1] ) )
-        del infoDict[pidCheck]
-
-    #Finally add the parent itself
-    if pid in infoDict:
-      info = infoDict[pid]
-      contribution = float( info[13] ) / 100 + float( info[14] ) / 100 + float( info[15] ) / 100 + float( info[16] ) / 100
-      childCPU += contribution
-      vsize += float( info[22] )
-      rss += float( info[23] ) * pageSize
-      self.log.debug( 'Added %s to CPU total (now %s) from PID %s %s' % ( contribution, childCPU, info[0], info[1] ) )
-      del infoDict[pid]
-
-      # Some debug printout if 0 CPU is determined
-      if childCPU == 0:
-        self.log.error( 'Consumed CPU is found to be 0' )
-        self.log.info( 'Contributing processes:' )
-        for pidCheck in pidList:
-          if pidCheck not in infoDict:
-            info = self.__getProcInfoLinux( pidCheck )
-            if info['OK']:
-              self.log.info( '  PID:', info['Value'] )
+    children = {}
+    for pidCheck, stat in procStats.items():
+      children.setdefault( stat[0], [] ).append( pidCheck )
+
+    procGroup = procStats[pid][1]
+    treePIDs = [pid]
+    #Orphan processes of the same process group
+    treePIDs += [ pidCheck for pidCheck in children.get( 1, [] )
+                  if pidCheck != pid and procStats[pidCheck][1] == procGroup ]
+    #The tree is walked breadth first, once
+    index = 0
+    while index < len( treePIDs ):
+      treePIDs.extend( children.get( treePIDs[index], [] ) )
+      index += 1
+
+    childCPU = 0.
+    vsize = 0.
+    rss = 0.
+    for pidCheck in set( treePIDs ):
+      _ppid, _pgrp, cpu, procVsize, procRSS = procStats[pidCheck]
+      childCPU += cpu
+      vsize += procVsize
+      rss += procRSS
+      self.log.debug( 'Added %s to CPU total (now %s) from PID %s' % ( cpu, childCPU, pidCheck ) )
+
+    # Some debug printout if 0 CPU is determined
+    if childCPU == 0:
+      self.log.error( 'Consumed CPU is found to be 0' )
+      self.log.info( 'Contributing processes: %s' % sorted( set( treePIDs ) ) )
 
     return S_OK( { "CPU": childCPU,
                    "Vsize": vsize,
-                   "RSS": rss } )
+                   "RSS": rss,
+                   "Processes": len( set( treePIDs ) ) } )
 
 
   #############################################################################
-  def __getProcInfoLinux( self, pid ):
-    """Attempts to read /proc/PID/stat and returns list of items if ok.
+  def __readProcStatLinux( self, pid ):
+    """Reads /proc/PID/stat and returns ( PPID, PGRP, CPU seconds, Vsize bytes, RSS bytes ),
+       or None if the process is gone. The CPU is the sum of the utime, stime, cutime and
+       cstime fields.
        /proc/[pid]/stat
               Status information about the process.  This is used by ps(1).
               It is defined in /usr/src/linux/fs/proc/array.c.
@@ -383,24 +366,19 @@ class ProcessMonitor( object ):
                           measured in clock ticks (divide by
                           sysconf(_SC_CLK_TCK)).
     """
-    procPath = '/proc/%s/stat' % ( pid )
+    buf = self.__statBuffer
     try:
-      with open( procPath, 'r' ) as fopen:
-        procStat = fopen.readline()
-    except Exception:
-      return S_ERROR( 'Not able to check %s' % pid )
-    return S_OK( procStat.split( ' ' ) )
-
-  #############################################################################
-  def __getProcGroupLinux( self, pid ):
-    """Returns UID for given PID.
-    """
-    result = shellCall( 10, 'ps --no-headers -o pgrp -p %s' % ( pid ) )
-    if not result['OK']:
-      if  not 'Value' in result:
-        return result
-
-    return S_OK( result['Value'][1] )
+      with io.FileIO( '/proc/%s/stat' % pid, 'r' ) as statFile:
+        size = statFile.readinto( buf )
+    except ( IOError, OSError ):
+      return None
+    #The command name can hold spaces and parentheses, the fields start after the last one
+    fields = buf[buf.rfind( ')', 0, size ) + 2:size].split()
+    try:
+      cpu = ( int( fields[11] ) + int( fields[12] ) + int( fields[13] ) + int( fields[14] ) ) / self.clockTicks
+      return ( int( fields[1] ), int( fields[2] ), cpu, float( fields[20] ), float( fields[21] ) * self.pageSize )
+    except ( IndexError, ValueError ):
+      return None
 
   #############################################################################
   def __checkCurrentOS( self ):
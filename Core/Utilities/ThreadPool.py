@@ -51,6 +51,13 @@ or::
 
 The result callback and the parameters are optional arguments.
 Once the requests have been added to the pool. They will be executed as soon as possible.
+Requests can be given a priority, the ones with the lowest value are executed first
+and the ones with the same priority in the order they were queued::
+
+   threadPool.generateJobAndQueueIt( <functionToExecute>,
+                                     args = ( arg1, arg2, ... ),
+                                     iPriority = 1 )
+
 Worker threads automatically return the return value of the requests. To run the result callback
 functions execute::
 
@@ -75,7 +82,9 @@ __RCSID__ = "$Id$"
 
 import time
 import sys
+import heapq
 import Queue
+import itertools
 import threading
 try:
   from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -114,6 +123,23 @@ class WorkingThread( threading.Thread ):
         self.__resultsQueue.put( oJob, block = True )
 
 
+class PendingJobsQueue( Queue.Queue ):
+  """
+  Queue giving back first the jobs with the lowest priority value, in
+  the order they were put for the same priority
+  """
+
+  def _init( self, maxsize ):
+    self.queue = []
+    self.__counter = itertools.count()
+
+  def _put( self, oJob ):
+    heapq.heappush( self.queue, ( oJob.getPriority(), self.__counter.next(), oJob ) )
+
+  def _get( self ):
+    return heapq.heappop( self.queue )[2]
+
+
 class ThreadedJob:
 
   def __init__( self,
@@ -122,7 +148,8 @@ class ThreadedJob:
                 kwargs = None,
                 sTJId = None,
                 oCallback = None,
-                oExceptionCallback = None ):
+                oExceptionCallback = None,
+                iPriority = 0 ):
     self.__jobFunction = oCallable
     self.__jobArgs = args or []
     self.__jobKwArgs = kwargs or {}
@@ -133,6 +160,7 @@ class ThreadedJob:
     self.__exceptionRaised = False
     self.__jobResult = None
     self.__jobException = None
+    self.__priority = iPriority
 
   def __showException( self, threadedJob, exceptionInfo ):
     if gLogger:
@@ -141,6 +169,9 @@ class ThreadedJob:
   def jobId( self ):
     return self.__tjID
 
+  def getPriority( self ):
+    return self.__priority
+
   def hasCallback( self ):
     return self.__resultCallback or self.__exceptionCallback
 
@@ -180,7 +211,7 @@ class ThreadPool( threading.Thread ):
     else:
       self.__maxThreads = iMaxThreads
     self.__strictLimits = strictLimits
-    self.__pendingQueue = Queue.Queue( iMaxQueuedRequests )
+    self.__pendingQueue = PendingJobsQueue( iMaxQueuedRequests )
     self.__resultsQueue = Queue.Queue( iMaxQueuedRequests + iMaxThreads )
     self.__workingThreadsList = []
     self.__spawnNeededWorkingThreads()
@@ -258,8 +289,9 @@ class ThreadPool( threading.Thread ):
                              sTJId = None,
                              oCallback = None,
                              oExceptionCallback = None,
-                             blocking = True ):
-    oTJ = ThreadedJob( oCallable, args, kwargs, sTJId, oCallback, oExceptionCallback )
+                             blocking = True,
+                             iPriority = 0 ):
+    oTJ = ThreadedJob( oCallable, args, kwargs, sTJId, oCallback, oExceptionCallback, iPriority )
     return self.queueJob( oTJ, blocking )
 
   def pendingJobs( self ):
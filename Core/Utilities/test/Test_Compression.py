@@ -0,0 +1,88 @@
+""" Test cases for DIRAC.Core.Utilities.Compression module
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import gzip
+import shutil
+import tarfile
+import tempfile
+import unittest
+import cStringIO
+
+from DIRAC.Core.Utilities import Compression
+
+class CompressionTestCase( unittest.TestCase ):
+  """ Test case for the Compression module
+  """
+
+  def setUp( self ):
+    self.tmpDir = tempfile.mkdtemp()
+    self.data = "".join( [ "line %d of a log file\n" % i for i in xrange( 200000 ) ] ) + os.urandom( 10000 )
+
+  def tearDown( self ):
+    shutil.rmtree( self.tmpDir )
+
+  def __compress( self, codec, data, threads = 0 ):
+    output = cStringIO.StringIO()
+    writer = Compression.getCompressedWriter( output, codec, threads = threads )
+    for i in xrange( 0, len( data ), 10240 ):
+      writer.write( data[ i : i + 10240 ] )
+    writer.close()
+    return output.getvalue()
+
+  def testParallelGzip( self ):
+    """ the blocks compressed in parallel make a valid gzip stream
+    """
+    for threads in ( 1, 3 ):
+      compressed = self.__compress( 'gz', self.data, threads )
+      self.assertTrue( len( compressed ) < len( self.data ) )
+      self.assertEqual( gzip.GzipFile( fileobj = cStringIO.StringIO( compressed ) ).read(), self.data )
+    compressed = self.__compress( 'gz', "" )
+    self.assertEqual( gzip.GzipFile( fileobj = cStringIO.StringIO( compressed ) ).read(), "" )
+
+  def testTarRoundTrip( self ):
+    """ tar streams written with each codec are read back without knowing the codec
+    """
+    with open( os.path.join( self.tmpDir, "log.txt" ), "w" ) as fd:
+      fd.write( self.data )
+    for codec in Compression.getAvailableCodecs():
+      output = cStringIO.StringIO()
+      writer = Compression.getCompressedWriter( output, codec )
+      tar = tarfile.open( name = "Pipe", mode = "w|", fileobj = writer )
+      tar.add( os.path.join( self.tmpDir, "log.txt" ), "log.txt" )
+      tar.close()
+      writer.close()
+      reader = Compression.getDecompressedReader( cStringIO.StringIO( output.getvalue() ) )
+      tar = tarfile.open( mode = "r|*", fileobj = reader )
+      for tarInfo in tar:
+        self.assertEqual( tarInfo.name, "log.txt" )
+        self.assertEqual( tar.extractfile( tarInfo ).read(), self.data )
+      tar.close()
+      #The codec, and the extension of the file, are known from the data
+      self.assertEqual( Compression.detectCodec( output.getvalue()[ :4 ] ), codec )
+
+  def testChooseCodec( self ):
+    """ codec depending on the peer, the size and the type of the files
+    """
+    textFile = os.path.join( self.tmpDir, "log.txt" )
+    with open( textFile, "w" ) as fd:
+      fd.write( self.data[ :1000 ] )
+    zipFile = os.path.join( self.tmpDir, "data.root" )
+    with open( zipFile, "w" ) as fd:
+      fd.write( os.urandom( 10000 ) )
+    self.assertEqual( Compression.chooseCodec( [ textFile ] ), ( 'bz2', 9 ) )
+    self.assertEqual( Compression.chooseCodec( [ textFile ], [ 'gz', 'bz2', 'none' ] ), ( 'gz', 6 ) )
+    self.assertEqual( Compression.chooseCodec( [ textFile ], [ 'bz2', 'none' ] ), ( 'bz2', 9 ) )
+    self.assertEqual( Compression.chooseCodec( [ self.tmpDir ], [ 'gz', 'none' ] ), ( 'none', 0 ) )
+    self.assertEqual( Compression.chooseCodec( [ textFile ], [ 'unknown' ] ), ( 'none', 0 ) )
+    Compression.SMALL_BULK_SIZE = 100
+    try:
+      self.assertEqual( Compression.chooseCodec( [ textFile ], [ 'gz', 'bz2' ] ), ( 'gz', 1 ) )
+    finally:
+      Compression.SMALL_BULK_SIZE = 4194304
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( CompressionTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
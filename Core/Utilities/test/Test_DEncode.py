@@ -0,0 +1,103 @@
+""" Test cases for DIRAC.Core.Utilities.DEncode module
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+import datetime
+
+from DIRAC.Core.Utilities import DEncode
+
+class DEncodeTestCase( unittest.TestCase ):
+  """ Test case for the DEncode module
+  """
+
+  def testScalars( self ):
+    """ wire format of the simple types
+    """
+    self.assertEqual( DEncode.encode( 1 ), "i1e" )
+    self.assertEqual( DEncode.encode( 1L ), "I1e" )
+    self.assertEqual( DEncode.encode( 1.5 ), "f1.5e" )
+    self.assertEqual( DEncode.encode( True ), "b1" )
+    self.assertEqual( DEncode.encode( None ), "n" )
+    self.assertEqual( DEncode.encode( "abc" ), "s3:abc" )
+    self.assertEqual( DEncode.encode( u"\xe9" ), "u2:\xc3\xa9" )
+
+  def testContainers( self ):
+    """ wire format of the containers, dictionary keys are sorted
+    """
+    self.assertEqual( DEncode.encode( [ 1, "a", [] ] ), "li1es1:alee" )
+    self.assertEqual( DEncode.encode( ( 1, ( "a", ) ) ), "ti1ets1:aee" )
+    self.assertEqual( DEncode.encode( { "b" : 2, "a" : "x", 3 : None } ),
+                      "di3ens1:as1:xs1:bi2ee" )
+    self.assertEqual( DEncode.encode( { "k" : { True : [ 1.0 ] } } ),
+                      "ds1:kdb1lf1.0eeee" )
+
+  def testRoundTrip( self ):
+    """ decode( encode( x ) ) gives back x
+    """
+    now = datetime.datetime( 2015, 6, 1, 12, 30, 5, 42 )
+    payload = { 'OK' : True,
+                'Value' : { 'Successful' : { '/a/b/c' : { 'SE1' : 'srm://a', 'SE2' : 'srm://b' } },
+                            'Failed' : {},
+                            1 : [ 1, -2, 10 ** 20, 1.5e-10, 2.0e20, None, False, u'\xe9t\xe9' ],
+                            'Times' : ( now, now.date(), now.time() ),
+                            'Nested' : [ [ [] ], {}, ( ), '', 'e' ] } }
+    data = DEncode.encode( payload )
+    self.assertEqual( DEncode.decode( data ), ( payload, len( data ) ) )
+    for item in ( [], {}, (), "", 0, [ "s1:" ], { "e" : "i1e" } ):
+      data = DEncode.encode( item )
+      self.assertEqual( DEncode.decode( data ), ( item, len( data ) ) )
+
+  def testTypes( self ):
+    """ decoded types match the encoded ones
+    """
+    decoded = DEncode.decode( DEncode.encode( [ 1, 1L, "a", u"a", ( 1, ) ] ) )[0]
+    self.assertEqual( [ type( x ) for x in decoded ], [ int, long, str, unicode, tuple ] )
+
+  def __streamDecode( self, data, streamPath, chunkSize ):
+    """ feed data to a StreamDecoder in chunks
+    """
+    decoder = DEncode.StreamDecoder( streamPath )
+    items = []
+    for i in xrange( 0, len( data ), chunkSize ):
+      items.extend( decoder.feed( data[ i : i + chunkSize ] ) )
+    items.extend( decoder.finish() )
+    return decoder.getEnvelope(), items
+
+  def testStreamDecoder( self ):
+    """ items of the streamed container are returned as they are complete
+    """
+    replicas = dict( ( '/a/%d' % i, { 'SE' : 'x' * i, 'Size' : 2.0e20 } ) for i in xrange( 50 ) )
+    payload = { 'OK' : True, 'Value' : { 'Successful' : replicas, 'Failed' : { '/b' : 'Error' } } }
+    data = DEncode.encode( payload )
+    for chunkSize in ( 1, 3, 64, len( data ) ):
+      envelope, items = self.__streamDecode( data, ( 'Value', 'Successful' ), chunkSize )
+      self.assertEqual( dict( items ), replicas )
+      self.assertEqual( envelope, { 'OK' : True, 'Value' : { 'Successful' : {}, 'Failed' : { '/b' : 'Error' } } } )
+      envelope, items = self.__streamDecode( data, (), chunkSize )
+      self.assertEqual( envelope, {} )
+      self.assertEqual( dict( items ), payload )
+    envelope, items = self.__streamDecode( DEncode.encode( [ 1, [ 2 ], 'e' ] ), (), 1 )
+    self.assertEqual( ( envelope, items ), ( [], [ 1, [ 2 ], 'e' ] ) )
+
+  def testStreamDecoderEnvelope( self ):
+    """ objects without the streamed container are decoded in the envelope
+    """
+    for payload in ( { 'OK' : False, 'Message' : 'Error' }, { 'OK' : True, 'Value' : 2 }, 5, 'abc', 1.5e20 ):
+      envelope, items = self.__streamDecode( DEncode.encode( payload ), ( 'Value', ), 2 )
+      self.assertEqual( ( envelope, items ), ( payload, [] ) )
+
+  def testStreamDecoderErrors( self ):
+    """ truncated or trailing data
+    """
+    decoder = DEncode.StreamDecoder()
+    decoder.feed( DEncode.encode( [ 1, 2 ] )[:-1] )
+    self.assertRaises( ValueError, decoder.finish )
+    decoder = DEncode.StreamDecoder()
+    decoder.feed( DEncode.encode( [ 1, 2 ] ) )
+    self.assertRaises( ValueError, decoder.feed, "i1e" )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DEncodeTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
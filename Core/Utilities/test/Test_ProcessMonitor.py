@@ -0,0 +1,54 @@
+""" Test cases for DIRAC.Core.Utilities.ProcessMonitor
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import time
+import signal
+import unittest
+import subprocess
+
+from DIRAC.Core.Utilities.ProcessMonitor import ProcessMonitor
+
+class ProcessMonitorTestCase( unittest.TestCase ):
+  """ Resources of a process tree sampled from /proc
+  """
+
+  def setUp( self ):
+    #A shell with two children, one of them burning some CPU with a child of its own
+    self.process = subprocess.Popen( [ 'sh', '-c', 'sleep 30 & sh -c "sleep 30 & while :; do :; done" & wait' ],
+                                     preexec_fn = os.setsid )
+    time.sleep( 1 )
+
+  def tearDown( self ):
+    os.killpg( self.process.pid, signal.SIGKILL )
+    self.process.wait()
+
+  def testTree( self ):
+    """ the descendants of the process are summed
+    """
+    monitor = ProcessMonitor()
+    result = monitor.getResourceConsumed( self.process.pid )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value']['Processes'], 4 )
+    self.assertTrue( result['Value']['CPU'] > 0 )
+    self.assertTrue( result['Value']['RSS'] > 0 )
+    self.assertTrue( result['Value']['Vsize'] >= result['Value']['RSS'] )
+
+    result = monitor.getResourceConsumed( os.getpid() )
+    self.assertTrue( result['OK'] )
+    self.assertTrue( result['Value']['Processes'] > 4 )
+
+    result = monitor.getCPUConsumed( self.process.pid )
+    self.assertTrue( result['OK'] )
+    self.assertTrue( result['Value'] > 0 )
+
+  def testMissingProcess( self ):
+    """ an error for a process that is gone
+    """
+    self.assertFalse( ProcessMonitor().getResourceConsumed( 2 ** 22 + 1 )['OK'] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ProcessMonitorTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
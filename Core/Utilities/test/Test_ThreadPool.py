@@ -0,0 +1,54 @@
+""" Test cases for DIRAC.Core.Utilities.ThreadPool
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+import threading
+
+from DIRAC.Core.Utilities.ThreadPool import ThreadPool
+
+class ThreadPoolTestCase( unittest.TestCase ):
+  """ Execution order of the queued jobs
+  """
+
+  def testPriorities( self ):
+    """ jobs with the lowest priority value go first, in order within a priority
+    """
+    threadPool = ThreadPool( 1, 1 )
+    blocker = threading.Event()
+    started = threading.Event()
+    def block():
+      started.set()
+      blocker.wait()
+    executed = []
+    done = threading.Event()
+    threadPool.generateJobAndQueueIt( block )
+    started.wait()
+    for name, priority in ( ( 'low1', 2 ), ( 'normal1', 1 ), ( 'high', 0 ), ( 'low2', 2 ), ( 'normal2', 1 ) ):
+      threadPool.generateJobAndQueueIt( executed.append, args = ( name, ), iPriority = priority )
+    threadPool.generateJobAndQueueIt( done.set, iPriority = 3 )
+    self.assertEqual( threadPool.pendingJobs(), 6 )
+    blocker.set()
+    done.wait( 10 )
+    self.assertEqual( executed, [ 'high', 'normal1', 'normal2', 'low1', 'low2' ] )
+
+  def testFullQueue( self ):
+    """ non blocking queueing fails when the queue is full
+    """
+    threadPool = ThreadPool( 1, 1, 2 )
+    blocker = threading.Event()
+    started = threading.Event()
+    def block():
+      started.set()
+      blocker.wait()
+    threadPool.generateJobAndQueueIt( block )
+    started.wait()
+    for _i in xrange( 2 ):
+      self.assertTrue( threadPool.generateJobAndQueueIt( blocker.wait, blocking = False )[ 'OK' ] )
+    self.assertFalse( threadPool.generateJobAndQueueIt( blocker.wait, blocking = False )[ 'OK' ] )
+    blocker.set()
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ThreadPoolTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
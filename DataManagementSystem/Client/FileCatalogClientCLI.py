@@ -9,7 +9,7 @@ import time
 import sys
 import getopt
 
-from DIRAC.Core.Utilities.ReturnValues import returnSingleResult
+from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR, returnSingleResult
 from DIRAC.Core.Base.CLI import CLI
 from DIRAC.Core.Security.ProxyInfo import getProxyInfo
 from DIRAC.Interfaces.API.Dirac import Dirac
@@ -1150,56 +1150,77 @@ File Catalog Client $Revision: 1.17 $Date:
       dList.printListing(reverse,timeorder,sizeorder,humanread)
       return         
     
-    # Get directory contents now
+    # Get directory contents now, page by page
     try:
-      result =  self.fc.listDirectory(path,_long)                   
       dList = DirectoryListing()
-      if result['OK']:
-        if result['Value']['Successful']:
-          for entry in result['Value']['Successful'][path]['Files']:
-            fname = entry.split('/')[-1]
-            # print entry, fname
-            # fname = entry.replace(self.cwd,'').replace('/','')
-            if _long:
-              fileDict = result['Value']['Successful'][path]['Files'][entry]['MetaData']
-              repDict = result['Value']['Successful'][path]['Files'][entry].get( "Replicas", {} )
-              if fileDict:
-                dList.addFile(fname,fileDict,repDict,numericid)
-            else:  
-              dList.addSimpleFile(fname)
-          for entry in result['Value']['Successful'][path]['SubDirs']:
-            dname = entry.split('/')[-1]
-            # print entry, dname
-            # dname = entry.replace(self.cwd,'').replace('/','')  
+      for result in self.__listDirectoryPages(path,_long):
+        if not result['OK']:
+          print "Error:",result['Message']
+          return
+        pathDict = result['Value']
+        for entry in pathDict['Files']:
+          fname = entry.split('/')[-1]
+          # print entry, fname
+          # fname = entry.replace(self.cwd,'').replace('/','')
+          if _long:
+            fileDict = pathDict['Files'][entry]['MetaData']
+            repDict = pathDict['Files'][entry].get( "Replicas", {} )
+            if fileDict:
+              dList.addFile(fname,fileDict,repDict,numericid)
+          else:  
+            dList.addSimpleFile(fname)
+        for entry in pathDict['SubDirs']:
+          dname = entry.split('/')[-1]
+          # print entry, dname
+          # dname = entry.replace(self.cwd,'').replace('/','')  
+          if _long:
+            dirDict = pathDict['SubDirs'][entry]
+            if dirDict:
+              dList.addDirectory(dname,dirDict,numericid)
+          else:    
+            dList.addSimpleFile(dname)
+          
+        for entry in pathDict['Links']:
+          pass
+          
+        if 'Datasets' in pathDict:
+          for entry in pathDict['Datasets']:
+            dname = os.path.basename( entry )    
             if _long:
-              dirDict = result['Value']['Successful'][path]['SubDirs'][entry]
-              if dirDict:
-                dList.addDirectory(dname,dirDict,numericid)
+              dsDict = pathDict['Datasets'][entry]['Metadata']  
+              if dsDict:
+                dList.addDataset(dname,dsDict,numericid)
             else:    
               dList.addSimpleFile(dname)
-          
-          for entry in result['Value']['Successful'][path]['Links']:
-            pass
-          
-          if 'Datasets' in result['Value']['Successful'][path]:
-            for entry in result['Value']['Successful'][path]['Datasets']:
-              dname = os.path.basename( entry )    
-              if _long:
-                dsDict = result['Value']['Successful'][path]['Datasets'][entry]['Metadata']  
-                if dsDict:
-                  dList.addDataset(dname,dsDict,numericid)
-              else:    
-                dList.addSimpleFile(dname)
               
-          if _long:
-            dList.printListing(reverse,timeorder,sizeorder,humanread)
-          else:
-            dList.printOrdered()
+      if _long:
+        dList.printListing(reverse,timeorder,sizeorder,humanread)
       else:
-        print "Error:",result['Message']
+        dList.printOrdered()
     except Exception as x:
       print "Error:", str(x)
 
+  def __listDirectoryPages(self,path,verbose):
+    """ Generator of the results of the listing of a directory by pages, or of the whole
+        listing at once if the catalog can not list by pages
+    """
+    if not hasattr(self.fc,'listDirectoryPage'):
+      result = self.fc.listDirectory(path,verbose)
+      if result['OK']:
+        if path in result['Value']['Successful']:
+          result = S_OK(result['Value']['Successful'][path])
+        else:
+          result = S_ERROR(result['Value']['Failed'].get(path,'Failed to list %s' % path))
+      yield result
+      return
+    token = None
+    while True:
+      result = self.fc.listDirectoryPage(path,verbose,token)
+      yield result
+      if not result['OK'] or not result['Value']['Token']:
+        return
+      token = result['Value']['Token']
+
   def complete_ls(self, text, line, begidx, endidx):
     result = []
     args = line.split()
@@ -3,15 +3,35 @@
 ########################################################################
 
 """ DIRAC FileCatalog plug-in class to manage dynamic datasets defined by a metadata query
+
+    The file IDs of the dynamic datasets are materialised in FC_MetaDatasetFiles. The
+    files added since the last use of a dataset, which have greater FileIDs, are evaluated
+    against its query with a window of the last evaluated ones, the removed files are
+    dropped when they are removed, and the whole query is evaluated again periodically and
+    when metadata it depends on changes. A change of the files within the window, as done by
+    the usual addFile then setMetadata ingestion, only makes the window evaluated again. The
+    frozen datasets keep a compressed snapshot of their LFNs and FileIDs.
 """
 
 __RCSID__ = "$Id$"
 
 import hashlib as md5
 import os
+import zlib
 
 from DIRAC import S_OK, S_ERROR, gLogger
-from DIRAC.Core.Utilities.List import stringListToString
+from DIRAC.Core.Utilities import DEncode
+from DIRAC.Core.Utilities.List import stringListToString, intListToString, breakListIntoChunks
+
+# Seconds after which the files below the watermark of a dataset are assumed complete
+DATASET_SETTLE_TIME = 300
+
+def _isRelatedPath( path, queryPath ):
+  """ One of the two paths contains the other one
+  """
+  path = path.rstrip( '/' ) + '/'
+  queryPath = queryPath.rstrip( '/' ) + '/'
+  return path.startswith( queryPath ) or queryPath.startswith( path )
 
 class DatasetManager( object ):
 
@@ -38,8 +58,28 @@ class DatasetManager( object ):
                                                 "DatasetID": "INT NOT NULL",
                                                 "FileID": "INT NOT NULL",      
                                                },
-                                     "UniqueIndexes": {"DatasetID_FileID":["DatasetID","FileID"]}
+                                     "UniqueIndexes": {"DatasetID_FileID":["DatasetID","FileID"]},
+                                     "Indexes": {"FileID":["FileID"]}
                                    }
+  _tables["FC_MetaDatasetSync"] = { "Fields": {
+                                               "DatasetID": "INT NOT NULL",
+                                               "LastFileID": "INT NOT NULL DEFAULT 0",
+                                               "SyncFileID": "INT NOT NULL DEFAULT 0",
+                                               "Stale": "TINYINT NOT NULL DEFAULT 0",
+                                               "FullSyncDate": "DATETIME",
+                                               "WatermarkDate": "DATETIME",
+                                               "LastSyncDate": "DATETIME"
+                                              },
+                                    "PrimaryKey": "DatasetID"
+                                  }
+  _tables["FC_MetaDatasetSnapshots"] = { "Fields": {
+                                                    "DatasetID": "INT NOT NULL",
+                                                    "NumberOfFiles": "INT NOT NULL",
+                                                    "Snapshot": "LONGBLOB NOT NULL",
+                                                    "CreationDate": "DATETIME"
+                                                   },
+                                         "PrimaryKey": "DatasetID"
+                                       }
   _tables["FC_DatasetAnnotations"] = { "Fields": {
                                                   "DatasetID": "INT NOT NULL",
                                                   "Annotation": "VARCHAR(512)"
@@ -307,7 +347,16 @@ class DatasetManager( object ):
 
   def __getMetaQueryParameters( self, metaQuery, credDict ):
     """ Get parameters ( hash, total size, number of files ) for the given metaquery
+
+        The parameters of the recent queries are taken from the metadata query cache, which
+        does not keep their LFNList and LFNIDList
     """
+    cacheKey = self.db.metaQueryCache.getKey( metaQuery )
+    parameters = self.db.metaQueryCache.get( cacheKey )
+    if parameters is not None:
+      return S_OK( parameters )
+    generation = self.db.metaQueryCache.getGeneration()
+
     findMetaQuery = dict( metaQuery )
 
     path = '/'
@@ -330,7 +379,16 @@ class DatasetManager( object ):
     lfnIDList = result.get( 'LFNIDList', [] )
     if not lfnIDList:
       lfnIDList = lfnIDDict.keys()
-    lfnList.sort()
+    result = self.__getFileListParameters( lfnList, lfnIDList )
+    # Not cached if the total size could not be obtained
+    if result['TotalSizeKnown']:
+      self.db.metaQueryCache.add( cacheKey, result['Value'], generation, path )
+    return result
+
+  def __getFileListParameters( self, lfnList, lfnIDList ):
+    """ Get parameters ( hash, total size, number of files ) for the given list of files
+    """
+    lfnList = sorted( lfnList )
     myMd5 = md5.md5()
     myMd5.update( str( lfnList ) )
     datasetHash = myMd5.hexdigest().upper()
@@ -340,12 +398,13 @@ class DatasetManager( object ):
     if result['OK']:
       totalSize = result['TotalSize']
 
-    result = S_OK( { 'DatasetHash': datasetHash,
-                     'NumberOfFiles': numberOfFiles,
-                     'TotalSize': totalSize,
-                     'LFNList': lfnList,
-                     'LFNIDList': lfnIDList } )
-    return result
+    parameters = S_OK( { 'DatasetHash': datasetHash,
+                         'NumberOfFiles': numberOfFiles,
+                         'TotalSize': totalSize,
+                         'LFNList': lfnList,
+                         'LFNIDList': lfnIDList } )
+    parameters['TotalSizeKnown'] = result['OK']
+    return parameters
 
   def removeDataset( self, datasets, credDict ):
     """ Remove the requested datasets
@@ -379,7 +438,8 @@ class DatasetManager( object ):
       return S_OK( 'Dataset %s does not exist' % datasetName  )
     datasetID = result['Value'][0][0]
 
-    for table in ["FC_MetaDatasetFiles","FC_MetaDatasets","FC_DatasetAnnotations"]:
+    for table in ["FC_MetaDatasetFiles","FC_MetaDatasetSync","FC_MetaDatasetSnapshots",
+                  "FC_MetaDatasets","FC_DatasetAnnotations"]:
       req = "DELETE FROM %s WHERE DatasetID=%s" % (table, datasetID)
       result = self.db._update( req )
 
@@ -406,7 +466,7 @@ class DatasetManager( object ):
   def __checkDataset( self, datasetName, credDict ):
     """ Check that the dataset parameters correspond to the actual state
     """
-    req = "SELECT MetaQuery,DatasetHash,TotalSize,NumberOfFiles FROM FC_MetaDatasets"
+    req = "SELECT MetaQuery,DatasetHash,TotalSize,NumberOfFiles,DatasetID,Status FROM FC_MetaDatasets"
     req += " WHERE DatasetName='%s'" % datasetName
     result = self.db._query( req )
     if not result['OK']:
@@ -419,10 +479,21 @@ class DatasetManager( object ):
     datasetHashOld = row[1]
     totalSizeOld = int( row[2] )
     numberOfFilesOld = int( row[3] )
+    datasetID = int( row[4] )
 
-    result = self.__getMetaQueryParameters( metaQuery, credDict )
+    result = self.db.fileManager._getIntStatus( int( row[5] ) )
     if not result['OK']:
       return result
+    if result['Value'] == 'Dynamic':
+      # The files of a dynamic dataset are given by its materialised file set
+      result = self.__getDynamicDatasetFiles( datasetID, credDict )
+      if not result['OK']:
+        return result
+      result = self.__getFileListParameters( result['Value'], result['FileIDList'] )
+    else:
+      result = self.__getMetaQueryParameters( metaQuery, credDict )
+      if not result['OK']:
+        return result
     totalSize = result['Value']['TotalSize']
     datasetHash = result['Value']['DatasetHash']
     numberOfFiles = result['Value']['NumberOfFiles']
@@ -677,8 +748,176 @@ class DatasetManager( object ):
     status = result['Value']['Status']
     return S_OK( status )
 
+  def __syncDatasetFiles( self, datasetID, metaQuery, credDict ):
+    """ Bring the materialised file set of a dynamic dataset up to date
+
+        The files added since the last synchronization, which have greater FileIDs, are
+        evaluated against the query. The DatasetSyncWindow FileIDs below the watermark are
+        evaluated again, also when no file was added, until a synchronization starts
+        DATASET_SETTLE_TIME after the watermark moved or a file of the window changed: the
+        files being added by the concurrent addFile calls can be incomplete or committed later
+        than the greater FileIDs. The whole query is evaluated when the dataset is not
+        materialised yet, when the metadata its query depends on changed below the window,
+        and every DatasetFullSyncPeriod to recover from any drift. The evaluated files replace
+        those of the evaluated range in one transaction, so that the set is never seen partially.
+    """
+    req = "SELECT LastFileID, Stale, "
+    req += "FullSyncDate IS NULL OR FullSyncDate < UTC_TIMESTAMP() - INTERVAL %d SECOND, " % self.db.datasetFullSyncPeriod
+    req += "IFNULL( LastSyncDate >= WatermarkDate + INTERVAL %d SECOND, 0 ) " % DATASET_SETTLE_TIME
+    req += "FROM FC_MetaDatasetSync WHERE DatasetID=%d" % datasetID
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    full = True
+    settled = False
+    lastFileID = 0
+    if result['Value']:
+      lastFileID, stale, fullSyncDue, settled = result['Value'][0]
+      full = stale or fullSyncDue or not lastFileID
+
+    result = self.db._query( "SELECT MAX(FileID), UTC_TIMESTAMP() FROM FC_Files" )
+    if not result['OK']:
+      return result
+    maxFileID = result['Value'][0][0] or 0
+    syncDate = result['Value'][0][1]
+    if not full and settled and maxFileID <= lastFileID:
+      return S_OK()
+
+    # The files up to SyncFileID are considered as evaluated by invalidateDatasets, so that
+    # a change during the evaluation marks the dataset stale. The watermark is kept until the
+    # end, as the stale flag set again by a change during a full evaluation
+    if full:
+      req = "INSERT INTO FC_MetaDatasetSync (DatasetID,SyncFileID,Stale,FullSyncDate) "
+      req += "VALUES (%d,%d,0,UTC_TIMESTAMP()) ON DUPLICATE KEY UPDATE " % ( datasetID, maxFileID )
+      req += "SyncFileID=GREATEST(SyncFileID,VALUES(SyncFileID)), Stale=0, FullSyncDate=VALUES(FullSyncDate)"
+    else:
+      req = "UPDATE FC_MetaDatasetSync SET SyncFileID=GREATEST(SyncFileID,%d) WHERE DatasetID=%d" % ( maxFileID,
+                                                                                                       datasetID )
+    result = self.db._update( req )
+    if not result['OK']:
+      return result
+
+    minFileID = 0
+    if not full:
+      minFileID = max( 0, lastFileID - self.db.datasetSyncWindow )
+    findMetaQuery = dict( metaQuery )
+    path = findMetaQuery.pop( 'Path', '/' )
+    result = self.db.fmeta.findFileIDsByMetadata( findMetaQuery, path, credDict, minFileID, maxFileID )
+    if result['OK']:
+      # The concurrent synchronizations of the dataset wait for each other on the lock of its row
+      cmdList = [ "SELECT LastFileID FROM FC_MetaDatasetSync WHERE DatasetID=%d FOR UPDATE" % datasetID ]
+      if full:
+        cmdList.append( "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID )
+      else:
+        # The files of the window which do not match the query any more are dropped
+        cmdList.append( "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%d AND FileID>%d AND FileID<=%d" % \
+                        ( datasetID, minFileID, maxFileID ) )
+      for fileIDs in breakListIntoChunks( result['Value'], 10000 ):
+        valueString = ','.join( [ '(%d,%d)' % ( datasetID, fileID ) for fileID in fileIDs ] )
+        cmdList.append( "INSERT IGNORE INTO FC_MetaDatasetFiles (DatasetID,FileID) VALUES %s" % valueString )
+      if full:
+        req = "UPDATE FC_MetaDatasetSync SET WatermarkDate=UTC_TIMESTAMP(), LastFileID=%d, " % maxFileID
+      else:
+        req = "UPDATE FC_MetaDatasetSync SET WatermarkDate=IF(LastFileID<%d,UTC_TIMESTAMP(),WatermarkDate), " % maxFileID
+        req += "LastFileID=GREATEST(LastFileID,%d), " % maxFileID
+      req += "LastSyncDate='%s' WHERE DatasetID=%d" % ( syncDate, datasetID )
+      cmdList.append( req )
+      result = self.db._transaction( cmdList )
+    if not result['OK']:
+      if full:
+        # Evaluated in full again at the next use
+        self.db._update( "UPDATE FC_MetaDatasetSync SET Stale=1 WHERE DatasetID=%d" % datasetID )
+      return result
+    return S_OK()
+
+  def invalidateDatasets( self, changes, files = None ):
+    """ Mark for a full evaluation the materialised datasets whose query depends on the
+        changed metadata of the given paths
+
+        :param dict changes: names of the changed metadata per path
+        :param list files: paths of changes which are files, the datasets which did not
+                           evaluate these files yet are not affected
+    """
+    if not changes:
+      return S_OK()
+    req = "SELECT S.DatasetID, D.MetaQuery FROM FC_MetaDatasetSync AS S "
+    req += "JOIN FC_MetaDatasets AS D ON S.DatasetID=D.DatasetID WHERE S.Stale=0"
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_OK()
+    datasetRows = result['Value']
+
+    # The names of the metadata sets do not tell which metadata they contain
+    result = self.db.dmeta.getMetadataFields( {} )
+    if not result['OK']:
+      return result
+    metaSets = set( [ name for name, metaType in result['Value'].items() if metaType == 'MetaSet' ] )
+    changes = [ ( path, set( metaNames ) ) for path, metaNames in changes.items() ]
+    relatedPaths = {}
+    for datasetID, metaQuery in datasetRows:
+      metaQuery = eval( metaQuery )
+      queryNames = set( metaQuery )
+      queryPath = metaQuery.get( 'Path', '/' )
+      paths = [ path for path, metaNames in changes
+                if ( queryNames & ( metaNames | metaSets ) ) and _isRelatedPath( path, queryPath ) ]
+      if paths:
+        relatedPaths[datasetID] = paths
+    if not relatedPaths:
+      return S_OK()
+
+    fileIDs = {}
+    filePaths = set( files or [] ) & set( [ path for paths in relatedPaths.values() for path in paths ] )
+    if filePaths:
+      result = self.db.fileManager._findFiles( list( filePaths ) )
+      if result['OK']:
+        fileIDs = dict( [ ( lfn, info['FileID'] ) for lfn, info in result['Value']['Successful'].items() ] )
+    staleIDs = []
+    windowIDs = []
+    conditions = []
+    for datasetID, paths in relatedPaths.items():
+      if [ path for path in paths if path not in fileIDs ]:
+        staleIDs.append( datasetID )
+      else:
+        # The files of the window are evaluated again by the next synchronization, only a
+        # file evaluated already below it, or being evaluated, needs a full evaluation
+        windowIDs.append( datasetID )
+        minFileID = min( [ fileIDs[path] for path in paths ] )
+        conditions.append( "(DatasetID=%d AND GREATEST(LastFileID,SyncFileID)-%d>=%d)" % \
+                           ( datasetID, self.db.datasetSyncWindow, minFileID ) )
+    if staleIDs:
+      conditions.append( "DatasetID IN (%s)" % intListToString( sorted( staleIDs ) ) )
+
+    # The watermarks are compared after the end of the synchronizations holding the rows
+    if windowIDs:
+      req = "UPDATE FC_MetaDatasetSync SET WatermarkDate=UTC_TIMESTAMP() WHERE DatasetID IN (%s)" % \
+            intListToString( sorted( windowIDs ) )
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
+    req = "UPDATE FC_MetaDatasetSync SET Stale=1 WHERE %s" % ' OR '.join( conditions )
+    return self.db._update( req )
+
+  def removeDatasetFiles( self, fileIDList ):
+    """ Drop the removed files from the materialised file sets of the dynamic datasets
+    """
+    if not fileIDList:
+      return S_OK()
+    result = self.db.fileManager._getStatusInt( 'Dynamic' )
+    if not result['OK']:
+      return result
+    intStatus = result['Value']
+    for fileIDs in breakListIntoChunks( fileIDList, 10000 ):
+      req = "DELETE F FROM FC_MetaDatasetFiles AS F JOIN FC_MetaDatasets AS D ON F.DatasetID=D.DatasetID "
+      req += "WHERE D.Status=%d AND F.FileID IN (%s)" % ( intStatus, intListToString( fileIDs ) )
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
+    return S_OK()
+
   def __getDynamicDatasetFiles( self, datasetID, credDict ):
-    """ Get dataset lfns from a dynamic meta query
+    """ Get dataset lfns from the materialised file set of a dynamic meta query
     """
     req = "SELECT MetaQuery FROM FC_MetaDatasets WHERE DatasetID=%d" % datasetID
     result = self.db._query( req )
@@ -688,18 +927,42 @@ class DatasetManager( object ):
       return S_ERROR( 'Unknown MetaDataset ID %d' % datasetID )
 
     metaQuery = eval( result['Value'][0][0] )
-    result = self.__getMetaQueryParameters( metaQuery, credDict )
+    result = self.__syncDatasetFiles( datasetID, metaQuery, credDict )
     if not result['OK']:
       return result
 
-    lfnList = result['Value']['LFNList']
-    finalResult = S_OK(lfnList)
-    finalResult['FileIDList'] = result['Value']['LFNIDList']
-    return finalResult
+    return self.__getStoredDatasetFiles( datasetID )
+
+  def __addSnapshot( self, datasetID, lfnList, fileIDList ):
+    """ Store the compressed snapshot of the files of a frozen dataset
+    """
+    snapshot = zlib.compress( DEncode.encode( ( lfnList, fileIDList ) ), 9 )
+    result = self.db._escapeString( snapshot )
+    if not result['OK']:
+      return result
+    req = "REPLACE INTO FC_MetaDatasetSnapshots (DatasetID,NumberOfFiles,Snapshot,CreationDate) "
+    req += "VALUES (%d,%d,%s,UTC_TIMESTAMP())" % ( datasetID, len( lfnList ), result['Value'] )
+    return self.db._update( req )
 
   def __getFrozenDatasetFiles( self, datasetID, credDict ):
     """ Get dataset lfns from a frozen snapshot
     """
+    req = "SELECT Snapshot FROM FC_MetaDatasetSnapshots WHERE DatasetID=%d" % datasetID
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      # Dataset frozen without a snapshot
+      return self.__getStoredDatasetFiles( datasetID )
+
+    lfnList, fileIDList = DEncode.decode( zlib.decompress( result['Value'][0][0] ) )[0]
+    result = S_OK( list( lfnList ) )
+    result['FileIDList'] = list( fileIDList )
+    return result
+
+  def __getStoredDatasetFiles( self, datasetID ):
+    """ Get dataset lfns from the file IDs stored for it
+    """
 
     req = "SELECT FileID FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
     result = self.db._query( req )
@@ -707,6 +970,10 @@ class DatasetManager( object ):
       return result
 
     fileIDList = [ row[0] for row in result['Value'] ]
+    if not fileIDList:
+      result = S_OK( [] )
+      result['FileIDList'] = []
+      return result
     result = self.db.fileManager._getFileLFNs( fileIDList )
     if not result['OK']:
       return result
@@ -777,20 +1044,18 @@ class DatasetManager( object ):
       return S_OK()
 
     datasetID = result['Value']['DatasetID']
-    req = "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
-    result = self.db._update( req )
-
     result = self.__getDynamicDatasetFiles( datasetID, credDict )
-
     if not result['OK']:
       return result
+    lfnList = result['Value']
     fileIDList = result['FileIDList']
-    valueList = []
-    for fileID in fileIDList:
-      valueList.append( '(%d,%d)' % (datasetID,fileID) )
-    valueString = ','.join( valueList )
-    req = "INSERT INTO FC_MetaDatasetFiles (DatasetID,FileID) VALUES %s" % valueString
+
+    # The materialised file set becomes the frozen contents, it is not maintained anymore
+    req = "DELETE FROM FC_MetaDatasetSync WHERE DatasetID=%d" % datasetID
     result = self.db._update( req )
+    if not result['OK']:
+      return result
+    result = self.__addSnapshot( datasetID, lfnList, fileIDList )
     if not result['OK']:
       return result
 
@@ -827,8 +1092,11 @@ class DatasetManager( object ):
       return S_OK()
 
     datasetID = result['Value']['DatasetID']
-    req = "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
-    result = self.db._update( req )
+    for table in [ "FC_MetaDatasetFiles", "FC_MetaDatasetSnapshots" ]:
+      req = "DELETE FROM %s WHERE DatasetID=%d" % ( table, datasetID )
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
 
     result = self.setDatasetStatus( datasetName, 'Dynamic' )
     return result
@@ -0,0 +1,184 @@
+""" DIRAC FileCatalog cache of the resolution of the directory paths
+
+    The cache keeps, for the most recently used directory paths, the DirID of
+    the directory and its UID, GID, Mode and Status, so that the resolution of
+    the directory of each LFN does not need a query. The number of entries is
+    bounded, the least recently used ones are dropped first, and they are
+    dropped after a maximum age in case an invalidation was missed. Only
+    existing directories are cached.
+
+    The entries are invalidated by the operations changing them in the
+    catalog service. When several catalog service instances share the
+    database, the invalidations of the other instances are obtained with a
+    synchronization function called at most once per synchronization period
+    before using the cache.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+from collections import OrderedDict
+
+from DIRAC import gLogger
+
+class DirectoryCache( object ):
+
+  def __init__( self, maxSize = 100000, syncFunction = None, syncPeriod = 1, maxAge = 300 ):
+    """ Constructor
+
+        :param int maxSize: maximum number of directories in the cache, 0 to disable it
+        :param float maxAge: seconds after which an entry is read again from the DB, 0 for no limit
+        :param syncFunction: function returning S_OK( list of ( path, recursive ) ) with the
+                             invalidations done elsewhere since its previous call, or S_OK( None )
+                             if the whole cache has to be invalidated
+        :param float syncPeriod: seconds between two calls of the synchronization function
+    """
+    self.log = gLogger.getSubLogger( 'DirectoryCache' )
+    self.maxSize = max( 0, maxSize )
+    self.maxAge = maxAge
+    self.__syncFunction = syncFunction
+    self.__syncPeriod = syncPeriod
+    self.__nextSync = 0
+    self.__syncLock = threading.Lock()
+    self.__lock = threading.Lock()
+    self.__cache = OrderedDict()
+    self.__hits = 0
+    self.__misses = 0
+    #Incremented by each invalidation
+    self.__generation = 0
+
+  def __sync( self ):
+    """ Apply the invalidations of the other catalog service instances
+    """
+    self.__lock.acquire()
+    try:
+      now = time.time()
+      if now < self.__nextSync:
+        return
+      self.__nextSync = now + self.__syncPeriod
+    finally:
+      self.__lock.release()
+    #Only one synchronization at a time
+    if not self.__syncLock.acquire( False ):
+      return
+    try:
+      result = self.__syncFunction()
+      if not result['OK']:
+        #The entries can not be trusted anymore
+        self.log.warn( 'Failed to synchronize the directory cache', result['Message'] )
+        self.clear()
+        return
+      if result['Value'] is None:
+        self.clear()
+        return
+      for path, recursive in result['Value']:
+        self.__invalidate( path, recursive )
+    finally:
+      self.__syncLock.release()
+
+  def get( self, path ):
+    """ Get the cached entry of a directory
+
+        :param str path: normalized directory path
+        :return: dictionary with the DirID, UID, GID, Mode and Status of the directory or None
+    """
+    if not self.maxSize:
+      return None
+    if self.__syncFunction:
+      self.__sync()
+    self.__lock.acquire()
+    try:
+      cached = self.__cache.pop( path, None )
+      if cached is None or ( self.maxAge and time.time() > cached[1] ):
+        self.__misses += 1
+        return None
+      #Moved at the end of the LRU order
+      self.__cache[ path ] = cached
+      self.__hits += 1
+      return cached[0]
+    finally:
+      self.__lock.release()
+
+  def getGeneration( self ):
+    """ Get the generation to give to add for the entries read from the DB from now on
+    """
+    return self.__generation
+
+  def add( self, path, entry, generation = None ):
+    """ Add or replace the entry of a directory
+
+        :param int generation: generation of the cache before the entry was read, the entry is
+                               not added if there has been an invalidation since then
+    """
+    if not self.maxSize:
+      return
+    self.__lock.acquire()
+    try:
+      if generation is not None and generation != self.__generation:
+        return
+      self.__cache.pop( path, None )
+      self.__cache[ path ] = ( entry, time.time() + self.maxAge )
+      while len( self.__cache ) > self.maxSize:
+        self.__cache.popitem( last = False )
+    finally:
+      self.__lock.release()
+
+  def __invalidate( self, path, recursive = False ):
+    self.__lock.acquire()
+    try:
+      self.__generation += 1
+      if recursive and path == '/':
+        self.__cache.clear()
+        return
+      self.__cache.pop( path, None )
+      if recursive:
+        prefix = path.rstrip( '/' ) + '/'
+        for cachedPath in [ cachedPath for cachedPath in self.__cache if cachedPath.startswith( prefix ) ]:
+          del self.__cache[ cachedPath ]
+    finally:
+      self.__lock.release()
+
+  def invalidate( self, paths, recursive = False ):
+    """ Drop the entries of the directories, and of all their subdirectories if recursive
+    """
+    if isinstance( paths, basestring ):
+      paths = [ paths ]
+    for path in paths:
+      self.__invalidate( path, recursive )
+
+  def invalidateDirIDs( self, dirIDs ):
+    """ Drop the entries of the directories with the given DirIDs
+    """
+    dirIDs = set( dirIDs )
+    self.__lock.acquire()
+    try:
+      self.__generation += 1
+      for cachedPath in [ cachedPath for cachedPath, cached in self.__cache.items() if cached[0]['DirID'] in dirIDs ]:
+        del self.__cache[ cachedPath ]
+    finally:
+      self.__lock.release()
+
+  def clear( self ):
+    """ Drop all the entries
+    """
+    self.__lock.acquire()
+    try:
+      self.__generation += 1
+      self.__cache.clear()
+    finally:
+      self.__lock.release()
+
+  def getCounters( self ):
+    """ Get the size and the hit rate of the cache
+    """
+    self.__lock.acquire()
+    try:
+      lookups = self.__hits + self.__misses
+      hitRate = 100. * self.__hits / lookups if lookups else 0.
+      return { 'Directory Cache Size' : len( self.__cache ),
+               'Directory Cache Hits' : self.__hits,
+               'Directory Cache Misses' : self.__misses,
+               'Directory Cache Hit Rate (%)' : round( hitRate, 1 ) }
+    finally:
+      self.__lock.release()
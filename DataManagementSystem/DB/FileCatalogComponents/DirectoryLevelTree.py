@@ -29,36 +29,78 @@ class DirectoryLevelTree(DirectoryTreeBase):
     
     return 'Directory'
 
+  def __findDirEntries( self, dpaths, connection = False ):
+    """ Get the directory cache entries of the given normalized paths, the entries
+        not cached are obtained together with their FC_DirectoryInfo parameters
+    """
+    entryDict = {}
+    missing = []
+    for dpath in dpaths:
+      entry = self.db.dirCache.get( dpath )
+      if entry:
+        entryDict[dpath] = entry
+      else:
+        missing.append( dpath )
+    if not missing:
+      return S_OK( entryDict )
+
+    generation = self.db.dirCache.getGeneration()
+    dpathString = ','.join( [ "'%s'" % dpath for dpath in missing ] )
+    req = "SELECT t.DirName,t.DirID,t.Level,i.UID,i.GID,i.Mode,i.Status FROM FC_DirectoryLevelTree AS t"
+    req += " LEFT JOIN FC_DirectoryInfo AS i ON t.DirID=i.DirID WHERE t.DirName IN (%s)" % dpathString
+    result = self.db._query( req, connection )
+    if not result['OK']:
+      return result
+    for dirName, dirID, level, uid, gid, mode, status in result['Value']:
+      entry = { 'DirID' : dirID, 'Level' : level, 'UID' : uid, 'GID' : gid, 'Mode' : mode, 'Status' : status }
+      entryDict[dirName] = entry
+      # A directory being created has no FC_DirectoryInfo yet
+      if uid is not None:
+        self.db.dirCache.add( dirName, entry, generation )
+    return S_OK( entryDict )
+
   def findDir(self,path,connection=False):
     """  Find directory ID for the given path
     """
     
     dpath = os.path.normpath( path )    
-    req = "SELECT DirID,Level from FC_DirectoryLevelTree WHERE DirName='%s'" % dpath
-    result = self.db._query(req,connection)
+    result = self.__findDirEntries( [dpath], connection )
     if not result['OK']:
       return result
     
-    if not result['Value']:
+    if not dpath in result['Value']:
       return S_OK('')
     
-    res = S_OK( result['Value'][0][0] )
-    res['Level'] = result['Value'][0][1]
+    entry = result['Value'][dpath]
+    res = S_OK( entry['DirID'] )
+    res['Level'] = entry['Level']
     return res
   
   def findDirs( self, paths, connection=False ):
     """ Find DirIDs for the given path list
     """
-    dpaths = ','.join( [ "'"+os.path.normpath( path )+"'" for path in paths ] )
-    req = "SELECT DirName,DirID from FC_DirectoryLevelTree WHERE DirName in (%s)" % dpaths
-    result = self.db._query(req,connection)
+    result = self.__findDirEntries( set( [ os.path.normpath( path ) for path in paths ] ), connection )
     if not result['OK']:
       return result
     dirDict = {}
-    for dirName, dirID in result['Value']:
-      dirDict[dirName] = dirID
+    for dirName, entry in result['Value'].items():
+      dirDict[dirName] = entry['DirID']
 
     return S_OK( dirDict )
+
+  def getDirectoryInfo( self, path ):
+    """ Get the DirID, UID, GID, Mode and Status of the given directory
+    """
+    dpath = os.path.normpath( path )
+    result = self.__findDirEntries( [dpath] )
+    if not result['OK']:
+      return result
+    entry = result['Value'].get( dpath )
+    if not entry:
+      return S_ERROR( '%s: not found' % dpath )
+    if entry['UID'] is None:
+      return S_ERROR( 'Directory not found' )
+    return S_OK( entry )
   
   def removeDir(self,path):
     """ Remove directory
@@ -10,15 +10,18 @@ __RCSID__ = "$Id$"
 import os, types
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Utilities.Time import queryTime
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner import MetaQueryPlanner
 
 class DirectoryMetadata:
 
   def __init__( self, database = None ):
 
     self.db = database
+    self.planner = MetaQueryPlanner( database )
 
   def setDatabase( self, database ):
     self.db = database
+    self.planner = MetaQueryPlanner( database )
 
 ##############################################################################
 #
@@ -79,8 +82,10 @@ class DirectoryMetadata:
     """ Remove metadata field
     """
 
+    self.planner.invalidate( 'FC_Meta_%s' % pname )
     req = "DROP TABLE FC_Meta_%s" % pname
     result = self.db._update( req )
+    self.db.metaQueryCache.clear()
     error = ''
     if not result['OK']:
       error = result["Message"]
@@ -199,6 +204,7 @@ class DirectoryMetadata:
       # Check that the metadata is not defined for the parent directories
       if metaName in dirmeta['Value']:
         return S_ERROR( 'Metadata conflict detected for %s for directory %s' % ( metaName, dpath ) )
+      self.planner.invalidate( 'FC_Meta_%s' % metaName )
       result = self.db._insert( 'FC_Meta_%s' % metaName, ['DirID', 'Value'], [dirID, metaValue] )
       if not result['OK']:
         if result['Message'].find( 'Duplicate' ) != -1:
@@ -230,6 +236,7 @@ class DirectoryMetadata:
     for meta in metadata:
       if meta in metaFields:
         # Indexed meta case
+        self.planner.invalidate( 'FC_Meta_%s' % meta )
         req = "DELETE FROM FC_Meta_%s WHERE DirID=%d" % ( meta, dirID )
         result = self.db._update( req )
         if not result['OK']:
@@ -455,13 +462,13 @@ class DirectoryMetadata:
     selectString = result['Value']
 
     req = " SELECT M.DirID FROM FC_Meta_%s AS M" % meta
+    conditions = []
     if pathSelection:
-      req += " JOIN ( %s ) AS P WHERE M.DirID=P.DirID" % pathSelection
+      conditions.append( "M.DirID IN ( %s )" % pathSelection )
     if selectString:
-      if pathSelection:
-        req += " AND %s" % selectString
-      else:
-        req += " WHERE %s" % selectString
+      conditions.append( selectString )
+    if conditions:
+      req += " WHERE %s" % ' AND '.join( conditions )
 
     result = self.db._query( req )
     if not result['OK']:
@@ -492,20 +499,16 @@ class DirectoryMetadata:
     result = self.__findSubdirByMeta( meta, 'Any', pathSelection )
     if not result['OK']:
       return result
-    dirList = result['Value']
-    table = self.db.dtree.getTreeTable()
-    dirString = ','.join( [ str( x ) for x in dirList ] )
-    if dirList:
-      req = 'SELECT DirID FROM %s WHERE DirID NOT IN ( %s )' % ( table, dirString )
+    metaDirs = set( result['Value'] )
+    if pathSelection:
+      req = pathSelection
     else:
-      req = 'SELECT DirID FROM %s' % table
+      req = 'SELECT DirID FROM %s' % self.db.dtree.getTreeTable()
     result = self.db._query( req )
     if not result['OK']:
       return result
-    if not result['Value']:
-      return S_OK( [] )
 
-    dirList = [ x[0] for x in result['Value'] ]
+    dirList = [ x[0] for x in result['Value'] if x[0] not in metaDirs ]
     return S_OK( dirList )
 
   def __expandMetaDictionary( self, metaDict, credDict ):
@@ -596,46 +599,29 @@ class DirectoryMetadata:
         # given metadata, no need to check it further 
         del finalMetaDict[meta]
 
+    pathSelection = ''
+    if pathDirID:
+      result = self.db.dtree.getSubdirectoriesByID( pathDirID, includeParent = True, requestString = True )
+      if not result['OK']:
+        return result
+      pathSelection = result['Value']
+
     if finalMetaDict:
-      pathSelection = ''
-      if pathDirID:
-        result = self.db.dtree.getSubdirectoriesByID( pathDirID, includeParent = True, requestString = True )
-        if not result['OK']:
-          return result
-        pathSelection = result['Value']
-      dirList = []
-      first = True
-      for meta, value in finalMetaDict.items():
-        if value == "Missing":
-          result = self.__findSubdirMissingMeta( meta, pathSelection )
-        else:
-          result = self.__findSubdirByMeta( meta, value, pathSelection )
-        if not result['OK']:
-          return result
-        mList = result['Value']
-        if first:
-          dirList = mList
-          first = False
-        else:
-          newList = []
-          for d in dirList:
-            if d in mList:
-              newList.append( d )
-          dirList = newList
-    else:
-      if pathDirID:
-        result = self.db.dtree.getSubdirectoriesByID( pathDirID, includeParent = True )
-        if not result['OK']:
-          return result
-        pathDirList = result['Value'].keys()
+      result = self.__findDirsByConditions( finalMetaDict, pathSelection )
+      if not result['OK']:
+        return result
+      dirList = result['Value']
+    elif pathDirID:
+      result = self.db.dtree.getSubdirectoriesByID( pathDirID, includeParent = True )
+      if not result['OK']:
+        return result
+      pathDirList = result['Value'].keys()
 
     finalList = []
     dirSelect = False
     if finalMetaDict:
       dirSelect = True
       finalList = dirList
-      if pathDirList:
-        finalList = list( set( dirList ) & set( pathDirList ) )
     else:
       if pathDirList:
         dirSelect = True
@@ -644,6 +630,9 @@ class DirectoryMetadata:
 
     if finalList:
       result['Selection'] = 'Done'
+      if not finalMetaDict:
+        # Only the path restricts the selection, it can be used in a subquery
+        result['PathSelection'] = pathSelection
     elif dirSelect:
       result['Selection'] = 'None'
     else:
@@ -651,6 +640,63 @@ class DirectoryMetadata:
 
     return result
 
+  def __findDirsByConditions( self, metaDict, pathSelection ):
+    """ Find the directories satisfying all the conditions of the metadata dictionary,
+        among the directories of the path selection if any
+
+        The conditions are evaluated by increasing estimated number of matching directories
+        and the evaluation stops as soon as no directory is left. The directories satisfying
+        the conditions evaluated so far are kept as the top directories of the matching
+        subtrees, which are only expanded at the end.
+    """
+    result = self.planner.orderConditions( metaDict )
+    if not result['OK']:
+      return result
+    metaList = result['Value']
+    missingList = [ meta for meta in metaList if metaDict[meta] == "Missing" ]
+    metaList = [ meta for meta in metaList if metaDict[meta] != "Missing" ]
+
+    if metaList:
+      topDirs = None
+      for meta in metaList:
+        result = self.__findSubdirByMeta( meta, metaDict[meta], pathSelection, subdirFlag = False )
+        if not result['OK']:
+          return result
+        metaDirs = set( result['Value'] )
+        if topDirs is None:
+          topDirs = metaDirs
+        elif metaDirs:
+          result = self.db.dtree.getAncestorsInList( list( topDirs | metaDirs ) )
+          if not result['OK']:
+            return result
+          ancestorDict = result['Value']
+          # Two subtrees intersect in the subtree of the deepest of their top directories
+          topDirs = set( [ dirID for dirID in topDirs if ancestorDict.get( dirID, set() ) & metaDirs ] ) | \
+                    set( [ dirID for dirID in metaDirs if ancestorDict.get( dirID, set() ) & topDirs ] )
+        else:
+          topDirs = set()
+        if not topDirs:
+          return S_OK( [] )
+      result = self.db.dtree.getAllSubdirectoriesByID( list( topDirs ) )
+      if not result['OK']:
+        return result
+      dirSet = topDirs | set( result['Value'] )
+    else:
+      result = self.__findSubdirMissingMeta( missingList.pop( 0 ), pathSelection )
+      if not result['OK']:
+        return result
+      dirSet = set( result['Value'] )
+
+    for meta in missingList:
+      if not dirSet:
+        break
+      result = self.__findSubdirByMeta( meta, 'Any', pathSelection )
+      if not result['OK']:
+        return result
+      dirSet -= set( result['Value'] )
+
+    return S_OK( list( dirSet ) )
+
   @queryTime
   def findDirectoriesByMetadata( self, queryDict, path, credDict ):
     """ Find Directory names satisfying the given metadata and being subdirectories of 
@@ -855,6 +901,7 @@ class DirectoryMetadata:
       return result
     metaFields = result['Value']
 
+    self.planner.invalidate()
     for meta in metaFields:
       req = "DELETE FROM FC_Meta_%s WHERE DirID in ( %s )" % ( meta, dirListString )
       result = self.db._query( req )
@@ -6,6 +6,7 @@
 __RCSID__ = "$Id$"
 
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities  import getIDSelectString
+from DIRAC.Core.Utilities.List                                     import breakListIntoChunks
 from DIRAC                                                          import S_OK, S_ERROR, gLogger
 import time, threading, os
 from types import StringTypes, ListType
@@ -79,7 +80,34 @@ class DirectoryTreeBase:
     return self.treeTable
     
   def setDatabase(self,database):
-    self.db = database  
+    self.db = database
+
+  def getAncestorsInList( self, dirIDList ):
+    """ Get, for each directory of the list, the directories of the list which are
+        the directory itself or one of its ancestors
+
+        :param list dirIDList: list of directory IDs
+        :return: S_OK( { dirID : set of dirIDs } )
+    """
+    dirPaths = {}
+    for dirIDs in breakListIntoChunks( list( set( dirIDList ) ), 10000 ):
+      result = self.getDirectoryPaths( dirIDs )
+      if not result['OK']:
+        return result
+      dirPaths.update( result['Value'] )
+    pathIDs = dict( [ ( path, dirID ) for dirID, path in dirPaths.items() ] )
+
+    ancestorDict = {}
+    for dirID, path in dirPaths.items():
+      ancestors = set()
+      while True:
+        if path in pathIDs:
+          ancestors.add( pathIDs[path] )
+        if path == '/':
+          break
+        path = os.path.dirname( path )
+      ancestorDict[dirID] = ancestors
+    return S_OK( ancestorDict )
 
   def makeDirectory(self,path,credDict,status=0):
     """Create a new directory. The return value is the dictionary
@@ -107,6 +135,8 @@ class DirectoryTreeBase:
       return result
     dirID = result['Value']
     if result['NewDirectory']:
+      # Entry of a directory with the same path removed by another catalog instance
+      self.db.invalidateDirectoryCache( path, local = True )
       req = "INSERT INTO FC_DirectoryInfo (DirID,UID,GID,CreationDate,ModificationDate,Mode,Status) Values "
       req = req + "(%d,%d,%d,UTC_TIMESTAMP(),UTC_TIMESTAMP(),%d,%d)" % ( dirID, l_uid, l_gid, self.db.umask, status )
       result = self.db._update( req )
@@ -119,6 +149,7 @@ class DirectoryTreeBase:
 
     if not dirDict:
       self.removeDir( path )
+      self.db.invalidateDirectoryCache( path )
       return S_ERROR( 'Failed to create directory %s' % path )
     return S_OK( dirID )
 
@@ -275,6 +306,7 @@ class DirectoryTreeBase:
         failed[dir] = result['Message']
       else:
         successful[dir] = result
+        self.db.invalidateDirectoryCache( dir )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
 #####################################################################
@@ -334,6 +366,22 @@ class DirectoryTreeBase:
 
     return S_OK( dirDict )
 
+#####################################################################
+  def getDirectoryInfo( self, path ):
+    """ Get the DirID, UID, GID, Mode and Status of the given directory, from the directory cache if possible
+    """
+    dpath = os.path.normpath( path )
+    entry = self.db.dirCache.get( dpath )
+    if entry:
+      return S_OK( entry )
+    generation = self.db.dirCache.getGeneration()
+    result = self.getDirectoryParameters( dpath )
+    if not result['OK']:
+      return result
+    entry = dict( [ ( key, result['Value'][key] ) for key in ( 'DirID', 'UID', 'GID', 'Mode', 'Status' ) ] )
+    self.db.dirCache.add( dpath, entry, generation )
+    return S_OK( entry )
+
 #####################################################################
   def _setDirectoryParameter( self, path, pname, pvalue ):
     """ Set a numerical directory parameter
@@ -342,6 +390,8 @@ class DirectoryTreeBase:
                            list/tuple of ints or a string to select directory IDs
         :param str pname: parameter name
         :param int pvalue: parameter value
+
+        The directory cache is not invalidated, it is up to the caller
     """
     result = getIDSelectString( path )
     if not result['OK'] and isinstance( path, basestring ):
@@ -454,6 +504,7 @@ class DirectoryTreeBase:
       if not result['OK']:
         failed[path] = result['Message']
         continue
+      self.db.invalidateDirectoryCache( os.path.normpath( path ) )
       if recursive:
         result = self.__getDirID( path )
         if not result['OK']:
@@ -473,6 +524,7 @@ class DirectoryTreeBase:
         fileQuery = result['Value']
 
         result = directoryFunction( subDirQuery, attribute )
+        self.db.invalidateDirectoryCache( os.path.normpath( path ), recursive = True )
         if not result['OK']:
           failed[path] = result['Message']
           continue
@@ -490,7 +542,12 @@ class DirectoryTreeBase:
   def setDirectoryStatus( self, path, status ):
     """ set the directory status
     """
-    return self._setDirectoryParameter( path, 'Status', status )
+    result = self._setDirectoryParameter( path, 'Status', status )
+    if isinstance( path, basestring ) and not path.lower().startswith( 'select' ):
+      self.db.invalidateDirectoryCache( os.path.normpath( path ) )
+    else:
+      self.db.invalidateDirectoryCache( '/', recursive = True )
+    return result
 
   def getPathPermissions( self, lfns, credDict ):
     """ Get permissions for the given user/group to manipulate the given lfns 
@@ -515,7 +572,7 @@ class DirectoryTreeBase:
       return result
     uid, gid = result['Value']
 
-    result = self.getDirectoryParameters( path )
+    result = self.getDirectoryInfo( path )
     if not result['OK']:
       if "not found" in result['Message'] or "not exist" in result['Message']:
         # If the directory does not exist, check the nearest parent for the permissions
@@ -633,15 +690,10 @@ class DirectoryTreeBase:
     result['LFNIDList'] = lfnIDList
     return result
 
-  def _getDirectoryContents( self, path, details = False ):
-    """ Get contents of a given directory
+  def __getDirectoryEntries( self, path, directoryID, details = False ):
+    """ Get the subdirectories, links and datasets of a given directory
     """
-    result = self.findDir( path )
-    if not result['OK']:
-      return result
-    directoryID = result['Value']
     directories = {}
-    files = {}
     links = {}
     result = self.getChildren( path )
     if not result['OK']:
@@ -662,16 +714,87 @@ class DirectoryTreeBase:
           directories[dirName] = result['Value']
       else:
         directories[dirName] = True
+    result = self.db.datasetManager.getDatasetsInDirectory( directoryID, verbose = details )
+    if not result['OK']:
+      return result
+    datasets = result['Value']
+    return S_OK( { 'SubDirs':directories, 'Links':links, 'Datasets':datasets } )
+
+  def _getDirectoryContents( self, path, details = False ):
+    """ Get contents of a given directory
+    """
+    result = self.findDir( path )
+    if not result['OK']:
+      return result
+    directoryID = result['Value']
+    result = self.__getDirectoryEntries( path, directoryID, details )
+    if not result['OK']:
+      return result
+    pathDict = result['Value']
     result = self.db.fileManager.getFilesInDirectory( directoryID, verbose = details )
     if not result['OK']:
       return result
-    files = result['Value']
-    result = self.db.datasetManager.getDatasetsInDirectory( directoryID, verbose = details )
+    pathDict['Files'] = result['Value']
+
+    return S_OK( pathDict )
+
+  def __getPageStart( self, path, token ):
+    """ Get the DirID of a directory and the FileID after which its next page of files starts
+
+        The continuation token is "<DirID>:<FileID of the last file of the previous page>",
+        it is refused if the directory has been removed and created again since then.
+    """
+    result = self.findDir( path )
     if not result['OK']:
       return result
-    datasets = result['Value']
-    pathDict = {'Files': files, 'SubDirs':directories, 'Links':links, 'Datasets':datasets }
+    directoryID = result['Value']
+    if not directoryID:
+      return S_ERROR( 'Directory does not exist: %s' % path )
+    if not token:
+      return S_OK( ( directoryID, 0 ) )
+    try:
+      tokenDirID, lastFileID = [ int( value ) for value in token.split( ':' ) ]
+    except ValueError:
+      return S_ERROR( 'Invalid continuation token: %s' % token )
+    if tokenDirID != directoryID:
+      return S_ERROR( 'Continuation token of another directory: %s' % token )
+    return S_OK( ( directoryID, lastFileID ) )
+
+  @staticmethod
+  def __getNextToken( directoryID, lastFileID ):
+    """ Get the continuation token of the next page, None after the last page
+    """
+    if lastFileID is None:
+      return None
+    return '%d:%d' % ( directoryID, lastFileID )
+
+  def listDirectoryPage( self, path, verbose = False, token = None, maxFiles = 1000 ):
+    """ Get a page of the contents of a given directory, with at most maxFiles files
 
+        The files are paged by FileID: the files added after the start of the listing are
+        in the last pages, the files removed are skipped and no file is returned twice.
+        The subdirectories, links and datasets are returned in the first page only.
+
+        :param str token: continuation token returned with the previous page, None for the first page
+        :return: S_OK( dictionary with the "Files", "SubDirs", "Links" and "Datasets" of the page,
+                 and the "Token" of the next page, None after the last page )
+    """
+    result = self.__getPageStart( path, token )
+    if not result['OK']:
+      return result
+    directoryID, lastFileID = result['Value']
+    if token:
+      pathDict = { 'SubDirs':{}, 'Links':{}, 'Datasets':{} }
+    else:
+      result = self.__getDirectoryEntries( path, directoryID, verbose )
+      if not result['OK']:
+        return result
+      pathDict = result['Value']
+    result = self.db.fileManager.getFilesInDirectoryPage( directoryID, lastFileID, maxFiles, verbose = verbose )
+    if not result['OK']:
+      return result
+    pathDict['Files'], lastFileID = result['Value']
+    pathDict['Token'] = self.__getNextToken( directoryID, lastFileID )
     return S_OK( pathDict )
 
   def listDirectory( self, lfns, verbose = False ):
@@ -721,6 +844,32 @@ class DirectoryTreeBase:
       
     return result
 
+  def getDirectoryReplicasPage( self, path, allStatus = False, token = None, maxFiles = 1000 ):
+    """ Get the replicas of a page of at most maxFiles files of a given directory, paged as in listDirectoryPage
+
+        :param str token: continuation token returned with the previous page, None for the first page
+        :return: S_OK( dictionary with the replicas per file name of the page as "Files", the "Token"
+                 of the next page, None after the last page, and the "SEPrefixes" if needed )
+    """
+    result = self.__getPageStart( path, token )
+    if not result['OK']:
+      return result
+    directoryID, lastFileID = result['Value']
+    result = self.db.fileManager.getDirectoryReplicasPage( directoryID, lastFileID, maxFiles, allStatus )
+    if not result['OK']:
+      return result
+    replicas, lastFileID = result['Value']
+    pageDict = { 'Files':replicas, 'Token':self.__getNextToken( directoryID, lastFileID ) }
+
+    if self.db.lfnPfnConvention:
+      sePrefixDict = {}
+      resSE = self.db.seManager.getSEPrefixes()
+      if resSE['OK']:
+        sePrefixDict = resSE['Value']
+      pageDict['SEPrefixes'] = sePrefixDict
+
+    return S_OK( pageDict )
+
   def getDirectorySize( self, lfns, longOutput = False, rawFileTables = False ):
     """ Get the total size of the requested directories. If long flag
         is True, get also physical size per Storage Element
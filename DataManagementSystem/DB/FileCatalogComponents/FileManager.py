@@ -4,7 +4,7 @@
 __RCSID__ = "$Id$"
 
 from DIRAC                                                                import S_OK, S_ERROR, gLogger
-from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManagerBase  import FileManagerBase
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManagerBase  import FileManagerBase, LFN_CHUNK_SIZE
 from DIRAC.Core.Utilities.List                                            import stringListToString, \
                                                                                  intListToString, \
                                                                                  breakListIntoChunks
@@ -33,31 +33,31 @@ class FileManager( FileManagerBase ):
       return result
     directoryIDs = result['Value']
 
+    dirFiles = {}
+    directoryPaths = {}
     for dirPath in dirDict:
       if not dirPath in directoryIDs:
         for fileName in dirDict[dirPath]:
           fname = '%s/%s' % (dirPath,fileName)
           fname = fname.replace('//','/')
           failed[fname] = 'No such file or directory'
+      else:
+        dirFiles[directoryIDs[dirPath]] = dirDict[dirPath]
+        directoryPaths[directoryIDs[dirPath]] = dirPath
 
     successful = {}
-    for dirPath in directoryIDs:
-      fileNames = dirDict[dirPath]
-      res = self._getDirectoryFiles( directoryIDs[dirPath], fileNames, metadata, allStatus = allStatus, connection = connection )
-      if (not res['OK']) or (not res['Value']):
-        error = res.get('Message','No such file or directory')
-        for fileName in fileNames:
-          fname = '%s/%s' % (dirPath,fileName)
-          fname = fname.replace('//','/')
-          failed[fname] = error
-      else:
-        for fileName,fileDict in res['Value'].items():
-          fname = '%s/%s' % (dirPath,fileName)
-          fname = fname.replace('//','/')
-          successful[fname] = fileDict
+    res = self.__getFiles( dirFiles, metadata, allStatus = allStatus, connection = connection )
+    if not res['OK']:
+      return res
+    for dirID, filesDict in res['Value'].items():
+      for fileName, fileDict in filesDict.items():
+        fname = '%s/%s' % (directoryPaths[dirID],fileName)
+        fname = fname.replace('//','/')
+        successful[fname] = fileDict
+    for dirID, fileNames in dirFiles.items():
       for fileName in fileNames:
-        if not fileName in res['Value']:
-          fname = '%s/%s' % (dirPath,fileName)
+        if not fileName in res['Value'].get( dirID, {} ):
+          fname = '%s/%s' % (directoryPaths[dirID],fileName)
           fname = fname.replace('//','/')
           failed[fname] = 'No such file or directory'    
     return S_OK({"Successful":successful,"Failed":failed})
@@ -74,6 +74,7 @@ class FileManager( FileManagerBase ):
       return result
     directoryIDs = result['Value']
     directoryPaths = {}
+    dirFiles = {}
 
     for dirPath in dirDict:
       if not dirPath in directoryIDs:
@@ -83,16 +84,10 @@ class FileManager( FileManagerBase ):
           failed[fname] = 'No such directory'
       else:
         directoryPaths[directoryIDs[dirPath]] = dirPath
-    directoryIDList = directoryIDs.keys()
-    for dirIDs in breakListIntoChunks( directoryIDList, 1000 ):
+        dirFiles[directoryIDs[dirPath]] = dirDict[dirPath]
 
-      wheres = []
-      for dirPath in dirIDs:
-        fileNames = dirDict[dirPath]
-        dirID = directoryIDs[dirPath]
-        wheres.append( "( DirID=%d AND FileName IN (%s) )" % (dirID, stringListToString(fileNames) ) )
-
-      req = "SELECT FileName,DirID,FileID FROM FC_Files WHERE %s" % " OR ".join( wheres )
+    for condition in self._getFileConditions( dirFiles ):
+      req = "SELECT FileName,DirID,FileID FROM FC_Files WHERE %s" % condition
       result = self.db._query(req,connection)
       if not result['OK']:
         return result
@@ -107,86 +102,102 @@ class FileManager( FileManagerBase ):
 
     return S_OK({"Successful":successful,"Failed":failed})
 
-  def _getDirectoryFiles(self,dirID,fileNames,metadata_input,allStatus=False,connection=False):
-    """ Get the metadata for files in the same directory
+  def __getFiles( self, dirFiles, metadata_input, allStatus = False, connection = False,
+                  lastFileID = None, maxFiles = None ):
+    """ Get the metadata of files of several directories, with one query per chunk of files
+
+        :param dict dirFiles: list of file names per DirID, an empty list for all the files of the directory
+        :param int lastFileID: if given, only the files with a greater FileID, at most maxFiles of them
+        :return: S_OK( dictionary of the metadata per file name per DirID )
     """
     metadata = list(metadata_input)
-    
-    connection = self._getConnection(connection)
     # metadata can be any of ['FileID','Size','UID','GID','Status','Checksum','ChecksumType',
     # 'Type','CreationDate','ModificationDate','Mode']
-    req = "SELECT FileName,DirID,FileID,Size,UID,GID,Status FROM FC_Files WHERE DirID=%d" % (dirID)
+    onlyFileID = metadata == ['FileID']
+    infoFields = [ field for field in metadata if not field in ['FileID','Size','DirID','UID','GID','Status'] ]
+    req = "SELECT f.FileName,f.DirID,f.FileID,f.Size,f.UID,f.GID,f.Status"
+    if infoFields:
+      req += ",i.FileID,%s FROM FC_Files AS f LEFT JOIN FC_FileInfo AS i ON i.FileID=f.FileID" % \
+             ','.join( [ 'i.%s' % field for field in infoFields ] )
+    else:
+      req += " FROM FC_Files AS f"
+    statusCondition = ''
     if not allStatus:
-      statusIDs = []
-      for status in self.db.visibleFileStatus:
-        res = self._getStatusInt( status, connection=connection )
-        if res['OK']:
-          statusIDs.append( res['Value'] )
+      statusIDs = self._getStatusIntList( self.db.visibleFileStatus, connection = connection )
       if statusIDs:
-        req = "%s AND Status IN (%s)" % (req,intListToString(statusIDs))
-    if fileNames:
-      req = "%s AND FileName IN (%s)" % (req,stringListToString(fileNames))
-    res = self.db._query(req,connection)
-    if not res['OK']:
-      return res
-    fileNameIDs = res['Value']
-    if not fileNameIDs:
-      return S_OK({})
-    filesDict = {}
-    # If we only requested the FileIDs then there is no need to do anything else
-    if metadata == ['FileID']:
-      for fileName,dirID,fileID,size,uid,gid,status in fileNameIDs:
-        filesDict[fileName] = {'FileID':fileID}
-      return S_OK(filesDict)
-    # Otherwise get the additionally requested metadata from the FC_FileInfo table
+        statusCondition = " AND f.Status IN (%s)" % intListToString( statusIDs )
+    pageClause = ''
+    if lastFileID is not None:
+      # Range scan of the ( DirID, FileID ) entries of the DirID index
+      pageClause = " AND f.FileID>%d ORDER BY f.FileID LIMIT %d" % ( lastFileID, maxFiles )
+
     files = {}
     userDict = {}
     groupDict = {}
-    for fileName,dirID,fileID,size,uid,gid,status in fileNameIDs:
-      filesDict[fileID] = fileName
-      files[fileName] = {}
-      if 'Size' in metadata:
-        files[fileName]['Size'] = size
-      if 'DirID' in metadata:
-        files[fileName]['DirID'] = dirID
-      if 'UID' in metadata:
-        files[fileName]['UID'] = uid
-        if uid in userDict:
-          owner = userDict[uid]
-        else:  
-          owner = 'unknown'
-          result = self.db.ugManager.getUserName(uid)
-          if result['OK']:
-            owner = result['Value']
-          userDict[uid] = owner  
-        files[fileName]['Owner'] = owner   
-      if 'GID' in metadata:
-        files[fileName]['GID'] = gid
-        if gid in groupDict:
-          group = groupDict[gid]
-        else:    
-          group = 'unknown'
-          result = self.db.ugManager.getGroupName(gid)
-          if result['OK']:
-            group = result['Value']
-          groupDict[gid] = group  
-        files[fileName]['OwnerGroup'] = group    
-      if 'Status' in metadata:
-        files[fileName]['Status'] = self._getIntStatus( status ).get( "Value", status )
-    for element in ['FileID','Size','DirID','UID','GID','Status']:
-      if element in metadata:
-        metadata.remove(element)    
-    metadata.append('FileID')
-    metadata.reverse()
-    req = "SELECT %s FROM FC_FileInfo WHERE FileID IN (%s)" % (intListToString(metadata),intListToString(filesDict.keys()))  
-    res = self.db._query(req,connection)
+    for condition in self._getFileConditions( dirFiles, 'f.' ):
+      res = self.db._query( "%s WHERE ( %s )%s%s" % ( req, condition, statusCondition, pageClause ), connection )
+      if not res['OK']:
+        return res
+      for row in res['Value']:
+        fileName, dirID, fileID, size, uid, gid, status = row[:7]
+        fileDict = {'FileID':fileID}
+        files.setdefault( dirID, {} )[fileName] = fileDict
+        # If we only requested the FileIDs then there is no need to do anything else
+        if onlyFileID:
+          continue
+        if 'Size' in metadata:
+          fileDict['Size'] = size
+        if 'DirID' in metadata:
+          fileDict['DirID'] = dirID
+        if 'UID' in metadata:
+          fileDict['UID'] = uid
+          if uid in userDict:
+            owner = userDict[uid]
+          else:  
+            owner = 'unknown'
+            result = self.db.ugManager.getUserName(uid)
+            if result['OK']:
+              owner = result['Value']
+            userDict[uid] = owner  
+          fileDict['Owner'] = owner   
+        if 'GID' in metadata:
+          fileDict['GID'] = gid
+          if gid in groupDict:
+            group = groupDict[gid]
+          else:    
+            group = 'unknown'
+            result = self.db.ugManager.getGroupName(gid)
+            if result['OK']:
+              group = result['Value']
+            groupDict[gid] = group  
+          fileDict['OwnerGroup'] = group    
+        if 'Status' in metadata:
+          fileDict['Status'] = self._getIntStatus( status ).get( "Value", status )
+        # Files without FC_FileInfo entry have a NULL i.FileID
+        if infoFields and row[7] is not None:
+          fileDict.update( zip( infoFields, row[8:] ) )
+    return S_OK( files )
+
+  def _getDirectoryFiles(self,dirID,fileNames,metadata_input,allStatus=False,connection=False):
+    """ Get the metadata for files in the same directory
+    """
+    connection = self._getConnection(connection)
+    res = self.__getFiles( { dirID : fileNames }, metadata_input, allStatus = allStatus, connection = connection )
     if not res['OK']:
       return res
-    for tuple_ in res['Value']:
-      fileID = tuple_[0]
-      rowDict = dict(zip(metadata,tuple_))
-      files[filesDict[fileID]].update(rowDict)
-    return S_OK(files)
+    return S_OK( res['Value'].get( dirID, {} ) )
+
+  def _getDirectoryFilesPage( self, dirID, lastFileID, maxFiles, metadata_input, allStatus = False, connection = False ):
+    """ Get the metadata of the files of a directory with a FileID greater than lastFileID,
+        at most maxFiles, as a list of ( FileName, metadata ) ordered by FileID
+    """
+    connection = self._getConnection( connection )
+    res = self.__getFiles( { dirID : [] }, metadata_input, allStatus = allStatus, connection = connection,
+                           lastFileID = lastFileID, maxFiles = maxFiles )
+    if not res['OK']:
+      return res
+    files = res['Value'].get( dirID, {} )
+    return S_OK( sorted( files.items(), key = lambda item: item[1]['FileID'] ) )
 
   def _getDirectoryFileIDs( self, dirID, requestString = False ):
     """ Get a list of IDs for all the files stored in given directories or their
@@ -687,47 +698,45 @@ class FileManager( FileManagerBase ):
     """
     fields = list(fields_input)
     connection = self._getConnection(connection)
-    res = self.__getFileIDReplicas( fileIDs, allStatus = allStatus, connection = connection )
-    if not res['OK']:
-      return res
-    fileIDDict = res['Value']
-    if fileIDDict:
-      if 'Status' in fields:
-        fields.remove('Status')
-      repIDDict = {}  
-      if fields:  
-        req = "SELECT RepID,%s FROM FC_ReplicaInfo WHERE RepID IN (%s);" % \
-              ( intListToString( fields ), intListToString( fileIDDict.keys() ) )
-        res = self.db._query( req, connection )
-        if not res['OK']:
-          return res
-        for tuple_ in res['Value']:
-          repID = tuple_[0]
-          repIDDict[repID] = dict( zip( fields, tuple_[1:] ) )
-          statusID = fileIDDict[repID][2]
-          res = self._getIntStatus( statusID, connection = connection )
-          if not res['OK']:
-            continue
-          repIDDict[repID]['Status'] = res['Value']
-      else:
-        for repID in fileIDDict:
-          statusID = fileIDDict[repID][2]
-          res = self._getIntStatus( statusID, connection = connection )
-          if not res['OK']:
-            continue
-          repIDDict[repID] = {'Status' : res['Value'] }  
+    if not fileIDs:
+      return S_ERROR("No such file or directory")
+    if 'Status' in fields:
+      fields.remove('Status')
+    req = "SELECT r.FileID,r.SEID,r.Status"
+    if fields:
+      req += ",ri.RepID,%s FROM FC_Replicas AS r LEFT JOIN FC_ReplicaInfo AS ri ON ri.RepID=r.RepID" % \
+             ','.join( [ 'ri.%s' % field for field in fields ] )
+    else:
+      req += " FROM FC_Replicas AS r"
+    statusCondition = ''
+    if not allStatus:
+      statusIDs = self._getStatusIntList( self.db.visibleReplicaStatus, connection = connection )
+      statusCondition = " AND r.Status IN (%s)" % intListToString( statusIDs )
+
     seDict = {}
     replicas = {}
-    for repID in fileIDDict.keys():
-      fileID, seID, statusID = fileIDDict[repID]
-      replicas.setdefault(fileID,{})
-      if not seID in seDict:
-        res = self.db.seManager.getSEName(seID)
-        if not res['OK']:
-          continue
-        seDict[seID] = res['Value']
-      seName = seDict[seID]
-      replicas[fileID][seName] = repIDDict.get(repID,{})
+    for fileIDChunk in breakListIntoChunks( fileIDs, LFN_CHUNK_SIZE ):
+      res = self.db._query( "%s WHERE r.FileID IN (%s)%s" % ( req, intListToString( fileIDChunk ), statusCondition ),
+                            connection )
+      if not res['OK']:
+        return res
+      for row in res['Value']:
+        fileID, seID, statusID = row[:3]
+        replicas.setdefault(fileID,{})
+        if not seID in seDict:
+          result = self.db.seManager.getSEName(seID)
+          if not result['OK']:
+            continue
+          seDict[seID] = result['Value']
+        seName = seDict[seID]
+        repDict = {}
+        # Replicas without FC_ReplicaInfo entry have a NULL ri.RepID
+        if not fields or row[3] is not None:
+          result = self._getIntStatus( statusID, connection = connection )
+          if result['OK']:
+            repDict = dict( zip( fields, row[4:] ) )
+            repDict['Status'] = result['Value']
+        replicas[fileID][seName] = repDict
       
     if len( replicas ) != len( fileIDs ):  
       for fileID in fileIDs:
@@ -740,20 +749,17 @@ class FileManager( FileManagerBase ):
     connection = self._getConnection(connection)
     if not fileIDs:
       return S_ERROR("No such file or directory")
-    req = "SELECT FileID,SEID,RepID,Status FROM FC_Replicas WHERE FileID IN (%s)" % (intListToString(fileIDs))
+    req = "SELECT FileID,SEID,RepID,Status FROM FC_Replicas WHERE FileID IN (%s)"
     if not allStatus:
-      statusIDs = []
-      for status in self.db.visibleReplicaStatus:
-        result = self._getStatusInt( status, connection=connection )
-        if result['OK']:
-          statusIDs.append( result['Value'] )
+      statusIDs = self._getStatusIntList( self.db.visibleReplicaStatus, connection = connection )
       req += " AND Status in (%s)" % (intListToString(statusIDs))
-    res = self.db._query(req,connection)
-    if not res['OK']:
-      return res
     fileIDDict = {}
-    for fileID,seID,repID,statusID in res['Value']:
-      fileIDDict[repID] = ( fileID, seID, statusID )
+    for fileIDChunk in breakListIntoChunks( fileIDs, LFN_CHUNK_SIZE ):
+      res = self.db._query( req % intListToString( fileIDChunk ), connection )
+      if not res['OK']:
+        return res
+      for fileID,seID,repID,statusID in res['Value']:
+        fileIDDict[repID] = ( fileID, seID, statusID )
     return S_OK(fileIDDict)
 
   def _getDirectoryReplicas( self, dirID, allStatus=False, connection=False ):
@@ -8,17 +8,24 @@
 __RCSID__ = "$Id$"
 
 from DIRAC                                  import S_OK, S_ERROR, gLogger
-from DIRAC.Core.Utilities.List              import intListToString
+from DIRAC.Core.Utilities.List              import intListToString, stringListToString, breakListIntoChunks
 from DIRAC.Core.Utilities.Pfn               import pfnparse, pfnunparse
 
 import os
 import stat
 
+# Maximum number of LFNs looked for in one query
+LFN_CHUNK_SIZE = 5000
+# Metadata of the files in the directory listings
+LISTING_METADATA = [ 'FileID', 'Size', 'GUID', 'Checksum', 'ChecksumType', 'Type', 'UID', 'GID',
+                     'CreationDate', 'ModificationDate', 'Mode', 'Status' ]
+
 class FileManagerBase( object ):
 
   def __init__( self, database = None ):
     self.db = database
     self.statusDict = {}
+    self.statusIntDict = {}
 
   def _getConnection( self, connection ):
     if connection:
@@ -159,6 +166,13 @@ class FileManagerBase( object ):
     """To be implemented on derived class
     """
     return S_ERROR( "To be implemented on derived class" )
+
+  def _getDirectoryFilesPage( self, dirID, lastFileID, maxFiles, metadata, allStatus = False, connection = False ):
+    """ To be implemented on derived class
+    Should return the files of the directory with a FileID greater than lastFileID, at most maxFiles,
+    as a list of ( FileName, metadata dictionary ) ordered by FileID
+    """
+    return S_ERROR( "To be implemented on derived class" )
   
   def _findFileIDs( self, lfns, connection=False ):
     """ To be implemented on derived class
@@ -1085,19 +1099,34 @@ class FileManagerBase( object ):
   #
 
   def _getStatusInt( self, status, connection = False ):
+    # The statuses are never removed nor renumbered
+    if status in self.statusIntDict:
+      return S_OK( self.statusIntDict[status] )
     connection = self._getConnection( connection )
     req = "SELECT StatusID FROM FC_Statuses WHERE Status = '%s';" % status
     res = self.db._query( req, connection )
     if not res['OK']:
       return res
     if res['Value']:
+      self.statusIntDict[status] = res['Value'][0][0]
       return S_OK( res['Value'][0][0] )
     req = "INSERT INTO FC_Statuses (Status) VALUES ('%s');" % status
     res = self.db._update( req, connection )
     if not res['OK']:
       return res
+    self.statusIntDict[status] = res['lastRowId']
     return S_OK( res['lastRowId'] )
 
+  def _getStatusIntList( self, statusList, connection = False ):
+    """ Get the StatusIDs of the given statuses, those which can not be obtained are ignored
+    """
+    statusIDs = []
+    for status in statusList:
+      res = self._getStatusInt( status, connection = connection )
+      if res['OK']:
+        statusIDs.append( res['Value'] )
+    return statusIDs
+
   def _getIntStatus(self,statusID,connection=False):
     if statusID in self.statusDict:
       return S_OK(self.statusDict[statusID])
@@ -1125,12 +1154,7 @@ class FileManagerBase( object ):
   def getFilesInDirectory( self, dirID, verbose = False, connection = False ):
     connection = self._getConnection( connection )
     files = {}
-    res = self._getDirectoryFiles( dirID, [], ['FileID', 'Size', 'GUID',
-                                               'Checksum', 'ChecksumType',
-                                               'Type', 'UID',
-                                               'GID', 'CreationDate',
-                                               'ModificationDate', 'Mode',
-                                               'Status'], connection = connection )
+    res = self._getDirectoryFiles( dirID, [], LISTING_METADATA, connection = connection )
     if not res['OK']:
       return res
     if not res['Value']:
@@ -1151,6 +1175,36 @@ class FileManagerBase( object ):
         
     return S_OK( files )
 
+  def getFilesInDirectoryPage( self, dirID, lastFileID = 0, maxFiles = 1000, verbose = False, connection = False ):
+    """ Get the files of a directory by pages, ordered by FileID
+
+        :param int lastFileID: FileID of the last file of the previous page, 0 for the first page
+        :param int maxFiles: maximum number of files of the page
+        :return: S_OK( ( files, lastFileID ) ), files in the format of getFilesInDirectory and
+                 lastFileID the FileID of the last file of the page, None if it is the last page
+    """
+    connection = self._getConnection( connection )
+    res = self._getDirectoryFilesPage( dirID, lastFileID, maxFiles, LISTING_METADATA, connection = connection )
+    if not res['OK']:
+      return res
+    page = res['Value']
+    files = {}
+    fileIDNames = {}
+    for fileName, fileDict in page:
+      files[fileName] = { 'MetaData' : fileDict }
+      fileIDNames[fileDict['FileID']] = fileName
+
+    if verbose and fileIDNames:
+      result = self._getFileReplicas( fileIDNames.keys(), connection = connection )
+      if not result['OK']:
+        return result
+      for fileID, seDict in result['Value'].items():
+        files[fileIDNames[fileID]]['Replicas'] = seDict
+
+    if len( page ) < maxFiles:
+      return S_OK( ( files, None ) )
+    return S_OK( ( files, page[-1][1]['FileID'] ) )
+
   def getDirectoryReplicas( self, dirID, path, allStatus = False, connection = False ):
     """ Get the replicas for all the Files in the given Directory
         :param DirID : ID of the directory
@@ -1178,6 +1232,38 @@ class FileManagerBase( object ):
 
     return S_OK( resultDict )
 
+  def getDirectoryReplicasPage( self, dirID, lastFileID = 0, maxFiles = 1000, allStatus = False, connection = False ):
+    """ Get the replicas of the files of a directory by pages, ordered by FileID
+
+        :param int lastFileID: FileID of the last file of the previous page, 0 for the first page
+        :param int maxFiles: maximum number of files of the page
+        :return: S_OK( ( replicas, lastFileID ) ), replicas in the format of getDirectoryReplicas and
+                 lastFileID the FileID of the last file of the page, None if it is the last page
+    """
+    connection = self._getConnection( connection )
+    res = self._getDirectoryFilesPage( dirID, lastFileID, maxFiles, ['FileID'], allStatus = allStatus,
+                                       connection = connection )
+    if not res['OK']:
+      return res
+    page = res['Value']
+    replicas = {}
+    if page:
+      res = self._getFileReplicas( [ fileDict['FileID'] for _fileName, fileDict in page ], ['PFN'],
+                                   allStatus = allStatus, connection = connection )
+      if not res['OK']:
+        return res
+      # With the Strong convention the PFNs are built by the client from the SE prefixes
+      strongConvention = self.db.lfnPfnConvention and self.db.lfnPfnConvention != "Weak"
+      for fileName, fileDict in page:
+        seDict = res['Value'].get( fileDict['FileID'] )
+        if seDict:
+          replicas[fileName] = dict( ( se, '' if strongConvention else repDict.get( 'PFN' ) or '' )
+                                     for se, repDict in seDict.items() )
+
+    if len( page ) < maxFiles:
+      return S_OK( ( replicas, None ) )
+    return S_OK( ( replicas, page[-1][1]['FileID'] ) )
+
   def _getFileDirectories( self, lfns ):
     """ For a list of lfn, returns a dictionary with key the directory, and value
         the files in that directory. It does not make any query, just splits the names
@@ -1192,6 +1278,36 @@ class FileManagerBase( object ):
       dirDict[lfnDir].append( lfnFile )
     return dirDict
 
+  def _getFileConditions( self, dirFiles, prefix = '' ):
+    """ Split the selection of the given files in conditions on the DirID and FileName
+        columns, each one selecting at most LFN_CHUNK_SIZE files
+
+        :param dict dirFiles: list of file names per DirID, an empty list for all the files of the directory
+        :param str prefix: prefix of the column names, e.g. the table alias
+        :return: list of conditions
+    """
+    conditions = []
+    wheres = []
+    count = 0
+    for dirID, fileNames in dirFiles.items():
+      if not fileNames:
+        chunks = [ [] ]
+      else:
+        chunks = breakListIntoChunks( fileNames, LFN_CHUNK_SIZE )
+      for chunk in chunks:
+        if wheres and count + len( chunk ) > LFN_CHUNK_SIZE:
+          conditions.append( ' OR '.join( wheres ) )
+          wheres = []
+          count = 0
+        if chunk:
+          wheres.append( "( %sDirID=%d AND %sFileName IN (%s) )" % ( prefix, dirID, prefix, stringListToString( chunk ) ) )
+        else:
+          wheres.append( "( %sDirID=%d )" % ( prefix, dirID ) )
+        count += len( chunk )
+    if wheres:
+      conditions.append( ' OR '.join( wheres ) )
+    return conditions
+
   def _checkInfo( self, info, requiredKeys ):
     if not info:
       return S_ERROR( "Missing parameters" )
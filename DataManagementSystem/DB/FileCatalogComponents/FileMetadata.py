@@ -80,6 +80,7 @@ class FileMetadata:
 
     req = "DROP TABLE FC_FileMeta_%s" % pname
     result = self.db._update( req )
+    self.db.metaQueryCache.clear()
     error = ''
     if not result['OK']:
       error = result["Message"]
@@ -496,9 +497,10 @@ class FileMetadata:
     return S_OK( resultList )
 
 
-  def __findFilesByMetadata( self, metaDict, dirList, credDict ):
+  def __findFilesByMetadata( self, metaDict, dirList, credDict, pathSelection = '', minFileID = 0, maxFileID = 0 ):
     """ Find a list of file IDs meeting the metaDict requirements and belonging
-        to directories in dirList
+        to directories in dirList, or to the directories selected by the pathSelection
+        subquery if given. The file IDs can be restricted to minFileID < FileID <= maxFileID
     """
     # 1.- classify Metadata keys
     storageElements = None
@@ -542,9 +544,15 @@ class FileMetadata:
     conditions = []
     tables = []
 
-    if dirList:
+    if pathSelection:
+      conditions.append( "F.DirID IN ( %s )" % pathSelection )
+    elif dirList:
       dirString = intListToString( dirList )
       conditions.append( "F.DirID in (%s)" % dirString )
+    if minFileID:
+      conditions.append( "F.FileID > %d" % minFileID )
+    if maxFileID:
+      conditions.append( "F.FileID <= %d" % maxFileID )
 
     counter = 0
     for table, condition in tablesAndConditions:
@@ -594,6 +602,7 @@ class FileMetadata:
       return result
     dirList = result['Value']
     dirFlag = result['Selection']
+    pathSelection = result.get( 'PathSelection', '' )
 
     # 2.- Get known file metadata fields
 #     fileMetaDict = {}
@@ -615,7 +624,7 @@ class FileMetadata:
 
       if fileMetaDict:
         # 3.- Do search in File Metadata
-        result = self.__findFilesByMetadata( fileMetaDict, dirList, credDict )
+        result = self.__findFilesByMetadata( fileMetaDict, dirList, credDict, pathSelection )
         if not result['OK']:
           return result
         fileList = result['Value']
@@ -640,3 +649,31 @@ class FileMetadata:
       result['LFNIDDict'] = lfnIdDict
 
     return result
+
+  def findFileIDsByMetadata( self, metaDict, path, credDict, minFileID = 0, maxFileID = 0 ):
+    """ Find the IDs of the files satisfying the given metadata, optionally only among
+        the files with minFileID < FileID <= maxFileID
+    """
+    if not path:
+      path = '/'
+
+    result = self.db.dmeta.findDirIDsByMetadata( metaDict, path, credDict )
+    if not result['OK']:
+      return result
+    if result['Selection'] == 'None':
+      return S_OK( [] )
+    dirList = []
+    if result['Selection'] != 'All':
+      dirList = result['Value']
+    pathSelection = result.get( 'PathSelection', '' )
+
+    result = self.getFileMetadataFields( credDict )
+    if not result['OK']:
+      return result
+    fileMetaKeys = result['Value'].keys() + FILE_STANDARD_METAKEYS.keys()
+    fileMetaDict = dict( item for item in metaDict.items() if item[0] in fileMetaKeys )
+    if not fileMetaDict and not dirList:
+      # As in findFilesByMetadata, no file is selected without any condition
+      return S_OK( [] )
+
+    return self.__findFilesByMetadata( fileMetaDict, dirList, credDict, pathSelection, minFileID, maxFileID )
@@ -0,0 +1,317 @@
+""" DIRAC FileCatalog planning and caching of the metadata queries
+
+    The MetaQueryPlanner estimates the number of directories matching each
+    condition of a metadata query from a histogram of the values of its
+    FC_Meta_<name> table, so that the most selective conditions are evaluated
+    first and the evaluation can stop as soon as no directory is left. The
+    histograms are read with one GROUP BY query per table, kept for a limited
+    time and dropped when the metadata values change. For the tables with too
+    many distinct values, only the number of rows and of distinct values are
+    kept and the estimates assume a uniform distribution.
+
+    The MetaQueryCache keeps the hash, total size and number of files of the
+    recent metadata queries of the datasets, not their file lists. A change of
+    the metadata, of the files or of the replicas drops the results of the
+    queries looking for files in the directories above or below the changed
+    path. The entries expire after a lifetime bounding the staleness of the
+    results when another catalog service instance changes the catalog.
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import time
+import operator
+import threading
+from collections import OrderedDict, deque
+
+from DIRAC import S_OK, gLogger
+
+# Maximum number of distinct values for which a full histogram is kept
+MAX_HISTOGRAM_VALUES = 1000
+# Number of invalidations remembered to check the results of the queries running during them
+MAX_INVALIDATION_LOG = 1000
+# Parameters of the query results kept in the MetaQueryCache
+CACHED_PARAMETERS = ( 'DatasetHash', 'NumberOfFiles', 'TotalSize' )
+
+COMPARISONS = { '>' : operator.gt, '<' : operator.lt, '>=' : operator.ge, '<=' : operator.le,
+                '=' : operator.eq, '!=' : operator.ne }
+
+def _normalize( value ):
+  """ Comparable form of a metadata value, numeric if possible
+  """
+  if isinstance( value, ( int, long, float ) ):
+    return value
+  try:
+    return float( value )
+  except ( TypeError, ValueError ):
+    return str( value )
+
+def matchCondition( value, condition ):
+  """ Check a metadata value against a condition of a metadata query
+
+      :param value: value of the metadata
+      :param condition: value, list of values, 'Any' or dictionary of operations as in the metadata queries
+  """
+  if condition == 'Any':
+    return True
+  value = _normalize( value )
+  if isinstance( condition, dict ):
+    for operation, operand in condition.items():
+      if operation in ( 'in', 'nin' ) or isinstance( operand, list ):
+        if not isinstance( operand, list ):
+          operand = [ operand ]
+        found = value in [ _normalize( x ) for x in operand ]
+        if found != ( operation in ( 'in', '=' ) ):
+          return False
+      elif operation in COMPARISONS:
+        if not COMPARISONS[ operation ]( value, _normalize( operand ) ):
+          return False
+    return True
+  if isinstance( condition, list ):
+    return value in [ _normalize( x ) for x in condition ]
+  return value == _normalize( condition )
+
+def estimateFromCounts( total, distinct, condition ):
+  """ Estimate the number of rows matching a condition assuming that the values are uniformly distributed
+  """
+  if not total:
+    return 0
+  perValue = float( total ) / max( distinct, 1 )
+  if condition == 'Any':
+    return total
+  if isinstance( condition, list ):
+    return min( total, perValue * len( condition ) )
+  if isinstance( condition, dict ):
+    estimate = float( total )
+    for operation, operand in condition.items():
+      if operation in ( 'in', '=' ):
+        nValues = len( operand ) if isinstance( operand, list ) else 1
+        estimate = min( estimate, perValue * nValues )
+      elif operation in ( '>', '<', '>=', '<=' ):
+        estimate = min( estimate, total / 3. )
+    return estimate
+  return perValue
+
+class MetaQueryPlanner( object ):
+
+  def __init__( self, database = None, lifetime = 600 ):
+    """ Constructor
+
+        :param database: FileCatalogDB object
+        :param int lifetime: seconds the histograms are kept
+    """
+    self.log = gLogger.getSubLogger( 'MetaQueryPlanner' )
+    self.db = database
+    self.lifetime = lifetime
+    self.__lock = threading.Lock()
+    self.__histograms = {}
+
+  def __getHistogram( self, table ):
+    """ Get the histogram of the values of a metadata table
+
+        :return: S_OK( dictionary with the Total number of rows, the number of Distinct values
+                       and the number of rows per value in Values or None if there are too many )
+    """
+    self.__lock.acquire()
+    try:
+      histogram = self.__histograms.get( table )
+      if histogram and histogram['Expires'] > time.time():
+        return S_OK( histogram )
+    finally:
+      self.__lock.release()
+
+    result = self.db._query( "SELECT COUNT(*), COUNT(DISTINCT Value) FROM %s" % table )
+    if not result['OK']:
+      return result
+    total, distinct = result['Value'][0]
+    values = None
+    if distinct <= MAX_HISTOGRAM_VALUES:
+      result = self.db._query( "SELECT Value, COUNT(*) FROM %s GROUP BY Value" % table )
+      if not result['OK']:
+        return result
+      values = dict( result['Value'] )
+    histogram = { 'Total' : total, 'Distinct' : distinct, 'Values' : values,
+                  'Expires' : time.time() + self.lifetime }
+    self.__lock.acquire()
+    try:
+      self.__histograms[ table ] = histogram
+    finally:
+      self.__lock.release()
+    return S_OK( histogram )
+
+  def estimate( self, table, condition ):
+    """ Estimate the number of rows of a metadata table matching a condition
+    """
+    result = self.__getHistogram( table )
+    if not result['OK']:
+      return result
+    histogram = result['Value']
+    if histogram['Values'] is None:
+      return S_OK( estimateFromCounts( histogram['Total'], histogram['Distinct'], condition ) )
+    return S_OK( sum( [ count for value, count in histogram['Values'].items()
+                        if matchCondition( value, condition ) ] ) )
+
+  def orderConditions( self, metaDict ):
+    """ Order the conditions of a directory metadata query by increasing estimated number of
+        matching directories, the 'Missing' conditions last
+
+        :param dict metaDict: condition per metadata name
+        :return: S_OK( list of metadata names )
+    """
+    estimates = []
+    for meta, condition in metaDict.items():
+      if condition == 'Missing':
+        estimates.append( ( 1, 0, meta ) )
+        continue
+      result = self.estimate( 'FC_Meta_%s' % meta, condition )
+      if not result['OK']:
+        return result
+      estimates.append( ( 0, result['Value'], meta ) )
+    estimates.sort()
+    return S_OK( [ meta for _missing, _estimate, meta in estimates ] )
+
+  def invalidate( self, table = None ):
+    """ Drop the histogram of a table, or all of them
+    """
+    self.__lock.acquire()
+    try:
+      if table is None:
+        self.__histograms.clear()
+      else:
+        self.__histograms.pop( table, None )
+    finally:
+      self.__lock.release()
+
+def _isRelated( path1, path2 ):
+  """ Check if one of the paths is the other one or is below it
+  """
+  if path1 == '/' or path2 == '/' or path1 == path2:
+    return True
+  return path1.startswith( path2 + '/' ) or path2.startswith( path1 + '/' )
+
+def _getCommonParent( paths ):
+  """ Get the deepest directory containing all the paths
+  """
+  common = os.path.commonprefix( paths )
+  if len( paths ) > 1 and not all( [ len( path ) == len( common ) or path[ len( common ) ] == '/'
+                                     for path in paths ] ):
+    common = os.path.dirname( common )
+  return common.rstrip( '/' ) or '/'
+
+class MetaQueryCache( object ):
+
+  def __init__( self, maxSize = 100, lifetime = 60 ):
+    """ Constructor
+
+        :param int maxSize: maximum number of query results in the cache, 0 to disable it
+        :param float lifetime: seconds the results are kept
+    """
+    self.maxSize = max( 0, maxSize )
+    self.lifetime = lifetime
+    self.__lock = threading.Lock()
+    self.__cache = OrderedDict()
+    self.__hits = 0
+    self.__misses = 0
+    #Incremented by each invalidation
+    self.__generation = 0
+    #Generation and common parent directory of the paths of the recent invalidations
+    self.__invalidations = deque( maxlen = MAX_INVALIDATION_LOG )
+
+  @staticmethod
+  def getKey( metaQuery ):
+    """ Key of a metadata query, independent of the order of its conditions
+    """
+    return repr( sorted( metaQuery.items() ) )
+
+  def get( self, key ):
+    """ Get the cached result of a query or None
+    """
+    if not self.maxSize:
+      return None
+    self.__lock.acquire()
+    try:
+      entry = self.__cache.pop( key, None )
+      if entry is None or entry[0] < time.time():
+        self.__misses += 1
+        return None
+      #Moved at the end of the LRU order
+      self.__cache[ key ] = entry
+      self.__hits += 1
+      return dict( entry[2] )
+    finally:
+      self.__lock.release()
+
+  def getGeneration( self ):
+    """ Get the generation to give to add for the results computed from now on
+    """
+    return self.__generation
+
+  def add( self, key, value, generation = None, path = '/' ):
+    """ Add the result of a query, only its hash, total size and number of files are kept
+
+        :param int generation: generation of the cache before the query was done, the result is
+                               not added if the paths of an invalidation since then are related to path
+        :param str path: directory below which the query looks for files
+    """
+    if not self.maxSize:
+      return
+    value = dict( [ ( name, value[name] ) for name in CACHED_PARAMETERS if name in value ] )
+    self.__lock.acquire()
+    try:
+      if generation is not None and generation != self.__generation:
+        if not self.__invalidations or self.__invalidations[0][0] > generation + 1:
+          #The invalidations done during the query are not all known any more
+          return
+        for invGeneration, invPath in self.__invalidations:
+          if invGeneration > generation and _isRelated( path, invPath ):
+            return
+      self.__cache.pop( key, None )
+      self.__cache[ key ] = ( time.time() + self.lifetime, path, value )
+      while len( self.__cache ) > self.maxSize:
+        self.__cache.popitem( last = False )
+    finally:
+      self.__lock.release()
+
+  def invalidate( self, paths ):
+    """ Drop the results of the queries looking for files in or above the changed paths
+
+        :param paths: path or list of paths of the changed files or directories
+    """
+    if isinstance( paths, basestring ):
+      paths = [ paths ]
+    paths = set( [ path.rstrip( '/' ) or '/' for path in paths ] )
+    if not paths:
+      return
+    self.__lock.acquire()
+    try:
+      self.__generation += 1
+      self.__invalidations.append( ( self.__generation, _getCommonParent( list( paths ) ) ) )
+      related = {}
+      for key, entry in self.__cache.items():
+        queryPath = entry[1]
+        if queryPath not in related:
+          related[ queryPath ] = any( [ _isRelated( queryPath, path ) for path in paths ] )
+        if related[ queryPath ]:
+          del self.__cache[ key ]
+    finally:
+      self.__lock.release()
+
+  def clear( self ):
+    """ Drop all the results
+    """
+    self.invalidate( '/' )
+
+  def getCounters( self ):
+    """ Get the size and the hit rate of the cache
+    """
+    self.__lock.acquire()
+    try:
+      lookups = self.__hits + self.__misses
+      hitRate = 100. * self.__hits / lookups if lookups else 0.
+      return { 'Metadata Query Cache Size' : len( self.__cache ),
+               'Metadata Query Cache Hits' : self.__hits,
+               'Metadata Query Cache Misses' : self.__misses,
+               'Metadata Query Cache Hit Rate (%)' : round( hitRate, 1 ) }
+    finally:
+      self.__lock.release()
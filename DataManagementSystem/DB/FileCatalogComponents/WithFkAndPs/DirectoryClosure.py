@@ -1,7 +1,7 @@
 ########################################################################
 # $HeadURL$
 ########################################################################
-from DIRAC.Core.Utilities.List import intListToString, stringListToString
+from DIRAC.Core.Utilities.List import intListToString, stringListToString, breakListIntoChunks
 
 """ DIRAC FileCatalog component representing a directory tree with
     a closure table
@@ -281,6 +281,28 @@ class DirectoryClosure( DirectoryTreeBase ):
     return S_OK( resultList )
 
 
+  def getAncestorsInList( self, dirIDList ):
+    """ Get, for each directory of the list, the directories of the list which are
+        the directory itself or one of its ancestors
+
+        :param dirIDList : list of dir Ids
+        :returns: S_OK( { dirID : set of dirIDs } )
+    """
+
+    dirIDs = list( set( dirIDList ) )
+    ancestorDict = dict( ( dirID, set() ) for dirID in dirIDs )
+    for chunk in breakListIntoChunks( dirIDs, 10000 ):
+      req = "SELECT ChildID, ParentID FROM FC_DirectoryClosure WHERE ChildID IN (%s) AND ParentID IN (%s)" % \
+            ( intListToString( chunk ), intListToString( dirIDs ) )
+      result = self.db._query( req )
+      if not result['OK']:
+        return result
+      for childID, parentID in result['Value']:
+        ancestorDict[childID].add( parentID )
+
+    return S_OK( ancestorDict )
+
+
 
   def getSubdirectories( self, path ):
     """ Get subdirectories of the given directory
@@ -396,6 +418,8 @@ class DirectoryClosure( DirectoryTreeBase ):
         return result
 
       dirId = result['Value'][0][0]
+      # Entry of a directory with the same path removed by another catalog instance
+      self.db.invalidateDirectoryCache( dpath, local = True )
 
       result = S_OK( dirId )
       result['NewDirectory'] = True
@@ -690,6 +714,8 @@ class DirectoryClosure( DirectoryTreeBase ):
     failed = {}
     for path, attribute in arguments.items():
       result = directoryFunction( path, attribute, recursive = recursive )
+      # The permissions of the cached directories can have changed even if it failed
+      self.db.invalidateDirectoryCache( os.path.normpath( path ), recursive = recursive )
       if not result['OK']:
         failed[path] = result['Message']
       else:
@@ -50,17 +50,21 @@ class FileManagerPs( FileManagerBase ):
       return result
 
     directoryIDs = result['Value']
+    dirFiles = dict( ( directoryIDs[dirPath], dirDict[dirPath] ) for dirPath in directoryIDs )
+    directoryPaths = dict( ( dirID, dirPath ) for dirPath, dirID in directoryIDs.items() )
 
     failed = {}
     successful = {}
-    for dirPath in directoryIDs:
-      fileNames = dirDict[dirPath]
-      res = self._getDirectoryFiles( directoryIDs[dirPath], fileNames, metadata,
-                                     allStatus = allStatus, connection = connection )
-
-      for fileName, fileDict in res.get( 'Value', {} ).items():
-        fname = os.path.join( dirPath, fileName )
-        successful[fname] = fileDict
+    # The files of all the directories are looked for at once, by chunks
+    fStatus = stringListToString( self.db.visibleFileStatus )
+    for condition in self._getFileConditions( dirFiles, 'f.' ):
+      result = self.db.executeStoredProcedureWithCursor( 'ps_get_all_info_for_files_in_dirs',
+                                                         ( condition, allStatus, fStatus ) )
+      if not result['OK']:
+        return result
+      for rowDict in self.__getFileRows( result['Value'] ):
+        fname = os.path.join( directoryPaths[rowDict['DirID']], rowDict['FileName'] )
+        successful[fname] = self.__selectMetadata( rowDict, metadata )
 
     # The lfns that are not in successful nor failed don't exist
     for failedLfn in ( set( lfns ) - set( successful ) ):
@@ -101,19 +105,16 @@ class FileManagerPs( FileManagerBase ):
       if not result['OK']:
         return result
       directoryPathToIds = result['Value']
+      directoryPaths = dict( ( dirID, dirPath ) for dirPath, dirID in directoryPathToIds.items() )
+      dirFiles = dict( ( dirID, filesInDirDict[dirPath] ) for dirPath, dirID in directoryPathToIds.items() )
 
-      # For each directory, we get the file ids of the files we want
-      for dirPath in directoryPathToIds:
-        fileNames = filesInDirDict[dirPath]
-        dirID = directoryPathToIds[dirPath]
-
-        formatedFileNames = stringListToString( fileNames )
-
-        result = self.db.executeStoredProcedureWithCursor( 'ps_get_file_ids_from_dir_id', ( dirID, formatedFileNames ) )
+      # We get the file ids of the files we want in all the directories at once, by chunks
+      for condition in self._getFileConditions( dirFiles ):
+        result = self.db.executeStoredProcedureWithCursor( 'ps_get_file_ids_from_dir_files', ( condition, ) )
         if not result['OK']:
           return result
-        for fileID, fileName in result['Value']:
-          fname = os.path.join( dirPath, fileName )
+        for fileID, dirID, fileName in result['Value']:
+          fname = os.path.join( directoryPaths[dirID], fileName )
           successful[fname] = fileID
 
       # The lfns that are not in successful dont exist
@@ -122,6 +123,26 @@ class FileManagerPs( FileManagerBase ):
 
     return S_OK({"Successful":successful,"Failed":failed})
 
+  def __getFileRows( self, rows ):
+    """ Get the dictionaries of the rows returned by the ps_get_all_info_for_files_in_dir(s) procedures
+    """
+    fieldNames = ["FileName", "DirID", "FileID", "Size", "UID", "Owner",
+                  "GID", "OwnerGroup", "Status", "GUID", "Checksum",
+                  "ChecksumType", "Type", "CreationDate", "ModificationDate", "Mode"]
+    return [ dict( zip( fieldNames, row ) ) for row in rows ]
+
+  def __selectMetadata( self, rowDict, metadata_input ):
+    """ Returns only the required metadata of a file
+    """
+    metadata = list( metadata_input )
+    if "UID" in metadata:
+      metadata.append( "Owner" )
+    if "GID" in metadata:
+      metadata.append( "OwnerGroup" )
+    if "FileID" not in metadata:
+      metadata.append( "FileID" )
+    return dict( ( key, rowDict.get( key, "Unknown metadata field" ) ) for key in metadata )
+
   def _getDirectoryFiles(self,dirID,fileNames,metadata_input,allStatus=False,connection=False):
     """ For a given directory, and eventually given file, returns all the desired metadata
 
@@ -137,14 +158,6 @@ class FileManagerPs( FileManagerBase ):
 
     connection = self._getConnection( connection )
 
-    metadata = list( metadata_input )
-    if "UID" in metadata:
-      metadata.append( "Owner" )
-    if "GID" in metadata:
-      metadata.append( "OwnerGroup" )
-    if "FileID" not in metadata:
-      metadata.append( "FileID" )
-
     # Format the filenames and status to be used in a IN clause in the sotred procedure
     formatedFileNames = stringListToString( fileNames )
     fStatus = stringListToString( self.db.visibleFileStatus )
@@ -157,24 +170,34 @@ class FileManagerPs( FileManagerBase ):
     if not result['OK']:
       return result
 
-    fieldNames = ["FileName", "DirID", "FileID", "Size", "UID", "Owner",
-                  "GID", "OwnerGroup", "Status", "GUID", "Checksum",
-                  "ChecksumType", "Type", "CreationDate", "ModificationDate", "Mode"]
-
-    rows = result['Value']
     files = {}
+    for rowDict in self.__getFileRows( result['Value'] ):
+      files[rowDict['FileName']] = self.__selectMetadata( rowDict, metadata_input )
 
-    for row in rows:
+    return S_OK( files )
 
-      rowDict = dict( zip( fieldNames, row ) )
-      fileName = rowDict['FileName']
-      # Returns only the required metadata
-      files[fileName] = dict( ( key, rowDict.get( key, "Unknown metadata field" ) ) for key in metadata )
 
 
-    return S_OK( files )
+  def _getDirectoryFilesPage( self, dirID, lastFileID, maxFiles, metadata_input, allStatus = False, connection = False ):
+    """ For a given directory, returns the desired metadata of the files with a FileID greater than lastFileID
+
+        :param dirID : directory ID
+        :param lastFileID : FileID after which the page starts, 0 for the first page
+        :param maxFiles : maximum number of files returned
+        :param metadata_input: list of desired metadata, as for _getDirectoryFiles
+        :param allStatus : if False, only displays the files whose status is in db.visibleFileStatus
 
+        :returns: S_OK(files), where files is a list of ( filename, dictionary of metadata ) ordered by FileID
+    """
+
+    fStatus = stringListToString( self.db.visibleFileStatus )
+    result = self.db.executeStoredProcedureWithCursor( 'ps_get_all_info_for_files_in_dir_page',
+                                                       ( dirID, lastFileID, maxFiles, allStatus, fStatus ) )
+    if not result['OK']:
+      return result
 
+    return S_OK( [ ( rowDict['FileName'], self.__selectMetadata( rowDict, metadata_input ) )
+                   for rowDict in self.__getFileRows( result['Value'] ) ] )
 
   def _getFileMetadataByID( self, fileIDs, connection=False ):
     """ Get standard file metadata for a list of files specified by FileID
@@ -0,0 +1,147 @@
+""" Test cases for the materialisation of the datasets in
+    DIRAC.DataManagementSystem.DB.FileCatalogComponents.DatasetManager
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DatasetManager import DatasetManager, _isRelatedPath
+
+class DatasetManagerTestCase( unittest.TestCase ):
+  """ Incremental evaluation of the dynamic datasets and snapshots of the frozen ones
+  """
+
+  def setUp( self ):
+    self.db = MagicMock()
+    self.db._query.return_value = S_OK( [ ( table, ) for table in DatasetManager._tables ] )
+    self.db._createTables.return_value = S_OK( [] )
+    self.db._update.return_value = S_OK()
+    self.db._transaction.return_value = S_OK( [] )
+    self.db.datasetSyncWindow = 5
+    self.db.datasetFullSyncPeriod = 86400
+    self.dm = DatasetManager( self.db )
+
+  def __setQueries( self, sync, maxFileID ):
+    def query( req ):
+      if 'FC_MetaDatasetSync' in req:
+        return S_OK( sync )
+      return S_OK( [ ( maxFileID, '2026-10-18 12:00:00' ) ] )
+    self.db._query.side_effect = query
+
+  def __getCommands( self ):
+    return self.db._transaction.call_args[0][0]
+
+  def testSync( self ):
+    """ only the files added since the last evaluation and a window below are evaluated
+    """
+    sync = self.dm._DatasetManager__syncDatasetFiles
+    metaQuery = { 'Path' : '/vo/mc', 'Type' : 'MC' }
+    self.db.fmeta.findFileIDsByMetadata.return_value = S_OK( [ 11, 12 ] )
+
+    # Not materialised yet, the file set replaced in one transaction serialised on the sync row
+    self.__setQueries( [], 12 )
+    self.assertTrue( sync( 1, metaQuery, {} )['OK'] )
+    self.db.fmeta.findFileIDsByMetadata.assert_called_with( { 'Type' : 'MC' }, '/vo/mc', {}, 0, 12 )
+    commands = self.__getCommands()
+    self.assertTrue( commands[0].endswith( 'FOR UPDATE' ) )
+    self.assertEqual( commands[1], 'DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=1' )
+    self.assertTrue( commands[-1].startswith( 'UPDATE FC_MetaDatasetSync SET WatermarkDate=UTC_TIMESTAMP(), LastFileID=12,' ) )
+    self.assertTrue( commands[-1].endswith( "LastSyncDate='2026-10-18 12:00:00' WHERE DatasetID=1" ) )
+    # The stale flag cleared before the evaluation, the watermark kept until the end
+    self.assertFalse( [ call for call in self.db._update.call_args_list if 'LastFileID' in call[0][0] ] )
+
+    # New files
+    self.db._update.reset_mock()
+    self.__setQueries( [ ( 10, 0, 0, 1 ) ], 12 )
+    self.assertTrue( sync( 1, metaQuery, {} )['OK'] )
+    self.db.fmeta.findFileIDsByMetadata.assert_called_with( { 'Type' : 'MC' }, '/vo/mc', {}, 5, 12 )
+    # Only the files of the evaluated range replaced
+    self.assertEqual( [ command for command in self.__getCommands() if 'DELETE' in command ],
+                      [ 'DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=1 AND FileID>5 AND FileID<=12' ] )
+    self.assertTrue( 'SyncFileID=GREATEST(SyncFileID,12)' in self.db._update.call_args[0][0] )
+
+    # No new file, but the window is not settled yet: a file completed late is picked up
+    self.db.fmeta.findFileIDsByMetadata.return_value = S_OK( [ 9, 11, 12 ] )
+    self.__setQueries( [ ( 12, 0, 0, 0 ) ], 12 )
+    self.assertTrue( sync( 1, metaQuery, {} )['OK'] )
+    self.db.fmeta.findFileIDsByMetadata.assert_called_with( { 'Type' : 'MC' }, '/vo/mc', {}, 7, 12 )
+    self.assertTrue( 'VALUES (1,9),(1,11),(1,12)' in self.__getCommands()[2] )
+    self.assertTrue( 'WatermarkDate=IF(LastFileID<12,UTC_TIMESTAMP(),WatermarkDate)' in self.__getCommands()[-1] )
+
+    # Up to date and settled
+    self.db.fmeta.findFileIDsByMetadata.reset_mock()
+    self.__setQueries( [ ( 12, 0, 0, 1 ) ], 12 )
+    self.assertTrue( sync( 1, metaQuery, {} )['OK'] )
+    self.assertFalse( self.db.fmeta.findFileIDsByMetadata.called )
+
+    # Stale, or not evaluated in full for too long
+    for syncRow in ( 12, 1, 0, 1 ), ( 12, 0, 1, 1 ):
+      self.__setQueries( [ syncRow ], 12 )
+      self.assertTrue( sync( 1, metaQuery, {} )['OK'] )
+      self.db.fmeta.findFileIDsByMetadata.assert_called_with( { 'Type' : 'MC' }, '/vo/mc', {}, 0, 12 )
+
+    # A failed full evaluation is done again at the next use
+    self.db._transaction.return_value = S_ERROR( 'Deadlock' )
+    self.assertFalse( sync( 1, metaQuery, {} )['OK'] )
+    self.assertTrue( self.db._update.call_args[0][0].startswith( 'UPDATE FC_MetaDatasetSync SET Stale=1' ) )
+
+  def testInvalidate( self ):
+    """ datasets marked stale by the changes of the metadata of their query under their path
+    """
+    self.assertTrue( _isRelatedPath( '/vo/mc/2015', '/vo/mc' ) )
+    self.assertTrue( _isRelatedPath( '/vo', '/vo/mc' ) )
+    self.assertFalse( _isRelatedPath( '/vo/mcx', '/vo/mc' ) )
+
+    self.db._query.return_value = S_OK( [ ( 1, repr( { 'Path' : '/vo/mc', 'Type' : 'MC' } ) ),
+                                          ( 2, repr( { 'Path' : '/vo/data', 'Type' : 'Data' } ) ),
+                                          ( 3, repr( { 'Run' : 5 } ) ) ] )
+    self.db.dmeta.getMetadataFields.return_value = S_OK( { 'Type' : 'VARCHAR(128)', 'Run' : 'INT' } )
+    self.assertTrue( self.dm.invalidateDatasets( { '/vo/mc/2015' : [ 'Type' ] } )['OK'] )
+    self.assertTrue( self.db._update.call_args[0][0].endswith( 'WHERE DatasetID IN (1)' ) )
+    self.assertTrue( self.dm.invalidateDatasets( { '/vo' : [ 'Type', 'Run' ] } )['OK'] )
+    self.assertTrue( self.db._update.call_args[0][0].endswith( 'IN (1,2,3)' ) )
+
+    # The queries and the metadata fields read once for all the paths
+    self.db._query.reset_mock()
+    self.db.dmeta.getMetadataFields.reset_mock()
+    self.db._update.reset_mock()
+    self.assertTrue( self.dm.invalidateDatasets( { '/vo/data/d1' : [ 'Type' ], '/vo/mc/d2' : [ 'Run' ],
+                                                   '/vo/mc/d3' : [ 'Run' ] } )['OK'] )
+    self.assertEqual( self.db._query.call_count, 1 )
+    self.assertEqual( self.db.dmeta.getMetadataFields.call_count, 1 )
+    self.assertEqual( self.db._update.call_count, 1 )
+    self.assertTrue( self.db._update.call_args[0][0].endswith( 'IN (2,3)' ) )
+
+    # The changes of the files of the window, or not evaluated yet, only make the window evaluated again
+    self.db._update.reset_mock()
+    self.db.fileManager._findFiles.return_value = S_OK( { 'Successful' : { '/vo/mc/f1' : { 'FileID' : 20 },
+                                                                           '/vo/mc/f2' : { 'FileID' : 30 } },
+                                                          'Failed' : {} } )
+    self.assertTrue( self.dm.invalidateDatasets( { '/vo/mc/f1' : [ 'Type' ], '/vo/mc/f2' : [ 'Type' ] },
+                                                 [ '/vo/mc/f1', '/vo/mc/f2' ] )['OK'] )
+    requests = [ call[0][0] for call in self.db._update.call_args_list ]
+    self.assertEqual( requests[0], 'UPDATE FC_MetaDatasetSync SET WatermarkDate=UTC_TIMESTAMP() WHERE DatasetID IN (1)' )
+    self.assertTrue( requests[1].endswith( '(DatasetID=1 AND GREATEST(LastFileID,SyncFileID)-5>=20)' ) )
+
+  def testSnapshot( self ):
+    """ frozen dataset files read back from the snapshot without the catalog
+    """
+    self.db._escapeString.side_effect = lambda value: S_OK( value )
+    self.assertTrue( self.dm._DatasetManager__addSnapshot( 1, [ '/vo/mc/f1', '/vo/mc/f2' ], [ 11, 12 ] )['OK'] )
+    req = self.db._update.call_args[0][0]
+    snapshot = req[ req.index( ',2,' ) + 3 : req.rindex( ',UTC_TIMESTAMP' ) ]
+
+    self.db._query.return_value = S_OK( [ ( snapshot, ) ] )
+    result = self.dm._DatasetManager__getFrozenDatasetFiles( 1, {} )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value'], [ '/vo/mc/f1', '/vo/mc/f2' ] )
+    self.assertEqual( result['FileIDList'], [ 11, 12 ] )
+    self.assertFalse( self.db.fileManager._getFileLFNs.called )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DatasetManagerTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
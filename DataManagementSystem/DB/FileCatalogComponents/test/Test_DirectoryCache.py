@@ -0,0 +1,87 @@
+""" Test cases for DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import unittest
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache import DirectoryCache
+
+def entry( dirID ):
+  return { 'DirID' : dirID, 'UID' : 1, 'GID' : 1, 'Mode' : 0775, 'Status' : 0 }
+
+class DirectoryCacheTestCase( unittest.TestCase ):
+  """ LRU cache of the directory paths resolution
+  """
+
+  def testLRU( self ):
+    """ least recently used entries dropped first, hit rate counted
+    """
+    cache = DirectoryCache( 2 )
+    cache.add( '/vo', entry( 1 ) )
+    cache.add( '/vo/user', entry( 2 ) )
+    self.assertEqual( cache.get( '/vo' )['DirID'], 1 )
+    cache.add( '/vo/data', entry( 3 ) )
+    self.assertEqual( cache.get( '/vo/user' ), None )
+    self.assertEqual( cache.get( '/vo/data' )['DirID'], 3 )
+    counters = cache.getCounters()
+    self.assertEqual( counters['Directory Cache Size'], 2 )
+    self.assertEqual( counters['Directory Cache Hits'], 2 )
+    self.assertEqual( counters['Directory Cache Misses'], 1 )
+    self.assertEqual( counters['Directory Cache Hit Rate (%)'], 66.7 )
+
+    disabled = DirectoryCache( 0 )
+    disabled.add( '/vo', entry( 1 ) )
+    self.assertEqual( disabled.get( '/vo' ), None )
+
+  def testInvalidate( self ):
+    """ entries dropped by path, subtree and DirID
+    """
+    cache = DirectoryCache( 10 )
+    for dirID, path in enumerate( [ '/vo', '/vo/user', '/vo/user/a', '/vo/users', '/vo/data' ] ):
+      cache.add( path, entry( dirID ) )
+    cache.invalidate( '/vo/user', recursive = True )
+    self.assertEqual( cache.get( '/vo/user' ), None )
+    self.assertEqual( cache.get( '/vo/user/a' ), None )
+    self.assertTrue( cache.get( '/vo/users' ) )
+    cache.invalidate( [ '/vo' ] )
+    self.assertEqual( cache.get( '/vo' ), None )
+    self.assertTrue( cache.get( '/vo/data' ) )
+    cache.invalidateDirIDs( [ 4 ] )
+    self.assertEqual( cache.get( '/vo/data' ), None )
+    cache.invalidate( '/', recursive = True )
+    self.assertEqual( cache.getCounters()['Directory Cache Size'], 0 )
+
+    #Entry read before an invalidation
+    generation = cache.getGeneration()
+    cache.invalidate( '/vo' )
+    cache.add( '/vo', entry( 0 ), generation )
+    self.assertEqual( cache.get( '/vo' ), None )
+
+  def testSync( self ):
+    """ invalidations of the other instances applied, cache cleared if they can not be read
+    """
+    syncResults = [ S_OK( [ ( '/vo/user', True ) ] ), S_ERROR( 'DB down' ) ]
+    cache = DirectoryCache( 10, syncFunction = lambda: syncResults.pop( 0 ), syncPeriod = 0 )
+    cache.add( '/vo', entry( 1 ) )
+    cache.add( '/vo/user/a', entry( 2 ) )
+    self.assertTrue( cache.get( '/vo' ) )
+    self.assertEqual( cache.get( '/vo/user/a' ), None )
+    syncResults.append( S_OK( [] ) )
+    self.assertEqual( cache.get( '/vo' ), None )
+
+  def testMaxAge( self ):
+    """ entries older than the maximum age are read again
+    """
+    cache = DirectoryCache( 10, maxAge = 0.1 )
+    cache.add( '/vo', entry( 1 ) )
+    self.assertTrue( cache.get( '/vo' ) )
+    time.sleep( 0.2 )
+    self.assertEqual( cache.get( '/vo' ), None )
+    self.assertEqual( cache.getCounters()['Directory Cache Size'], 0 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryCacheTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,75 @@
+""" Test cases for the bulk resolution of the LFNs of DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents import FileManagerBase
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager import FileManager
+
+class FileManagerTestCase( unittest.TestCase ):
+  """ LFNs of several directories resolved with one query per chunk
+  """
+
+  def setUp( self ):
+    self.db = MagicMock()
+    self.db.visibleFileStatus = [ 'AprioriGood' ]
+    self.db.dtree.findDirs.return_value = S_OK( { '/vo/a' : 1, '/vo/b' : 2 } )
+    self.fileManager = FileManager( self.db )
+    self.fileManager.statusIntDict = { 'AprioriGood' : 1 }
+    self.fileManager.statusDict = { 1 : 'AprioriGood' }
+
+  def tearDown( self ):
+    FileManagerBase.LFN_CHUNK_SIZE = 5000
+
+  def testFileConditions( self ):
+    """ conditions split by number of files
+    """
+    FileManagerBase.LFN_CHUNK_SIZE = 2
+    conditions = self.fileManager._getFileConditions( { 1 : [ 'f1', 'f2', 'f3' ], 2 : [] }, 'f.' )
+    self.assertEqual( len( conditions ), 2 )
+    self.assertTrue( "f.DirID=1 AND f.FileName IN ('f1','f2')" in conditions[0] )
+    self.assertTrue( "( f.DirID=1 AND f.FileName IN ('f3') ) OR ( f.DirID=2 )" in conditions[1] or
+                     "( f.DirID=2 ) OR ( f.DirID=1 AND f.FileName IN ('f3') )" in conditions[1] )
+
+  def testFindFiles( self ):
+    """ metadata of files in several directories, missing files and directories failed
+    """
+    self.db._query.return_value = S_OK( [ ( 'f1', 1, 10, 100, 1, 2, 1, 10, 'ad32' ),
+                                          ( 'f2', 2, 11, 200, 1, 2, 1, None, None ) ] )
+    result = self.fileManager._findFiles( [ '/vo/a/f1', '/vo/b/f2', '/vo/b/f3', '/vo/c/f4' ],
+                                          [ 'FileID', 'Size', 'Checksum' ] )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.db._query.call_count, 1 )
+    req = self.db._query.call_args[0][0]
+    self.assertTrue( 'LEFT JOIN FC_FileInfo' in req )
+    self.assertTrue( 'f.Status IN (1)' in req )
+    self.assertEqual( result['Value']['Successful'], { '/vo/a/f1' : { 'FileID' : 10, 'Size' : 100, 'Checksum' : 'ad32' },
+                                                       '/vo/b/f2' : { 'FileID' : 11, 'Size' : 200 } } )
+    self.assertEqual( sorted( result['Value']['Failed'] ), [ '/vo/b/f3', '/vo/c/f4' ] )
+
+  def testFilesInDirectoryPage( self ):
+    """ files of a directory paged by FileID, the last page shorter than the others
+    """
+    noInfo = ( None, ) * 8
+    self.db._query.return_value = S_OK( [ ( 'f2', 1, 12, 200, 1, 2, 1 ) + noInfo,
+                                          ( 'f1', 1, 11, 100, 1, 2, 1 ) + noInfo ] )
+    result = self.fileManager.getFilesInDirectoryPage( 1, 10, 2 )
+    self.assertTrue( result['OK'] )
+    self.assertTrue( 'f.FileID>10 ORDER BY f.FileID LIMIT 2' in self.db._query.call_args[0][0] )
+    files, lastFileID = result['Value']
+    self.assertEqual( sorted( files ), [ 'f1', 'f2' ] )
+    self.assertEqual( lastFileID, 12 )
+
+    self.db._query.return_value = S_OK( [ ( 'f3', 1, 13, 300, 1, 2, 1 ) + noInfo ] )
+    result = self.fileManager.getFilesInDirectoryPage( 1, 12, 2 )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value'][1], None )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileManagerTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,132 @@
+""" Test cases for DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner import MetaQueryPlanner, MetaQueryCache, \
+                                                                                matchCondition
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryMetadata import DirectoryMetadata
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryTreeBase import DirectoryTreeBase
+
+DIRECTORIES = { 1 : '/', 2 : '/vo', 3 : '/vo/mc', 4 : '/vo/mc/2015', 5 : '/vo/mc/2016', 6 : '/vo/data' }
+
+def getSubdirectories( dirIDs ):
+  return S_OK( [ dirID for dirID, path in DIRECTORIES.items()
+                 for parentID in dirIDs if path.startswith( DIRECTORIES[parentID].rstrip( '/' ) + '/' ) ] )
+
+class MetaQueryPlannerTestCase( unittest.TestCase ):
+  """ Selectivity of the metadata conditions, evaluation of the queries and cache of their results
+  """
+
+  def testMatchCondition( self ):
+    """ conditions of the metadata queries evaluated on the values
+    """
+    self.assertTrue( matchCondition( 'MC', 'MC' ) )
+    self.assertTrue( matchCondition( 3L, '3' ) )
+    self.assertTrue( matchCondition( 'x', 'Any' ) )
+    self.assertTrue( matchCondition( 'b', [ 'a', 'b' ] ) )
+    self.assertTrue( matchCondition( 5, { '>' : 3, '<=' : 5 } ) )
+    self.assertFalse( matchCondition( 6, { '>' : 3, '<=' : 5 } ) )
+    self.assertFalse( matchCondition( 'a', { 'nin' : [ 'a', 'b' ] } ) )
+    self.assertTrue( matchCondition( 'c', { '!=' : [ 'a', 'b' ] } ) )
+
+  def testOrderConditions( self ):
+    """ conditions ordered by the number of matching rows in the histograms, Missing last
+    """
+    histograms = { 'FC_Meta_Type' : ( 2, [ ( 'MC', 900 ), ( 'Data', 100 ) ] ),
+                   'FC_Meta_Run' : ( 5000, None ) }
+    def query( req ):
+      table = req.split()[-1] if 'GROUP BY' not in req else req.split()[-4]
+      distinct, values = histograms[table]
+      if 'GROUP BY' in req:
+        return S_OK( values )
+      return S_OK( [ ( 10000, distinct ) ] )
+    db = MagicMock()
+    db._query.side_effect = query
+    planner = MetaQueryPlanner( db )
+
+    self.assertEqual( planner.estimate( 'FC_Meta_Type', 'Data' )['Value'], 100 )
+    self.assertEqual( planner.estimate( 'FC_Meta_Run', 12 )['Value'], 2. )
+    result = planner.orderConditions( { 'Type' : 'MC', 'Run' : [ 12, 13 ], 'Energy' : 'Missing' } )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value'], [ 'Run', 'Type', 'Energy' ] )
+    #Histograms kept until invalidated
+    self.assertEqual( db._query.call_count, 3 )
+    planner.invalidate( 'FC_Meta_Type' )
+    planner.estimate( 'FC_Meta_Type', 'MC' )
+    self.assertEqual( db._query.call_count, 5 )
+
+  def testFindDirectories( self ):
+    """ directories satisfying several conditions, defined at different levels of the tree
+    """
+    metaDirs = { 'Type' : [ 3 ], 'Year' : [ 4, 6 ], 'Energy' : [ 5 ], 'Run' : [ 6 ] }
+    db = MagicMock()
+    db._query.side_effect = lambda req: S_OK( [ ( dirID, ) for dirID in metaDirs[ req.split()[3][8:] ] ] )
+    db.dtree = DirectoryTreeBase( db )
+    db.dtree.getDirectoryPaths = lambda dirIDs: S_OK( dict( [ ( dirID, DIRECTORIES[dirID] ) for dirID in dirIDs ] ) )
+    db.dtree.getAllSubdirectoriesByID = getSubdirectories
+    dmeta = DirectoryMetadata( db )
+    dmeta.planner = MagicMock()
+    dmeta.planner.orderConditions.side_effect = lambda metaDict: S_OK( sorted( metaDict ) )
+    findDirs = dmeta._DirectoryMetadata__findDirsByConditions
+
+    self.assertEqual( sorted( findDirs( { 'Type' : 'MC', 'Year' : 2015 }, '' )['Value'] ), [ 4 ] )
+    self.assertEqual( sorted( findDirs( { 'Type' : 'MC' }, '' )['Value'] ), [ 3, 4, 5 ] )
+    #No intersection, the last condition is not evaluated
+    db._query.reset_mock()
+    self.assertEqual( findDirs( { 'Energy' : 'High', 'Run' : 1, 'Type' : 'MC' }, '' )['Value'], [] )
+    self.assertEqual( db._query.call_count, 2 )
+
+  def testQueryCache( self ):
+    """ results expired, dropped by the invalidations and not added if computed before them
+    """
+    cache = MetaQueryCache( 10, lifetime = 60 )
+    key = cache.getKey( { 'Type' : 'MC', 'Path' : '/vo' } )
+    self.assertEqual( key, cache.getKey( { 'Path' : '/vo', 'Type' : 'MC' } ) )
+    cache.add( key, { 'NumberOfFiles' : 3 } )
+    self.assertEqual( cache.get( key ), { 'NumberOfFiles' : 3 } )
+    generation = cache.getGeneration()
+    cache.clear()
+    self.assertEqual( cache.get( key ), None )
+    cache.add( key, { 'NumberOfFiles' : 4 }, generation )
+    self.assertEqual( cache.get( key ), None )
+
+    cache.lifetime = -1
+    cache.add( key, { 'NumberOfFiles' : 4 } )
+    self.assertEqual( cache.get( key ), None )
+    self.assertEqual( cache.getCounters()['Metadata Query Cache Hits'], 1 )
+
+  def testQueryCachePaths( self ):
+    """ only the parameters kept, results dropped by the changes above or below the query paths
+    """
+    cache = MetaQueryCache( 10, lifetime = 60 )
+    cache.add( 'mc', { 'NumberOfFiles' : 1, 'TotalSize' : 5, 'DatasetHash' : 'A',
+                       'LFNList' : [ '/vo/mc/f1' ], 'LFNIDList' : [ 1 ] }, path = '/vo/mc' )
+    cache.add( 'data', { 'NumberOfFiles' : 2 }, path = '/vo/data' )
+    cache.add( 'all', { 'NumberOfFiles' : 3 } )
+    self.assertEqual( cache.get( 'mc' ), { 'NumberOfFiles' : 1, 'TotalSize' : 5, 'DatasetHash' : 'A' } )
+
+    cache.invalidate( [ '/vo/mc/2015/f2', '/vo/mc/2016/f3' ] )
+    self.assertEqual( cache.get( 'mc' ), None )
+    self.assertEqual( cache.get( 'all' ), None )
+    self.assertEqual( cache.get( 'data' ), { 'NumberOfFiles' : 2 } )
+    #Directory metadata inherited by the query path
+    cache.invalidate( '/vo/' )
+    self.assertEqual( cache.get( 'data' ), None )
+
+    #Only the invalidations related to the path of the query done during them
+    generation = cache.getGeneration()
+    cache.invalidate( [ '/vo/mc/f4', '/vo/mc/2015/f5' ] )
+    cache.add( 'data', { 'NumberOfFiles' : 2 }, generation, '/vo/data' )
+    cache.add( 'mc', { 'NumberOfFiles' : 1 }, generation, '/vo/mc/2015' )
+    self.assertEqual( cache.get( 'data' ), { 'NumberOfFiles' : 2 } )
+    self.assertEqual( cache.get( 'mc' ), None )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( MetaQueryPlannerTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -2,6 +2,8 @@
 
 __RCSID__ = "$Id$"
 
+import time
+
 from DIRAC                                                                     import gLogger, S_OK, S_ERROR
 from DIRAC.Core.Base.DB                                                        import DB
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryMetadata     import DirectoryMetadata
@@ -18,8 +20,14 @@ from DIRAC.DataManagementSystem.DB.FileCatalogComponents.SEManager             i
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.SecurityManager       import NoSecurityManager, DirectorySecurityManager, FullSecurityManager, DirectorySecurityManagerWithDelete, PolicyBasedSecurityManager
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.UserAndGroupManager   import UserAndGroupManagerCS,UserAndGroupManagerDB
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DatasetManager        import DatasetManager
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache        import DirectoryCache
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.MetaQueryPlanner      import MetaQueryCache
 from DIRAC.Resources.Catalog.Utilities                                         import checkArgumentFormat
 
+# Seconds the invalidations of the directory cache are kept for the other catalog service instances
+INVALIDATION_LIFETIME = 3600
+INVALIDATION_PURGE_PERIOD = 600
+
 #############################################################################
 class FileCatalogDB( DB ):
 
@@ -60,6 +68,14 @@ class FileCatalogDB( DB ):
     self.visibleFileStatus = databaseConfig['VisibleFileStatus']
     self.visibleReplicaStatus = databaseConfig['VisibleReplicaStatus']
 
+    result = self.__setupDirectoryCache( databaseConfig )
+    if not result['OK']:
+      return result
+    self.metaQueryCache = MetaQueryCache( int( databaseConfig.get( 'MetaQueryCacheSize', 100 ) ),
+                                          float( databaseConfig.get( 'MetaQueryCacheLifetime', 60 ) ) )
+    self.datasetSyncWindow = int( databaseConfig.get( 'DatasetSyncWindow', 1000 ) )
+    self.datasetFullSyncPeriod = int( databaseConfig.get( 'DatasetFullSyncPeriod', 86400 ) )
+
     try:
       # Obtain the plugins to be used for DB interaction
       self.ugManager = eval( "%s(self)" % databaseConfig['UserGroupManager'] )
@@ -79,6 +95,93 @@ class FileCatalogDB( DB ):
   def setUmask( self, umask ):
     self.umask = umask
 
+  ########################################################################
+  #
+  #  Directory cache methods
+  #
+
+  def __setupDirectoryCache( self, databaseConfig ):
+    """ Create the cache of the directory paths resolution
+
+        With the 'Shared' invalidation, the default, the invalidations are also written in the
+        FC_DirectoryCacheInvalidations table and read by the other catalog service instances.
+        The 'Local' invalidation is only right if a single catalog service instance uses the DB
+    """
+    cacheSize = int( databaseConfig.get( 'DirectoryCacheSize', 50000 ) )
+    invalidation = databaseConfig.get( 'DirectoryCacheInvalidation', 'Shared' )
+    syncPeriod = float( databaseConfig.get( 'DirectoryCacheSyncPeriod', 1 ) )
+    maxAge = float( databaseConfig.get( 'DirectoryCacheMaxAge', 300 ) )
+    if invalidation not in ( 'Local', 'Shared' ):
+      return S_ERROR( 'Invalid DirectoryCacheInvalidation %s' % invalidation )
+    self.__sharedDirectoryCache = False
+    syncFunction = None
+    if cacheSize and invalidation == 'Shared':
+      result = self._query( "SELECT MAX(Seq) FROM FC_DirectoryCacheInvalidations" )
+      if not result['OK']:
+        # Without the table, the changes done by the other instances can not be seen
+        gLogger.warn( 'Directory cache disabled, the invalidations can not be shared', result['Message'] )
+        cacheSize = 0
+      else:
+        self.__lastInvalidation = result['Value'][0][0] or 0
+        self.__nextInvalidationPurge = 0
+        self.__sharedDirectoryCache = True
+        syncFunction = self.__syncDirectoryCache
+    self.dirCache = DirectoryCache( cacheSize, syncFunction = syncFunction, syncPeriod = syncPeriod, maxAge = maxAge )
+    return S_OK()
+
+  def __syncDirectoryCache( self ):
+    """ Get the directory cache invalidations done since the last call, by all the instances
+
+        :return: S_OK( list of ( path, recursive ) ), or S_OK( None ) if some invalidations can have been missed
+    """
+    req = "SELECT Seq, DirName, Recursive FROM FC_DirectoryCacheInvalidations WHERE Seq > %d ORDER BY Seq" % \
+          self.__lastInvalidation
+    result = self._query( req )
+    if not result['OK']:
+      return result
+    invalidations = []
+    complete = True
+    for seq, dirName, recursive in result['Value']:
+      if seq != self.__lastInvalidation + 1:
+        # The missing invalidations were purged or are not committed yet
+        complete = False
+      self.__lastInvalidation = seq
+      invalidations.append( ( dirName, bool( recursive ) ) )
+
+    if time.time() > self.__nextInvalidationPurge:
+      self.__nextInvalidationPurge = time.time() + INVALIDATION_PURGE_PERIOD
+      req = "DELETE FROM FC_DirectoryCacheInvalidations WHERE InvalidationTime < UTC_TIMESTAMP() - INTERVAL %d SECOND" % \
+            INVALIDATION_LIFETIME
+      res = self._update( req )
+      if not res['OK']:
+        gLogger.warn( 'Failed to purge the directory cache invalidations', res['Message'] )
+
+    if not complete:
+      return S_OK( None )
+    return S_OK( invalidations )
+
+  def invalidateDirectoryCache( self, paths, recursive = False, local = False ):
+    """ Drop the cached entries of the directories in all the catalog service instances
+
+        :param paths: directory path or list of paths
+        :param bool recursive: drop also the entries of all their subdirectories
+        :param bool local: drop the entries of this instance only
+    """
+    if isinstance( paths, basestring ):
+      paths = [ paths ]
+    self.dirCache.invalidate( paths, recursive )
+    if local or not self.__sharedDirectoryCache or not paths:
+      return S_OK()
+    result = self._escapeValues( paths )
+    if not result['OK']:
+      return result
+    values = ','.join( [ "(%s,%d,UTC_TIMESTAMP())" % ( path, int( recursive ) ) for path in result['Value'] ] )
+    req = "INSERT INTO FC_DirectoryCacheInvalidations (DirName,Recursive,InvalidationTime) VALUES %s" % values
+    result = self._update( req )
+    if not result['OK']:
+      gLogger.error( 'Failed to share the directory cache invalidation', result['Message'] )
+    return result
+
   ########################################################################
   #
   #  SE based write methods
@@ -287,6 +390,7 @@ class FileCatalogDB( DB ):
                                           recursive = recursive )
       failed.update( result['Value']['Failed'] )
       successful = result['Value']['Successful']
+      self.__invalidateDatasets( dict.fromkeys( successful, [ 'User', 'UID' ] ), successful.keys() )
     return S_OK( { 'Successful':successful, 'Failed':failed } )
 
   def changePathGroup( self, paths, credDict, recursive = False ):
@@ -308,6 +412,7 @@ class FileCatalogDB( DB ):
                                           recursive = recursive )
       failed.update( result['Value']['Failed'] )
       successful = result['Value']['Successful']
+      self.__invalidateDatasets( dict.fromkeys( successful, [ 'Group', 'GID' ] ), successful.keys() )
     return S_OK( { 'Successful':successful, 'Failed':failed } )
 
   def changePathMode( self, paths, credDict, recursive = False ):
@@ -375,12 +480,14 @@ class FileCatalogDB( DB ):
         fileArgs[path] = paths[path]
     if dirArgs:
       result = change_function_directory( dirArgs, recursive = recursive )
+      self.metaQueryCache.invalidate( dirArgs.keys() )
       if not result['OK']:
         return result
       successful.update( result['Value']['Successful'] )
       failed.update( result['Value']['Failed'] )
     if fileArgs:
       result = change_function_file( fileArgs )
+      self.metaQueryCache.invalidate( fileArgs.keys() )
       if not result['OK']:
         return result
       successful.update( result['Value']['Successful'] )
@@ -411,7 +518,9 @@ class FileCatalogDB( DB ):
     if not res['Value']['Successful']:
       return S_OK( {'Successful':{}, 'Failed':failed} )
 
-    res = self.fileManager.addFile(res['Value']['Successful'],credDict)
+    lfnsToAdd = res['Value']['Successful']
+    res = self.fileManager.addFile( lfnsToAdd, credDict )
+    self.metaQueryCache.invalidate( lfnsToAdd.keys() )
     if not res['OK']:
       return res
     failed.update( res['Value']['Failed'] )
@@ -437,11 +546,14 @@ class FileCatalogDB( DB ):
     if not res['Value']['Successful']:
       return S_OK( {'Successful':{}, 'Failed':failed} )
 
-    res = self.fileManager.setFileStatus( res['Value']['Successful'], credDict )
+    lfnsToChange = res['Value']['Successful']
+    res = self.fileManager.setFileStatus( lfnsToChange, credDict )
+    self.metaQueryCache.invalidate( lfnsToChange.keys() )
     if not res['OK']:
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    self.__invalidateDatasets( dict.fromkeys( successful, [ 'Status' ] ), successful.keys() )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def removeFile( self, lfns, credDict ):
@@ -462,11 +574,21 @@ class FileCatalogDB( DB ):
     if not res['Value']['Successful']:
       return S_OK( {'Successful':{}, 'Failed':failed} )
 
-    res = self.fileManager.removeFile(res['Value']['Successful'])
+    lfnsToRemove = res['Value']['Successful']
+    # The FileIDs are needed to drop the removed files from the datasets
+    fileIDs = {}
+    result = self.fileManager._findFiles( list( lfnsToRemove ) )
+    if result['OK']:
+      fileIDs = result['Value']['Successful']
+    res = self.fileManager.removeFile( lfnsToRemove )
+    self.metaQueryCache.invalidate( lfnsToRemove.keys() )
     if not res['OK']:
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    result = self.datasetManager.removeDatasetFiles( [ fileIDs[lfn]['FileID'] for lfn in successful if lfn in fileIDs ] )
+    if not result['OK']:
+      gLogger.error( 'Failed to remove the files from the datasets', result['Message'] )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def addReplica( self, lfns, credDict ):
@@ -489,11 +611,14 @@ class FileCatalogDB( DB ):
     if not res['Value']['Successful']:
       return S_OK( {'Successful':{}, 'Failed':failed} )
 
-    res = self.fileManager.addReplica(res['Value']['Successful'])
+    lfnsToChange = res['Value']['Successful']
+    res = self.fileManager.addReplica( lfnsToChange )
+    self.metaQueryCache.invalidate( lfnsToChange.keys() )
     if not res['OK']:
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    self.__invalidateDatasets( dict.fromkeys( successful, [ 'SE' ] ), successful.keys() )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def removeReplica( self, lfns, credDict ):
@@ -516,11 +641,14 @@ class FileCatalogDB( DB ):
     if not res['Value']['Successful']:
       return S_OK( {'Successful':{}, 'Failed':failed} )
 
-    res = self.fileManager.removeReplica(res['Value']['Successful'])
+    lfnsToChange = res['Value']['Successful']
+    res = self.fileManager.removeReplica( lfnsToChange )
+    self.metaQueryCache.invalidate( lfnsToChange.keys() )
     if not res['OK']:
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    self.__invalidateDatasets( dict.fromkeys( successful, [ 'SE' ] ), successful.keys() )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def setReplicaStatus( self, lfns, credDict ):
@@ -542,7 +670,9 @@ class FileCatalogDB( DB ):
     if not res['Value']['Successful']:
       return S_OK( {'Successful':{}, 'Failed':failed} )
 
-    res = self.fileManager.setReplicaStatus(res['Value']['Successful'])
+    lfnsToChange = res['Value']['Successful']
+    res = self.fileManager.setReplicaStatus( lfnsToChange )
+    self.metaQueryCache.invalidate( lfnsToChange.keys() )
     if not res['OK']:
       return res
     failed.update( res['Value']['Failed'] )
@@ -559,7 +689,9 @@ class FileCatalogDB( DB ):
     if not res['Value']['Successful']:
       return S_OK( {'Successful':{}, 'Failed':failed} )
 
-    res = self.fileManager.setReplicaHost(res['Value']['Successful'])
+    lfnsToChange = res['Value']['Successful']
+    res = self.fileManager.setReplicaHost( lfnsToChange )
+    self.metaQueryCache.invalidate( lfnsToChange.keys() )
     if not res['OK']:
       return res
     failed.update( res['Value']['Failed'] )
@@ -856,7 +988,9 @@ class FileCatalogDB( DB ):
 
 
 
-    res = self.dtree.removeDirectory( res['Value']['Successful'], credDict )
+    dirsToRemove = res['Value']['Successful']
+    res = self.dtree.removeDirectory( dirsToRemove, credDict )
+    self.metaQueryCache.invalidate( dirsToRemove.keys() )
     if not res['OK']:
       return res
     failed.update( res['Value']['Failed'] )
@@ -909,6 +1043,29 @@ class FileCatalogDB( DB ):
     successful = res['Value']['Successful']
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
+  def listDirectoryPage( self, path, credDict, verbose = False, token = None, maxFiles = 1000 ):
+    """
+        List a directory by pages of files
+
+        :param str path: directory
+        :param creDict: credential
+        :param str token: continuation token of the page, None for the first page
+        :param int maxFiles: maximum number of files in the page
+
+        :return: dictionary indexed "Files", "Datasets", "SubDirs", "Links" and "Token",
+                 the continuation token of the next page or None after the last page
+    """
+
+    res = self._checkPathPermissions( 'listDirectory', [ path ], credDict )
+    if not res['OK']:
+      return res
+    if res['Value']['Failed']:
+      return S_ERROR( res['Value']['Failed'].values()[0] )
+    # The normalized path
+    path = res['Value']['Successful'].keys()[0]
+
+    return self.dtree.listDirectoryPage( path, verbose = verbose, token = token, maxFiles = maxFiles )
+
   def isDirectory( self, lfns, credDict ):
     """
         Checks whether a list of LFNS are directories or not
@@ -953,6 +1110,29 @@ class FileCatalogDB( DB ):
     successful = res['Value']['Successful']
     return S_OK( { 'Successful':successful, 'Failed':failed, 'SEPrefixes': res['Value'].get( 'SEPrefixes', {} )} )
 
+  def getDirectoryReplicasPage( self, path, allStatus, credDict, token = None, maxFiles = 1000 ):
+    """
+        Get the replicas of the files of a directory by pages
+
+        :param str path: directory
+        :param creDict: credential
+        :param str token: continuation token of the page, None for the first page
+        :param int maxFiles: maximum number of files in the page
+
+        :return: dictionary indexed "Files", "Token", the continuation token of the next page
+                 or None after the last page, and "SEPrefixes"
+    """
+
+    res = self._checkPathPermissions( 'getDirectoryReplicas', [ path ], credDict )
+    if not res['OK']:
+      return res
+    if res['Value']['Failed']:
+      return S_ERROR( res['Value']['Failed'].values()[0] )
+    # The normalized path
+    path = res['Value']['Successful'].keys()[0]
+
+    return self.dtree.getDirectoryReplicasPage( path, allStatus, token = token, maxFiles = maxFiles )
+
   def getDirectorySize( self, lfns, longOutput, fromFiles, credDict ):
     """
         Get the sizes of a list of directories
@@ -1016,6 +1196,8 @@ class FileCatalogDB( DB ):
     result = S_OK()
     if directoryFlag:
       result = self.dtree.recoverOrphanDirectories( credDict )
+      # The DirIDs of the directories can have been changed
+      self.invalidateDirectoryCache( '/', recursive = True )
 
     return result
 
@@ -1027,6 +1209,17 @@ class FileCatalogDB( DB ):
   def setMetadata( self, path, metadataDict, credDict ):
     """ Add metadata to the given path
     """
+    result = self.__setMetadata( path, metadataDict, credDict )
+    isFile = result.pop( 'IsFile', None )
+    if isFile is not None:
+      self.__invalidateDatasets( { path : metadataDict.keys() }, [ path ] if isFile else [] )
+    return result
+
+  def __setMetadata( self, path, metadataDict, credDict ):
+    """ Add metadata to the given path, without invalidating the datasets
+
+        :return: S_OK/S_ERROR with IsFile telling the type of the path once it is known
+    """
     res = self._checkPathPermissions( 'setMetadata', path, credDict )
     if not res['OK']:
       return res
@@ -1040,43 +1233,77 @@ class FileCatalogDB( DB ):
       return result
     if not result['Value']['Successful']:
       return S_ERROR( 'Failed to determine the path type' )
-    if result['Value']['Successful'][path]:
+    isFile = not result['Value']['Successful'][path]
+    if not isFile:
       # This is a directory
-      return self.dmeta.setMetadata( path, metadataDict, credDict )
+      result = self.dmeta.setMetadata( path, metadataDict, credDict )
     else:
       # This is a file
-      return self.fmeta.setMetadata( path, metadataDict, credDict )
+      result = self.fmeta.setMetadata( path, metadataDict, credDict )
+    # Even a partial change makes the results of the metadata queries obsolete
+    self.metaQueryCache.invalidate( path )
+    result['IsFile'] = isFile
+    return result
 
   def setMetadataBulk( self, pathMetadataDict, credDict ):
     """  Add metadata for the given paths
     """
     successful = {}
     failed = {}
+    changes = {}
+    files = []
     for path, metadataDict in pathMetadataDict.items():
-      result = self.setMetadata( path, metadataDict, credDict )
+      result = self.__setMetadata( path, metadataDict, credDict )
       if result['OK']:
         successful[path] = True
       else:
         failed[path] = result['Message']
+      if 'IsFile' in result:
+        changes[path] = metadataDict.keys()
+        if result['IsFile']:
+          files.append( path )
+    # The datasets are invalidated once for all the paths
+    self.__invalidateDatasets( changes, files )
 
     return S_OK( { 'Successful': successful, 'Failed': failed } )
 
+  def __invalidateDatasets( self, changes, files = None ):
+    """ Mark for a full evaluation the materialised datasets depending on the changed
+        metadata of the paths
+
+        :param dict changes: names of the changed metadata per path
+        :param list files: paths which are files, the datasets which did not evaluate them yet are not affected
+    """
+    result = self.datasetManager.invalidateDatasets( changes, files )
+    if not result['OK']:
+      gLogger.error( 'Failed to invalidate the datasets', result['Message'] )
+
   def removeMetadata( self, pathMetadataDict, credDict ):
     """ Remove metadata for the given paths
     """
     successful = {}
     failed = {}
+    changes = {}
+    files = []
     for path, metadataDict in pathMetadataDict.items():
       result = self.__removeMetadata( path, metadataDict, credDict )
       if result['OK']:
         successful[path] = True
       else:
         failed[path] = result['Message']
+      if 'IsFile' in result:
+        changes[path] = metadataDict
+        if result['IsFile']:
+          files.append( path )
+    # The datasets are invalidated once for all the paths
+    self.__invalidateDatasets( changes, files )
 
     return S_OK( { 'Successful': successful, 'Failed': failed } )
 
   def __removeMetadata( self, path, metadata, credDict ):
-    """ Remove metadata from the given path
+    """ Remove metadata from the given path, without invalidating the datasets
+
+        :return: S_OK/S_ERROR with IsFile telling the type of the path once it is known
     """
     res = self._checkPathPermissions( '__removeMetadata', path, credDict )
     if not res['OK']:
@@ -1091,12 +1318,17 @@ class FileCatalogDB( DB ):
       return result
     if not result['Value']['Successful']:
       return S_ERROR( 'Failed to determine the path type' )
-    if result['Value']['Successful'][path]:
+    isFile = not result['Value']['Successful'][path]
+    if not isFile:
       # This is a directory
-      return self.dmeta.removeMetadata( path, metadata, credDict )
+      result = self.dmeta.removeMetadata( path, metadata, credDict )
     else:
       # This is a file
-      return self.fmeta.removeMetadata( path, metadata, credDict )
+      result = self.fmeta.removeMetadata( path, metadata, credDict )
+    # Even a partial change makes the results of the metadata queries obsolete
+    self.metaQueryCache.invalidate( path )
+    result['IsFile'] = isFile
+    return result
 
   #######################################################################
   #
@@ -1126,6 +1358,8 @@ class FileCatalogDB( DB ):
     if not res['OK']:
       return res
     counterDict.update( res['Value'] )
+    counterDict.update( self.dirCache.getCounters() )
+    counterDict.update( self.metaQueryCache.getCounters() )
     return S_OK( counterDict )
 
   ########################################################################
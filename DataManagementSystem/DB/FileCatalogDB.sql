@@ -272,3 +272,12 @@ CREATE TABLE FC_FileAncestors (
   UNIQUE INDEX (FileID,AncestorID)
 ) ENGINE = INNODB;
 
+-- ------------------------------------------------------------------------------
+
+CREATE TABLE FC_DirectoryCacheInvalidations (
+  Seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+  DirName VARCHAR(1024) CHARACTER SET latin1 COLLATE latin1_bin NOT NULL,
+  Recursive TINYINT NOT NULL DEFAULT 0,
+  InvalidationTime DATETIME NOT NULL,
+  INDEX (InvalidationTime)
+) ENGINE = INNODB;
@@ -689,6 +689,58 @@ DELIMITER ;
 
 
 
+-- ps_get_file_ids_from_dir_files : get the file ids of files in several directories
+-- dir_files : condition on the DirID and FileName of the files we are interested in
+-- output : FileID, DirID, FileName
+
+drop procedure if exists ps_get_file_ids_from_dir_files;
+DELIMITER //
+CREATE PROCEDURE ps_get_file_ids_from_dir_files
+(IN dir_files MEDIUMTEXT)
+BEGIN
+
+  SET @sql = CONCAT('SELECT SQL_NO_CACHE FileID, DirID, FileName FROM FC_Files WHERE ', dir_files);
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt;
+  DEALLOCATE PREPARE stmt;
+
+END //
+DELIMITER ;
+
+
+-- ps_get_all_info_for_files_in_dirs : get all the info about files in several directories
+-- dir_files : condition on the f.DirID and f.FileName of the files we are interested in
+-- allStatus : if False, consider the visibleFileStatus
+-- visibleFileStatus : list of status we are interested in
+-- output : FileName, DirID, f.FileID, Size, f.uid, UserName, f.gid, GroupName, s.Status,
+--                     GUID, Checksum, ChecksumType, Type, CreationDate,ModificationDate, Mode
+
+drop procedure if exists ps_get_all_info_for_files_in_dirs;
+DELIMITER //
+CREATE PROCEDURE ps_get_all_info_for_files_in_dirs
+(IN dir_files MEDIUMTEXT, IN allStatus BOOLEAN, IN visibleFileStatus VARCHAR(255))
+BEGIN
+
+  set @sql = CONCAT('SELECT SQL_NO_CACHE FileName, DirID, f.FileID, Size, f.uid, UserName, f.gid, GroupName, s.Status,
+                     GUID, Checksum, ChecksumType, Type, CreationDate,ModificationDate, Mode
+                    FROM FC_Files f
+                    JOIN FC_Users u ON f.UID = u.UID
+                    JOIN FC_Groups g ON f.GID = g.GID
+                    JOIN FC_Statuses s ON f.Status = s.StatusID
+                    WHERE ( ', dir_files, ' ) ' );
+
+  IF not allStatus THEN
+    SET @sql = CONCAT(@sql,' and s.Status  in (',visibleFileStatus,') ');
+  END IF;
+
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt;
+  DEALLOCATE PREPARE stmt;
+
+END //
+DELIMITER ;
+
+
 -- ps_get_all_info_for_files_in_dir : get all the info about files in a given directory
 -- dir_id : directory id
 -- specificFiles : if True, consider the file_names list
@@ -728,6 +780,44 @@ END //
 DELIMITER ;
 
 
+-- ps_get_all_info_for_files_in_dir_page : get all the info about a page of the files of a given directory
+-- dir_id : directory id
+-- last_file_id : the files with a FileID greater than this one are considered
+-- max_files : maximum number of files returned
+-- allStatus : if False, consider the visibleFileStatus
+-- visibleFileStatus : list of status we are interested in
+-- output : FileName, DirID, f.FileID, Size, f.uid, UserName, f.gid, GroupName, s.Status,
+--                     GUID, Checksum, ChecksumType, Type, CreationDate,ModificationDate, Mode
+--          ordered by FileID
+
+drop procedure if exists ps_get_all_info_for_files_in_dir_page;
+DELIMITER //
+CREATE PROCEDURE ps_get_all_info_for_files_in_dir_page
+(IN dir_id INT, IN last_file_id INT, IN max_files INT, IN allStatus BOOLEAN, IN visibleFileStatus VARCHAR(255))
+BEGIN
+
+  set @sql = CONCAT('SELECT SQL_NO_CACHE FileName, DirID, f.FileID, Size, f.uid, UserName, f.gid, GroupName, s.Status,
+                     GUID, Checksum, ChecksumType, Type, CreationDate,ModificationDate, Mode
+                    FROM FC_Files f
+                    JOIN FC_Users u ON f.UID = u.UID
+                    JOIN FC_Groups g ON f.GID = g.GID
+                    JOIN FC_Statuses s ON f.Status = s.StatusID
+                    WHERE DirID = ', dir_id, ' and f.FileID > ', last_file_id, ' ' );
+
+  IF not allStatus THEN
+    SET @sql = CONCAT(@sql,' and s.Status  in (',visibleFileStatus,') ');
+  END IF;
+
+  SET @sql = CONCAT(@sql,' ORDER BY f.FileID LIMIT ', max_files);
+
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt;
+  DEALLOCATE PREPARE stmt;
+
+END //
+DELIMITER ;
+
+
 
 -- ps_get_all_info_for_file_ids : get all the info for given file ids
 -- file_ids : list of file ids
@@ -1803,3 +1893,13 @@ DELIMITER ;
 --                         ADD UNIQUE (FileID,SEID);
 
 SET FOREIGN_KEY_CHECKS = 1;
+
+-- ------------------------------------------------------------------------------
+
+CREATE TABLE FC_DirectoryCacheInvalidations (
+  Seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+  DirName VARCHAR(1024) CHARACTER SET latin1 COLLATE latin1_bin NOT NULL,
+  Recursive TINYINT NOT NULL DEFAULT 0,
+  InvalidationTime DATETIME NOT NULL,
+  INDEX (InvalidationTime)
+) ENGINE = INNODB;
@@ -19,6 +19,7 @@ from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
 from DIRAC import gLogger, S_OK, S_ERROR
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.DataManagementSystem.DB.FileCatalogDB import FileCatalogDB
+from DIRAC.Resources.Catalog.Utilities import encodeDirectoryPage
 
 # This is a global instance of the FileCatalogDB class
 gFileCatalogDB = None
@@ -58,7 +59,15 @@ def initializeFileCatalogHandler( serviceInfo ):
                     'ValidFileStatus'     : ['AprioriGood','Trash','Removing','Probing'],
                     'ValidReplicaStatus'  : ['AprioriGood','Trash','Removing','Probing'],
                     'VisibleFileStatus'   : ['AprioriGood'],
-                    'VisibleReplicaStatus': ['AprioriGood']}
+                    'VisibleReplicaStatus': ['AprioriGood'],
+                    'DirectoryCacheSize'  : 50000,
+                    'DirectoryCacheInvalidation' : 'Shared',
+                    'DirectoryCacheSyncPeriod' : 1,
+                    'DirectoryCacheMaxAge' : 300,
+                    'MetaQueryCacheSize'  : 100,
+                    'MetaQueryCacheLifetime' : 60,
+                    'DatasetSyncWindow'   : 1000,
+                    'DatasetFullSyncPeriod' : 86400 }
   for configKey in sorted( defaultConfig.keys() ):
     defaultValue = defaultConfig[configKey]
     configValue = getServiceOption( serviceInfo, configKey, defaultValue )
@@ -372,6 +381,20 @@ class FileCatalogHandler( RequestHandler ):
     gMonitor.addMark( 'ListDirectory', 1 )
     return gFileCatalogDB.listDirectory( lfns, self.getRemoteCredentials(), verbose = verbose )
 
+  def __getPageSize( self, maxFiles ):
+    """ Number of files of the pages of the directory listings, bounded by the MaxPageSize option """
+    maxPageSize = self.srv_getCSOption( 'MaxPageSize', 10000 )
+    if not isinstance( maxFiles, ( IntType, LongType ) ) or maxFiles <= 0:
+      return maxPageSize
+    return min( maxFiles, maxPageSize )
+
+  types_listDirectoryPage = [ StringTypes, BooleanType ]
+  def export_listDirectoryPage( self, path, verbose, token = None, maxFiles = 0 ):
+    """ List a page of the contents of the supplied directory """
+    gMonitor.addMark( 'ListDirectory', 1 )
+    return gFileCatalogDB.listDirectoryPage( path, self.getRemoteCredentials(), verbose = verbose,
+                                             token = token, maxFiles = self.__getPageSize( maxFiles ) )
+
   types_isDirectory = [ [ ListType, DictType ] + list( StringTypes ) ]
   def export_isDirectory( self, lfns ):
     """ Determine whether supplied path is a directory """
@@ -392,6 +415,54 @@ class FileCatalogHandler( RequestHandler ):
     """ Get replicas for files in the supplied directory """
     return gFileCatalogDB.getDirectoryReplicas( lfns, allStatus, self.getRemoteCredentials() )
 
+  types_getDirectoryReplicasPage = [ StringTypes, BooleanType ]
+  def export_getDirectoryReplicasPage( self, path, allStatus = False, token = None, maxFiles = 0 ):
+    """ Get replicas for a page of the files in the supplied directory """
+    return gFileCatalogDB.getDirectoryReplicasPage( path, allStatus, self.getRemoteCredentials(),
+                                                    token = token, maxFiles = self.__getPageSize( maxFiles ) )
+
+  def transfer_toClient( self, fileId, token, fileHelper ):
+    """ Stream all the pages of a directory to the client
+
+        fileId is ( "listDirectory", path, verbose ) or ( "getDirectoryReplicas", path, allStatus ),
+        the pages are the ones of listDirectoryPage or getDirectoryReplicasPage, encoded
+        with encodeDirectoryPage.
+    """
+    try:
+      method, path, flag = fileId
+    except ( TypeError, ValueError ):
+      fileHelper.sendError( 'Invalid directory export: %s' % str( fileId ) )
+      return S_ERROR( 'Invalid directory export: %s' % str( fileId ) )
+    credDict = self.getRemoteCredentials()
+    maxFiles = self.__getPageSize( 0 )
+    if method == 'listDirectory':
+      gMonitor.addMark( 'ListDirectory', 1 )
+      getPage = lambda pageToken: gFileCatalogDB.listDirectoryPage( path, credDict, verbose = flag,
+                                                                   token = pageToken, maxFiles = maxFiles )
+    elif method == 'getDirectoryReplicas':
+      getPage = lambda pageToken: gFileCatalogDB.getDirectoryReplicasPage( path, flag, credDict,
+                                                                          token = pageToken, maxFiles = maxFiles )
+    else:
+      fileHelper.sendError( 'Unknown directory export: %s' % method )
+      return S_ERROR( 'Unknown directory export: %s' % method )
+
+    pageToken = None
+    while True:
+      result = getPage( pageToken )
+      if not result['OK']:
+        fileHelper.sendError( result['Message'] )
+        return result
+      pageToken = result['Value']['Token']
+      result = fileHelper.sendData( encodeDirectoryPage( result['Value'] ) )
+      if not result['OK']:
+        return result
+      if result.get( 'AbortTransfer' ):
+        gLogger.verbose( "Directory export aborted", path )
+        return S_OK()
+      if not pageToken:
+        break
+    return fileHelper.sendEOF()
+
   ########################################################################
   #
   # Administrative database operations
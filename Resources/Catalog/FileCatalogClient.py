@@ -6,10 +6,12 @@
 __RCSID__ = "$Id$"
 
 import os
+import tempfile
 
 from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.DISET.TransferClient                   import TransferClient
 from DIRAC.ConfigurationSystem.Client.Helpers.Registry import getVOMSAttributeForGroup, getDNForUsername
-from DIRAC.Resources.Catalog.Utilities                 import checkCatalogArguments
+from DIRAC.Resources.Catalog.Utilities                 import checkCatalogArguments, readDirectoryPages
 from DIRAC.Resources.Catalog.FileCatalogClientBase     import FileCatalogClientBase
 
 # The list of methods below is defining the client interface
@@ -20,7 +22,8 @@ READ_METHODS = ['exists', 'isFile', 'getFileMetadata', 'getReplicas',
                 'findFilesByMetadata','getMetadataFields','getDirectoryUserMetadata',
                 'findDirectoriesByMetadata','getReplicasByMetadata','findFilesByMetadataDetailed',
                 'findFilesByMetadataWeb','getCompatibleMetadata','getMetadataSet', 'getDatasets',
-                'checkDataset', 'getDatasetParameters', 'getDatasetFiles', 'getDatasetAnnotation']
+                'checkDataset', 'getDatasetParameters', 'getDatasetFiles', 'getDatasetAnnotation',
+                'listDirectoryPage', 'getDirectoryReplicasPage', 'exportDirectory']
 
 WRITE_METHODS = ['createLink', 'removeLink', 'addFile', 'setFileStatus', 'addReplica', 'removeReplica',
                  'removeFile', 'setReplicaStatus', 'setReplicaHost', 'setReplicaProblematic', 'createDirectory',
@@ -32,7 +35,8 @@ WRITE_METHODS = ['createLink', 'removeLink', 'addFile', 'setFileStatus', 'addRep
 NO_LFN_METHODS = ['findFilesByMetadata','addMetadataField','deleteMetadataField','getMetadataFields','setMetadata',
                   'setMetadataBulk','removeMetadata','getDirectoryUserMetadata','findDirectoriesByMetadata',
                   'getReplicasByMetadata','findFilesByMetadataDetailed','findFilesByMetadataWeb',
-                  'getCompatibleMetadata','addMetadataSet','getMetadataSet']
+                  'getCompatibleMetadata','addMetadataSet','getMetadataSet',
+                  'listDirectoryPage', 'getDirectoryReplicasPage', 'exportDirectory']
 
 ADMIN_METHODS = [ 'addUser', 'deleteUser', 'addGroup', 'deleteGroup', 'getUsers', 'getGroups',
                   'getCatalogCounters', 'repairCatalog', 'rebuildDirectoryUsage' ]
@@ -222,6 +226,72 @@ class FileCatalogClient( FileCatalogClientBase ):
         pathDict[lfn] = detailsDict
     return result
 
+  @staticmethod
+  def __setPageLFNs( path, pageDict ):
+    """ Force the entries of a directory page to be LFNs, and build the PFNs from the SE prefixes
+    """
+    seDict = pageDict.get( 'SEPrefixes', {} )
+    for entryType in ['Files', 'SubDirs', 'Links']:
+      entryDict = pageDict.get( entryType, {} )
+      for fname in entryDict.keys():
+        detailsDict = entryDict.pop( fname )
+        lfn = os.path.join( path, os.path.basename( fname ) )
+        if seDict:
+          for se in detailsDict:
+            if not detailsDict[se] and se in seDict:
+              detailsDict[se] = seDict[se] + lfn
+        entryDict[lfn] = detailsDict
+
+  def listDirectoryPage( self, path, verbose = False, token = None, maxFiles = 0, timeout = 120 ):
+    """ List a page of the given directory's contents, with at most maxFiles files
+
+        The next page is obtained with the "Token" of the page, until it is None. The subdirectories,
+        links and datasets are in the first page. The service bounds maxFiles, 0 for its maximum.
+    """
+    rpcClient = self._getRPC( timeout = timeout )
+    result = rpcClient.listDirectoryPage( path, verbose, token, maxFiles )
+    if not result['OK']:
+      return result
+    self.__setPageLFNs( path, result['Value'] )
+    return result
+
+  def getDirectoryReplicasPage( self, path, allStatus = False, token = None, maxFiles = 0, timeout = 120 ):
+    """ Get the replicas of a page of the given directory's files, paged as in listDirectoryPage
+    """
+    rpcClient = self._getRPC( timeout = timeout )
+    result = rpcClient.getDirectoryReplicasPage( path, allStatus, token, maxFiles )
+    if not result['OK']:
+      return result
+    self.__setPageLFNs( path, result['Value'] )
+    return result
+
+  def exportDirectory( self, path, pageCallback, replicas = False, verbose = False, allStatus = False ):
+    """ Get all the pages of the given directory streamed at once by the service, for bulk exports
+
+        :param pageCallback: function called with each page, as returned by listDirectoryPage,
+                             or by getDirectoryReplicasPage if replicas is True
+        :return: S_OK( { 'NumberOfFiles' : number of files } )
+    """
+    if replicas:
+      fileId = ( 'getDirectoryReplicas', path, allStatus )
+    else:
+      fileId = ( 'listDirectory', path, verbose )
+    # The stream is kept on disk and read back one page at a time
+    tmpFile = tempfile.TemporaryFile()
+    try:
+      result = TransferClient( self.serverURL ).receiveFile( tmpFile, fileId )
+      if not result['OK']:
+        return result
+      tmpFile.seek( 0 )
+      numberOfFiles = 0
+      for pageDict in readDirectoryPages( tmpFile ):
+        self.__setPageLFNs( path, pageDict )
+        numberOfFiles += len( pageDict['Files'] )
+        pageCallback( pageDict )
+      return S_OK( { 'NumberOfFiles' : numberOfFiles } )
+    finally:
+      tmpFile.close()
+
   def findFilesByMetadata( self, metaDict, path = '/', timeout = 120 ):
     """ Find files given the meta data query and the path
     """
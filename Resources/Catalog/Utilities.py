@@ -11,6 +11,7 @@ import os
 import errno
 
 from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.Utilities import DEncode
 
 def checkArgumentFormat( path, generateMap = False ):
   """ Bring the various possible form of arguments to FileCatalog methods to
@@ -101,3 +102,21 @@ def checkCatalogArguments( f ):
     return result
 
   return processWithCheckingArguments
+
+def encodeDirectoryPage( pageDict ):
+  """ Encode a page of a directory streamed by the FileCatalog service: the DEncoded
+      page preceded by its length on one line
+  """
+  data = DEncode.encode( pageDict )
+  return '%d\n%s' % ( len( data ), data )
+
+def readDirectoryPages( fileObject ):
+  """ Generator of the pages of a directory streamed by the FileCatalog service
+      and written in the given file object
+  """
+  while True:
+    line = fileObject.readline()
+    if not line:
+      return
+    data = fileObject.read( int( line ) )
+    yield DEncode.decode( data )[0]
@@ -78,6 +78,8 @@ class JobAgent( AgentModule ):
     self.minimumTimeLeft = self.am_getOption( 'MinimumTimeLeft', 1000 )
     self.stopOnApplicationFailure = self.am_getOption( 'StopOnApplicationFailure', True )
     self.stopAfterFailedMatches = self.am_getOption( 'StopAfterFailedMatches', 10 )
+    # Jobs requested at once when the CE has several free slots, 0 to fill all of them
+    self.maxJobsPerRequest = self.am_getOption( 'MaxJobsPerRequest', 0 )
     self.jobCount = 0
     self.matchFailedCount = 0
     self.extraOptions = gConfig.getValue( '/AgentJobRequirements/ExtraOptions', '' )
@@ -158,8 +160,9 @@ class JobAgent( AgentModule ):
     self.log.info( 'Configured number of processors: %d, WholeNode: %s' % ( processors, wholeNode ) )
 
     self.log.verbose( ceDict )
+    freeSlots = self.__getFreeSlots( available )
     start = time.time()
-    jobRequest = self.__requestJob( ceDict )
+    jobRequest = self.__requestJobs( ceDict, freeSlots )
     matchTime = time.time() - start
     self.log.info( 'MatcherTime = %.2f (s)' % ( matchTime ) )
 
@@ -192,11 +195,27 @@ class JobAgent( AgentModule ):
     # Reset the Counter
     self.matchFailedCount = 0
 
-    matcherInfo = jobRequest['Value']
+    matchedJobs = jobRequest['Value']
+    self.log.info( 'Matched %d jobs for %d free slots' % ( len( matchedJobs ), freeSlots ) )
+    for iJob, matcherInfo in enumerate( matchedJobs ):
+      result = self.__processMatchedJob( matcherInfo, ceDict, processors, matchTime )
+      if not result['OK']:
+        self.__rescheduleMatchedJobs( matchedJobs[iJob + 1:] )
+        return result
+
+    return S_OK( 'Job Agent cycle complete' )
+
+  #############################################################################
+  def __processMatchedJob( self, matcherInfo, ceDict, processors, matchTime ):
+    """Submit a job received from the matcher to the CE
+    """
     if not self.pilotInfoReportedFlag:
       # Check the flag after the first access to the Matcher
       self.pilotInfoReportedFlag = matcherInfo.get( 'PilotInfoReportedFlag', False )
     jobID = matcherInfo['JobID']
+    # Processors needed by the job when several were matched at once
+    ceDict = dict( ceDict )
+    ceDict['Processors'] = matcherInfo.pop( 'Processors', processors )
     matcherParams = ['JDL', 'DN', 'Group']
     for param in matcherParams:
       if param not in matcherInfo:
@@ -245,7 +264,7 @@ class JobAgent( AgentModule ):
       params['Arguments'] += ' ' + self.extraOptions
       params['ExtraOptions'] = self.extraOptions
 
-    self.log.verbose( 'Job request successful: \n', jobRequest['Value'] )
+    self.log.verbose( 'Job request successful: \n', matcherInfo )
     self.log.info( 'Received JobID=%s, JobType=%s' % ( jobID, jobType ) )
     self.log.info( 'OwnerDN: %s JobGroup: %s' % ( ownerDN, jobGroup ) )
     self.jobCount += 1
@@ -310,7 +329,7 @@ class JobAgent( AgentModule ):
     self.__setJobParam( jobID, 'ScaledCPUTime', str( scaledCPUTime - self.scaledCPUTime ) )
     self.scaledCPUTime = scaledCPUTime
 
-    return S_OK( 'Job Agent cycle complete' )
+    return S_OK( 'Job submitted' )
 
   #############################################################################
   def __saveJobJDLRequest( self, jobID, jobJDL ):
@@ -470,6 +489,41 @@ class JobAgent( AgentModule ):
 
     return ret
 
+  #############################################################################
+  def __getFreeSlots( self, available ):
+    """Number of jobs to request, from the free slots reported by the CE
+    """
+    try:
+      freeSlots = max( 1, int( available['Value'] ) )
+    except ( TypeError, ValueError ):
+      freeSlots = 1
+    if self.maxJobsPerRequest:
+      freeSlots = min( freeSlots, self.maxJobsPerRequest )
+    return freeSlots
+
+  #############################################################################
+  def __requestJobs( self, ceDict, numJobs ):
+    """Request up to numJobs jobs from the matcher service in a single call.
+       Returns the list of jobs, as given by requestJob for each one
+    """
+    if numJobs < 2:
+      result = self.__requestJob( ceDict )
+      if result['OK']:
+        result['Value'] = [ result['Value'] ]
+      return result
+    try:
+      matcher = RPCClient( 'WorkloadManagement/Matcher', timeout = 600 )
+      result = matcher.requestJobs( ceDict, numJobs )
+    except Exception as x:
+      self.log.exception( lException = x )
+      return S_ERROR( "Job request to matcher service failed with exception" )
+    if not result['OK'] and result['Message'].find( 'Unknown method' ) != -1:
+      # The matcher can only serve one job per call
+      self.log.info( 'Matcher does not serve several jobs per call, requesting one' )
+      self.maxJobsPerRequest = 1
+      return self.__requestJobs( ceDict, 1 )
+    return result
+
   #############################################################################
   def __requestJob( self, ceDict ):
     """Request a single job from the matcher service.
@@ -482,6 +536,20 @@ class JobAgent( AgentModule ):
       self.log.exception( lException = x )
       return S_ERROR( "Job request to matcher service failed with exception" )
 
+  #############################################################################
+  def __rescheduleMatchedJobs( self, matchedJobs ):
+    """Give back the jobs matched in the same request that won't be run here
+    """
+    if not matchedJobs:
+      return S_OK()
+    jobIDs = [ matcherInfo['JobID'] for matcherInfo in matchedJobs ]
+    self.log.info( 'Rescheduling matched jobs that will not be run', ', '.join( [ str( jobID ) for jobID in jobIDs ] ) )
+    jobManager = RPCClient( 'WorkloadManagement/JobManager' )
+    result = jobManager.rescheduleJob( jobIDs )
+    if not result['OK']:
+      self.log.error( 'Failed to reschedule jobs', result['Message'] )
+    return result
+
   #############################################################################
   def __getJDLParameters( self, jdl ):
     """Returns a dictionary of JDL parameters.
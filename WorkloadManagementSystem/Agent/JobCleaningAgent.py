@@ -54,6 +54,8 @@ class JobCleaningAgent( AgentModule ):
     self.maxJobsAtOnce = 100
     self.jobByJob = False
     self.throttlingPeriod = 0.
+    self.summaryCheckPeriod = 3600
+    self.lastSummaryCheck = 0
 
     self.removeStatusDelay = {'Done':7,
                               'Killed':1,
@@ -78,6 +80,7 @@ class JobCleaningAgent( AgentModule ):
     self.maxJobsAtOnce = self.am_getOption( 'MaxJobsAtOnce', 500 )
     self.jobByJob = self.am_getOption( 'JobByJob', False )
     self.throttlingPeriod = self.am_getOption('ThrottlingPeriod', 0.)
+    self.summaryCheckPeriod = self.am_getOption( 'JobsSummaryCheckPeriod', 3600 )
     
     self.removeStatusDelay['Done'] = self.am_getOption( 'RemoveStatusDelay/Done', 7 )
     self.removeStatusDelay['Killed'] = self.am_getOption( 'RemoveStatusDelay/Killed', 7 )
@@ -102,6 +105,22 @@ class JobCleaningAgent( AgentModule ):
   def execute( self ):
     """ Remove jobs in various status
     """
+    #Check now and then the job counters of the JobsSummary table, repairing the ones that differ
+    if self.summaryCheckPeriod and time.time() - self.lastSummaryCheck >= self.summaryCheckPeriod:
+      self.lastSummaryCheck = time.time()
+      result = self.jobDB.checkJobsSummary()
+      if not result[ 'OK' ]:
+        gLogger.warn( 'Failed to check the JobsSummary table', result[ 'Message' ] )
+      elif result[ 'Value' ]:
+        gLogger.info( 'JobsSummary table repaired', '%s counters differed' % result[ 'Value' ] )
+    #Compact the heart beat series of the jobs
+    if self.jobDB.heartBeatStorage == 'Series':
+      result = self.jobDB.compactHeartBeatData()
+      if not result[ 'OK' ]:
+        gLogger.warn( 'Failed to compact the heart beat data', result[ 'Message' ] )
+      else:
+        gLogger.info( 'Heart beat data compacted', '%(Compacted)s blocks compacted, %(Downsampled)s downsampled' % \
+                      result[ 'Value' ] )
     #Delete jobs in "Deleted" state
     result = self.removeJobsByStatus( { 'Status' : 'Deleted' } )
     if not result[ 'OK' ]:
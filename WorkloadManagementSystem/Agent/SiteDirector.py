@@ -12,6 +12,8 @@ import tempfile
 import random
 import socket
 import hashlib
+import time
+import threading
 
 import DIRAC
 from DIRAC                                                 import S_OK, S_ERROR, gConfig
@@ -21,6 +23,7 @@ from DIRAC.Resources.Computing.ComputingElementFactory     import ComputingEleme
 from DIRAC.WorkloadManagementSystem.Client.ServerUtils     import pilotAgentsDB, jobDB
 from DIRAC.WorkloadManagementSystem.Service.WMSUtilities   import getGridEnv
 from DIRAC.WorkloadManagementSystem.private.ConfigHelper   import findGenericPilotCredentials
+from DIRAC.WorkloadManagementSystem.private.CECallPool     import CECallPool
 from DIRAC.FrameworkSystem.Client.ProxyManagerClient       import gProxyManager
 from DIRAC.AccountingSystem.Client.Types.Pilot             import Pilot as PilotAccounting
 from DIRAC.AccountingSystem.Client.DataStoreClient         import gDataStoreClient
@@ -43,6 +46,8 @@ WAITING_PILOT_STATUS = ['Submitted', 'Waiting', 'Scheduled', 'Ready']
 FINAL_PILOT_STATUS = ['Aborted', 'Failed', 'Done']
 MAX_PILOTS_TO_SUBMIT = 100
 MAX_JOBS_IN_FILLMODE = 5
+MAX_CE_THREADS = 10
+CE_TIMEOUT = 120
 
 def getSubmitPools( group = None, vo = None ):
   if group:
@@ -70,7 +75,12 @@ class SiteDirector( AgentModule ):
     self.queueDict = {}
     self.queueCECache = {}
     self.queueSlots = {}
+    self.queueLatency = {}
     self.failedQueues = defaultdict( int )
+    self.ceCallPool = None
+    # Pilots submitted by the submissions abandoned after their timeout, not counted yet
+    self.latePilots = 0
+    self.latePilotsLock = threading.Lock()
     self.firstPass = True
     self.maxJobsInFillMode = MAX_JOBS_IN_FILLMODE
     self.maxPilotsToSubmit = MAX_PILOTS_TO_SUBMIT
@@ -145,6 +155,11 @@ class SiteDirector( AgentModule ):
     self.pilotWaitingTime = self.am_getOption( 'MaxPilotWaitingTime', 3600 )
     self.failedQueueCycleFactor = self.am_getOption( 'FailedQueueCycleFactor', 10 )
     self.pilotStatusUpdateCycleFactor = self.am_getOption( 'PilotStatusUpdateCycleFactor', 10 )
+    self.ceTimeout = self.am_getOption( 'CETimeout', CE_TIMEOUT )
+    self.batchMatching = self.am_getOption( 'BatchMatching', True )
+    self.slowQueuesToReport = self.am_getOption( 'SlowQueuesToReport', 5 )
+    if not self.ceCallPool:
+      self.ceCallPool = CECallPool( self.am_getOption( 'MaxCEThreads', MAX_CE_THREADS ) )
 
     # Flags
     self.updateStatus = self.am_getOption( 'UpdatePilotStatus', True )
@@ -426,8 +441,11 @@ class SiteDirector( AgentModule ):
 
     queues = self.queueDict.keys()
     random.shuffle( queues )
-    totalSubmittedPilots = 0
-    matchedQueues = 0
+    latency = {}
+    self.queueLatency = {}
+
+    # Prepare the description of each queue to look for eligible jobs
+    queueCEDicts = []
     for queue in queues:
 
       # Check if the queue failed previously
@@ -436,10 +454,12 @@ class SiteDirector( AgentModule ):
         self.log.warn( "%s queue failed recently, skipping %d cycles" % ( queue, 10-failedCount ) )
         self.failedQueues[queue] += 1
         continue
+      if self.ceCallPool.isBusy( queue ):
+        self.log.warn( "%s queue is still busy with a submission of a previous cycle, skipping" % queue )
+        continue
 
       ce = self.queueDict[queue]['CE']
       ceName = self.queueDict[queue]['CEName']
-      ceType = self.queueDict[queue]['CEType']
       queueName = self.queueDict[queue]['QueueName']
       siteName = self.queueDict[queue]['Site']
       platform = self.queueDict[queue]['Platform']
@@ -452,15 +472,10 @@ class SiteDirector( AgentModule ):
         self.log.verbose( "Skipping queue %s at site %s not in the mask" % (queueName, siteName) )
         continue
 
-      if 'CPUTime' in self.queueDict[queue]['ParametersDict'] :
-        queueCPUTime = int( self.queueDict[queue]['ParametersDict']['CPUTime'] )
-      else:
+      if 'CPUTime' not in self.queueDict[queue]['ParametersDict'] :
         self.log.warn( 'CPU time limit is not specified for queue %s, skipping...' % queue )
         continue
-      if queueCPUTime > self.maxQueueLength:
-        queueCPUTime = self.maxQueueLength
 
-      # Prepare the queue description to look for eligible jobs
       ceDict = ce.getParameterDict()
       ceDict[ 'GridCE' ] = ceName
       #if not siteMask and 'Site' in ceDict:
@@ -481,26 +496,28 @@ class SiteDirector( AgentModule ):
       if not result['OK']:
         continue
       ceDict['Platform'] = result['Value']
+      queueCEDicts.append( ( queue, ceDict ) )
 
-      # Get the number of eligible jobs for the target site/queue
-      result = rpcMatcher.getMatchingTaskQueues( ceDict )
-      if not result['OK']:
-        self.log.error( 'Could not retrieve TaskQueues from TaskQueueDB', result['Message'] )
-        return result
-      taskQueueDict = result['Value']
+    # Get the eligible jobs for all the queues at once
+    start = time.time()
+    result = self.__getMatchingTaskQueues( rpcMatcher, queueCEDicts )
+    latency['Matching'] = time.time() - start
+    if not result['OK']:
+      return result
+    queueTaskQueues = result['Value']
+
+    # Get the number of already waiting pilots for the task queues of each queue
+    queueWaitingPilots = {}
+    candidateQueues = []
+    for queue, _ceDict in queueCEDicts:
+      taskQueueDict = queueTaskQueues.get( queue )
       if not taskQueueDict:
         self.log.verbose( 'No matching TQs found for %s' % queue )
         continue
-
-      matchedQueues += 1
-      totalTQJobs = 0
+      totalTQJobs = sum( [ taskQueueDict[tq]['Jobs'] for tq in taskQueueDict ] )
       tqIDList = taskQueueDict.keys()
-      for tq in taskQueueDict:
-        totalTQJobs += taskQueueDict[tq]['Jobs']
-
       self.log.verbose( '%d job(s) from %d task queue(s) are eligible for %s queue' % (totalTQJobs, len( tqIDList ), queue) )
 
-      # Get the number of already waiting pilots for these task queues
       totalWaitingPilots = 0
       if self.pilotWaitingFlag:
         lastUpdateTime = dateTime() - self.pilotWaitingTime * second
@@ -516,105 +533,249 @@ class SiteDirector( AgentModule ):
       if totalWaitingPilots >= totalTQJobs:
         self.log.verbose( "%d waiting pilots already for all the available jobs" % totalWaitingPilots )
         continue
-
       self.log.verbose( "%d waiting pilots for the total of %d eligible jobs for %s" % (totalWaitingPilots, totalTQJobs, queue) )
+      queueWaitingPilots[queue] = totalWaitingPilots
+      candidateQueues.append( queue )
+    matchedQueues = len( [ queue for queue in queueTaskQueues if queueTaskQueues[queue] ] )
 
-      # Get the working proxy
-      cpuTime = queueCPUTime + 86400
-      self.log.verbose( "Getting pilot proxy for %s/%s %d long" % ( self.pilotDN, self.pilotGroup, cpuTime ) )
-      result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, cpuTime )
-      if not result['OK']:
-        return result
-      self.proxy = result['Value']
-      ce.setProxy( self.proxy, cpuTime - 60 )
+    if not candidateQueues:
+      self.log.info( "No pilots to submit in this cycle, %d matched queues" % matchedQueues )
+      return S_OK()
 
-      # Get the number of available slots on the target site/queue
-      totalSlots = self.getQueueSlots( queue )
+    # Get the working proxy, long enough for all the queues
+    queueCPUTimes = dict( [ ( queue, min( int( self.queueDict[queue]['ParametersDict']['CPUTime'] ),
+                                          self.maxQueueLength ) ) for queue in candidateQueues ] )
+    cpuTime = max( queueCPUTimes.values() ) + 86400
+    self.log.verbose( "Getting pilot proxy for %s/%s %d long" % ( self.pilotDN, self.pilotGroup, cpuTime ) )
+    result = gProxyManager.getPilotProxyFromDIRACGroup( self.pilotDN, self.pilotGroup, cpuTime )
+    if not result['OK']:
+      return result
+    self.proxy = result['Value']
+    for queue in candidateQueues:
+      self.queueDict[queue]['CE'].setProxy( self.proxy, queueCPUTimes[queue] + 86400 - 60 )
+
+    # Get the number of available slots of the queues in parallel
+    start = time.time()
+    results = self.ceCallPool.execute( dict( [ ( queue, ( self.getQueueSlots, ( queue, ), self.__getCETimeout( queue ) ) )
+                                               for queue in candidateQueues ] ) )
+    latency['Slots'] = time.time() - start
+    queueSlots = {}
+    for queue in candidateQueues:
+      totalSlots, seconds = results[queue]
+      self.queueLatency[queue] = { 'Slots' : seconds }
+      if isinstance( totalSlots, dict ):
+        self.log.warn( 'Failed to get the slots of queue %s' % queue, totalSlots['Message'] )
+        self.failedQueues[queue] += 1
+        continue
       if totalSlots == 0:
         self.log.debug( '%s: No slots available' % queue )
         continue
+      queueSlots[queue] = totalSlots
+
+    # Distribute the waiting jobs among the queues
+    pilotPlan = self._planPilots( [ queue for queue in candidateQueues if queue in queueSlots ],
+                                  queueTaskQueues, queueWaitingPilots, queueSlots )
+
+    # Submit the pilots to the queues in parallel
+    start = time.time()
+    results = self.ceCallPool.execute( dict( [ ( queue, ( self._submitPilotsToQueue,
+                                                          ( queue, pilotPlan[queue], queueTaskQueues[queue] ),
+                                                          self.__getCETimeout( queue ) ) )
+                                               for queue in pilotPlan if pilotPlan[queue] > 0 ] ) )
+    latency['Submission'] = time.time() - start
+    totalSubmittedPilots = 0
+    for queue, ( result, seconds ) in results.items():
+      self.queueLatency[queue]['Submission'] = seconds
+      if not result['OK']:
+        self.log.error( 'Failed submission to queue %s:\n' % queue, result['Message'] )
+        self.failedQueues[queue] += 1
+        # The chunks submitted before the timeout are in the PilotAgentsDB
+        totalSubmittedPilots += result.get( 'Progress' ) or 0
+        continue
+      totalSubmittedPilots += result['Value']
+    self.latePilotsLock.acquire()
+    try:
+      if self.latePilots:
+        self.log.info( "%d pilots submitted by submissions abandoned after their timeout" % self.latePilots )
+      totalSubmittedPilots += self.latePilots
+      self.latePilots = 0
+    finally:
+      self.latePilotsLock.release()
+
+    self.__reportLatency( latency )
+    self.log.info( "%d pilots submitted in total in this cycle, %d matched queues" % ( totalSubmittedPilots, matchedQueues ) )
+    return S_OK()
 
+  def __getCETimeout( self, queue ):
+    """ Timeout of the calls to the CE of the queue
+    """
+    return float( self.queueDict[queue]['ParametersDict'].get( 'CETimeout', self.ceTimeout ) )
+
+  def __getMatchingTaskQueues( self, rpcMatcher, queueCEDicts ):
+    """ Get the task queues matching each queue, in a single batch of calls to the Matcher
+    """
+    queueTaskQueues = {}
+    if not queueCEDicts:
+      return S_OK( queueTaskQueues )
+    results = None
+    if self.batchMatching:
+      with rpcMatcher.batch() as batch:
+        for _queue, ceDict in queueCEDicts:
+          batch.getMatchingTaskQueues( ceDict )
+      if batch.result['OK']:
+        results = batch.results
+      else:
+        self.log.warn( 'Batch of task queue matchings failed, matching the queues one by one', batch.result['Message'] )
+    if results is None:
+      results = [ rpcMatcher.getMatchingTaskQueues( ceDict ) for _queue, ceDict in queueCEDicts ]
+    for ( queue, _ceDict ), result in zip( queueCEDicts, results ):
+      if not result['OK']:
+        self.log.error( 'Could not retrieve TaskQueues from TaskQueueDB', result['Message'] )
+        return result
+      queueTaskQueues[queue] = result['Value']
+    return S_OK( queueTaskQueues )
+
+  def _planPilots( self, queues, queueTaskQueues, queueWaitingPilots, queueSlots ):
+    """ Get the number of pilots to submit to each queue. The queues are served in
+        the given order, each one taking from the jobs of its task queues, the most
+        prioritary first, the ones left by the pilots of the queues before it
+    """
+    remainingJobs = {}
+    for queue in queues:
+      for tq, tqDict in queueTaskQueues[queue].items():
+        remainingJobs.setdefault( tq, tqDict['Jobs'] )
+    pilotPlan = {}
+    for queue in queues:
+      taskQueueDict = queueTaskQueues[queue]
+      totalTQJobs = sum( [ remainingJobs[tq] for tq in taskQueueDict ] )
+      totalWaitingPilots = queueWaitingPilots.get( queue, 0 )
+      totalSlots = queueSlots[queue]
       pilotsToSubmit = max( 0, min( totalSlots, totalTQJobs - totalWaitingPilots ) )
       self.log.info( '%s: Slots=%d, TQ jobs=%d, Pilots: waiting %d, to submit=%d' % \
                               ( queue, totalSlots, totalTQJobs, totalWaitingPilots, pilotsToSubmit ) )
-
       # Limit the number of pilots to submit to MAX_PILOTS_TO_SUBMIT
       pilotsToSubmit = min( self.maxPilotsToSubmit, pilotsToSubmit )
+      pilotPlan[queue] = pilotsToSubmit
+      pilotsLeft = pilotsToSubmit
+      for tq in sorted( taskQueueDict, key = lambda tq: taskQueueDict[tq]['Priority'], reverse = True ):
+        taken = min( pilotsLeft, remainingJobs[tq] )
+        remainingJobs[tq] -= taken
+        pilotsLeft -= taken
+    return pilotPlan
+
+  def _submitPilotsToQueue( self, queue, pilotsToSubmit, taskQueueDict ):
+    """ Submit the pilots to the queue and register them, run in the threads of the pool.
+        The timeout of the pool applies to each chunk of pilots: the progress is
+        reported after each one, and the submission stops if it was abandoned
+
+        :return: S_OK( number of pilots submitted )
+    """
+    ce = self.queueDict[queue]['CE']
+    ceName = self.queueDict[queue]['CEName']
+    ceType = self.queueDict[queue]['CEType']
+    queueName = self.queueDict[queue]['QueueName']
+    siteName = self.queueDict[queue]['Site']
+    submittedPilots = 0
+    reportedPilots = 0
 
-      while pilotsToSubmit > 0:
-        self.log.info( 'Going to submit %d pilots to %s queue' % ( pilotsToSubmit, queue ) )
+    while pilotsToSubmit > 0:
+      self.log.info( 'Going to submit %d pilots to %s queue' % ( pilotsToSubmit, queue ) )
 
-        bundleProxy = self.queueDict[queue].get( 'BundleProxy', False )
-        jobExecDir = ''
-        jobExecDir = self.queueDict[queue]['ParametersDict'].get( 'JobExecDir', jobExecDir )
-        httpProxy = self.queueDict[queue]['ParametersDict'].get( 'HttpProxy', '' )
+      bundleProxy = self.queueDict[queue].get( 'BundleProxy', False )
+      jobExecDir = ''
+      jobExecDir = self.queueDict[queue]['ParametersDict'].get( 'JobExecDir', jobExecDir )
+      httpProxy = self.queueDict[queue]['ParametersDict'].get( 'HttpProxy', '' )
 
-        result = self.getExecutable( queue, pilotsToSubmit, bundleProxy, httpProxy, jobExecDir )
-        if not result['OK']:
-          return result
+      result = self.getExecutable( queue, pilotsToSubmit, bundleProxy, httpProxy, jobExecDir )
+      if not result['OK']:
+        return result
+
+      executable, pilotSubmissionChunk = result['Value']
+      result = ce.submitJob( executable, '', pilotSubmissionChunk )
+      ### FIXME: The condor thing only transfers the file with some
+      ### delay, so when we unlink here the script is gone
+      ### FIXME 2: but at some time we need to clean up the pilot wrapper scripts...
+      if ceType != 'HTCondorCE':
+        os.unlink( executable )
+      if not result['OK']:
+        return result
 
-        executable, pilotSubmissionChunk = result['Value']
-        result = ce.submitJob( executable, '', pilotSubmissionChunk )
-        ### FIXME: The condor thing only transfers the file with some
-        ### delay, so when we unlink here the script is gone
-        ### FIXME 2: but at some time we need to clean up the pilot wrapper scripts...
-        if ceType != 'HTCondorCE':
-          os.unlink( executable )
+      pilotsToSubmit = pilotsToSubmit - pilotSubmissionChunk
+      # Add pilots to the PilotAgentsDB assign pilots to TaskQueue proportionally to the
+      # task queue priorities
+      pilotList = result['Value']
+      self.queueSlots[queue]['AvailableSlots'] -= len( pilotList )
+      submittedPilots += len( pilotList )
+      self.log.info( 'Submitted %d pilots to %s@%s' % ( len( pilotList ), queueName, ceName ) )
+      stampDict = {}
+      if result.has_key( 'PilotStampDict' ):
+        stampDict = result['PilotStampDict']
+      tqPriorityList = []
+      sumPriority = 0.
+      for tq in taskQueueDict:
+        sumPriority += taskQueueDict[tq]['Priority']
+        tqPriorityList.append( ( tq, sumPriority ) )
+      tqDict = {}
+      for pilotID in pilotList:
+        rndm = random.random() * sumPriority
+        for tq, prio in tqPriorityList:
+          if rndm < prio:
+            tqID = tq
+            break
+        if not tqDict.has_key( tqID ):
+          tqDict[tqID] = []
+        tqDict[tqID].append( pilotID )
+
+      for tqID, pilotList in tqDict.items():
+        result = pilotAgentsDB.addPilotTQReference( pilotList,
+                                                    tqID,
+                                                    self.pilotDN,
+                                                    self.pilotGroup,
+                                                    self.localhost,
+                                                    ceType,
+                                                    '',
+                                                    stampDict )
         if not result['OK']:
-          self.log.error( 'Failed submission to queue %s:\n' % queue, result['Message'] )
-          pilotsToSubmit = 0
-          self.failedQueues[queue] += 1
+          self.log.error( 'Failed add pilots to the PilotAgentsDB: ', result['Message'] )
           continue
-
-        pilotsToSubmit = pilotsToSubmit - pilotSubmissionChunk
-        # Add pilots to the PilotAgentsDB assign pilots to TaskQueue proportionally to the
-        # task queue priorities
-        pilotList = result['Value']
-        self.queueSlots[queue]['AvailableSlots'] -= len( pilotList )
-        totalSubmittedPilots += len( pilotList )
-        self.log.info( 'Submitted %d pilots to %s@%s' % ( len( pilotList ), queueName, ceName ) )
-        stampDict = {}
-        if result.has_key( 'PilotStampDict' ):
-          stampDict = result['PilotStampDict']
-        tqPriorityList = []
-        sumPriority = 0.
-        for tq in taskQueueDict:
-          sumPriority += taskQueueDict[tq]['Priority']
-          tqPriorityList.append( ( tq, sumPriority ) )
-        rndm = random.random()*sumPriority
-        tqDict = {}
-        for pilotID in pilotList:
-          rndm = random.random() * sumPriority
-          for tq, prio in tqPriorityList:
-            if rndm < prio:
-              tqID = tq
-              break
-          if not tqDict.has_key( tqID ):
-            tqDict[tqID] = []
-          tqDict[tqID].append( pilotID )
-
-        for tqID, pilotList in tqDict.items():
-          result = pilotAgentsDB.addPilotTQReference( pilotList,
-                                                      tqID,
-                                                      self.pilotDN,
-                                                      self.pilotGroup,
-                                                      self.localhost,
-                                                      ceType,
-                                                      '',
-                                                      stampDict )
+        for pilot in pilotList:
+          result = pilotAgentsDB.setPilotStatus(pilot, 'Submitted', ceName,
+                                                'Successfully submitted by the SiteDirector',
+                                                siteName, queueName )
           if not result['OK']:
-            self.log.error( 'Failed add pilots to the PilotAgentsDB: ', result['Message'] )
+            self.log.error( 'Failed to set pilot status: ', result['Message'] )
             continue
-          for pilot in pilotList:
-            result = pilotAgentsDB.setPilotStatus(pilot, 'Submitted', ceName,
-                                                  'Successfully submitted by the SiteDirector',
-                                                  siteName, queueName )
-            if not result['OK']:
-              self.log.error( 'Failed to set pilot status: ', result['Message'] )
-              continue
 
-    self.log.info( "%d pilots submitted in total in this cycle, %d matched queues" % ( totalSubmittedPilots, matchedQueues ) )
-    return S_OK()
+      if self.ceCallPool and not self.ceCallPool.progress( queue, submittedPilots ):
+        # The pilots of the last chunk are counted by the next cycle
+        self.latePilotsLock.acquire()
+        try:
+          self.latePilots += submittedPilots - reportedPilots
+        finally:
+          self.latePilotsLock.release()
+        self.log.warn( 'Submission to %s abandoned after its timeout, %d pilots left to submit' % ( queue,
+                                                                                                    pilotsToSubmit ) )
+        break
+      reportedPilots = submittedPilots
+
+    return S_OK( submittedPilots )
+
+  def __reportLatency( self, latency ):
+    """ Log where the time of the submission cycle went
+    """
+    self.log.info( 'Cycle times: %s' % ', '.join( [ '%s %.2f s' % ( step, latency[step] )
+                                                  for step in ( 'Matching', 'Slots', 'Submission' )
+                                                  if step in latency ] ) )
+    queueTimes = []
+    for queue, queueLatency in self.queueLatency.items():
+      seconds = [ value for value in queueLatency.values() if value is not None ]
+      queueTimes.append( ( sum( seconds ), queue ) )
+    queueTimes.sort( reverse = True )
+    for total, queue in queueTimes[:self.slowQueuesToReport]:
+      self.log.info( 'Queue %s: %.2f s (%s)' % ( queue, total,
+                                                 ', '.join( [ '%s %s' % ( step, '%.2f s' % seconds if seconds is not None
+                                                                                else 'not started' )
+                                                              for step, seconds in sorted( self.queueLatency[queue].items() ) ] ) ) )
 
   def getQueueSlots( self, queue ):
     """ Get the number of available slots in the queue
@@ -12,14 +12,25 @@ from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
 from DIRAC.Core.Base.AgentModule import AgentModule
 from DIRAC.Core.Utilities.Time import fromString, toEpoch, dateTime, second
-from DIRAC import S_OK, S_ERROR, gConfig
+from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.DISET.RPCClient import RPCClient
 from DIRAC.AccountingSystem.Client.Types.Job import Job
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd
 from DIRAC.ConfigurationSystem.Client.Helpers import cfgPath
 from DIRAC.ConfigurationSystem.Client.PathFinder import getSystemInstance
+from DIRAC.WorkloadManagementSystem.JobWrapper.Watchdog import getCheckingTimes
 import types
 
+def getStalledTimes( wrapperSection, stalledCycles, failedCycles ):
+  """ Get the seconds without heart beat after which a job is Stalled, and Failed
+
+      The Watchdog of a stable job sends its heart beats every MaxCheckingTime, the longest
+      cycle, so a healthy job is never Stalled
+  """
+  watchdogCycle = getCheckingTimes( wrapperSection )[1]
+  # Add half cycle to avoid race conditions
+  return watchdogCycle * ( stalledCycles + 0.5 ), watchdogCycle * ( failedCycles + 0.5 )
+
 class StalledJobAgent( AgentModule ):
   """
 The specific agents must provide the following methods:
@@ -68,12 +79,7 @@ for the agent restart
     self.log.verbose( 'StalledTime = %s cycles' % ( stalledTime ) )
     self.log.verbose( 'FailedTime = %s cycles' % ( failedTime ) )
 
-    watchdogCycle = gConfig.getValue( cfgPath( wrapperSection , 'CheckingTime' ), 30 * 60 )
-    watchdogCycle = max( watchdogCycle, gConfig.getValue( cfgPath( wrapperSection , 'MinCheckingTime' ), 20 * 60 ) )
-
-    # Add half cycle to avoid race conditions
-    stalledTime = watchdogCycle * ( stalledTime + 0.5 )
-    failedTime = watchdogCycle * ( failedTime + 0.5 )
+    stalledTime, failedTime = getStalledTimes( wrapperSection, stalledTime, failedTime )
 
     result = self.__markStalledJobs( stalledTime )
     if not result['OK']:
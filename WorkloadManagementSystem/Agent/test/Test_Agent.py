@@ -2,13 +2,15 @@
 """
 
 # imports
-import unittest, importlib
-from mock import MagicMock
+import unittest, importlib, os
+from mock import MagicMock, patch
 
-from DIRAC import gLogger
+from DIRAC import gLogger, S_OK
 
 # sut
 from DIRAC.WorkloadManagementSystem.Agent.SiteDirector import SiteDirector
+from DIRAC.WorkloadManagementSystem.Agent.StalledJobAgent import getStalledTimes
+from DIRAC.WorkloadManagementSystem.JobWrapper.WatchdogLinux import WatchdogLinux
 
 class AgentsTestCase( unittest.TestCase ):
   """ Base class for the Agents test cases
@@ -36,14 +38,68 @@ class SiteDirectorBaseSuccess( AgentsTestCase ):
     self.sd.queueDict['aQueue']['ParametersDict'] = {}
     _res = self.sd._getPilotOptions( 'aQueue', 10 )
 
+  def test__planPilots( self ):
+    self.sd.maxPilotsToSubmit = 100
+    tqs = { 1 : { 'Jobs' : 10, 'Priority' : 2 }, 2 : { 'Jobs' : 5, 'Priority' : 1 } }
+    queueTaskQueues = { 'aQueue' : { 1 : tqs[1] }, 'bQueue' : tqs }
+    # The jobs taken by the pilots of aQueue are not left for bQueue
+    res = self.sd._planPilots( ['aQueue', 'bQueue'], queueTaskQueues, { 'aQueue' : 2 }, { 'aQueue' : 4, 'bQueue' : 100 } )
+    self.assertEqual( res, { 'aQueue' : 4, 'bQueue' : 11 } )
+    res = self.sd._planPilots( ['bQueue', 'aQueue'], queueTaskQueues, { 'aQueue' : 2 }, { 'aQueue' : 4, 'bQueue' : 100 } )
+    self.assertEqual( res, { 'aQueue' : 0, 'bQueue' : 15 } )
+    self.sd.maxPilotsToSubmit = 5
+    res = self.sd._planPilots( ['aQueue', 'bQueue'], queueTaskQueues, {}, { 'aQueue' : 4, 'bQueue' : 100 } )
+    self.assertEqual( res, { 'aQueue' : 4, 'bQueue' : 5 } )
+
+  def test__submitPilotsToQueueAbandoned( self ):
+    self.sd.queueDict = { 'aQueue' : { 'CE' : MagicMock(), 'CEName' : 'aCE', 'CEType' : 'HTCondorCE',
+                                       'QueueName' : 'aQueue', 'Site' : 'aSite', 'ParametersDict' : {} } }
+    self.sd.queueDict['aQueue']['CE'].submitJob.side_effect = [ S_OK( [ 'p1', 'p2' ] ), S_OK( [ 'p3', 'p4' ] ) ]
+    self.sd.queueSlots = { 'aQueue' : { 'AvailableSlots' : 10 } }
+    self.sd.getExecutable = MagicMock( return_value = S_OK( ( 'executable', 2 ) ) )
+    self.sd.pilotDN, self.sd.pilotGroup, self.sd.localhost = '/DC=pilot', 'pilot', 'localhost'
+    self.sd_m.pilotAgentsDB = MagicMock()
+    self.sd.ceCallPool = MagicMock()
+    # The submission is abandoned while the second chunk is submitted
+    self.sd.ceCallPool.progress.side_effect = [ True, False ]
+    res = self.sd._submitPilotsToQueue( 'aQueue', 6, { 1 : { 'Priority' : 1 } } )
+    self.assertEqual( res['Value'], 4 )
+    self.assertEqual( self.sd.queueDict['aQueue']['CE'].submitJob.call_count, 2 )
+    self.assertEqual( self.sd.latePilots, 2 )
 
 #############################################################################
 # Test Suite run
 #############################################################################
 
+class StalledJobAgentSuccess( unittest.TestCase ):
+
+  def test_getStalledTimes( self ):
+    wd_m = importlib.import_module( 'DIRAC.WorkloadManagementSystem.JobWrapper.Watchdog' )
+    config = { 'JobWrapper/CheckingTime' : 1800, 'JobWrapper/MaxCheckingTime' : 5 * 3600 }
+    with patch.object( wd_m, 'gConfig' ) as gConfigMock:
+      gConfigMock.getValue.side_effect = lambda option, default: config.get( option, default )
+      stalledTime, failedTime = getStalledTimes( 'JobWrapper', 2, 6 )
+      self.assertEqual( ( stalledTime, failedTime ), ( 2.5 * 5 * 3600, 6.5 * 5 * 3600 ) )
+      config.pop( 'JobWrapper/MaxCheckingTime' )
+      self.assertEqual( getStalledTimes( 'JobWrapper', 2, 6 ), ( 2.5 * 3600, 6.5 * 3600 ) )
+
+    # The heart beats of a healthy stable job, sent at each check, are closer than the Stalled threshold
+    config[ 'JobWrapper/MaxCheckingTime' ] = 5 * 3600
+    wd = WatchdogLinux( os.getpid(), MagicMock(), MagicMock(), 1000, 1024 * 1024 )
+    with patch.object( wd_m, 'gConfig' ) as gConfigMock:
+      gConfigMock.getValue.side_effect = lambda option, default: config.get( option, default )
+      wd.checkingTime, wd.maxCheckingTime = wd_m.getCheckingTimes( 'JobWrapper' )
+      stalledTime = getStalledTimes( 'JobWrapper', 2, 6 )[0]
+    wd.parameters['Vsize'] = [1000., 1000.]
+    wd.parameters['RSS'] = [500., 500.]
+    checkingTimes = [ wd._Watchdog__getCheckingTime() for _i in range( 10 ) ]
+    self.assertEqual( max( checkingTimes ), 5 * 3600 )
+    self.assertTrue( max( checkingTimes ) < stalledTime )
+
 if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase( AgentsTestCase )
   suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( SiteDirectorBaseSuccess ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( StalledJobAgentSuccess ) )
   testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
 
 # EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#
@@ -5,7 +5,9 @@
 ########################################################################
 __RCSID__ = "$Id$"
 
+from DIRAC                                         import S_OK
 from DIRAC.Core.Base.Client                         import Client
+from DIRAC.WorkloadManagementSystem.Utilities.JobColumns import unpackColumns, extendColumns
 
 class JobMonitoringClient( Client ):
 
@@ -20,3 +22,32 @@ class JobMonitoringClient( Client ):
 
   def traceJobParameter( self, site, localID, parameter, date = None, until = None ):
     return self.monitoringHandler.traceJobParameter( site, localID, parameter, date, until )
+
+  def iterJobColumns( self, condDict, attrList, paramList = None, chunkSize = 10000, compact = True ):
+    """ Get attributes and parameters of the jobs selected by condDict in chunks of
+        chunkSize jobs. For each chunk it yields S_OK( columns ), the dictionary of
+        the lists of values of each attribute or parameter, parallel to the 'JobID'
+        column, or an S_ERROR after which it stops. With compact, the numeric
+        attributes are transferred and given as array.array
+    """
+    startJobID = 0
+    while True:
+      result = self.monitoringHandler.getJobColumns( condDict, attrList, paramList, startJobID, chunkSize, compact )
+      if not result['OK']:
+        yield result
+        return
+      yield S_OK( unpackColumns( result['Value']['Columns'] ) )
+      startJobID = result['Value']['LastJobID']
+      if startJobID is None:
+        return
+
+  def getJobColumns( self, condDict, attrList, paramList = None, chunkSize = 10000, compact = True ):
+    """ Get attributes and parameters of all the jobs selected by condDict as columns,
+        fetched in chunks with iterJobColumns
+    """
+    columns = {}
+    for result in self.iterJobColumns( condDict, attrList, paramList, chunkSize, compact ):
+      if not result['OK']:
+        return result
+      extendColumns( columns, result['Value'] )
+    return S_OK( columns )
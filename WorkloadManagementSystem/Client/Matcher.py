@@ -90,6 +90,88 @@ class Matcher( object ):
         raise RuntimeError( result['Message'] )
       raise RuntimeError( "Job %s is not in Waiting state" % str( jobID ) )
 
+    resultDict = self._assignJob( resourceDict, jobID, resAtt['Value'] )
+
+    matchTime = time.time() - startTime
+    self.log.info( "Match time: [%s]" % str( matchTime ) )
+    gMonitor.addMark( "matchTime", matchTime )
+
+    pilotInfoReportedFlag = resourceDict.get( 'PilotInfoReportedFlag', False )
+    if not pilotInfoReportedFlag:
+      self._updatePilotInfo( resourceDict )
+    self._updatePilotJobMapping( resourceDict, jobID )
+    resultDict['PilotInfoReportedFlag'] = True
+
+    return resultDict
+
+  def selectJobs( self, resourceDescription, credDict, numJobs ):
+    """ Select up to numJobs jobs for a resource with several slots, the
+        credentials, mask and pilot version are checked only once.
+        If the resource gives its NumberOfProcessors, the jobs selected need
+        no more processors in total than that
+    """
+
+    startTime = time.time()
+
+    resourceDict = self._getResourceDict( resourceDescription, credDict )
+    try:
+      maxProcessors = int( resourceDescription.get( 'NumberOfProcessors', 0 ) )
+    except ( AttributeError, ValueError ):
+      maxProcessors = 0
+
+    negativeCond = self.limiter.getNegativeCondForSite( resourceDict['Site'] )
+    result = self.tqDB.matchAndGetJobs( resourceDict, numJobs, maxProcessors = maxProcessors,
+                                        negativeCond = negativeCond )
+
+    if not result['OK']:
+      raise RuntimeError( result['Message'] )
+    result = result['Value']
+    if not result['matchFound']:
+      self.log.info( "No match found" )
+      return []
+
+    jobIDs = [ job['jobId'] for job in result['jobs'] ]
+    resAtt = self.jobDB.getAttributesForJobList( jobIDs, ['OwnerDN', 'OwnerGroup', 'Status'] )
+    if not resAtt['OK']:
+      raise RuntimeError( 'Could not retrieve job attributes' )
+
+    resultList = []
+    for job in result['jobs']:
+      jobID = job['jobId']
+      jobAttrs = resAtt['Value'].get( jobID )
+      if not jobAttrs:
+        self.log.error( "No attributes returned for job", str( jobID ) )
+        continue
+      if not jobAttrs['Status'] == 'Waiting':
+        self.log.error( 'Job matched by the TQ is not in Waiting state', str( jobID ) )
+        result = self.tqDB.deleteJob( jobID )
+        if not result[ 'OK' ]:
+          self.log.error( "Could not delete job from the TQ", result['Message'] )
+        continue
+      try:
+        resultDict = self._assignJob( resourceDict, jobID, jobAttrs )
+      except RuntimeError as rte:
+        self.log.error( "Could not assign matched job", "%s: %s" % ( jobID, rte ) )
+        continue
+      resultDict['Processors'] = job['processors']
+      resultList.append( resultDict )
+
+    matchTime = time.time() - startTime
+    self.log.info( "Match time for %s jobs: [%s]" % ( len( resultList ), matchTime ) )
+    gMonitor.addMark( "matchTime", matchTime )
+
+    if resultList:
+      if not resourceDict.get( 'PilotInfoReportedFlag', False ):
+        self._updatePilotInfo( resourceDict )
+      for resultDict in resultList:
+        self._updatePilotJobMapping( resourceDict, resultDict['JobID'] )
+        resultDict['PilotInfoReportedFlag'] = True
+
+    return resultList
+
+  def _assignJob( self, resourceDict, jobID, jobAttrs ):
+    """ Mark a matched job as assigned to the resource and get what the pilot needs to run it
+    """
     self._reportStatus( resourceDict, jobID )
 
     result = self.jobDB.getJobJDL( jobID )
@@ -100,32 +182,17 @@ class Matcher( object ):
     resultDict['JDL'] = result['Value']
     resultDict['JobID'] = jobID
 
-    matchTime = time.time() - startTime
-    self.log.info( "Match time: [%s]" % str( matchTime ) )
-    gMonitor.addMark( "matchTime", matchTime )
-
     # Get some extra stuff into the response returned
     resOpt = self.jobDB.getJobOptParameters( jobID )
     if resOpt['OK']:
       for key, value in resOpt['Value'].items():
         resultDict[key] = value
-    resAtt = self.jobDB.getJobAttributes( jobID, ['OwnerDN', 'OwnerGroup'] )
-    if not resAtt['OK']:
-      raise RuntimeError( 'Could not retrieve job attributes' )
-    if not resAtt['Value']:
-      raise RuntimeError( 'No attributes returned for job' )
 
     if self.opsHelper.getValue( "JobScheduling/CheckMatchingDelay", True ):
       self.limiter.updateDelayCounters( resourceDict['Site'], jobID )
 
-    pilotInfoReportedFlag = resourceDict.get( 'PilotInfoReportedFlag', False )
-    if not pilotInfoReportedFlag:
-      self._updatePilotInfo( resourceDict )
-    self._updatePilotJobMapping( resourceDict, jobID )
-
-    resultDict['DN'] = resAtt['Value']['OwnerDN']
-    resultDict['Group'] = resAtt['Value']['OwnerGroup']
-    resultDict['PilotInfoReportedFlag'] = True
+    resultDict['DN'] = jobAttrs['OwnerDN']
+    resultDict['Group'] = jobAttrs['OwnerGroup']
 
     return resultDict
 
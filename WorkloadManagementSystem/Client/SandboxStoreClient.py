@@ -18,11 +18,14 @@ from DIRAC.Core.DISET.RPCClient import RPCClient
 from DIRAC.Resources.Storage.StorageElement import StorageElement
 from DIRAC.Core.Utilities.ReturnValues import returnSingleResult
 from DIRAC.Core.Utilities.File import getGlobbedTotalSize
+from DIRAC.Core.Utilities import Compression
 from DIRAC.ConfigurationSystem.Client.Helpers.Registry import getVOForGroup
 
 class SandboxStoreClient( object ):
 
   __validSandboxTypes = ( 'Input', 'Output' )
+  #Sandboxes are unpacked with tarfile by any client version, so only its codecs are used
+  __sandboxCodecs = ( 'gz', 'bz2', 'none' )
   __smdb = None
 
   def __init__( self, rpcClient = None, transferClient = None, **kwargs ):
@@ -118,7 +121,10 @@ class SandboxStoreClient( object ):
     except Exception as e:
       return S_ERROR( "Cannot create temporal file: %s" % str( e ) )
 
-    tf = tarfile.open( name = tmpFilePath, mode = "w|bz2" )
+    codec, level = Compression.chooseCodec( files2Upload, self.__sandboxCodecs )
+    tmpFile = open( tmpFilePath, "wb" )
+    writer = Compression.getCompressedWriter( tmpFile, codec, level )
+    tf = tarfile.open( name = tmpFilePath, mode = "w|", fileobj = writer )
     for sFile in files2Upload:
       if isinstance( sFile, basestring ):
         tf.add( os.path.realpath( sFile ), os.path.basename( sFile ), recursive = True )
@@ -127,6 +133,8 @@ class SandboxStoreClient( object ):
         tarInfo.size = len( sFile.buf )
         tf.addfile( tarinfo = tarInfo, fileobj = sFile )
     tf.close()
+    writer.close()
+    tmpFile.close()
 
     if sizeLimit > 0:
       # Evaluate the compressed size of the sandbox
@@ -143,7 +151,7 @@ class SandboxStoreClient( object ):
         bData = fd.read( 10240 )
 
     transferClient = self.__getTransferClient()
-    result = transferClient.sendFile( tmpFilePath, ( "%s.tar.bz2" % oMD5.hexdigest(), assignTo ) )
+    result = transferClient.sendFile( tmpFilePath, ( "%s%s" % ( oMD5.hexdigest(), Compression.getCodecExtension( codec ) ), assignTo ) )
     result[ 'SandboxFileName' ] = tmpFilePath
     try:
       if result['OK']:
@@ -12,6 +12,8 @@ from DIRAC import S_OK
 from DIRAC.WorkloadManagementSystem.Client.DownloadInputData import DownloadInputData
 from DIRAC.WorkloadManagementSystem.Client.Matcher import Matcher
 from DIRAC.WorkloadManagementSystem.Client.SandboxStoreClient import SandboxStoreClient
+from DIRAC.WorkloadManagementSystem.Client.JobMonitoringClient import JobMonitoringClient
+from DIRAC.WorkloadManagementSystem.Utilities.JobColumns import packColumns
 
 class ClientsTestCase( unittest.TestCase ):
   """ Base class for the clients test cases
@@ -147,6 +149,40 @@ class MatcherTestCase( ClientsTestCase ):
 
     self.assertEqual( res, resExpected )
 
+  def test_selectJobs( self ):
+
+    self.matcher._getResourceDict = MagicMock( return_value = {'Site': 'DIRAC.Jenkins.ch', 'Setup': 'LHCb-Certification'} )
+    self.matcher.limiter = MagicMock()
+    self.matcher.limiter.getNegativeCondForSite.return_value = {}
+    self.matcher._reportStatus = MagicMock()
+    self.matcher._updatePilotInfo = MagicMock()
+    self.matcher._updatePilotJobMapping = MagicMock()
+
+    self.tqDBMock.matchAndGetJobs.return_value = S_OK( {'matchFound': False} )
+    self.assertEqual( self.matcher.selectJobs( {'NumberOfProcessors': 4}, {}, 4 ), [] )
+
+    self.tqDBMock.matchAndGetJobs.return_value = S_OK( {'matchFound': True,
+                                                        'jobs': [{'jobId': 1, 'taskQueueId': 1, 'processors': 1},
+                                                                 {'jobId': 2, 'taskQueueId': 1, 'processors': 1},
+                                                                 {'jobId': 3, 'taskQueueId': 2, 'processors': 2}]} )
+    self.jobDBMock.getAttributesForJobList.return_value = S_OK( {1: {'OwnerDN': 'aDN', 'OwnerGroup': 'aGroup',
+                                                                     'Status': 'Waiting'},
+                                                                 2: {'OwnerDN': 'aDN', 'OwnerGroup': 'aGroup',
+                                                                     'Status': 'Killed'},
+                                                                 3: {'OwnerDN': 'aDN', 'OwnerGroup': 'aGroup',
+                                                                     'Status': 'Waiting'}} )
+    self.jobDBMock.getJobJDL.return_value = S_OK( '[]' )
+    self.jobDBMock.getJobOptParameters.return_value = S_OK( {} )
+    self.tqDBMock.deleteJob.return_value = S_OK()
+
+    res = self.matcher.selectJobs( {'NumberOfProcessors': 4}, {}, 4 )
+    self.tqDBMock.matchAndGetJobs.assert_called_with( {'Site': 'DIRAC.Jenkins.ch', 'Setup': 'LHCb-Certification'}, 4,
+                                                      maxProcessors = 4, negativeCond = {} )
+    self.assertEqual( [ ( r['JobID'], r['Processors'] ) for r in res ], [ ( 1, 1 ), ( 3, 2 ) ] )
+    self.tqDBMock.deleteJob.assert_called_once_with( 2 )
+    self.assertEqual( self.matcher._updatePilotInfo.call_count, 1 )
+    self.assertEqual( self.matcher._updatePilotJobMapping.call_count, 2 )
+
 #############################################################################
 
 class SandboxStoreTestCaseSuccess( ClientsTestCase ):
@@ -165,10 +201,32 @@ class SandboxStoreTestCaseSuccess( ClientsTestCase ):
 # Test Suite run
 #############################################################################
 
+class JobMonitoringClientTestCase( ClientsTestCase ):
+
+  def test_getJobColumns( self ):
+
+    chunks = [ { 'Columns' : packColumns( { 'JobID' : [ 1, 2 ], 'Status' : [ 'Done', 'Failed' ], 'CPUTime' : [ 1.5, 2. ] } ),
+                 'LastJobID' : 2 },
+               { 'Columns' : packColumns( { 'JobID' : [ 5 ], 'Status' : [ 'Running' ], 'CPUTime' : [ 0. ] } ),
+                 'LastJobID' : None } ]
+    jobMonitoring = JobMonitoringClient()
+    jobMonitoring.monitoringHandler = MagicMock()
+    jobMonitoring.monitoringHandler.getJobColumns.side_effect = [ S_OK( chunk ) for chunk in chunks ]
+
+    res = jobMonitoring.getJobColumns( { 'Owner' : 'user' }, [ 'Status', 'CPUTime' ], chunkSize = 2 )
+    self.assert_( res['OK'] )
+    self.assertEqual( list( res['Value']['JobID'] ), [ 1, 2, 5 ] )
+    self.assertEqual( res['Value']['JobID'].typecode, 'I' )
+    self.assertEqual( list( res['Value']['CPUTime'] ), [ 1.5, 2., 0. ] )
+    self.assertEqual( res['Value']['Status'], [ 'Done', 'Failed', 'Running' ] )
+    self.assertEqual( jobMonitoring.monitoringHandler.getJobColumns.call_args[0][3], 2 )
+
+
 if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase( ClientsTestCase )
   suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( MatcherTestCase ) )
   suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( DownloadInputDataSuccess ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( JobMonitoringClientTestCase ) )
   suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( SandboxStoreTestCaseSuccess ) )
   testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
 
@@ -9,6 +9,8 @@
     getAllJobAttributes()
     getDistinctJobAttributes()
     getAttributesForJobList()
+    getJobAttributesColumns()
+    getJobParametersColumns()
     getJobParameter()
     getJobParameters()
     getAllJobParameters()
@@ -27,6 +29,7 @@
     setInputData()
 
     insertNewJobIntoDB()
+    insertNewJobsIntoDB()
     removeJobFromDB()
 
     rescheduleJob()
@@ -38,11 +41,16 @@
     banSiteInMask()
 
     getCounters()
+    getJobCounters()
+    checkJobsSummary()
 """
 
 __RCSID__ = "$Id$"
 
 import sys
+import uuid
+import calendar
+import datetime
 import operator
 
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight               import ClassAd
@@ -53,6 +61,15 @@ from DIRAC.ConfigurationSystem.Client.Helpers.Registry       import getVOForGrou
 from DIRAC.Core.Base.DB                                      import DB
 from DIRAC.ConfigurationSystem.Client.Helpers.Resources      import getDIRACPlatform
 from DIRAC.WorkloadManagementSystem.Client.JobState.JobManifest   import JobManifest
+from DIRAC.WorkloadManagementSystem.Utilities.JobColumns     import NUMERIC_ATTRIBUTES
+from DIRAC.WorkloadManagementSystem.Utilities.HeartBeatSeries import packRawPoints, unpackRawPoints, \
+                                                                    encodeBlock, decodeBlock, downsample, RAW_POINT
+
+#Statements of the bulk insertions are split to stay under this size
+MAX_BULK_STATEMENT_SIZE = 1024 * 1024
+#Attributes of the jobs counted in the JobsSummary table
+JOBS_SUMMARY_FIELDS = [ 'DIRACSetup', 'Status', 'MinorStatus', 'Site', 'Owner', 'OwnerGroup',
+                        'JobGroup', 'JobType', 'JobSplitType' ]
 
 #############################################################################
 
@@ -65,6 +82,14 @@ class JobDB( DB ):
     DB.__init__( self, 'JobDB', 'WorkloadManagement/JobDB' )
 
     self.maxRescheduling = self.getCSOption( 'MaxRescheduling', 3 )
+    self.bulkInsertionSize = self.getCSOption( 'BulkInsertionSize', 1000 )
+    self.useJobsSummary = self.getCSOption( 'UseJobsSummary', True )
+    self.__jobsSummaryAvailable = None
+    # Rows: one row per heart beat value, Series: time series blocks in HeartBeatSeries
+    self.heartBeatStorage = self.getCSOption( 'HeartBeatStorage', 'Rows' )
+    self.heartBeatBlockSize = self.getCSOption( 'HeartBeatBlockSize', 60 )
+    self.heartBeatDownsampleAge = self.getCSOption( 'HeartBeatDownsampleAge', 86400 )
+    self.heartBeatDownsampleInterval = self.getCSOption( 'HeartBeatDownsampleInterval', 600 )
 
     self.jobAttributeNames = []
 
@@ -81,6 +106,12 @@ class JobDB( DB ):
     self.JOB_FINAL_STATES = ['Done', 'Completed', 'Failed']
     self.jdl2DBParameters = ['JobName', 'JobType', 'JobGroup']
 
+    result = self._query( "SHOW TABLES LIKE 'HeartBeatSeries'" )
+    self.__heartBeatSeriesAvailable = result['OK'] and bool( result['Value'] )
+    if self.heartBeatStorage == 'Series' and not self.__heartBeatSeriesAvailable:
+      self.log.error( "No HeartBeatSeries table, the heart beat data are stored as rows" )
+      self.heartBeatStorage = 'Rows'
+
     self.log.info( "MaxReschedule:  %s" % self.maxRescheduling )
     self.log.info( "==================================================" )
 
@@ -141,6 +172,65 @@ class JobDB( DB ):
     except Exception as x:
       return S_ERROR( 'JobDB.getAttributesForJobList: Failed\n%s' % str( x ) )
 
+#############################################################################
+  def getJobAttributesColumns( self, condDict, attrList, startJobID = 0, maxJobs = 10000 ):
+    """ Get attributes of the jobs selected by condDict, as a dictionary of
+        columns: the list of the values of each attribute, parallel to the
+        list of JobIDs in the 'JobID' column. The jobs are taken by increasing
+        JobID after startJobID, at most maxJobs of them, so that all the jobs
+        are fetched in chunks by passing the last JobID of a chunk to get the
+        next one. NULL values are given as None and the dates as strings
+    """
+    attrList = [ attr for attr in attrList if attr != 'JobID' ]
+    for attr in attrList:
+      if attr not in self.jobAttributeNames:
+        return S_ERROR( 'JobDB.getJobAttributesColumns: unknown attribute %s' % attr )
+    try:
+      cond = self.buildCondition( condDict = condDict, greater = { 'JobID' : int( startJobID ) + 1 } )
+    except Exception as x:
+      return S_ERROR( x )
+
+    cmd = 'SELECT %s FROM Jobs %s ORDER BY JobID LIMIT %d' % ( ', '.join( [ 'JobID' ] + attrList ), cond,
+                                                               int( maxJobs ) )
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    rows = result['Value']
+    columns = dict( [ ( name, [] ) for name in [ 'JobID' ] + attrList ] )
+    for name, values in zip( [ 'JobID' ] + attrList, zip( *rows ) ):
+      if name in NUMERIC_ATTRIBUTES:
+        columns[name] = list( values )
+      else:
+        # Dates and enums as strings
+        columns[name] = [ value if value is None or isinstance( value, basestring ) else str( value )
+                          for value in values ]
+    return S_OK( columns )
+
+#############################################################################
+  def getJobParametersColumns( self, jobIDList, paramList ):
+    """ Get parameters of a list of jobs as a dictionary of columns parallel to
+        jobIDList, with None for the parameters a job doesn't have
+    """
+    columns = dict( [ ( name, [ None ] * len( jobIDList ) ) for name in paramList ] )
+    if not jobIDList or not paramList:
+      return S_OK( columns )
+    result = self._escapeValues( paramList )
+    if not result['OK']:
+      return result
+    cmd = 'SELECT JobID, Name, Value FROM JobParameters WHERE JobID IN ( %s ) AND Name IN ( %s )' % \
+          ( ', '.join( [ str( int( jobID ) ) for jobID in jobIDList ] ), ', '.join( result['Value'] ) )
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    positions = dict( [ ( int( jobID ), i ) for i, jobID in enumerate( jobIDList ) ] )
+    for jobID, name, value in result['Value']:
+      try:
+        value = value.tostring()
+      except Exception:
+        value = str( value )
+      columns[name][positions[int( jobID )]] = value
+    return S_OK( columns )
+
 
 #############################################################################
   def getDistinctJobAttributes( self, attribute, condDict = None, older = None,
@@ -657,6 +747,43 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'JobDB.setAttributes: failed to set attribute' )
 
+#############################################################################
+  def setJobsAttributes( self, jobIDList, attrNames, attrValues, update = False, excludedStatuses = None ):
+    """ Set the same attribute values for several jobs in one statement.
+        The LastUpdate time stamp is refreshed if explicitely requested.
+        The jobs in one of the excludedStatuses are left unchanged
+    """
+
+    if not jobIDList:
+      return S_OK( 0 )
+
+    if len( attrNames ) != len( attrValues ):
+      return S_ERROR( 'JobDB.setJobsAttributes: incompatible Argument length' )
+
+    attr = []
+    for i in range( len( attrNames ) ):
+      ret = self._escapeString( attrValues[i] )
+      if not ret['OK']:
+        return ret
+      attr.append( "%s=%s" % ( attrNames[i], ret['Value'] ) )
+    if update:
+      attr.append( "LastUpdateTime=UTC_TIMESTAMP()" )
+    if not attr:
+      return S_ERROR( 'JobDB.setJobsAttributes: Nothing to do' )
+
+    cmd = 'UPDATE Jobs SET %s WHERE JobID in ( %s )' % ( ', '.join( attr ),
+                                                         ', '.join( [ str( int( jobID ) ) for jobID in jobIDList ] ) )
+    if excludedStatuses:
+      ret = self._escapeValues( excludedStatuses )
+      if not ret['OK']:
+        return ret
+      cmd += ' AND Status NOT IN ( %s )' % ', '.join( ret['Value'] )
+    res = self._update( cmd )
+    if res['OK']:
+      return res
+    else:
+      return S_ERROR( 'JobDB.setJobsAttributes: failed to set attributes' )
+
 #############################################################################
   def setJobStatus( self, jobID, status = '', minor = '', application = '', appCounter = None ):
     """ Set status of the job specified by its jobID
@@ -854,22 +981,6 @@ class JobDB( DB ):
 
     return result
 
-#############################################################################
-  def __setInitialJobParameters( self, classadJob, jobID ):
-    """ Set initial job parameters as was defined in the Classad
-    """
-
-    # Extract initital job parameters
-    parameters = {}
-    if classadJob.lookupAttribute( "Parameters" ):
-      parameters = classadJob.getDictionaryFromSubJDL( "Parameters" )
-    res = self.setJobParameters( jobID, parameters.items() )
-
-    if not res['OK']:
-      return res
-
-    return S_OK()
-
 #############################################################################
   def setJobJDL( self, jobID, jdl = None, originalJDL = None ):
     """ Insert JDL's for job specified by jobID
@@ -936,6 +1047,93 @@ class JobDB( DB ):
 
     return S_OK( jobID )
 
+#############################################################################
+  def __insertNewJDLs( self, jdlList ):
+    """Insert several new JDLs at once, this produces a range of new JobIDs.
+       The JDL field holds a token until the job JDL is set, to find the JobID
+       given to each JDL
+    """
+
+    err = 'JobDB.__insertNewJDLs: Failed to retrieve the new Ids.'
+
+    token = uuid.uuid4().hex
+    ret = self._escapeValues( [ ( '%s:%s' % ( token, n ), '', jdl ) for n, jdl in enumerate( jdlList ) ] )
+    if not ret['OK']:
+      return ret
+    firstJobID = None
+    for cmd in self.__getBulkStatements( 'INSERT INTO JobJDLs (JDL,JobRequirements,OriginalJDL) VALUES', ret['Value'] ):
+      result = self._update( cmd )
+      if not result['OK']:
+        self.log.error( 'Can not insert New JDLs', result['Message'] )
+        break
+      if not 'lastRowId' in result:
+        result = S_ERROR( err )
+        break
+      # The ids of a statement may not be consecutive if others insert at the same time
+      firstJobID = min( firstJobID or result['lastRowId'], result['lastRowId'] )
+
+    jobIDs = [ None ] * len( jdlList )
+    if firstJobID is not None:
+      cmd = "SELECT JobID, JDL FROM JobJDLs WHERE JobID >= %d AND JDL LIKE '%s:%%'" % ( int( firstJobID ), token )
+      resIDs = self._query( cmd )
+      if not resIDs['OK']:
+        result = resIDs
+      else:
+        for jobID, jdlToken in resIDs['Value']:
+          jobIDs[ int( jdlToken.split( ':' )[1] ) ] = int( jobID )
+
+    if result['OK'] and None in jobIDs:
+      result = S_ERROR( err )
+    if not result['OK']:
+      insertedIDs = [ jobID for jobID in jobIDs if jobID is not None ]
+      if insertedIDs:
+        self._update( 'DELETE FROM JobJDLs WHERE JobID in (%s)' % ','.join( [ str( j ) for j in insertedIDs ] ) )
+      return result
+
+    self.log.info( 'JobDB: New JobIDs served "%s-%s"' % ( min( jobIDs ), max( jobIDs ) ) )
+
+    return S_OK( jobIDs )
+
+#############################################################################
+  def setJobsParameters( self, jobParameters ):
+    """ Set the parameters of several jobs, given as a dictionary with the
+        list of name/value pairs of each JobID
+    """
+
+    insertValueList = []
+    for jobID in jobParameters:
+      for name, value in jobParameters[jobID]:
+        ret = self._escapeValues( [ name, value ] )
+        if not ret['OK']:
+          return ret
+        e_name, e_value = ret['Value']
+        insertValueList.append( '(%d,%s,%s)' % ( int( jobID ), e_name, e_value ) )
+
+    for cmd in self.__getBulkStatements( 'REPLACE JobParameters (JobID,Name,Value) VALUES', insertValueList ):
+      result = self._update( cmd )
+      if not result['OK']:
+        return S_ERROR( 'JobDB.setJobsParameters: operation failed.' )
+
+    return S_OK()
+
+#############################################################################
+  def __getBulkStatements( self, cmdPrefix, rowList, cmdSuffix = '' ):
+    """ Split the rows of a multi-row statement in statements of a reasonable size
+    """
+    cmdList = []
+    rows = []
+    size = 0
+    for row in rowList:
+      if rows and size + len( row ) > MAX_BULK_STATEMENT_SIZE:
+        cmdList.append( '%s %s %s' % ( cmdPrefix, ', '.join( rows ), cmdSuffix ) )
+        rows = []
+        size = 0
+      rows.append( row )
+      size += len( row ) + 2
+    if rows:
+      cmdList.append( '%s %s %s' % ( cmdPrefix, ', '.join( rows ), cmdSuffix ) )
+    return cmdList
+
 
 #############################################################################
   def getJobJDL( self, jobID, original = False, status = '' ):
@@ -977,6 +1175,174 @@ class JobDB( DB ):
         Do initial JDL crosscheck,
         Set Initial job Attributes and Status
     """
+    result = self.__loadNewJobManifest( jdl, owner, ownerDN, ownerGroup, diracSetup )
+    if not result['OK']:
+      return result
+    jobManifest = result['Value']
+
+    # 1.- insert original JDL on DB and get new JobID
+    # Fix the possible lack of the brackets in the JDL
+    if jdl.strip()[0].find( '[' ) != 0 :
+      jdl = '[' + jdl + ']'
+    result = self.__insertNewJDL( jdl )
+    if not result[ 'OK' ]:
+      return S_ERROR( 'Can not insert JDL in to DB' )
+    jobID = result[ 'Value' ]
+
+    # 2.- Check JDL and Prepare DIRAC JDL
+    result = self.__prepareNewJob( jobID, jobManifest, owner, ownerDN, ownerGroup, diracSetup )
+    if not result['OK']:
+      jobDict = result.pop( 'JobDict' )
+      resultInsert = self.setJobAttributes( jobID, jobDict['AttrNames'], jobDict['AttrValues'] )
+      if not resultInsert['OK']:
+        result['MinorStatus'] += '; %s' % resultInsert['Message']
+      return result
+    jobDict = result['Value']
+
+    retVal = S_OK( jobID )
+    retVal['JobID'] = jobID
+    if jobDict['JDL'] is None:
+      result = self.insertFields( 'Jobs', jobDict['AttrNames'], jobDict['AttrValues'] )
+      if not result['OK']:
+        return result
+
+      retVal['Status'] = jobDict['Status']
+      retVal['MinorStatus'] = jobDict['MinorStatus']
+      return retVal
+
+    result = self.setJobJDL( jobID, jobDict['JDL'] )
+    if not result['OK']:
+      return result
+
+    # Adding the job in the Jobs table
+    result = self.insertFields( 'Jobs', jobDict['AttrNames'], jobDict['AttrValues'] )
+    if not result['OK']:
+      return result
+
+    # Setting the Job parameters
+    result = self.setJobParameters( jobID, jobDict['Parameters'] )
+    if not result['OK']:
+      return result
+
+    # Looking for the Input Data
+    values = []
+
+    ret = self._escapeString( jobID )
+    if not ret['OK']:
+      return ret
+    e_jobID = ret['Value']
+
+    for lfn in jobDict['InputData']:
+      ret = self._escapeString( lfn )
+      if not ret['OK']:
+        return ret
+      lfn = ret['Value']
+
+      values.append( '(%s, %s )' % ( e_jobID, lfn ) )
+
+    if values:
+      cmd = 'INSERT INTO InputData (JobID,LFN) VALUES %s' % ', '.join( values )
+      result = self._update( cmd )
+      if not result['OK']:
+        return result
+
+    retVal['Status'] = jobDict['Status']
+    retVal['MinorStatus'] = jobDict['MinorStatus']
+
+    return retVal
+
+#############################################################################
+  def insertNewJobsIntoDB( self, jdlList, owner, ownerDN, ownerGroup, diracSetup ):
+    """ Insert several new jobs at once, as insertNewJobIntoDB does for one.
+        The JobIDs are served by multi-row insertions of the JDLs and the rest of
+        the job records are inserted with multi-row insertions as well, in a
+        transaction per chunk of jobs. If a job can not be inserted, none is.
+        Return S_OK( [ { 'JobID', 'Status', 'MinorStatus' } ] ) / S_ERROR
+    """
+    if not jdlList:
+      return S_OK( [] )
+    jobManifests = []
+    for jdl in jdlList:
+      result = self.__loadNewJobManifest( jdl, owner, ownerDN, ownerGroup, diracSetup )
+      if not result['OK']:
+        return result
+      jobManifests.append( result['Value'] )
+
+    # 1.- insert original JDLs on DB and get new JobIDs
+    # Fix the possible lack of the brackets in the JDLs
+    jdlList = [ jdl if jdl.strip()[0].find( '[' ) == 0 else '[' + jdl + ']' for jdl in jdlList ]
+    result = self.__insertNewJDLs( jdlList )
+    if not result[ 'OK' ]:
+      return S_ERROR( 'Can not insert JDLs in to DB' )
+    jobIDs = result[ 'Value' ]
+
+    # 2.- Check JDLs and Prepare DIRAC JDLs
+    jobDicts = []
+    for jobID, jobManifest in zip( jobIDs, jobManifests ):
+      result = self.__prepareNewJob( jobID, jobManifest, owner, ownerDN, ownerGroup, diracSetup )
+      if not result['OK']:
+        result.pop( 'JobDict' )
+        self.removeJobFromDB( jobIDs )
+        return result
+      jobDicts.append( result['Value'] )
+
+    # 3.- Insert the jobs, a transaction per chunk
+    for i in xrange( 0, len( jobDicts ), self.bulkInsertionSize ):
+      result = self.__insertNewJobs( jobDicts[ i : i + self.bulkInsertionSize ] )
+      if not result['OK']:
+        self.log.error( 'Can not insert new jobs', result['Message'] )
+        self.removeJobFromDB( jobIDs )
+        return S_ERROR( 'Can not insert jobs in to DB: %s' % result['Message'] )
+
+    return S_OK( [ { 'JobID' : jobDict['JobID'],
+                     'Status' : jobDict['Status'],
+                     'MinorStatus' : jobDict['MinorStatus'] } for jobDict in jobDicts ] )
+
+  def __insertNewJobs( self, jobDicts ):
+    """ Insert the JDLs, attributes, parameters and input data of prepared jobs
+        with multi-row insertions in a single transaction
+    """
+    cmdList = [ 'START TRANSACTION' ]
+
+    ret = self._escapeValues( [ ( jobDict['JobID'], jobDict['JDL'] or '' ) for jobDict in jobDicts ] )
+    if not ret['OK']:
+      return ret
+    cmdList += self.__getBulkStatements( 'INSERT INTO JobJDLs (JobID,JDL) VALUES', ret['Value'],
+                                         'ON DUPLICATE KEY UPDATE JDL=VALUES(JDL)' )
+
+    # Jobs may not give the same attributes
+    attrRows = {}
+    for jobDict in jobDicts:
+      attrRows.setdefault( tuple( jobDict['AttrNames'] ), [] ).append( tuple( jobDict['AttrValues'] ) )
+    for attrNames, rows in attrRows.items():
+      ret = self._escapeValues( rows )
+      if not ret['OK']:
+        return ret
+      cmd = 'INSERT INTO Jobs (%s) VALUES' % ','.join( [ '`%s`' % name for name in attrNames ] )
+      cmdList += self.__getBulkStatements( cmd, ret['Value'] )
+
+    for table, fields, key in ( ( 'JobParameters', 'JobID,Name,Value', 'Parameters' ),
+                                ( 'InputData', 'JobID,LFN', 'InputData' ) ):
+      rows = []
+      for jobDict in jobDicts:
+        for value in jobDict[ key ]:
+          if isinstance( value, tuple ):
+            rows.append( ( jobDict['JobID'], ) + value )
+          else:
+            rows.append( ( jobDict['JobID'], value ) )
+      if not rows:
+        continue
+      ret = self._escapeValues( rows )
+      if not ret['OK']:
+        return ret
+      cmdList += self.__getBulkStatements( 'INSERT INTO %s (%s) VALUES' % ( table, fields ), ret['Value'] )
+
+    return self._transaction( cmdList )
+
+#############################################################################
+  def __loadNewJobManifest( self, jdl, owner, ownerDN, ownerGroup, diracSetup ):
+    """ Load and check the manifest of a new job
+    """
     jobManifest = JobManifest()
     result = jobManifest.load( jdl )
     if not result['OK']:
@@ -988,18 +1354,17 @@ class JobDB( DB ):
     result = jobManifest.check()
     if not result['OK']:
       return result
+    return S_OK( jobManifest )
+
+  def __prepareNewJob( self, jobID, jobManifest, owner, ownerDN, ownerGroup, diracSetup ):
+    """ Check the JDL of a new job and prepare its attributes, JDL, initial
+        parameters and input data to be inserted.
+        The JDL is None if it could not be parsed. On error, the attributes of the
+        failed job are in the JobDict key of the result
+    """
     jobAttrNames = []
     jobAttrValues = []
 
-    # 1.- insert original JDL on DB and get new JobID
-    # Fix the possible lack of the brackets in the JDL
-    if jdl.strip()[0].find( '[' ) != 0 :
-      jdl = '[' + jdl + ']'
-    result = self.__insertNewJDL( jdl )
-    if not result[ 'OK' ]:
-      return S_ERROR( 'Can not insert JDL in to DB' )
-    jobID = result[ 'Value' ]
-
     jobManifest.setOption( 'JobID', jobID )
 
     jobAttrNames.append( 'JobID' )
@@ -1023,11 +1388,15 @@ class JobDB( DB ):
     jobAttrNames.append( 'DIRACSetup' )
     jobAttrValues.append( diracSetup )
 
-    # 2.- Check JDL and Prepare DIRAC JDL
+    jobDict = { 'JobID' : jobID,
+                'AttrNames' : jobAttrNames,
+                'AttrValues' : jobAttrValues,
+                'JDL' : None,
+                'Parameters' : [],
+                'InputData' : [] }
+
     classAdJob = ClassAd( jobManifest.dumpAsJDL() )
     classAdReq = ClassAd( '[]' )
-    retVal = S_OK( jobID )
-    retVal['JobID'] = jobID
     if not classAdJob.isOK():
       jobAttrNames.append( 'Status' )
       jobAttrValues.append( 'Failed' )
@@ -1035,13 +1404,9 @@ class JobDB( DB ):
       jobAttrNames.append( 'MinorStatus' )
       jobAttrValues.append( 'Error in JDL syntax' )
 
-      result = self.insertFields( 'Jobs', jobAttrNames, jobAttrValues )
-      if not result['OK']:
-        return result
-
-      retVal['Status'] = 'Failed'
-      retVal['MinorStatus'] = 'Error in JDL syntax'
-      return retVal
+      jobDict['Status'] = 'Failed'
+      jobDict['MinorStatus'] = 'Error in JDL syntax'
+      return S_OK( jobDict )
 
     classAdJob.insertAttributeInt( 'JobID', jobID )
     result = self.__checkAndPrepareJob( jobID, classAdJob, classAdReq,
@@ -1049,6 +1414,7 @@ class JobDB( DB ):
                                         ownerGroup, diracSetup,
                                         jobAttrNames, jobAttrValues )
     if not result['OK']:
+      result['JobDict'] = jobDict
       return result
 
     priority = classAdJob.getAttributeInt( 'Priority' )
@@ -1087,53 +1453,20 @@ class JobDB( DB ):
     # Replace the JobID placeholder if any
     if jobJDL.find( '%j' ) != -1:
       jobJDL = jobJDL.replace( '%j', str( jobID ) )
+    jobDict['JDL'] = jobJDL
 
-    result = self.setJobJDL( jobID, jobJDL )
-    if not result['OK']:
-      return result
-
-    # Adding the job in the Jobs table
-    result = self.insertFields( 'Jobs', jobAttrNames, jobAttrValues )
-    if not result['OK']:
-      return result
-
-    # Setting the Job parameters
-    result = self.__setInitialJobParameters( classAdJob, jobID )
-    if not result['OK']:
-      return result
+    # Extract initial job parameters
+    if classAdJob.lookupAttribute( "Parameters" ):
+      jobDict['Parameters'] = classAdJob.getDictionaryFromSubJDL( "Parameters" ).items()
 
-    # Looking for the Input Data
-    inputData = []
+    # Looking for the Input Data, some jobs are setting empty string as InputData
     if classAdJob.lookupAttribute( 'InputData' ):
-      inputData = classAdJob.getListFromExpression( 'InputData' )
-    values = []
-
-    ret = self._escapeString( jobID )
-    if not ret['OK']:
-      return ret
-    e_jobID = ret['Value']
+      jobDict['InputData'] = [ lfn.strip() for lfn in classAdJob.getListFromExpression( 'InputData' ) if lfn ]
 
-    for lfn in inputData:
-      # some jobs are setting empty string as InputData
-      if not lfn:
-        continue
-      ret = self._escapeString( lfn.strip() )
-      if not ret['OK']:
-        return ret
-      lfn = ret['Value']
+    jobDict['Status'] = 'Received'
+    jobDict['MinorStatus'] = 'Job accepted'
 
-      values.append( '(%s, %s )' % ( e_jobID, lfn ) )
-
-    if values:
-      cmd = 'INSERT INTO InputData (JobID,LFN) VALUES %s' % ', '.join( values )
-      result = self._update( cmd )
-      if not result['OK']:
-        return result
-
-    retVal['Status'] = 'Received'
-    retVal['MinorStatus'] = 'Job accepted'
-
-    return retVal
+    return S_OK( jobDict )
 
   def __checkAndPrepareJob( self, jobID, classAdJob, classAdReq, owner, ownerDN,
                             ownerGroup, diracSetup, jobAttrNames, jobAttrValues ):
@@ -1225,9 +1558,6 @@ class JobDB( DB ):
 
       jobAttrNames.append( 'MinorStatus' )
       jobAttrValues.append( error )
-      resultInsert = self.setJobAttributes( jobID, jobAttrNames, jobAttrValues )
-      if not resultInsert['OK']:
-        retVal['MinorStatus'] += '; %s' % resultInsert['Message']
 
       return retVal
 
@@ -1254,14 +1584,17 @@ class JobDB( DB ):
 
     failedTablesList = []
     jobIDString = ','.join( [str( j ) for j in jobIDList] )
-    for table in ['InputData',
-                  'JobParameters',
-                  'AtticJobParameters',
-                  'HeartBeatLoggingInfo',
-                  'OptimizerParameters',
-                  'JobCommands',
-                  'Jobs',
-                  'JobJDLs']:
+    tableList = ['InputData',
+                 'JobParameters',
+                 'AtticJobParameters',
+                 'HeartBeatLoggingInfo',
+                 'OptimizerParameters',
+                 'JobCommands',
+                 'Jobs',
+                 'JobJDLs']
+    if self.__heartBeatSeriesAvailable:
+      tableList.insert( 4, 'HeartBeatSeries' )
+    for table in tableList:
 
       cmd = 'DELETE FROM %s WHERE JobID in (%s)' % ( table, jobIDString )
       result = self._update( cmd )
@@ -1693,9 +2026,7 @@ class JobDB( DB ):
       last_update = selectDict['LastUpdateTime']
       del selectDict['LastUpdateTime']
 
-    result = self.getCounters( 'Jobs', ['Site', 'Status'],
-                              {}, newer = last_update,
-                              timeStamp = 'LastUpdateTime' )
+    result = self.getJobCounters( ['Site', 'Status'], {}, newer = last_update )
     last_day = Time.dateTime() - Time.day
     resultDay = self.getCounters( 'Jobs', ['Site', 'Status'],
                                  {}, newer = last_day,
@@ -1847,30 +2178,61 @@ class JobDB( DB ):
       self.log.warn( result['Message'] )
 
     # Add dynamic data to the job heart beat log
-    # start = time.time()
-    valueList = []
-    for key, value in dynamicDataDict.items():
-      result = self._escapeString( key )
-      if not result['OK']:
-        self.log.warn( 'Failed to escape string ' + key )
-        continue
-      e_key = result['Value']
-      result = self._escapeString( value )
-      if not result['OK']:
-        self.log.warn( 'Failed to escape string ' + value )
-        continue
-      e_value = result['Value']
-      valueList.append( "( %s, %s,%s,UTC_TIMESTAMP())" % ( e_jobID, e_key, e_value ) )
+    result = self.__insertHeartBeatLogging( [ ( jobID, key, value, None ) for key, value in dynamicDataDict.items() ] )
+    if not result['OK']:
+      ok = False
+      self.log.warn( result['Message'] )
 
-    if valueList:
+    if ok:
+      return S_OK()
+    else:
+      return S_ERROR( 'Failed to store some or all the parameters' )
+
+#####################################################################################
+  def setJobsHeartBeatData( self, heartBeatDict, excludedStatuses = None ):
+    """ Add the heart beat data of several jobs to the database. The heartBeatDict
+        holds for each JobID a tuple ( heartBeatTime, staticDataDict, dynamicDataList )
+        where the dynamic data are ( name, value, heartBeatTime ) tuples. The jobs
+        in one of the excludedStatuses are not set Running
+    """
 
-      valueString = ','.join( valueList )
-      req = "INSERT INTO HeartBeatLoggingInfo (JobID,Name,Value,HeartBeatTime) VALUES "
-      req += valueString
+    if not heartBeatDict:
+      return S_OK()
+
+    statusCond = ''
+    if excludedStatuses:
+      ret = self._escapeValues( excludedStatuses )
+      if not ret['OK']:
+        return ret
+      statusCond = ' AND Status NOT IN ( %s )' % ', '.join( ret['Value'] )
+
+    # The jobs with the same heart beat time are updated together
+    timeDict = {}
+    for jobID in heartBeatDict:
+      timeDict.setdefault( heartBeatDict[jobID][0], [] ).append( str( int( jobID ) ) )
+    for heartBeatTime in timeDict:
+      ret = self._escapeString( heartBeatTime )
+      if not ret['OK']:
+        return ret
+      req = "UPDATE Jobs SET HeartBeatTime=%s, Status='Running' WHERE JobID in ( %s )%s" % \
+            ( ret['Value'], ', '.join( timeDict[heartBeatTime] ), statusCond )
       result = self._update( req )
       if not result['OK']:
-        ok = False
-        self.log.warn( result['Message'] )
+        return S_ERROR( 'Failed to set the heart beat time: ' + result['Message'] )
+
+    ok = True
+    result = self.setJobsParameters( dict( [ ( jobID, heartBeatDict[jobID][1].items() )
+                                             for jobID in heartBeatDict ] ) )
+    if not result['OK']:
+      ok = False
+      self.log.warn( result['Message'] )
+
+    result = self.__insertHeartBeatLogging( [ ( jobID, key, value, heartBeatTime )
+                                              for jobID in heartBeatDict
+                                              for key, value, heartBeatTime in heartBeatDict[jobID][2] ] )
+    if not result['OK']:
+      ok = False
+      self.log.warn( result['Message'] )
 
     if ok:
       return S_OK()
@@ -1878,6 +2240,69 @@ class JobDB( DB ):
       return S_ERROR( 'Failed to store some or all the parameters' )
 
 #####################################################################################
+  def __insertHeartBeatLogging( self, rowList ):
+    """ Store the dynamic heart beat data given as ( jobID, name, value, heartBeatTime )
+        tuples, with a None time for the current one. In the Series storage the
+        numeric values are appended to the open block of raw points of their series
+    """
+    if not rowList:
+      return S_OK()
+
+    valueList = []
+    series = {}
+    now = None
+    for jobID, key, value, heartBeatTime in rowList:
+      if self.heartBeatStorage == 'Series':
+        try:
+          value = float( str( value ).replace( '"', '' ) )
+        except ValueError:
+          pass
+        else:
+          pointDate = Time.fromString( str( heartBeatTime ) ) if heartBeatTime else None
+          if pointDate:
+            epoch = calendar.timegm( pointDate.utctimetuple() )
+          else:
+            if now is None:
+              now = calendar.timegm( Time.dateTime().utctimetuple() )
+            epoch = now
+          series.setdefault( ( int( jobID ), key ), [] ).append( ( epoch, value ) )
+          continue
+      result = self._escapeValues( [ key, value ] )
+      if not result['OK']:
+        self.log.warn( 'Failed to escape the heart beat data of job %s' % jobID )
+        continue
+      e_key, e_value = result['Value']
+      if heartBeatTime:
+        result = self._escapeString( heartBeatTime )
+        if not result['OK']:
+          return result
+        e_time = result['Value']
+      else:
+        e_time = 'UTC_TIMESTAMP()'
+      valueList.append( "( %d, %s, %s, %s )" % ( int( jobID ), e_key, e_value, e_time ) )
+
+    # The rows written again when the journal of the buffered job updates is replayed are ignored
+    cmdList = self.__getBulkStatements( "INSERT IGNORE INTO HeartBeatLoggingInfo (JobID,Name,Value,HeartBeatTime) "
+                                        "VALUES", valueList )
+    seriesList = []
+    for ( jobID, key ), points in series.items():
+      result = self._escapeString( key )
+      if not result['OK']:
+        self.log.warn( 'Failed to escape the heart beat data of job %s' % jobID )
+        continue
+      seriesList.append( "( %d, %s, 0, 0, %d, %d, X'%s' )" % ( jobID, result['Value'], max( [ p[0] for p in points ] ),
+                                                              len( points ), packRawPoints( points ).encode( 'hex' ) ) )
+    cmdList += self.__getBulkStatements( "INSERT INTO HeartBeatSeries (JobID,Name,Format,StartTime,EndTime,"
+                                         "NumPoints,Data) VALUES", seriesList,
+                                         "ON DUPLICATE KEY UPDATE Data=CONCAT(Data,VALUES(Data)), "
+                                         "NumPoints=NumPoints+VALUES(NumPoints), "
+                                         "EndTime=GREATEST(EndTime,VALUES(EndTime))" )
+    for cmd in cmdList:
+      result = self._update( cmd )
+      if not result['OK']:
+        return result
+    return S_OK()
+
   def getHeartBeatData( self, jobID ):
     """ Retrieve the job's heart beat data
     """
@@ -1891,16 +2316,90 @@ class JobDB( DB ):
     if not res['OK']:
       return res
 
-    if len( res['Value'] ) == 0:
-      return S_OK ( [] )
-
     result = []
     values = res['Value']
     for row in values:
       result.append( ( str( row[0] ), '%.01f' % ( float( row[1].replace( '"', '' ) ) ), str( row[2] ) ) )
 
+    if self.__heartBeatSeriesAvailable:
+      cmd = 'SELECT Name,Format,Data FROM HeartBeatSeries WHERE JobID=%s' % jobID
+      res = self._query( cmd )
+      if not res['OK']:
+        return res
+      for name, blockFormat, data in res['Value']:
+        points = unpackRawPoints( data ) if blockFormat == 0 else decodeBlock( data )
+        for pointTime, value in points:
+          result.append( ( str( name ), '%.01f' % value, str( datetime.datetime.utcfromtimestamp( pointTime ) ) ) )
+      # The points of the series are ordered by time, only needed if the job has some
+      if res['Value']:
+        result.sort( key = lambda row: ( row[0], row[2] ) )
+
     return S_OK( result )
 
+#####################################################################################
+  def compactHeartBeatData( self, maxSeries = 1000 ):
+    """ Compact the raw points of the heart beat series of the Series storage:
+        the open blocks that got HeartBeatBlockSize points, or of the jobs that
+        are over, are delta encoded, and the blocks older than
+        HeartBeatDownsampleAge seconds are downsampled to one point per
+        HeartBeatDownsampleInterval seconds
+
+        :return: S_OK( { 'Compacted' : number of blocks, 'Downsampled' : number of blocks } )
+    """
+    stats = { 'Compacted' : 0, 'Downsampled' : 0 }
+    if self.heartBeatStorage != 'Series':
+      return S_OK( stats )
+
+    finalStates = ', '.join( [ "'%s'" % status for status in self.JOB_FINAL_STATES + [ 'Killed', 'Deleted' ] ] )
+    cmd = "SELECT s.JobID, s.Name, s.Data FROM HeartBeatSeries s, Jobs j WHERE s.Format=0 AND s.JobID=j.JobID " \
+          "AND ( s.NumPoints >= %d OR j.Status IN ( %s ) ) LIMIT %d" % ( self.heartBeatBlockSize, finalStates,
+                                                                         maxSeries )
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    for jobID, name, data in result['Value']:
+      points = sorted( unpackRawPoints( data ) )
+      if not points:
+        continue
+      result = self._escapeString( name )
+      if not result['OK']:
+        return result
+      seriesCond = "JobID=%d AND Name=%s AND Format=0 AND StartTime=0" % ( jobID, result['Value'] )
+      # The points appended since they were read stay in the open block. A block
+      # starting at the same time holds points replayed by the job state updates
+      # and already compacted, they are dropped
+      cmdList = [ "START TRANSACTION",
+                  "INSERT IGNORE INTO HeartBeatSeries (JobID,Name,Format,StartTime,EndTime,NumPoints,Data) "
+                  "VALUES ( %d, %s, 1, %d, %d, %d, X'%s' )" % ( jobID, result['Value'], points[0][0], points[-1][0],
+                                                               len( points ), encodeBlock( points ).encode( 'hex' ) ),
+                  "UPDATE HeartBeatSeries SET Data=SUBSTRING(Data,%d), NumPoints=NumPoints-%d WHERE %s" % \
+                  ( len( points ) * RAW_POINT.size + 1, len( points ), seriesCond ),
+                  "DELETE FROM HeartBeatSeries WHERE %s AND NumPoints<=0" % seriesCond ]
+      result = self._transaction( cmdList )
+      if not result['OK']:
+        return result
+      stats['Compacted'] += 1
+
+    oldTime = calendar.timegm( Time.dateTime().utctimetuple() ) - self.heartBeatDownsampleAge
+    cmd = "SELECT JobID, Name, StartTime, Data FROM HeartBeatSeries WHERE Format=1 AND Resolution=0 " \
+          "AND EndTime<%d LIMIT %d" % ( oldTime, maxSeries )
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    for jobID, name, startTime, data in result['Value']:
+      points = downsample( decodeBlock( data ), self.heartBeatDownsampleInterval )
+      result = self._escapeString( name )
+      if not result['OK']:
+        return result
+      cmd = "UPDATE HeartBeatSeries SET Data=X'%s', NumPoints=%d, Resolution=%d WHERE JobID=%d AND Name=%s " \
+            "AND Format=1 AND StartTime=%d" % ( encodeBlock( points ).encode( 'hex' ), len( points ),
+                                                self.heartBeatDownsampleInterval, jobID, result['Value'], startTime )
+      result = self._update( cmd )
+      if not result['OK']:
+        return result
+      stats['Downsampled'] += 1
+    return S_OK( stats )
+
 #####################################################################################
   def setJobCommand( self, jobID, command, arguments = None ):
     """ Store a command to be passed to the job together with the
@@ -1990,9 +2489,114 @@ class JobDB( DB ):
     defFields = [ 'DIRACSetup' ] + requestedFields
     valueFields = [ 'COUNT(JobID)', 'SUM(RescheduleCounter)' ]
     defString = ", ".join( defFields )
+    if self.__isJobsSummaryUsable( defFields ):
+      sqlCmd = "SELECT %s, SUM(Jobs), SUM(Reschedules) FROM JobsSummary GROUP BY %s HAVING SUM(Jobs) > 0" % \
+               ( defString, defString )
+      result = self._query( sqlCmd )
+      if not result[ 'OK' ]:
+        return result
+      records = [ record[:-2] + ( int( record[-2] ), int( record[-1] ) ) for record in result[ 'Value' ] ]
+      return S_OK( ( ( defFields + valueFields ), tuple( records ) ) )
     valueString = ", ".join( valueFields )
     sqlCmd = "SELECT %s, %s From Jobs GROUP BY %s" % ( defString, valueString, defString )
     result = self._query( sqlCmd )
     if not result[ 'OK' ]:
       return result
     return S_OK( ( ( defFields + valueFields ), result[ 'Value' ] ) )
+
+#############################################################################
+  def __isJobsSummaryUsable( self, fields ):
+    """ Check if the counters of the jobs by the given fields can be taken from the JobsSummary table
+    """
+    if not self.useJobsSummary:
+      return False
+    for field in fields:
+      if field not in JOBS_SUMMARY_FIELDS:
+        return False
+    if self.__jobsSummaryAvailable is None:
+      result = self._query( "SHOW TABLES LIKE 'JobsSummary'" )
+      if not result[ 'OK' ]:
+        return False
+      self.__jobsSummaryAvailable = bool( result[ 'Value' ] )
+      if not self.__jobsSummaryAvailable:
+        self.log.warn( "No JobsSummary table, the job counters are taken from the Jobs table" )
+    return self.__jobsSummaryAvailable
+
+  def getJobCounters( self, attrList, condDict = None, older = None, newer = None, timeStamp = 'LastUpdateTime' ):
+    """ Count the jobs on each distinct combination of the attributes in attrList, as
+        getCounters( 'Jobs', ... ) does. Without time limits and with the attributes and
+        conditions on the summary fields, the counters are read from the JobsSummary table
+        instead of scanning the Jobs table
+    """
+    if not condDict:
+      condDict = {}
+    condFields = []
+    for key in condDict:
+      condFields.extend( list( key ) if isinstance( key, tuple ) else [ key ] )
+    if older or newer or not self.__isJobsSummaryUsable( list( attrList ) + condFields ):
+      return self.getCounters( 'Jobs', attrList, condDict, older = older, newer = newer, timeStamp = timeStamp )
+
+    try:
+      cond = self.buildCondition( condDict = condDict )
+    except Exception as x:
+      return S_ERROR( x )
+    attrNames = ', '.join( attrList )
+    cmd = 'SELECT %s, SUM(Jobs) FROM JobsSummary %s GROUP BY %s HAVING SUM(Jobs) > 0 ORDER BY %s' % \
+          ( attrNames, cond, attrNames, attrNames )
+    result = self._query( cmd )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( [ ( dict( zip( attrList, row[:-1] ) ), int( row[-1] ) ) for row in result[ 'Value' ] ] )
+
+  def checkJobsSummary( self, repair = True ):
+    """ Compare the JobsSummary table with the counters of the Jobs table and repair
+        the counters that differ. The table can differ if it was created after the
+        jobs or if the Jobs table was modified without its triggers.
+
+        Both tables are read in the same consistent snapshot. The triggers change
+        the counters of the jobs and of the table alike, so the differences seen in
+        the snapshot are added to the counters without locking the Jobs table
+
+        :return: S_OK( number of counters that differed )
+    """
+    fields = ', '.join( JOBS_SUMMARY_FIELDS )
+    result = self.transactionStart()
+    if not result[ 'OK' ]:
+      return result
+    try:
+      result = self._query( "SELECT %s, COUNT(*), SUM(RescheduleCounter) FROM Jobs GROUP BY %s" % ( fields, fields ) )
+      if not result[ 'OK' ]:
+        return result
+      jobCounters = dict( [ ( row[:-2], ( int( row[-2] ), int( row[-1] ) ) ) for row in result[ 'Value' ] ] )
+      result = self._query( "SELECT %s, Jobs, Reschedules FROM JobsSummary WHERE Jobs <> 0 OR Reschedules <> 0" % \
+                            fields )
+      if not result[ 'OK' ]:
+        return result
+      summaryCounters = dict( [ ( row[:-2], ( int( row[-2] ), int( row[-1] ) ) ) for row in result[ 'Value' ] ] )
+    finally:
+      self.transactionCommit()
+
+    rowList = []
+    for key in set( jobCounters ) | set( summaryCounters ):
+      jobs, reschedules = jobCounters.get( key, ( 0, 0 ) )
+      summaryJobs, summaryReschedules = summaryCounters.get( key, ( 0, 0 ) )
+      if ( jobs, reschedules ) == ( summaryJobs, summaryReschedules ):
+        continue
+      result = self._escapeValues( list( key ) )
+      if not result[ 'OK' ]:
+        return result
+      rowList.append( "( %s, %d, %d )" % ( ', '.join( result[ 'Value' ] ), jobs - summaryJobs,
+                                            reschedules - summaryReschedules ) )
+    if not rowList:
+      return S_OK( 0 )
+    self.log.warn( "JobsSummary differs from the Jobs table", "%s counters" % len( rowList ) )
+    if not repair:
+      return S_OK( len( rowList ) )
+    for cmd in self.__getBulkStatements( "INSERT INTO JobsSummary (%s, Jobs, Reschedules) VALUES" % fields, rowList,
+                                         "ON DUPLICATE KEY UPDATE Jobs = Jobs + VALUES(Jobs), "
+                                         "Reschedules = Reschedules + VALUES(Reschedules)" ):
+      result = self._update( cmd )
+      if not result[ 'OK' ]:
+        return result
+    self.log.info( "JobsSummary repaired", "%s counters" % len( rowList ) )
+    return S_OK( len( rowList ) )
@@ -88,6 +88,68 @@ CREATE TABLE `Jobs` (
   KEY `LastUpdateTime` (`LastUpdateTime`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 
+-- ------------------------------------------------------------------------------
+--
+-- Number of jobs and sum of their reschedulings for each combination of the
+-- summary attributes, kept up to date by the triggers on the Jobs table.
+-- JobDB.checkJobsSummary() repairs the counters that differ from the Jobs table
+--
+DROP TABLE IF EXISTS `JobsSummary`;
+CREATE TABLE `JobsSummary` (
+  `DIRACSetup` VARCHAR(32) NOT NULL,
+  `Status` VARCHAR(32) NOT NULL,
+  `MinorStatus` VARCHAR(128) NOT NULL,
+  `Site` VARCHAR(100) NOT NULL,
+  `Owner` VARCHAR(32) NOT NULL,
+  `OwnerGroup` VARCHAR(128) NOT NULL,
+  `JobGroup` VARCHAR(32) NOT NULL,
+  `JobType` VARCHAR(32) NOT NULL,
+  `JobSplitType` ENUM('Single','Master','Subjob','DAGNode') NOT NULL,
+  `Jobs` INT(11) NOT NULL DEFAULT 0,
+  `Reschedules` INT(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`DIRACSetup`,`Status`,`MinorStatus`,`Site`,`Owner`,`OwnerGroup`,`JobGroup`,`JobType`,`JobSplitType`),
+  KEY `Status` (`Status`),
+  KEY `Site` (`Site`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
+CREATE TRIGGER JobsSummaryInsert AFTER INSERT ON Jobs
+FOR EACH ROW INSERT INTO JobsSummary (DIRACSetup, Status, MinorStatus, Site, Owner, OwnerGroup, JobGroup, JobType,
+                                      JobSplitType, Jobs, Reschedules)
+VALUES (NEW.DIRACSetup, NEW.Status, NEW.MinorStatus, NEW.Site, NEW.Owner, NEW.OwnerGroup, NEW.JobGroup, NEW.JobType,
+        NEW.JobSplitType, 1, NEW.RescheduleCounter)
+ON DUPLICATE KEY UPDATE Jobs = Jobs + 1, Reschedules = Reschedules + NEW.RescheduleCounter;
+
+CREATE TRIGGER JobsSummaryDelete AFTER DELETE ON Jobs
+FOR EACH ROW UPDATE JobsSummary SET Jobs = Jobs - 1, Reschedules = Reschedules - OLD.RescheduleCounter
+WHERE DIRACSetup = OLD.DIRACSetup AND Status = OLD.Status AND MinorStatus = OLD.MinorStatus AND Site = OLD.Site
+  AND Owner = OLD.Owner AND OwnerGroup = OLD.OwnerGroup AND JobGroup = OLD.JobGroup AND JobType = OLD.JobType
+  AND JobSplitType = OLD.JobSplitType;
+
+-- The job is moved from the counters of its old attributes to the new ones.
+-- The trigger has to be a single statement for the DB installer, so instead of
+-- an IF each row of the move is only selected when a summary attribute changed:
+-- the other updates, like the heart beats, don't touch the JobsSummary table
+CREATE TRIGGER JobsSummaryUpdate AFTER UPDATE ON Jobs
+FOR EACH ROW INSERT INTO JobsSummary (DIRACSetup, Status, MinorStatus, Site, Owner, OwnerGroup, JobGroup, JobType,
+                                      JobSplitType, Jobs, Reschedules)
+SELECT * FROM (
+  SELECT OLD.DIRACSetup, OLD.Status, OLD.MinorStatus, OLD.Site, OLD.Owner, OLD.OwnerGroup, OLD.JobGroup,
+         OLD.JobType, OLD.JobSplitType, -1 AS MovedJobs, -OLD.RescheduleCounter AS MovedReschedules FROM DUAL
+  WHERE NOT ( OLD.DIRACSetup <=> NEW.DIRACSetup AND OLD.Status <=> NEW.Status AND OLD.MinorStatus <=> NEW.MinorStatus
+              AND OLD.Site <=> NEW.Site AND OLD.Owner <=> NEW.Owner AND OLD.OwnerGroup <=> NEW.OwnerGroup
+              AND OLD.JobGroup <=> NEW.JobGroup AND OLD.JobType <=> NEW.JobType
+              AND OLD.JobSplitType <=> NEW.JobSplitType AND OLD.RescheduleCounter <=> NEW.RescheduleCounter )
+  UNION ALL
+  SELECT NEW.DIRACSetup, NEW.Status, NEW.MinorStatus, NEW.Site, NEW.Owner, NEW.OwnerGroup, NEW.JobGroup,
+         NEW.JobType, NEW.JobSplitType, 1, NEW.RescheduleCounter FROM DUAL
+  WHERE NOT ( OLD.DIRACSetup <=> NEW.DIRACSetup AND OLD.Status <=> NEW.Status AND OLD.MinorStatus <=> NEW.MinorStatus
+              AND OLD.Site <=> NEW.Site AND OLD.Owner <=> NEW.Owner AND OLD.OwnerGroup <=> NEW.OwnerGroup
+              AND OLD.JobGroup <=> NEW.JobGroup AND OLD.JobType <=> NEW.JobType
+              AND OLD.JobSplitType <=> NEW.JobSplitType AND OLD.RescheduleCounter <=> NEW.RescheduleCounter )
+) AS Moved
+ON DUPLICATE KEY UPDATE JobsSummary.Jobs = JobsSummary.Jobs + VALUES(Jobs),
+                        JobsSummary.Reschedules = JobsSummary.Reschedules + VALUES(Reschedules);
+
 -- ------------------------------------------------------------------------------
 DROP TABLE IF EXISTS `InputData`;
 CREATE TABLE `InputData` (
@@ -161,6 +223,23 @@ CREATE TABLE `HeartBeatLoggingInfo` (
   FOREIGN KEY (`JobID`) REFERENCES `Jobs`(`JobID`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 
+-- ------------------------------------------------------------------------------
+DROP TABLE IF EXISTS `HeartBeatSeries`;
+CREATE TABLE `HeartBeatSeries` (
+  `JobID` INT(11) UNSIGNED NOT NULL,
+  `Name` VARCHAR(100) NOT NULL,
+  `Format` TINYINT NOT NULL DEFAULT 0,
+  `StartTime` INT(11) UNSIGNED NOT NULL DEFAULT 0,
+  `EndTime` INT(11) UNSIGNED NOT NULL DEFAULT 0,
+  `Resolution` INT(11) UNSIGNED NOT NULL DEFAULT 0,
+  `NumPoints` INT(11) NOT NULL DEFAULT 0,
+  `Data` MEDIUMBLOB NOT NULL,
+  PRIMARY KEY (`JobID`,`Name`,`Format`,`StartTime`),
+  KEY (`Format`,`NumPoints`),
+  KEY (`Format`,`Resolution`,`EndTime`),
+  FOREIGN KEY (`JobID`) REFERENCES `Jobs`(`JobID`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
 -- ------------------------------------------------------------------------------
 DROP TABLE IF EXISTS `JobCommands`;
 CREATE TABLE `JobCommands` (
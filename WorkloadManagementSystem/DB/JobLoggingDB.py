@@ -2,6 +2,8 @@
     The following methods are provided
 
     addLoggingRecord()
+    addLoggingRecords()
+    addLoggingRecordList()
     getJobLoggingInfo()
     getWMSTimeStamps()
 """
@@ -31,23 +33,11 @@ class JobLoggingDB( DB ):
     self.gLogger = gLogger
 
 #############################################################################
-  def addLoggingRecord( self,
-                        jobID,
-                        status = 'idem',
-                        minor = 'idem',
-                        application = 'idem',
-                        date = '',
-                        source = 'Unknown' ):
-    """ Add a new entry to the JobLoggingDB table. One, two or all the three status
-        components can be specified. Optionaly the time stamp of the status can
-        be provided in a form of a string in a format '%Y-%m-%d %H:%M:%S' or
-        as datetime.datetime object. If the time stamp is not provided the current
-        UTC time is used.
+  def __getDateAndTimeOrder( self, date ):
+    """ Get the UTC datetime of a logging record and its float time order,
+        the current time if the date is not given or not valid
     """
 
-    event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
-    self.gLogger.info( "Adding record for job " + str( jobID ) + ": '" + event + "' from " + source )
-
     if not date:
       # Make the UTC datetime string and float
       _date = Time.dateTime()
@@ -75,12 +65,88 @@ class JobLoggingDB( DB ):
         epoc = time.mktime( _date.timetuple() ) - MAGIC_EPOC_NUMBER
         time_order = round( epoc, 3 )
 
+    return _date, time_order
+
+#############################################################################
+  def addLoggingRecord( self,
+                        jobID,
+                        status = 'idem',
+                        minor = 'idem',
+                        application = 'idem',
+                        date = '',
+                        source = 'Unknown' ):
+    """ Add a new entry to the JobLoggingDB table. One, two or all the three status
+        components can be specified. Optionaly the time stamp of the status can
+        be provided in a form of a string in a format '%Y-%m-%d %H:%M:%S' or
+        as datetime.datetime object. If the time stamp is not provided the current
+        UTC time is used.
+    """
+
+    event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
+    self.gLogger.info( "Adding record for job " + str( jobID ) + ": '" + event + "' from " + source )
+
+    _date, time_order = self.__getDateAndTimeOrder( date )
+
     cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
           "StatusTime, StatusTimeOrder, StatusSource) VALUES (%d,'%s','%s','%s','%s',%f,'%s')" % \
            ( int( jobID ), status, minor, application, str( _date ), time_order, source )
 
     return self._update( cmd )
 
+#############################################################################
+  def addLoggingRecords( self,
+                         jobIDList,
+                         status = 'idem',
+                         minor = 'idem',
+                         application = 'idem',
+                         source = 'Unknown' ):
+    """ Add the same entry for several jobs at once, with the current UTC
+        time stamp, as for bulk submissions
+    """
+
+    if not jobIDList:
+      return S_OK()
+
+    event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
+    self.gLogger.info( "Adding record for %s jobs: '%s' from %s" % ( len( jobIDList ), event, source ) )
+
+    _date = Time.dateTime()
+    epoc = time.mktime( _date.timetuple() ) + _date.microsecond / 1000000. - MAGIC_EPOC_NUMBER
+    time_order = round( epoc, 3 )
+
+    values = [ "(%d,'%s','%s','%s','%s',%f,'%s')" % ( int( jobID ), status, minor, application,
+                                                       str( _date ), time_order, source ) for jobID in jobIDList ]
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES %s" % ', '.join( values )
+
+    return self._update( cmd )
+
+#############################################################################
+  def addLoggingRecordList( self, recordList ):
+    """ Add the entries of several jobs at once, each one given as a tuple
+        ( jobID, status, minor, application, date, source ) with the same
+        meaning as the arguments of addLoggingRecord
+    """
+
+    if not recordList:
+      return S_OK()
+
+    self.gLogger.info( "Adding %s logging records" % len( recordList ) )
+
+    values = []
+    for jobID, status, minor, application, date, source in recordList:
+      _date, time_order = self.__getDateAndTimeOrder( date )
+      result = self._escapeValues( [ status, minor, application, source ] )
+      if not result['OK']:
+        return result
+      e_status, e_minor, e_application, e_source = result['Value']
+      values.append( "(%d,%s,%s,%s,'%s',%f,%s)" % ( int( jobID ), e_status, e_minor, e_application,
+                                                    str( _date ), time_order, e_source ) )
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES %s" % ', '.join( values )
+
+    return self._update( cmd )
+
 #############################################################################
   def getJobLoggingInfo( self, jobID ):
     """ Returns a Status,MinorStatus,ApplicationStatus,StatusTime,StatusSource tuple
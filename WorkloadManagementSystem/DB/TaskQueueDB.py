@@ -3,11 +3,16 @@
 
 __RCSID__ = "$Id"
 
+import re
+import time
 import types
 import random
+import threading
 from DIRAC  import gConfig, gLogger, S_OK, S_ERROR
 from DIRAC.WorkloadManagementSystem.private.SharesCorrector import SharesCorrector
 from DIRAC.WorkloadManagementSystem.private.Queues import maxCPUSegments
+from DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex import TaskQueueMatchIndex
+from DIRAC.WorkloadManagementSystem.private.TaskQueueShares import TaskQueueShares
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.Core.Utilities import List
 from DIRAC.Core.Utilities.DictCache import DictCache
@@ -27,6 +32,8 @@ bannedJobMatchFields = ( 'Site', )
 strictRequireMatchFields = ( 'SubmitPool', 'Platform', 'PilotType', 'Tag' )
 mandatoryMatchFields = ( 'Setup', 'CPUTime' )
 priorityIgnoredFields = ( 'Sites', 'BannedSites' )
+#Escape sequences of MySQL that don't stand for the escaped character
+mysqlUnescapes = { '0' : '\0', 'n' : '\n', 'r' : '\r', 'Z' : '\x1a' }
 
 class TaskQueueDB( DB ):
 
@@ -42,6 +49,14 @@ class TaskQueueDB( DB ):
     self.__opsHelper = Operations()
     self.__ensureInsertionIsSingle = False
     self.__sharesCorrector = SharesCorrector( self.__opsHelper )
+    self.__matchIndex = None
+    self.__matchIndexLock = threading.Lock()
+    self.__matchIndexPeriods = ( 10, 600 )
+    self.__matchIndexRefreshed = 0
+    self.__matchIndexResynced = 0
+    self.__matchIndexDeferredTQs = set()
+    self.__tqShares = TaskQueueShares( TQ_MIN_SHARE, priorityIgnoredFields )
+    self.__tqSharesLock = threading.Lock()
     result = self.__initializeDB()
     if not result[ 'OK' ]:
       raise Exception( "Can't create tables: %s" % result[ 'Message' ] )
@@ -310,6 +325,9 @@ class TaskQueueDB( DB ):
         self.cleanOrphanedTaskQueues( connObj = connObj )
         return S_ERROR( "Can't insert values %s for field %s: %s" % ( str( values ), field, result[ 'Message' ] ) )
     self.log.info( "Created TQ %s" % tqId )
+    if self.__matchIndex:
+      self.__matchIndex.addTaskQueue( tqId, self.__unescapeDefinition( tqDefDict ) )
+    self.__tqShares.addTaskQueue( tqId, self.__unescapeDefinition( tqDefDict ), priority )
     return S_OK( tqId )
 
   def cleanOrphanedTaskQueues( self, connObj = False ):
@@ -325,6 +343,8 @@ class TaskQueueDB( DB ):
                              conn = connObj )
       if not result[ 'OK' ]:
         return result
+    #Reload the match index to forget the deleted task queues
+    self.__matchIndexResynced = 0
     return S_OK()
 
   def __setTaskQueueEnabled( self, tqId, enabled = True, connObj = False ):
@@ -416,6 +436,9 @@ class TaskQueueDB( DB ):
     result = self._update( "INSERT INTO tq_Jobs ( TQId, JobId, Priority, RealPriority ) VALUES ( %s, %s, %s, %f ) ON DUPLICATE KEY UPDATE TQId = %s, Priority = %s, RealPriority = %f" % ( tqId, jobId, jobPriority, hackedPriority, tqId, jobPriority, hackedPriority ), conn = connObj )
     if not result[ 'OK' ]:
       return result
+    #A job already in a task queue is taken out of it when the sums of the group are reloaded
+    if result[ 'Value' ] == 1:
+      self.__tqShares.addJob( tqId, hackedPriority )
     return S_OK()
 
   def __generateTQFindSQL( self, tqDefDict, skipDefinitionCheck = False, connObj = False ):
@@ -494,10 +517,15 @@ class TaskQueueDB( DB ):
     #Make a copy to avoid modification of original if escaping needs to be done
     tqMatchDict = dict( tqMatchDict )
     self.log.info( "Starting match for requirements", self.__strDict( tqMatchDict ) )
+    rawMatchDict = dict( tqMatchDict )
     retVal = self._checkMatchDefinition( tqMatchDict )
     if not retVal[ 'OK' ]:
       self.log.error( "TQ match request check failed", retVal[ 'Message' ] )
       return retVal
+    tqIdList = self.__getMatchCandidates( rawMatchDict )
+    if tqIdList is not None and not tqIdList:
+      self.log.info( "No TQ matches requirements" )
+      return S_OK( { 'matchFound' : False, 'tqMatch' : tqMatchDict } )
     retVal = self._getConnection()
     if not retVal[ 'OK' ]:
       return S_ERROR( "Can't connect to DB: %s" % retVal[ 'Message' ] )
@@ -511,14 +539,16 @@ class TaskQueueDB( DB ):
         retVal = self.matchAndGetTaskQueue( tqMatchDict,
                                             numQueuesToGet = 0,
                                             skipMatchDictDef = True,
-                                            connObj = connObj )
+                                            connObj = connObj,
+                                            tqIdList = tqIdList )
         preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % ( preJobSQL, tqMatchDict['JobID'] )
       else:
         retVal = self.matchAndGetTaskQueue( tqMatchDict,
                                             numQueuesToGet = numQueuesPerTry,
                                             skipMatchDictDef = True,
                                             negativeCond = negativeCond,
-                                            connObj = connObj )
+                                            connObj = connObj,
+                                            tqIdList = tqIdList )
       if not retVal[ 'OK' ]:
         return retVal
       tqList = retVal[ 'Value' ]
@@ -556,17 +586,130 @@ class TaskQueueDB( DB ):
     self.log.info( "Could not find a match after %s match retries" % self.__maxMatchRetry )
     return S_ERROR( "Could not find a match after %s match retries" % self.__maxMatchRetry )
 
+  def matchAndGetJobs( self, tqMatchDict, numJobs, maxProcessors = 0, numQueuesPerTry = 10, negativeCond = {} ):
+    """
+    Match up to numJobs jobs at once, taking them out of their task queues.
+    If maxProcessors is given, the processors required by the jobs taken
+    (the nProcessors tags of their task queues) don't add up to more than it
+    Returns S_OK( { 'matchFound' : bool, 'jobs' : [ { 'jobId', 'taskQueueId', 'processors' } ], 'tqMatch' } )
+    """
+    #Make a copy to avoid modification of original if escaping needs to be done
+    tqMatchDict = dict( tqMatchDict )
+    self.log.info( "Starting match of %s jobs for requirements" % numJobs, self.__strDict( tqMatchDict ) )
+    rawMatchDict = dict( tqMatchDict )
+    retVal = self._checkMatchDefinition( tqMatchDict )
+    if not retVal[ 'OK' ]:
+      self.log.error( "TQ match request check failed", retVal[ 'Message' ] )
+      return retVal
+    matchedJobs = []
+    tqIdList = self.__getMatchCandidates( rawMatchDict )
+    if tqIdList is not None and not tqIdList:
+      self.log.info( "No TQ matches requirements" )
+      return S_OK( { 'matchFound' : False, 'jobs' : matchedJobs, 'tqMatch' : tqMatchDict } )
+    retVal = self._getConnection()
+    if not retVal[ 'OK' ]:
+      return S_ERROR( "Can't connect to DB: %s" % retVal[ 'Message' ] )
+    connObj = retVal[ 'Value' ]
+    jobsSQL = "SELECT `tq_Jobs`.JobId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT %s"
+    freeProcessors = maxProcessors
+    exhaustedTQs = set()
+    for _ in range( self.__maxMatchRetry ):
+      retVal = self.matchAndGetTaskQueue( tqMatchDict,
+                                          numQueuesToGet = numQueuesPerTry,
+                                          skipMatchDictDef = True,
+                                          negativeCond = negativeCond,
+                                          connObj = connObj,
+                                          tqIdList = tqIdList )
+      if not retVal[ 'OK' ]:
+        return retVal
+      tqList = [ tqTuple for tqTuple in retVal[ 'Value' ] if tqTuple[0] not in exhaustedTQs ]
+      if not tqList:
+        break
+      retVal = self.__getTQProcessors( [ tqTuple[0] for tqTuple in tqList ], connObj = connObj )
+      if not retVal[ 'OK' ]:
+        return retVal
+      tqProcessors = retVal[ 'Value' ]
+      jobsInPass = len( matchedJobs )
+      for tqId, tqOwnerDN, tqOwnerGroup in tqList:
+        jobsToGet = numJobs - len( matchedJobs )
+        processors = tqProcessors[ tqId ]
+        if maxProcessors:
+          #Whole node jobs need all the processors
+          if processors is None:
+            processors = maxProcessors
+          jobsToGet = min( jobsToGet, freeProcessors // processors )
+        if jobsToGet < 1:
+          continue
+        self.log.info( "Trying to extract %s jobs from TQ %s" % ( jobsToGet, tqId ) )
+        retVal = self._query( jobsSQL % ( tqId, 2 * jobsToGet ), conn = connObj )
+        if not retVal[ 'OK' ]:
+          return S_ERROR( "Can't retrieve jobs for matching: %s" % retVal[ 'Message' ] )
+        jobIds = [ row[0] for row in retVal[ 'Value' ] ]
+        if len( jobIds ) < 2 * jobsToGet:
+          exhaustedTQs.add( tqId )
+        if not jobIds:
+          gLogger.info( "Task queue %s seems to be empty, triggering a cleaning" % tqId )
+          self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
+        for jobId in jobIds:
+          if jobsToGet < 1:
+            break
+          retVal = self.deleteJob( jobId, connObj = connObj )
+          if not retVal[ 'OK' ]:
+            self.log.error( "Could not take job", " %s out from the TQ %s: %s" % ( jobId, tqId, retVal[ 'Message' ] ) )
+            continue
+          #Another match may have taken it meanwhile
+          if retVal[ 'Value' ] == True:
+            self.log.info( "Extracted job %s from TQ %s" % ( jobId, tqId ) )
+            matchedJobs.append( { 'jobId' : jobId, 'taskQueueId' : tqId, 'processors' : processors or 1 } )
+            freeProcessors -= processors or 1
+            jobsToGet -= 1
+      if len( matchedJobs ) >= numJobs or ( maxProcessors and freeProcessors < 1 ):
+        break
+      if len( matchedJobs ) == jobsInPass and len( tqList ) < numQueuesPerTry:
+        break
+    self.log.info( "Matched %s jobs" % len( matchedJobs ) )
+    return S_OK( { 'matchFound' : len( matchedJobs ) > 0, 'jobs' : matchedJobs, 'tqMatch' : tqMatchDict } )
+
+  def __getTQProcessors( self, tqIdList, connObj = False ):
+    """
+    Get the processors required by the jobs of the task queues, from their
+    nProcessors tags. None for the ones requiring a whole node
+    """
+    tqProcessors = dict( [ ( tqId, 1 ) for tqId in tqIdList ] )
+    sqlCmd = "SELECT TQId, Value FROM `tq_TQToTags` WHERE TQId IN ( %s )" % ", ".join( [ str( tqId ) for tqId in tqIdList ] )
+    retVal = self._query( sqlCmd, conn = connObj )
+    if not retVal[ 'OK' ]:
+      return S_ERROR( "Can't retrieve the tags of the task queues: %s" % retVal[ 'Message' ] )
+    for tqId, tag in retVal[ 'Value' ]:
+      if tqProcessors[ tqId ] is None:
+        continue
+      if tag == 'WholeNode':
+        tqProcessors[ tqId ] = None
+        continue
+      match = re.match( r'^(\d+)Processors$', tag )
+      if match:
+        tqProcessors[ tqId ] = max( tqProcessors[ tqId ], int( match.group( 1 ) ) )
+    return S_OK( tqProcessors )
+
   def matchAndGetTaskQueue( self, tqMatchDict, numQueuesToGet = 1, skipMatchDictDef = False,
-                            negativeCond = {}, connObj = False ):
+                            negativeCond = {}, connObj = False, tqIdList = None ):
     """ Get a queue that matches the requirements
+
+        If tqIdList is given, only those task queues are considered
     """
     #Make a copy to avoid modification of original if escaping needs to be done
     tqMatchDict = dict( tqMatchDict )
     if not skipMatchDictDef:
+      rawMatchDict = dict( tqMatchDict )
       retVal = self._checkMatchDefinition( tqMatchDict )
       if not retVal[ 'OK' ]:
         return retVal
-    retVal = self.__generateTQMatchSQL( tqMatchDict, numQueuesToGet = numQueuesToGet, negativeCond = negativeCond )
+      if tqIdList is None:
+        tqIdList = self.__getMatchCandidates( rawMatchDict )
+    if tqIdList is not None and not tqIdList:
+      return S_OK( [] )
+    retVal = self.__generateTQMatchSQL( tqMatchDict, numQueuesToGet = numQueuesToGet, negativeCond = negativeCond,
+                                        tqIdList = tqIdList )
     if not retVal[ 'OK' ]:
       return retVal
     matchSQL = retVal[ 'Value' ]
@@ -575,6 +718,121 @@ class TaskQueueDB( DB ):
       return retVal
     return S_OK( [ ( row[0], row[1], row[2] ) for row in retVal[ 'Value' ] ] )
 
+  def enableMatchIndex( self, refreshPeriod = 10, resyncPeriod = 600 ):
+    """
+    Keep the task queue definitions in memory to find the candidates of a match
+    before going to the DB. The task queues created by other processes are
+    loaded every refreshPeriod seconds, so they can't be matched here for up to
+    that long after their creation. The whole index is reloaded every
+    resyncPeriod seconds to forget the ones deleted by other processes
+    """
+    self.__matchIndexPeriods = ( refreshPeriod, resyncPeriod )
+    self.__matchIndex = TaskQueueMatchIndex( self.__isJobSharingGroup )
+    self.__matchIndexRefreshed = 0
+    self.__matchIndexResynced = 0
+    return self.__refreshMatchIndex()
+
+  def getMatchIndexStats( self ):
+    """
+    Get the number of task queues in the match index and of candidates found per lookup
+    """
+    if not self.__matchIndex:
+      return S_ERROR( "The match index is not enabled" )
+    return S_OK( self.__matchIndex.getStats() )
+
+  def __isJobSharingGroup( self, group ):
+    return Properties.JOB_SHARING in CS.getPropertiesForGroup( group )
+
+  def __unescapeValue( self, value ):
+    """
+    Get back a value as it was before going through _escapeString
+    """
+    if not isinstance( value, basestring ) or len( value ) < 2 or value[0] != '"' or value[-1] != '"':
+      return value
+    return re.sub( r'\\(.)', lambda match: mysqlUnescapes.get( match.group( 1 ), match.group( 1 ) ), value[1:-1] )
+
+  def __unescapeDefinition( self, tqDefDict ):
+    tqDef = {}
+    for field in tqDefDict:
+      value = tqDefDict[ field ]
+      if isinstance( value, ( list, tuple ) ):
+        tqDef[ field ] = [ self.__unescapeValue( v ) for v in value ]
+      else:
+        tqDef[ field ] = self.__unescapeValue( value )
+    return tqDef
+
+  def __loadTaskQueueDefinitions( self, fromTQId ):
+    """
+    Get the definitions and the enabled flag of the task queues with an id higher than fromTQId
+    """
+    sqlCmd = "SELECT TQId, %s, Enabled FROM `tq_TaskQueues` WHERE TQId > %d" % ( ", ".join( singleValueDefFields ),
+                                                                                 fromTQId )
+    result = self._query( sqlCmd )
+    if not result[ 'OK' ]:
+      return result
+    tqDefs = {}
+    tqEnabled = {}
+    for record in result[ 'Value' ]:
+      tqDefs[ record[0] ] = dict( zip( singleValueDefFields, record[1:-1] ) )
+      tqEnabled[ record[0] ] = record[-1]
+    for field in multiValueDefFields:
+      result = self._query( "SELECT TQId, Value FROM `tq_TQTo%s` WHERE TQId > %d" % ( field, fromTQId ) )
+      if not result[ 'OK' ]:
+        return result
+      for tqId, value in result[ 'Value' ]:
+        if tqId in tqDefs:
+          tqDefs[ tqId ].setdefault( field, [] ).append( value )
+    return S_OK( ( tqDefs, tqEnabled ) )
+
+  def __refreshMatchIndex( self ):
+    """
+    Load the task queues created since the last refresh, or all of them if it's time to resync
+    """
+    now = time.time()
+    refreshPeriod, resyncPeriod = self.__matchIndexPeriods
+    resync = now - self.__matchIndexResynced >= resyncPeriod
+    if not resync and now - self.__matchIndexRefreshed < refreshPeriod:
+      return S_OK()
+    #Only one thread loads, the others use the index as it is meanwhile
+    if not self.__matchIndexLock.acquire( False ):
+      return S_OK()
+    try:
+      lastTQId = self.__matchIndex.getLastTQId()
+      result = self.__loadTaskQueueDefinitions( 0 if resync else lastTQId )
+      if not result[ 'OK' ]:
+        self.log.error( "Cannot load the task queues in the match index", result[ 'Message' ] )
+        return result
+      tqDefs, tqEnabled = result[ 'Value' ]
+      #Task queues are disabled until all their values are inserted. The new ones
+      #still disabled are left for the next load
+      deferredTQs = set( [ tqId for tqId in tqDefs if tqId > lastTQId and tqEnabled[ tqId ] < 1 and
+                           tqId not in self.__matchIndexDeferredTQs ] )
+      for tqId in deferredTQs:
+        tqDefs.pop( tqId )
+      if deferredTQs:
+        newLastTQId = min( deferredTQs ) - 1
+      else:
+        newLastTQId = max( [ lastTQId ] + list( tqDefs ) )
+      self.__matchIndexDeferredTQs = deferredTQs
+      if resync:
+        self.__matchIndex.reset( tqDefs, newLastTQId )
+        self.__matchIndexResynced = now
+      else:
+        self.__matchIndex.update( tqDefs, newLastTQId )
+      self.__matchIndexRefreshed = now
+    finally:
+      self.__matchIndexLock.release()
+    return S_OK()
+
+  def __getMatchCandidates( self, rawMatchDict ):
+    """
+    Get the ids of the task queues that can match, None if the match index is not enabled
+    """
+    if not self.__matchIndex:
+      return None
+    self.__refreshMatchIndex()
+    return self.__matchIndex.getCandidates( rawMatchDict )
+
   def __generateSQLSubCond( self, sqlString, value, boolOp = 'OR' ):
     if type( value ) not in ( types.ListType, types.TupleType ):
       return sqlString % str( value ).strip()
@@ -638,12 +896,15 @@ class TaskQueueDB( DB ):
       return tableN, "`%s`" % fullTableName,
     return  sqlTables[ fullTableName ], "`%s`" % fullTableName
 
-  def __generateTQMatchSQL( self, tqMatchDict, numQueuesToGet = 1, negativeCond = {} ):
+  def __generateTQMatchSQL( self, tqMatchDict, numQueuesToGet = 1, negativeCond = {}, tqIdList = None ):
     """
     Generate the SQL needed to match a task queue
     """
     #Only enabled TQs
     sqlCondList = []
+    #Only the candidates found by the match index
+    if tqIdList is not None:
+      sqlCondList.append( "tq.TQId IN ( %s )" % ", ".join( [ str( tqId ) for tqId in sorted( tqIdList ) ] ) )
     sqlTables = { "tq_TaskQueues" : "tq" }
     #If OwnerDN and OwnerGroup are defined only use those combinations that make sense
     if 'OwnerDN' in tqMatchDict and 'OwnerGroup' in tqMatchDict:
@@ -775,13 +1036,13 @@ class TaskQueueDB( DB ):
       if not retVal[ 'OK' ]:
         return S_ERROR( "Can't delete job: %s" % retVal[ 'Message' ] )
       connObj = retVal[ 'Value' ]
-    retVal = self._query( "SELECT t.TQId, t.OwnerDN, t.OwnerGroup FROM `tq_TaskQueues` t, `tq_Jobs` j WHERE j.JobId = %s AND t.TQId = j.TQId" % jobId, conn = connObj )
+    retVal = self._query( "SELECT t.TQId, t.OwnerDN, t.OwnerGroup, j.RealPriority FROM `tq_TaskQueues` t, `tq_Jobs` j WHERE j.JobId = %s AND t.TQId = j.TQId" % jobId, conn = connObj )
     if not retVal[ 'OK' ]:
       return S_ERROR( "Could not get job from task queue %s: %s" % ( jobId, retVal[ 'Message' ] ) )
     data = retVal[ 'Value' ]
     if not data:
       return S_OK( False )
-    tqId, tqOwnerDN, tqOwnerGroup = data[0]
+    tqId, tqOwnerDN, tqOwnerGroup, realPriority = data[0]
     self.log.info( "Deleting job %s" % jobId )
     retVal = self._update( "DELETE FROM `tq_Jobs` WHERE JobId = %s" % jobId, conn = connObj )
     if not retVal[ 'OK' ]:
@@ -789,6 +1050,7 @@ class TaskQueueDB( DB ):
     if retVal['Value'] == 0:
       #No job deleted
       return S_OK( False )
+    self.__tqShares.removeJob( tqId, realPriority )
     #Always return S_OK() because job has already been taken out from the TQ
     self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
     return S_OK( True )
@@ -887,6 +1149,9 @@ class TaskQueueDB( DB ):
         retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % ( mvField, tqId ), conn = connObj )
         if not retVal[ 'OK' ]:
           return retVal
+      if self.__matchIndex:
+        self.__matchIndex.removeTaskQueue( tqId )
+      self.__tqShares.removeTaskQueue( tqId )
       self.recalculateTQSharesForEntity( tqOwnerDN, tqOwnerGroup, connObj = connObj )
       self.log.info( "Deleted empty and enabled TQ %s" % tqId )
       return S_OK( True )
@@ -923,6 +1188,9 @@ class TaskQueueDB( DB ):
       retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % ( field, tqId ), conn = connObj )
       if not retVal[ 'OK' ]:
         return retVal
+    if self.__matchIndex:
+      self.__matchIndex.removeTaskQueue( tqId )
+    self.__tqShares.removeTaskQueue( tqId )
     if delTQ > 0:
       self.recalculateTQSharesForEntity( tqOwnerDN, tqOwnerGroup, connObj = connObj )
       return S_OK( True )
@@ -1035,21 +1303,78 @@ class TaskQueueDB( DB ):
       self.__sharesCorrector.update()
     self.__updateGlobalShares()
     self.log.info( "Recalculating shares for all TQs" )
-    retVal = self._getConnection()
-    if not retVal[ 'OK' ]:
-      return S_ERROR( "Can't insert job: %s" % retVal[ 'Message' ] )
-    result = self._query( "SELECT DISTINCT( OwnerGroup ) FROM `tq_TaskQueues`" )
+    #Reconcile the running sums of the job priorities with the DB
+    result = self.__loadTQShares()
     if not result[ 'OK' ]:
       return result
-    for group in [ r[0] for r in result[ 'Value' ] ]:
-      self.recalculateTQSharesForEntity( "all", group )
+    for group in self.__tqShares.getGroups():
+      self.recalculateTQSharesForEntity( "all", group, reloadShares = False )
+    return S_OK()
+
+  def getTQSharesStats( self ):
+    """
+    Get the number of task queues and owners known by the shares, and of updates done
+    """
+    stats = self.__tqShares.getStats()
+    stats[ 'Loaded' ] = self.__tqShares.getLoadTime()
+    return S_OK( stats )
+
+  def __loadTQShares( self, ownerGroup = None, connObj = False ):
+    """
+    Load the number of jobs, the sum of their priorities and the priority
+    written for all the task queues, or the ones of a group
+    """
+    groupCond = ""
+    if ownerGroup is not None:
+      result = self._escapeString( ownerGroup )
+      if not result[ 'OK' ]:
+        return result
+      groupCond = "WHERE t.OwnerGroup = %s " % result[ 'Value' ]
+    self.__tqSharesLock.acquire()
+    try:
+      sqlCmd = "SELECT t.TQId, %s, t.Priority, COUNT( j.JobId ), SUM( j.RealPriority ) " % \
+               ", ".join( [ "t.%s" % field for field in singleValueDefFields ] )
+      sqlCmd += "FROM `tq_TaskQueues` t LEFT JOIN `tq_Jobs` j ON t.TQId = j.TQId %sGROUP BY t.TQId" % groupCond
+      result = self._query( sqlCmd, conn = connObj )
+      if not result[ 'OK' ]:
+        self.log.error( "Cannot load the shares of the task queues", result[ 'Message' ] )
+        return result
+      tqData = {}
+      for record in result[ 'Value' ]:
+        tqDef = dict( zip( singleValueDefFields, record[1:-3] ) )
+        tqData[ record[0] ] = ( tqDef, record[-2], record[-1], record[-3] )
+      for field in multiValueDefFields:
+        if field in priorityIgnoredFields:
+          continue
+        sqlCmd = "SELECT v.TQId, v.Value FROM `tq_TQTo%s` v" % field
+        if groupCond:
+          sqlCmd += ", `tq_TaskQueues` t %sAND t.TQId = v.TQId" % groupCond
+        result = self._query( sqlCmd, conn = connObj )
+        if not result[ 'OK' ]:
+          self.log.error( "Cannot load the shares of the task queues", result[ 'Message' ] )
+          return result
+        for tqId, value in result[ 'Value' ]:
+          if tqId in tqData:
+            tqData[ tqId ][0].setdefault( field, [] ).append( value )
+      self.__tqShares.reset( tqData, ownerGroup )
+    finally:
+      self.__tqSharesLock.release()
     return S_OK()
 
-  def recalculateTQSharesForEntity( self, userDN, userGroup, connObj = False ):
+  def recalculateTQSharesForEntity( self, userDN, userGroup, connObj = False, reloadShares = True ):
     """
     Recalculate the shares for a userDN/userGroup combo
     """
+    userDN = self.__unescapeValue( userDN )
+    userGroup = self.__unescapeValue( userGroup )
     self.log.info( "Recalculating shares for %s@%s TQs" % ( userDN, userGroup ) )
+    #The priorities are calculated from the running sums. Other processes change the jobs
+    #of the group too, its sums are reconciled with the DB when they are too old
+    reconciliationPeriod = self.__getCSOption( "SharesReconciliationPeriod", 60 )
+    if reloadShares and time.time() - self.__tqShares.getLoadTime( userGroup ) > reconciliationPeriod:
+      result = self.__loadTQShares( userGroup, connObj = connObj )
+      if not result[ 'OK' ]:
+        return result
     if userGroup in self.__groupShares:
       share = self.__groupShares[ userGroup ]
     else:
@@ -1058,24 +1383,18 @@ class TaskQueueDB( DB ):
       #If group has JobSharing just set prio for that entry, userDN is irrelevant
       return self.__setPrioritiesForEntity( userDN, userGroup, share, connObj = connObj )
 
-    selSQL = "SELECT OwnerDN, COUNT(OwnerDN) FROM `tq_TaskQueues` WHERE OwnerGroup='%s' GROUP BY OwnerDN" % ( userGroup )
-    result = self._query( selSQL, conn = connObj )
-    if not result[ 'OK' ]:
-      return result
     #Get owners in this group and the amount of times they appear
-    data = [ ( r[0], r[1] ) for r in result[ 'Value' ] if r ]
-    numOwners = len( data )
+    owners = self.__tqShares.getOwners( userGroup )
+    numOwners = len( owners )
     #If there are no owners do now
     if numOwners == 0:
       return S_OK()
     #Split the share amongst the number of owners
     share /= numOwners
-    entitiesShares = dict( [ ( row[0], share ) for row in data ] )
+    entitiesShares = dict( [ ( owner, share ) for owner in owners ] )
     #If corrector is enabled let it work it's magic
     if self.isSharesCorrectionEnabled():
       entitiesShares = self.__sharesCorrector.correctShares( entitiesShares, group = userGroup )
-    #Keep updating
-    owners = dict( data )
     #IF the user is already known and has more than 1 tq, the rest of the users don't need to be modified
     #(The number of owners didn't change)
     if userDN in owners and owners[ userDN ] > 1:
@@ -1085,92 +1404,31 @@ class TaskQueueDB( DB ):
       self.__setPrioritiesForEntity( userDN, userGroup, entitiesShares[ userDN ], connObj = connObj )
     return S_OK()
 
-  def __setPrioritiesForEntity( self, userDN, userGroup, share, connObj = False, consolidationFunc = "AVG" ):
+  def __setPrioritiesForEntity( self, userDN, userGroup, share, connObj = False ):
     """
-    Set the priority for a userDN/userGroup combo given a splitted share
+    Set the priority for a userDN/userGroup combo given a splitted share.
+    Only the priorities that changed are written
     """
     self.log.info( "Setting priorities to %s@%s TQs" % ( userDN, userGroup ) )
-    tqCond = [ "t.OwnerGroup='%s'" % userGroup ]
     allowBgTQs = gConfig.getValue( "/Registry/Groups/%s/AllowBackgroundTQs" % userGroup, False )
-    if Properties.JOB_SHARING not in CS.getPropertiesForGroup( userGroup ):
-      res = self._escapeString( userDN )
-      if not res['OK']:
-        return res
-      userDN = res['Value']
-      tqCond.append( "t.OwnerDN= %s " % userDN )
-    tqCond.append( "t.TQId = j.TQId" )
-    if consolidationFunc == 'AVG':
-      selectSQL = "SELECT j.TQId, SUM( j.RealPriority )/COUNT(j.RealPriority) FROM `tq_TaskQueues` t, `tq_Jobs` j WHERE "
-    elif consolidationFunc == 'SUM':
-      selectSQL = "SELECT j.TQId, SUM( j.RealPriority ) FROM `tq_TaskQueues` t, `tq_Jobs` j WHERE "
-    else:
-      return S_ERROR( "Unknown consolidation func %s for setting priorities" % consolidationFunc )
-    selectSQL += " AND ".join( tqCond )
-    selectSQL += " GROUP BY t.TQId"
-    result = self._query( selectSQL, conn = connObj )
-    if not result[ 'OK' ]:
-      return result
-
-    tqDict = dict( result[ 'Value' ] )
+    if Properties.JOB_SHARING in CS.getPropertiesForGroup( userGroup ):
+      userDN = None
+    tqDict = self.__tqShares.calculatePriorities( userGroup, share, ownerDN = userDN, allowBackground = allowBgTQs )
     if len( tqDict ) == 0:
       return S_OK()
-    #Calculate Sum of priorities
-    totalPrio = 0
-    for k in tqDict:
-      if tqDict[k] > 0.1 or not allowBgTQs:
-        totalPrio += tqDict[ k ]
-    #Update prio for each TQ
-    for tqId in tqDict:
-      if tqDict[ tqId ] > 0.1 or not allowBgTQs:
-        prio = ( share / totalPrio ) * tqDict[ tqId ]
-      else:
-        prio = TQ_MIN_SHARE
-      prio = max( prio, TQ_MIN_SHARE )
-      tqDict[ tqId ] = prio
-
-    #Generate groups of TQs that will have the same prio=sum(prios) maomenos
-    result = self.retrieveTaskQueues( list( tqDict ) )
-    if not result[ 'OK' ]:
-      return result
-    allTQsData = result[ 'Value' ]
-    tqGroups = {}
-    for tqid in allTQsData:
-      tqData = allTQsData[ tqid ]
-      for field in ( 'Jobs', 'Priority' ) + priorityIgnoredFields:
-        if field in tqData:
-          tqData.pop( field )
-      tqHash = []
-      for f in sorted( tqData ):
-        tqHash.append( "%s:%s" % ( f, tqData[ f ] ) )
-      tqHash = "|".join( tqHash )
-      if tqHash not in tqGroups:
-        tqGroups[ tqHash ] = []
-      tqGroups[ tqHash ].append( tqid )
-    tqGroups = [ tqGroups[ td ] for td in tqGroups ]
-
-    #Do the grouping
-    for tqGroup in tqGroups:
-      totalPrio = 0
-      if len( tqGroup ) < 2:
-        continue
-      for tqid in tqGroup:
-        totalPrio += tqDict[ tqid ]
-      for tqid in tqGroup:
-        tqDict[ tqid ] = totalPrio
 
     #Group by priorities
-    prioDict = {}
-    for tqId in tqDict:
-      prio = tqDict[ tqId ]
-      if prio not in prioDict:
-        prioDict[ prio ] = []
-      prioDict[ prio ].append( tqId )
+    prioDict = self.__tqShares.getChangedPriorities( tqDict )
 
     #Execute updates
     for prio in prioDict:
       tqList = ", ".join( [ str( tqId ) for tqId in prioDict[ prio ] ] )
       updateSQL = "UPDATE `tq_TaskQueues` SET Priority=%.4f WHERE TQId in ( %s )" % ( prio, tqList )
-      self._update( updateSQL, conn = connObj )
+      result = self._update( updateSQL, conn = connObj )
+      if not result[ 'OK' ]:
+        self.log.error( "Cannot set the priority of the task queues", result[ 'Message' ] )
+        continue
+      self.__tqShares.setPriority( prioDict[ prio ], prio )
     return S_OK()
 
   def getGroupShares( self ):
@@ -30,6 +30,17 @@ from DIRAC.ConfigurationSystem.Client.PathFinder        import getSystemInstance
 from DIRAC.Core.Utilities.ProcessMonitor                import ProcessMonitor
 from DIRAC.Core.Utilities.TimeLeft.TimeLeft             import TimeLeft
 
+def getCheckingTimes( section ):
+  """ Get the CheckingTime and the MaxCheckingTime of the Watchdog, the latter being the
+      longest time between two of its heart beats
+
+      :param str section: JobWrapper section of the WorkloadManagement system
+  """
+  checkingTime = max( gConfig.getValue( section + '/CheckingTime', 30 * 60 ),
+                      gConfig.getValue( section + '/MinCheckingTime', 20 * 60 ) )
+  maxCheckingTime = max( gConfig.getValue( section + '/MaxCheckingTime', 2 * checkingTime ), checkingTime )
+  return checkingTime, maxCheckingTime
+
 class Watchdog( object ):
 
   #############################################################################
@@ -77,6 +88,13 @@ class Watchdog( object ):
     self.nullCPULimit = 5  # After 5 sample times return null CPU consumption kill job
     self.checkCount = 0
     self.nullCPUCount = 0
+    # Adaptive schedule of the checks
+    self.initialCheckingTime = 5 * 60
+    self.maxCheckingTime = 2 * self.checkingTime
+    self.checkingTimeFactor = 2
+    self.stableChangeLimit = 10  # %age change of the job memory between stable checks
+    self.currentCheckingTime = self.initialCheckingTime
+    self.nextCheckTime = 0
 
     self.grossTimeLeftLimit = 10 * self.checkingTime
     self.timeLeftUtil = TimeLeft()
@@ -127,7 +145,14 @@ class Watchdog( object ):
     self.nullCPULimit = gConfig.getValue( self.section + '/NullCPUCountLimit', 5 )  # After 5 sample times return null CPU consumption kill job
     if self.checkingTime < self.minCheckingTime:
       self.log.info( 'Requested CheckingTime of %s setting to %s seconds (minimum)' % ( self.checkingTime, self.minCheckingTime ) )
-      self.checkingTime = self.minCheckingTime
+    # The checks start every InitialCheckingTime, the period grows by CheckingTimeFactor after each check
+    # up to CheckingTime, and up to MaxCheckingTime while the job is stable. The StalledJobAgent
+    # derives the Stalled threshold from the same MaxCheckingTime
+    self.checkingTime, self.maxCheckingTime = getCheckingTimes( self.section )
+    self.initialCheckingTime = min( gConfig.getValue( self.section + '/InitialCheckingTime', 5 * 60 ), self.checkingTime )
+    self.checkingTimeFactor = max( gConfig.getValue( self.section + '/CheckingTimeFactor', 2 ), 1 )
+    self.stableChangeLimit = gConfig.getValue( self.section + '/StableChangeLimit', 10 )  # %age
+    self.currentCheckingTime = self.initialCheckingTime
 
     # The time left is returned in seconds @ 250 SI00 = 1 HS06,
     # the self.checkingTime and self.pollingTime are in seconds,
@@ -187,12 +212,13 @@ class Watchdog( object ):
 
     # Note: need to poll regularly to see if the thread is alive
     #      but only perform checks with a certain frequency
-    if ( time.time() - self.initialValues['StartTime'] ) > self.checkingTime * self.checkCount:
+    if time.time() >= self.nextCheckTime:
       self.checkCount += 1
       result = self._performChecks()
       if not result['OK']:
         self.log.warn( 'Problem during recent checks' )
         self.log.warn( result['Message'] )
+      self.nextCheckTime = time.time() + self.__getCheckingTime()
       return S_OK()
     else:
       # self.log.debug('Application thread is alive: checking count is %s' %(self.checkCount))
@@ -232,7 +258,9 @@ class Watchdog( object ):
         self.parameters['MemoryUsed'] = []
       self.parameters['MemoryUsed'].append( memoryUsed )
 
-    result = self.processMonitor.getMemoryConsumed( self.wrapperPID )
+    # A single sample of the process tree for the memory and the CPU
+    result = self.processMonitor.getResourceConsumed( self.wrapperPID )
+    resources = result['Value'] if result['OK'] else {}
     if result['OK']:
       vsize = result['Value']['Vsize']/1024.
       rss = result['Value']['RSS']/1024.
@@ -255,7 +283,7 @@ class Watchdog( object ):
       self.parameters['DiskSpace'].append( result['Value'] )
       heartBeatDict['AvailableDiskSpace'] = result['Value']
     
-    cpu = self.__getCPU()
+    cpu = self.__getCPU( resources.get( 'CPU' ) )
     if not cpu['OK']:
       msg += 'CPU: ERROR '
       hmsCPU = 0
@@ -333,15 +361,17 @@ class Watchdog( object ):
     return S_OK( 'Watchdog checking cycle complete' )
 
   #############################################################################
-  def __getCPU( self ):
+  def __getCPU( self, cpuTime = None ):
     """Uses os.times() to get CPU time and returns HH:MM:SS after conversion.
+       The CPU time already sampled can be given.
     """
     try:
-      cpuTime = self.processMonitor.getCPUConsumed( self.wrapperPID )
-      if not cpuTime['OK']:
-        self.log.warn( 'Problem while checking consumed CPU' )
-        return cpuTime
-      cpuTime = cpuTime['Value']
+      if cpuTime is None:
+        cpuTime = self.processMonitor.getCPUConsumed( self.wrapperPID )
+        if not cpuTime['OK']:
+          self.log.warn( 'Problem while checking consumed CPU' )
+          return cpuTime
+        cpuTime = cpuTime['Value']
       if cpuTime:
         self.log.verbose( "Raw CPU time consumed (s) = %s" % ( cpuTime ) )
         return self.__getCPUHMS( cpuTime )
@@ -364,6 +394,34 @@ class Watchdog( object ):
     self.log.verbose( 'Human readable CPU time is: %s' % humanTime )
     return S_OK( humanTime )
 
+  #############################################################################
+  def __getCheckingTime( self ):
+    """ Returns the time to wait until the next checks, growing from InitialCheckingTime
+        up to CheckingTime, and beyond up to MaxCheckingTime while the job is stable.
+    """
+    if self.littleTimeLeft:
+      limit = self.checkingTime
+    elif self.__isJobStable():
+      limit = self.maxCheckingTime
+    else:
+      limit = self.checkingTime
+    self.currentCheckingTime = min( self.currentCheckingTime * self.checkingTimeFactor, limit )
+    self.log.verbose( 'Next checks in %d seconds' % self.currentCheckingTime )
+    return self.currentCheckingTime
+
+  #############################################################################
+  def __isJobStable( self ):
+    """ The job is stable when its memory changed by less than StableChangeLimit
+        percent between the last two checks.
+    """
+    for name in ( 'Vsize', 'RSS' ):
+      values = self.parameters.get( name, [] )
+      if len( values ) < 2:
+        return False
+      if abs( values[-1] - values[-2] ) > self.stableChangeLimit / 100. * max( values[-2], 1. ):
+        return False
+    return True
+
   #############################################################################
   def __interpretControlSignal( self, signalDict ):
     """This method is called whenever a signal is sent via the result of
@@ -473,7 +531,13 @@ class Watchdog( object ):
                                                                                             self.sampleCPUTime ) )
       return S_OK()
 
-    intervals = max( 1, int( self.sampleCPUTime / self.checkingTime ) )
+    # The checks are not evenly spaced, the snapshot compared is the last one
+    # taken at least CPUSampleTime (less a polling period) before the last one
+    wallClockTimes = self.parameters['WallClockTime']
+    intervals = 1
+    while intervals < len( wallClockTimes ) - 1 and \
+          wallClockTimes[-1] - wallClockTimes[-1 - intervals] < self.sampleCPUTime - self.pollingTime:
+      intervals += 1
     if len( self.parameters['CPUConsumed'] ) < intervals + 1:
       self.log.info( "Not enough snapshots to calculate, there are %s and we need %s" % ( len( self.parameters['CPUConsumed'] ),
                                                                                           intervals + 1 ) )
@@ -644,7 +708,9 @@ class Watchdog( object ):
     self.__getWallClockTime()
     self.parameters['WallClockTime'] = []
 
-    cpuConsumed = self.__getCPU()
+    result = self.processMonitor.getResourceConsumed( self.wrapperPID )
+    resources = result['Value'] if result['OK'] else {}
+    cpuConsumed = self.__getCPU( resources.get( 'CPU' ) )
     if not cpuConsumed['OK']:
       self.log.warn( "Could not establish CPU consumed, setting to 0.0" )
       cpuConsumed = 0.0
@@ -674,13 +740,12 @@ class Watchdog( object ):
     self.initialValues['MemoryUsed'] = memUsed
     self.parameters['MemoryUsed'] = []
     
-    result = self.processMonitor.getMemoryConsumed( self.wrapperPID )
-    self.log.verbose( 'Job Memory: %s' % ( result['Value'] ) )
-    if not result['OK']:
+    self.log.verbose( 'Job Memory: %s' % ( resources ) )
+    if not resources:
       self.log.warn( 'Could not get job memory usage' )
 
-    self.initialValues['Vsize'] = result['Value']['Vsize']/1024.
-    self.initialValues['RSS'] = result['Value']['RSS']/1024.
+    self.initialValues['Vsize'] = resources.get( 'Vsize', 0. )/1024.
+    self.initialValues['RSS'] = resources.get( 'RSS', 0. )/1024.
     self.parameters['Vsize'] = []
     self.parameters['RSS'] = []
 
@@ -66,24 +66,29 @@ class WatchdogLinux( Watchdog ):
   def getLoadAverage(self):
     """Obtains the load average.
     """
-    comm = '/bin/cat /proc/loadavg'
-    loadAvgDict = shellCall( 5, comm )
-    if loadAvgDict['OK']:
-      return S_OK( float( string.split( loadAvgDict['Value'][1] )[0] ) )
-    else:
+    try:
+      with open( '/proc/loadavg', 'r' ) as loadAvgFile:
+        return S_OK( float( loadAvgFile.read().split()[0] ) )
+    except ( IOError, ValueError, IndexError ):
       self.log.warn( 'Could not obtain load average' )
       return S_ERROR( 'Could not obtain load average' )
 
   #############################################################################
   def getMemoryUsed(self):
-    """Obtains the memory used.
+    """Obtains the memory used, as the used memory reported by free: the total
+       memory less the free one, in kB.
     """
-    comm = '/usr/bin/free'
-    memDict = shellCall( 5, comm )
-    if memDict['OK']:
-      mem = string.split(memDict['Value'][1]) [8]
-      return S_OK( float( mem ) )
-    else:
+    try:
+      memInfo = {}
+      with open( '/proc/meminfo', 'r' ) as memInfoFile:
+        for line in memInfoFile:
+          fields = line.split()
+          if fields[0] in ( 'MemTotal:', 'MemFree:' ):
+            memInfo[fields[0]] = float( fields[1] )
+            if len( memInfo ) == 2:
+              break
+      return S_OK( memInfo['MemTotal:'] - memInfo['MemFree:'] )
+    except ( IOError, ValueError, IndexError, KeyError ):
       self.log.warn( 'Could not obtain memory used' )
       return S_ERROR( 'Could not obtain memory used' )
 
@@ -65,6 +65,20 @@ class JobWrapperTestCaseSuccess( JobWrapperTestCase ):
     res = wd._performChecks()
     self.assert_( res['OK'] )
 
+  def test__getCheckingTime( self ):
+    wd = WatchdogLinux( os.getpid(), MagicMock(), MagicMock(), 1000, 1024 * 1024 )
+    wd.currentCheckingTime = 300
+    wd.checkingTime = 1800
+    wd.maxCheckingTime = 3600
+    # Without memory samples the job is not known to be stable
+    res = [wd._Watchdog__getCheckingTime() for _i in range( 4 )]
+    self.assertEqual( res, [600, 1200, 1800, 1800] )
+    wd.parameters['Vsize'] = [1000., 1050.]
+    wd.parameters['RSS'] = [500., 510.]
+    self.assertEqual( wd._Watchdog__getCheckingTime(), 3600 )
+    wd.parameters['RSS'].append( 800. )
+    self.assertEqual( wd._Watchdog__getCheckingTime(), 1800 )
+
 
 
 #############################################################################
@@ -179,8 +179,24 @@ class JobManagerHandler( RequestHandler ):
       jobDescList = [ jobDesc ]
 
     jobIDList = []
-    for jobDescription in jobDescList:
-      result = gJobDB.insertNewJobIntoDB( jobDescription, self.owner, self.ownerDN, self.ownerGroup, self.diracSetup )
+    if len( jobDescList ) > 1:
+      #Bulk insertion of the parametric jobs
+      result = gJobDB.insertNewJobsIntoDB( jobDescList, self.owner, self.ownerDN, self.ownerGroup, self.diracSetup )
+      if not result['OK']:
+        return result
+
+      jobsByStatus = {}
+      for jobDict in result['Value']:
+        jobIDList.append( jobDict['JobID'] )
+        jobsByStatus.setdefault( ( jobDict['Status'], jobDict['MinorStatus'] ), [] ).append( jobDict['JobID'] )
+      gLogger.info( 'Jobs %s-%s added to the JobDB for %s/%s' % ( jobIDList[0], jobIDList[-1],
+                                                                   self.ownerDN, self.ownerGroup ) )
+
+      for ( status, minorStatus ), jobIDs in jobsByStatus.items():
+        gJobLoggingDB.addLoggingRecords( jobIDs, status, minorStatus, source = 'JobManager' )
+
+    else:
+      result = gJobDB.insertNewJobIntoDB( jobDescList[0], self.owner, self.ownerDN, self.ownerGroup, self.diracSetup )
       if not result['OK']:
         return result
 
@@ -15,6 +15,7 @@ from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
 from DIRAC.WorkloadManagementSystem.Service.JobPolicy import JobPolicy, RIGHT_GET_INFO
 import DIRAC.Core.Utilities.Time as Time
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
+from DIRAC.WorkloadManagementSystem.Utilities.JobColumns import packColumns
 
 # These are global instances of the DB classes
 gJobDB = False
@@ -26,6 +27,8 @@ SUMMARY = ['JobType', 'Site', 'JobName', 'Owner', 'SubmissionTime',
 SUMMARY = []
 PRIMARY_SUMMARY = []
 FINAL_STATES = ['Done', 'Completed', 'Stalled', 'Failed', 'Killed']
+# Largest number of jobs returned by a getJobColumns call
+MAX_COLUMNS_CHUNK = 50000
 
 def initializeJobMonitoringHandler( serviceInfo ):
 
@@ -172,7 +175,7 @@ class JobMonitoringHandler( RequestHandler ):
     if not attrDict:
       attrDict = {}
 
-    return gJobDB.getCounters( 'Jobs', attrList, attrDict, newer = cutDate, timeStamp = 'LastUpdateTime' )
+    return gJobDB.getJobCounters( attrList, attrDict, newer = cutDate )
 
 ##############################################################################
   types_getCurrentJobCounters = [ ]
@@ -184,7 +187,7 @@ class JobMonitoringHandler( RequestHandler ):
 
     if not attrDict:
       attrDict = {}
-    result = gJobDB.getCounters( 'Jobs', ['Status'], attrDict, timeStamp = 'LastUpdateTime' )
+    result = gJobDB.getJobCounters( ['Status'], attrDict )
     if not result['OK']:
       return result
     last_update = Time.dateTime() - Time.day
@@ -249,6 +252,46 @@ class JobMonitoringHandler( RequestHandler ):
       return S_OK( {} )
     return gJobDB.getAttributesForJobList( jobIDs, parameters )
 
+##############################################################################
+  types_getJobColumns = [ DictType, ListType ]
+  def export_getJobColumns( self, condDict, attrList, paramList = None, startJobID = 0, maxJobs = 10000,
+                            compact = True ):
+    """ Get attributes and parameters of the jobs selected by condDict as columns,
+        the lists of values of each attribute or parameter parallel to the 'JobID'
+        column. The jobs are returned by increasing JobID after startJobID, in
+        chunks of maxJobs jobs at most. With compact, the numeric attributes
+        are packed as typed arrays, see JobColumns.
+
+        :return: S_OK( { 'Columns' : columns, 'LastJobID' : JobID to start the next chunk
+                         from, None if this is the last one } )
+    """
+    condDict = dict( condDict )
+    result = self.jobPolicy.getControlledUsers( RIGHT_GET_INFO )
+    if not result['OK']:
+      return S_ERROR( 'Failed to evaluate user rights' )
+    if result['Value'] != 'ALL':
+      condDict[ ( 'Owner', 'OwnerGroup' ) ] = result['Value']
+
+    maxJobs = max( 1, min( int( maxJobs ), MAX_COLUMNS_CHUNK ) )
+    result = gJobDB.getJobAttributesColumns( condDict, attrList, startJobID, maxJobs )
+    if not result['OK']:
+      return result
+    columns = result['Value']
+    if paramList:
+      result = gJobDB.getJobParametersColumns( columns['JobID'], paramList )
+      if not result['OK']:
+        return result
+      for name, values in result['Value'].items():
+        if name not in columns:
+          columns[name] = values
+
+    lastJobID = None
+    if len( columns['JobID'] ) == maxJobs:
+      lastJobID = columns['JobID'][-1]
+    if compact:
+      columns = packColumns( columns )
+    return S_OK( { 'Columns' : columns, 'LastJobID' : lastJobID } )
+
 ##############################################################################
   types_getJobsStatus = [ ListType ]
   @staticmethod
@@ -335,10 +378,9 @@ class JobMonitoringHandler( RequestHandler ):
       orderAttribute = None
 
     statusDict = {}
-    result = gJobDB.getCounters( 'Jobs', ['Status'], selectDict,
-                               newer = startDate,
-                               older = endDate,
-                               timeStamp = 'LastUpdateTime' )
+    result = gJobDB.getJobCounters( ['Status'], selectDict,
+                                    newer = startDate,
+                                    older = endDate )
 
     nJobs = 0
     if result['OK']:
@@ -9,22 +9,31 @@
 
     setJobStatus()
 
+    With the WriteBehind option, the status, parameter and heart beat updates
+    are buffered and written periodically, see JobStateUpdateBuffer. The
+    flushJobUpdates() call writes the buffered updates of some jobs at once.
+
 """
 
 __RCSID__ = "$Id$"
 
 from types import StringTypes, IntType, LongType, ListType, DictType
 # from types import *
+import os
 import time
-from DIRAC.Core.DISET.RequestHandler import RequestHandler
+from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
 from DIRAC.Core.Utilities import Time
-from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+from DIRAC import gLogger, gConfig, rootPath, S_OK, S_ERROR
 from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
+from DIRAC.WorkloadManagementSystem.private.JobStateUpdateBuffer import JobStateUpdateBuffer
 
 # This is a global instance of the JobDB class
 jobDB = False
 logDB = False
+# Write-behind buffer of the updates, None if they are written at once
+updateBuffer = None
 
 JOB_FINAL_STATES = ['Done', 'Completed', 'Failed']
 
@@ -34,8 +43,29 @@ def initializeJobStateUpdateHandler( serviceInfo ):
   global logDB
   jobDB = JobDB()
   logDB = JobLoggingDB()
+
+  global updateBuffer
+  if getServiceOption( serviceInfo, 'WriteBehind', False ):
+    journalPath = getServiceOption( serviceInfo, 'JournalLocation', 'data/JobStateUpdateJournal' ).strip()
+    if journalPath[0] != "/":
+      journalPath = os.path.realpath( "%s/%s" % ( gConfig.getValue( '/LocalSite/InstancePath', rootPath ),
+                                                  journalPath ) )
+    updateBuffer = JobStateUpdateBuffer( jobDB, logDB, journalPath,
+                                         getServiceOption( serviceInfo, 'MaxBufferedJobs', 5000 ) )
+    result = updateBuffer.loadJournal()
+    if not result['OK']:
+      return result
+    gThreadScheduler.addPeriodicTask( getServiceOption( serviceInfo, 'FlushPeriod', 5 ), updateBuffer.flush )
+    gLogger.info( "Job state updates buffered", "journal in %s" % journalPath )
   return S_OK()
 
+def flushJobUpdates( jobIDs ):
+  """ Write the buffered updates of the jobs before updating them directly
+  """
+  if updateBuffer:
+    return updateBuffer.flush( [ int( jobID ) for jobID in jobIDs ] )
+  return S_OK( 0 )
+
 class JobStateUpdateHandler( RequestHandler ):
 
   ###########################################################################
@@ -51,6 +81,10 @@ class JobStateUpdateHandler( RequestHandler ):
     else:
       return S_ERROR( "updateJobFromStager: %s status not known." % status )
 
+    result = flushJobUpdates( [ jobID ] )
+    if not result['OK']:
+      return result
+
     infoStr = None
     trials = 10
     for i in range( trials ):
@@ -84,6 +118,8 @@ class JobStateUpdateHandler( RequestHandler ):
         Set optionally the status date and source component which sends the
         status information.
     """
+    if updateBuffer:
+      return updateBuffer.setJobStatus( jobID, status, minorStatus, source, datetime )
     return self.__setJobStatus( int( jobID ), status, minorStatus, source, datetime )
 
   ###########################################################################
@@ -94,7 +130,10 @@ class JobStateUpdateHandler( RequestHandler ):
         status information.
     """
     for jobID in jobIDs:
-      self.__setJobStatus( int( jobID ), status, minorStatus, source, datetime )
+      if updateBuffer:
+        updateBuffer.setJobStatus( jobID, status, minorStatus, source, datetime )
+      else:
+        self.__setJobStatus( int( jobID ), status, minorStatus, source, datetime )
     return S_OK()
 
   def __setJobStatus( self, jobID, status, minorStatus, source, datetime ):
@@ -118,7 +157,7 @@ class JobStateUpdateHandler( RequestHandler ):
     status = result['Value']['Status']
     minorStatus = result['Value']['MinorStatus']
     if datetime:
-      result = logDB.addLoggingRecord( jobID, status, minorStatus, datetime, source )
+      result = logDB.addLoggingRecord( jobID, status, minorStatus, date = datetime, source = source )
     else:
       result = logDB.addLoggingRecord( jobID, status, minorStatus, source = source )
     return result
@@ -141,6 +180,10 @@ class JobStateUpdateHandler( RequestHandler ):
     startFlag = ''
     jobID = int( jobID )
 
+    result = flushJobUpdates( [ jobID ] )
+    if not result['OK']:
+      return result
+
     result = jobDB.getJobAttributes( jobID, ['Status'] )
     if not result['OK']:
       return result
@@ -230,6 +273,9 @@ class JobStateUpdateHandler( RequestHandler ):
   def export_setJobSite( self, jobID, site ):
     """Allows the site attribute to be set for a job specified by its jobID.
     """
+    result = flushJobUpdates( [ jobID ] )
+    if not result['OK']:
+      return result
     result = jobDB.setJobAttribute( int( jobID ), 'Site', site )
     return result
 
@@ -238,6 +284,9 @@ class JobStateUpdateHandler( RequestHandler ):
   def export_setJobFlag( self, jobID, flag ):
     """ Set job flag for job with jobID
     """
+    result = flushJobUpdates( [ jobID ] )
+    if not result['OK']:
+      return result
     result = jobDB.setJobAttribute( int( jobID ), flag, 'True' )
     return result
 
@@ -246,6 +295,9 @@ class JobStateUpdateHandler( RequestHandler ):
   def export_unsetJobFlag( self, jobID, flag ):
     """ Unset job flag for job with jobID
     """
+    result = flushJobUpdates( [ jobID ] )
+    if not result['OK']:
+      return result
     result = jobDB.setJobAttribute( int( jobID ), flag, 'False' )
     return result
 
@@ -255,6 +307,10 @@ class JobStateUpdateHandler( RequestHandler ):
     """ Set the application status for job specified by its JobId.
     """
 
+    result = flushJobUpdates( [ jobID ] )
+    if not result['OK']:
+      return result
+
     result = jobDB.getJobAttributes( int( jobID ), ['Status', 'MinorStatus'] )
     if not result['OK']:
       return result
@@ -284,6 +340,8 @@ class JobStateUpdateHandler( RequestHandler ):
         for job specified by its JobId
     """
 
+    if updateBuffer:
+      return updateBuffer.setJobParameters( jobID, [ ( name, value ) ] )
     result = jobDB.setJobParameter( int( jobID ), name, value )
     return result
 
@@ -294,6 +352,9 @@ class JobStateUpdateHandler( RequestHandler ):
         for job specified by its JobId
     """
     for jobID in jobsParameterDict:
+      if updateBuffer:
+        updateBuffer.setJobParameters( jobID, [ jobsParameterDict[jobID][:2] ] )
+        continue
       jobDB.setJobParameter( jobID, str( jobsParameterDict[jobID][0] ), str( jobsParameterDict[jobID][1] ) )
     return S_OK()
 
@@ -304,7 +365,10 @@ class JobStateUpdateHandler( RequestHandler ):
         for job specified by its JobId
     """
 
-    result = jobDB.setJobParameters( int( jobID ), parameters )
+    if updateBuffer:
+      result = updateBuffer.setJobParameters( jobID, parameters )
+    else:
+      result = jobDB.setJobParameters( int( jobID ), parameters )
     if not result['OK']:
       return S_ERROR( 'Failed to store some of the parameters' )
 
@@ -316,7 +380,10 @@ class JobStateUpdateHandler( RequestHandler ):
     """ Send a heart beat sign of life for a job jobID
     """
 
-    result = jobDB.setHeartBeatData( int( jobID ), staticData, dynamicData )
+    if updateBuffer:
+      result = updateBuffer.setHeartBeatData( jobID, staticData, dynamicData )
+    else:
+      result = jobDB.setHeartBeatData( int( jobID ), staticData, dynamicData )
     if not result['OK']:
       gLogger.warn( 'Failed to set the heart beat data for job %d ' % int( jobID ) )
 
@@ -345,3 +412,15 @@ class JobStateUpdateHandler( RequestHandler ):
 
     return S_OK( jobMessageDict )
 
+  ###########################################################################
+  types_flushJobUpdates = []
+  def export_flushJobUpdates( self, jobIDs = None ):
+    """ Write at once the buffered updates of the jobs given, or of all the
+        jobs if None, for the callers needing them in the JobDB
+    """
+    if not updateBuffer:
+      return S_OK( 0 )
+    if jobIDs is None:
+      return updateBuffer.flush()
+    return flushJobUpdates( jobIDs )
+
@@ -6,12 +6,12 @@
 
 __RCSID__ = "$Id$"
 
-from types import StringTypes, DictType, StringTypes
+from types import StringTypes, DictType, StringTypes, IntType, LongType
 
 from DIRAC                                               import gLogger, S_OK, S_ERROR
 
 from DIRAC.Core.Utilities.ThreadScheduler                import gThreadScheduler
-from DIRAC.Core.DISET.RequestHandler                     import RequestHandler
+from DIRAC.Core.DISET.RequestHandler                     import RequestHandler, getServiceOption
 
 from DIRAC.FrameworkSystem.Client.MonitoringClient       import gMonitor
 
@@ -51,6 +51,12 @@ def initializeMatcherHandler( serviceInfo ):
   gMonitor.registerActivity( 'numTQs', "Number of Task Queues",
                              'Matching', "tqsk queues" , gMonitor.OP_MEAN, 300 )
 
+  if getServiceOption( serviceInfo, "UseMatchIndex", True ):
+    result = gTaskQueueDB.enableMatchIndex( getServiceOption( serviceInfo, "MatchIndexRefreshPeriod", 10 ),
+                                            getServiceOption( serviceInfo, "MatchIndexResyncPeriod", 600 ) )
+    if not result[ 'OK' ]:
+      return result
+
   gTaskQueueDB.recalculateTQSharesForAll()
   gThreadScheduler.addPeriodicTask( 120, gTaskQueueDB.recalculateTQSharesForAll )
   gThreadScheduler.addPeriodicTask( 60, sendNumTaskQueues )
@@ -102,6 +108,36 @@ class MatcherHandler( RequestHandler ):
       # FIXME: This is correctly interpreted by the JobAgent, but DErrno should be used instead
       return S_ERROR( "No match found" )
 
+##############################################################################
+  types_requestJobs = [ list( StringTypes ) + [DictType], [ IntType, LongType ] ]
+  def export_requestJobs( self, resourceDescription, numJobs ):
+    """ Serve up to numJobs jobs at once to an agent with several free slots,
+        as a list of what requestJob returns for each one
+    """
+
+    resourceDescription['Setup'] = self.serviceInfoDict['clientSetup']
+    credDict = self.getRemoteCredentials()
+    numJobs = max( 1, min( numJobs, self.srv_getCSOption( "MaxJobsPerRequest", 64 ) ) )
+
+    try:
+      opsHelper = Operations( group = credDict['group'] )
+      matcher = Matcher( pilotAgentsDB = pilotAgentsDB,
+                         jobDB = gJobDB,
+                         tqDB = gTaskQueueDB,
+                         jlDB = jlDB,
+                         opsHelper = opsHelper )
+      result = matcher.selectJobs( resourceDescription, credDict, numJobs )
+    except RuntimeError, rte:
+      self.log.error( "Error requesting jobs: ", rte )
+      return S_ERROR( "Error requesting job" )
+
+    gMonitor.addMark( "matchesDone" )
+    if result:
+      gMonitor.addMark( "matchesOK", len( result ) )
+      return S_OK( result )
+    else:
+      return S_ERROR( "No match found" )
+
 ##############################################################################
   types_getActiveTaskQueues = []
   def export_getActiveTaskQueues( self ):
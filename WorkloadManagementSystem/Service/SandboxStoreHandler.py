@@ -19,6 +19,7 @@ from DIRAC.RequestManagementSystem.Client.Operation import Operation
 from DIRAC.RequestManagementSystem.Client.File import File
 from DIRAC.Resources.Storage.StorageElement import StorageElement
 from DIRAC.Core.Security import Properties
+from DIRAC.Core.Utilities import Compression
 
 sandboxDB = False
 
@@ -158,11 +159,16 @@ class SandboxStoreHandler( RequestHandler ):
     result = self.__networkToFile( fileHelper )
     if not result[ 'OK' ]:
       return result
-    tmpFilePath = result[ 'OK' ]
+    tmpFilePath = result[ 'Value' ]
     gLogger.info( "Got Sandbox to local storage", tmpFilePath )
 
-    extension = fileId[ fileId.find( ".tar" ) + 1: ]
-    sbPath = "%s.%s" % ( self.__getSandboxPath( fileHelper.getHash() ), extension )
+    #The sender chooses the codec after sending the bulk id, the extension is the one of the data
+    try:
+      extension = Compression.getCodecExtension( Compression.getFileCodec( tmpFilePath ) )
+    except IOError as e:
+      self.__secureUnlinkFile( tmpFilePath )
+      return S_ERROR( "Cannot read the received sandbox: %s" % str( e ) )
+    sbPath = "%s%s" % ( self.__getSandboxPath( fileHelper.getHash() ), extension )
     gLogger.info( "Sandbox path will be", sbPath )
     # Generate the location
     result = self.__generateLocation( sbPath )
@@ -0,0 +1,91 @@
+""" Encoding of the heart beat data of the jobs as time series
+
+    The heart beat values of a job are stored per name in blocks. The open
+    block of a series receives the points as they come, each one packed as
+    a fixed size raw record, so that they are appended in the DB without
+    reading the block. The raw points are then compacted in delta encoded
+    blocks: the time in seconds and the value in tenths (the precision the
+    heart beat data are shown with) of each point are stored as the zigzag
+    varint of their difference with the previous point. The points of the
+    old blocks are downsampled to one point, the mean, per interval.
+"""
+__RCSID__ = "$Id$"
+
+import struct
+
+#Raw point: epoch seconds and value
+RAW_POINT = struct.Struct( '<Id' )
+
+def packRawPoints( points ):
+  """ Pack a list of ( epoch seconds, value ) as raw records
+  """
+  return ''.join( [ RAW_POINT.pack( int( pointTime ), float( value ) ) for pointTime, value in points ] )
+
+def unpackRawPoints( data ):
+  """ Get the list of ( epoch seconds, value ) of raw records, an incomplete last record is ignored
+  """
+  size = RAW_POINT.size
+  return [ RAW_POINT.unpack_from( data, offset ) for offset in xrange( 0, len( data ) - size + 1, size ) ]
+
+def _encodeVarint( number, out ):
+  #Zigzag to have small positive integers for small deltas of any sign
+  number = number * 2 if number >= 0 else -number * 2 - 1
+  while number >= 0x80:
+    out.append( chr( ( number & 0x7f ) | 0x80 ) )
+    number >>= 7
+  out.append( chr( number ) )
+
+def encodeBlock( points ):
+  """ Delta encode a list of ( epoch seconds, value ) sorted by time
+  """
+  out = []
+  lastTime = 0
+  lastValue = 0
+  for pointTime, value in points:
+    pointTime = int( pointTime )
+    value = int( round( value * 10 ) )
+    _encodeVarint( pointTime - lastTime, out )
+    _encodeVarint( value - lastValue, out )
+    lastTime = pointTime
+    lastValue = value
+  return ''.join( out )
+
+def decodeBlock( data ):
+  """ Get the list of ( epoch seconds, value ) of a delta encoded block
+  """
+  numbers = []
+  number = 0
+  shift = 0
+  for char in data:
+    byte = ord( char )
+    number |= ( byte & 0x7f ) << shift
+    if byte & 0x80:
+      shift += 7
+      continue
+    numbers.append( number >> 1 if not number & 1 else -( ( number + 1 ) >> 1 ) )
+    number = 0
+    shift = 0
+  points = []
+  pointTime = 0
+  value = 0
+  for i in xrange( 0, len( numbers ) - 1, 2 ):
+    pointTime += numbers[i]
+    value += numbers[i + 1]
+    points.append( ( pointTime, value / 10. ) )
+  return points
+
+def downsample( points, interval ):
+  """ Replace the points of each interval by their mean, at the time of the first one
+  """
+  result = []
+  bucket = None
+  for pointTime, value in points:
+    if bucket is None or pointTime // interval != bucket[0] // interval:
+      if bucket:
+        result.append( ( bucket[0], bucket[1] / bucket[2] ) )
+      bucket = [ pointTime, 0., 0 ]
+    bucket[1] += value
+    bucket[2] += 1
+  if bucket:
+    result.append( ( bucket[0], bucket[1] / bucket[2] ) )
+  return result
@@ -0,0 +1,74 @@
+""" Columns of job attributes and parameters fetched in bulk
+
+    The values of each attribute or parameter of a set of jobs are kept in a
+    list parallel to the list of JobIDs. The columns of the numeric attributes
+    can be packed as little endian typed arrays to be sent compactly, and are
+    unpacked as array.array objects.
+"""
+__RCSID__ = "$Id$"
+
+import sys
+import array
+
+#Type codes of the arrays of the numeric attributes of the Jobs table
+NUMERIC_ATTRIBUTES = { 'JobID' : 'I',
+                       'MasterJobID' : 'I',
+                       'ApplicationNumStatus' : 'i',
+                       'UserPriority' : 'i',
+                       'SystemPriority' : 'i',
+                       'RescheduleCounter' : 'i',
+                       'CPUTime' : 'd' }
+
+def packColumn( values, typeCode ):
+  """ Pack a column of numbers as ( typeCode, little endian bytes of the array )
+  """
+  column = array.array( typeCode, values )
+  if sys.byteorder == 'big':
+    column.byteswap()
+  return ( typeCode, column.tostring() )
+
+def unpackColumn( packedColumn ):
+  """ Get the array.array of a column packed with packColumn
+  """
+  typeCode, data = packedColumn
+  column = array.array( typeCode )
+  column.fromstring( data )
+  if sys.byteorder == 'big':
+    column.byteswap()
+  return column
+
+def packColumns( columns ):
+  """ Pack the numeric attributes of a dictionary of columns, the other columns are left as lists
+  """
+  packed = {}
+  for name, values in columns.items():
+    if name in NUMERIC_ATTRIBUTES and None not in values:
+      packed[ name ] = packColumn( values, NUMERIC_ATTRIBUTES[ name ] )
+    else:
+      packed[ name ] = values
+  return packed
+
+def unpackColumns( columns ):
+  """ Unpack the packed columns of a dictionary of columns
+  """
+  unpacked = {}
+  for name, values in columns.items():
+    if isinstance( values, tuple ) and len( values ) == 2 and isinstance( values[0], basestring ):
+      unpacked[ name ] = unpackColumn( values )
+    else:
+      unpacked[ name ] = values
+  return unpacked
+
+def extendColumns( columns, chunk ):
+  """ Append the columns of a chunk of jobs to the columns of the previous ones
+  """
+  for name, values in chunk.items():
+    if name in columns:
+      try:
+        columns[ name ].extend( values )
+      except TypeError:
+        #A typed array followed by values that could not be packed
+        columns[ name ] = list( columns[ name ] ) + list( values )
+    else:
+      columns[ name ] = values
+  return columns
@@ -0,0 +1,52 @@
+""" Test cases for DIRAC.WorkloadManagementSystem.Utilities.HeartBeatSeries
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC.WorkloadManagementSystem.Utilities.HeartBeatSeries import packRawPoints, unpackRawPoints, \
+                                                                    encodeBlock, decodeBlock, downsample, RAW_POINT
+
+class HeartBeatSeriesTestCase( unittest.TestCase ):
+  """ Raw and delta encoded blocks of heart beat points
+  """
+
+  def setUp( self ):
+    self.points = [ ( 1400000000 + 300 * i, value ) for i, value in
+                    enumerate( [ 0.5, 12.3, 12.3, 2048.7, 0., 1.1, 1e6, 3.4 ] ) ]
+
+  def testRaw( self ):
+    """ raw records are appended and an incomplete one is ignored
+    """
+    data = packRawPoints( self.points[:3] ) + packRawPoints( self.points[3:] )
+    self.assertEqual( len( data ), len( self.points ) * RAW_POINT.size )
+    self.assertEqual( unpackRawPoints( data ), self.points )
+    self.assertEqual( unpackRawPoints( data[:-1] ), self.points[:-1] )
+    #What is left once the first records are compacted
+    self.assertEqual( unpackRawPoints( data[2 * RAW_POINT.size:] ), self.points[2:] )
+
+  def testBlock( self ):
+    """ the values are kept to a tenth, in a few bytes per point
+    """
+    points = self.points + [ ( 1400003000, -7.25 ) ]
+    data = encodeBlock( points )
+    self.assertTrue( len( data ) < len( packRawPoints( points ) ) / 2 )
+    decoded = decodeBlock( data )
+    self.assertEqual( [ t for t, _v in decoded ], [ t for t, _v in points ] )
+    for ( _t, value ), ( _t2, expected ) in zip( decoded, points ):
+      self.assertAlmostEqual( value, expected, 1 )
+    self.assertEqual( decodeBlock( encodeBlock( [] ) ), [] )
+
+  def testDownsample( self ):
+    """ one point per interval, the mean of its points
+    """
+    result = downsample( self.points, 600 )
+    self.assertEqual( len( result ), 4 )
+    self.assertEqual( result[0], ( self.points[0][0], 6.4 ) )
+    self.assertEqual( result[1][0], self.points[2][0] )
+    self.assertEqual( downsample( self.points, 1 ), self.points )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( HeartBeatSeriesTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
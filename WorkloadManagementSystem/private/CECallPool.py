@@ -0,0 +1,150 @@
+""" Pool of threads running the calls to the computing elements of the queues
+
+    The calls of a cycle are run in a bounded pool of threads, and each one
+    is waited for at most its timeout from the moment it starts, so that a
+    slow endpoint does not hold the others. A call doing several requests to
+    its CE reports its progress after each one, which starts its timeout
+    again. A call that times out is abandoned: it keeps its thread until the
+    CE answers, its queue stays busy in the meantime, and the calls queued
+    behind it that could not start are cancelled.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+
+from DIRAC                              import S_ERROR, gLogger
+from DIRAC.Core.Utilities.ThreadPool    import ThreadPool
+
+class CECallPool( object ):
+
+  def __init__( self, maxThreads ):
+    self.log = gLogger.getSubLogger( 'CECallPool' )
+    self.__maxThreads = max( 1, maxThreads )
+    self.__threadPool = ThreadPool( self.__maxThreads, self.__maxThreads )
+    self.__lock = threading.Lock()
+    #Calls not finished, the abandoned ones included, per key
+    self.__inFlight = {}
+
+  def isBusy( self, key ):
+    """ A call for the key, abandoned in a previous execution, is still running
+    """
+    self.__lock.acquire()
+    try:
+      return key in self.__inFlight
+    finally:
+      self.__lock.release()
+
+  def __runCall( self, key, call, function, args ):
+    """ Function run in the threads of the pool
+    """
+    self.__lock.acquire()
+    try:
+      if call['Abandoned']:
+        return
+      call['Start'] = call['Last'] = time.time()
+    finally:
+      self.__lock.release()
+    try:
+      result = function( *args )
+    except Exception as excp:
+      self.log.exception( 'Exception in the call for %s' % key, lException = excp )
+      result = S_ERROR( 'Exception in the call: %s' % excp )
+    self.__lock.acquire()
+    try:
+      call['Result'] = result
+      call['End'] = time.time()
+      if self.__inFlight.get( key ) is call:
+        del self.__inFlight[ key ]
+    finally:
+      self.__lock.release()
+    if call['Abandoned']:
+      self.log.info( 'Call for %s finished after %.1f s, after its timeout' % ( key, call['End'] - call['Start'] ) )
+
+  def progress( self, key, value = None ):
+    """ Report the progress of the running call for the key, its timeout starts again
+
+        :param value: Progress reported in the result if the call times out later
+        :return: False if the call was abandoned and should stop
+    """
+    self.__lock.acquire()
+    try:
+      call = self.__inFlight.get( key )
+      if not call:
+        return True
+      if call['Abandoned']:
+        return False
+      call['Last'] = time.time()
+      call['Progress'] = value
+      return True
+    finally:
+      self.__lock.release()
+
+  def execute( self, calls, pollingTime = 0.05 ):
+    """ Run the calls and wait for them
+
+        :param dict calls: ( function, args, timeout in seconds ) per key
+        :return: dictionary of ( result, seconds the call took or None if it did not start ) per key.
+                 The error of a call that timed out holds the last progress it reported
+    """
+    callDict = {}
+    self.__lock.acquire()
+    try:
+      for key in calls:
+        if key in self.__inFlight:
+          continue
+        callDict[ key ] = { 'Start' : None, 'Last' : None, 'End' : None, 'Result' : None, 'Abandoned' : False,
+                            'Timeout' : calls[ key ][2], 'Progress' : None }
+        self.__inFlight[ key ] = callDict[ key ]
+    finally:
+      self.__lock.release()
+    for key, call in callDict.items():
+      function, args, _timeout = calls[ key ]
+      self.__threadPool.generateJobAndQueueIt( self.__runCall, args = ( key, call, function, args ) )
+
+    while True:
+      now = time.time()
+      self.__lock.acquire()
+      try:
+        waiting = False
+        notStarted = []
+        for key, call in callDict.items():
+          if call['End'] is not None or call['Abandoned']:
+            continue
+          if call['Start'] is None:
+            notStarted.append( key )
+          elif now - call['Last'] > call['Timeout']:
+            self.log.warn( 'Call for %s abandoned after %s s' % ( key, call['Timeout'] ) )
+            call['Abandoned'] = True
+          else:
+            waiting = True
+        if notStarted and not waiting:
+          heldThreads = len( [ call for call in self.__inFlight.values()
+                               if call['Abandoned'] and call['Start'] is not None ] )
+          if heldThreads >= self.__maxThreads:
+            #All the threads are held by abandoned calls
+            for key in notStarted:
+              callDict[ key ]['Abandoned'] = True
+              del self.__inFlight[ key ]
+            notStarted = []
+        if not waiting and not notStarted:
+          break
+      finally:
+        self.__lock.release()
+      time.sleep( pollingTime )
+
+    results = {}
+    for key in calls:
+      call = callDict.get( key )
+      if not call:
+        results[ key ] = ( S_ERROR( 'A previous call is still running' ), None )
+      elif call['End'] is not None:
+        results[ key ] = ( call['Result'], call['End'] - call['Start'] )
+      elif call['Start'] is not None:
+        result = S_ERROR( 'Timeout after %s s' % call['Timeout'] )
+        result['Progress'] = call['Progress']
+        results[ key ] = ( result, now - call['Start'] )
+      else:
+        results[ key ] = ( S_ERROR( 'Cancelled, no thread available' ), None )
+    return results
@@ -0,0 +1,386 @@
+""" Write-behind buffer of the job state updates
+
+    The status, parameter and heart beat updates received by the JobStateUpdate
+    service are kept per job and written periodically: the attributes of a job
+    are set once with the last values received, its parameters are merged, and
+    the jobs are written together with multi-row statements. All the logging
+    records and heart beat data received are kept, with the time they were
+    received.
+
+    Each update accepted is appended to a local journal before it is buffered,
+    so the updates not yet written when the service dies are replayed when it
+    starts again. The journal is made of segments, a new one is started by every
+    flush of the whole buffer and the previous ones are deleted once their
+    updates are in the DB. The flushes of some jobs only, done to give them
+    synchronous semantics, are recorded in the journal so that their updates
+    are not replayed. Updates are written at least once: an update could be
+    written again if the service dies while flushing.
+
+    When a flush fails its updates are put back in the buffer, without the heart
+    beat data already inserted. The buffered statuses don't overwrite the final
+    ones, like Killed, set directly by the other services.
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import json
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Utilities import Time
+
+JOB_FINAL_STATES = [ 'Done', 'Completed', 'Failed' ]
+#Statuses the buffered updates, received later, must not overwrite
+JOB_FROZEN_STATES = [ 'Done', 'Failed', 'Killed', 'Deleted' ]
+
+class JobStateUpdateBuffer( object ):
+
+  def __init__( self, jobDB, logDB, journalDir = None, maxJobs = 5000 ):
+    """
+    :type journalDir: string
+    :param journalDir: Directory of the journal segments, None to not keep a journal
+    :type maxJobs: int
+    :param maxJobs: Number of buffered jobs from which the updates are flushed
+                    by the thread adding them
+    """
+    self.__jobDB = jobDB
+    self.__logDB = logDB
+    self.__journalDir = journalDir
+    self.__maxJobs = maxJobs
+    self.log = gLogger.getSubLogger( 'JobStateUpdateBuffer' )
+    #Protects the buffered updates and the journal
+    self.__lock = threading.Lock()
+    #Only one flush is done at a time
+    self.__flushLock = threading.Lock()
+    #jobID -> list of updates in the order they were received
+    self.__updates = {}
+    self.__seq = 0
+    #Journal segments holding updates not yet written, the last one is open
+    self.__segments = []
+    self.__lastSegment = 0
+    self.__journal = None
+    self.__stats = { 'Updates' : 0, 'Flushes' : 0, 'FlushedJobs' : 0, 'FlushedUpdates' : 0,
+                     'FailedFlushes' : 0, 'Replayed' : 0 }
+
+  ############################################################################
+  # Journal
+
+  def __segmentPath( self, segment ):
+    return os.path.join( self.__journalDir, "%010d.journal" % segment )
+
+  def __startSegment( self ):
+    """
+    Start a new journal segment, must be called with the lock held
+    """
+    if not self.__journalDir:
+      return
+    journal = open( self.__segmentPath( self.__lastSegment + 1 ), "a" )
+    if self.__journal:
+      self.__journal.close()
+    self.__journal = journal
+    self.__lastSegment += 1
+    self.__segments.append( self.__lastSegment )
+
+  def __journalRecord( self, record ):
+    """
+    Append a record to the journal, must be called with the lock held
+    """
+    if not self.__journal:
+      return
+    self.__journal.write( json.dumps( record ) + "\n" )
+    self.__journal.flush()
+
+  def __deleteSegments( self, segments ):
+    for segment in segments:
+      try:
+        os.unlink( self.__segmentPath( segment ) )
+      except OSError as excp:
+        self.log.warn( "Cannot delete journal segment", "%s: %s" % ( segment, excp ) )
+
+  def loadJournal( self ):
+    """
+    Replay the updates of the journal left by a previous run and start a new segment,
+    the journal is only kept once it is loaded. The updates replayed are written
+    with the next flush
+
+    :return: S_OK( number of updates replayed )
+    """
+    if not self.__journalDir:
+      return S_OK( 0 )
+    try:
+      if not os.path.isdir( self.__journalDir ):
+        os.makedirs( self.__journalDir )
+      segments = sorted( [ int( fileName.split( '.' )[0] ) for fileName in os.listdir( self.__journalDir )
+                           if fileName.endswith( '.journal' ) and fileName.split( '.' )[0].isdigit() ] )
+    except OSError as excp:
+      return S_ERROR( "Cannot read the journal directory %s: %s" % ( self.__journalDir, excp ) )
+    replayed = 0
+    self.__lock.acquire()
+    try:
+      for segment in segments:
+        try:
+          with open( self.__segmentPath( segment ) ) as fd:
+            lines = fd.readlines()
+        except IOError as excp:
+          return S_ERROR( "Cannot read journal segment %s: %s" % ( segment, excp ) )
+        for line in lines:
+          try:
+            record = json.loads( line )
+          except ValueError:
+            #The last line may be incomplete if the service died while writing it
+            self.log.warn( "Skipping corrupted journal record", "in segment %s" % segment )
+            continue
+          if 'Flushed' in record:
+            self.__dropUpdates( record[ 'Flushed' ], record[ 'Seq' ] )
+            continue
+          self.__seq = max( self.__seq, record[ 'Seq' ] )
+          self.__updates.setdefault( record[ 'JobID' ], [] ).append( record )
+      replayed = sum( [ len( updates ) for updates in self.__updates.values() ] )
+      self.__segments = segments
+      self.__lastSegment = max( segments + [ self.__lastSegment ] )
+      self.__startSegment()
+      self.__stats[ 'Replayed' ] += replayed
+    except IOError as excp:
+      return S_ERROR( "Cannot open a journal segment in %s: %s" % ( self.__journalDir, excp ) )
+    finally:
+      self.__lock.release()
+    if replayed:
+      self.log.info( "Replayed updates from the journal", "%s updates of %s jobs" % ( replayed,
+                                                                                     len( self.__updates ) ) )
+    return S_OK( replayed )
+
+  def __dropUpdates( self, jobIDs, seq ):
+    for jobID in jobIDs:
+      updates = [ update for update in self.__updates.get( jobID, [] ) if update[ 'Seq' ] > seq ]
+      if updates:
+        self.__updates[ jobID ] = updates
+      else:
+        self.__updates.pop( jobID, None )
+
+  ############################################################################
+  # Updates
+
+  def __add( self, jobID, update ):
+    self.__lock.acquire()
+    try:
+      self.__seq += 1
+      update[ 'Seq' ] = self.__seq
+      update[ 'JobID' ] = jobID
+      update[ 'Time' ] = Time.toString( Time.dateTime() )
+      try:
+        self.__journalRecord( update )
+      except IOError as excp:
+        return S_ERROR( "Cannot write the journal: %s" % excp )
+      self.__updates.setdefault( jobID, [] ).append( update )
+      self.__stats[ 'Updates' ] += 1
+      numJobs = len( self.__updates )
+    finally:
+      self.__lock.release()
+    if numJobs >= self.__maxJobs and self.__flushLock.acquire( False ):
+      #Too many jobs waiting, this thread writes them unless a flush is already running
+      try:
+        self.__flush()
+      finally:
+        self.__flushLock.release()
+    return S_OK()
+
+  def setJobStatus( self, jobID, status, minorStatus, source = 'Unknown', datetime = None ):
+    """
+    Buffer a status change, empty status or minor status are left unchanged
+    """
+    if not status and not minorStatus:
+      return S_ERROR( 'JobStateUpdateBuffer.setJobStatus: Nothing to do' )
+    if datetime and not isinstance( datetime, basestring ):
+      datetime = Time.toString( datetime )
+    return self.__add( int( jobID ), { 'Op' : 'Status', 'Status' : status, 'MinorStatus' : minorStatus,
+                                       'Source' : source, 'Date' : datetime or None } )
+
+  def setJobParameters( self, jobID, parameters ):
+    """
+    Buffer a list of name/value pairs of job parameters
+    """
+    return self.__add( int( jobID ), { 'Op' : 'Parameters',
+                                       'Parameters' : [ ( str( name ), str( value ) ) for name, value in parameters ] } )
+
+  def setHeartBeatData( self, jobID, staticData, dynamicData ):
+    """
+    Buffer a heart beat, it sets the job Running as JobDB.setHeartBeatData
+    """
+    return self.__add( int( jobID ), { 'Op' : 'HeartBeat', 'StaticData' : staticData, 'DynamicData' : dynamicData } )
+
+  def getNumberOfJobs( self ):
+    self.__lock.acquire()
+    try:
+      return len( self.__updates )
+    finally:
+      self.__lock.release()
+
+  def getStats( self ):
+    self.__lock.acquire()
+    try:
+      stats = dict( self.__stats )
+      stats[ 'BufferedJobs' ] = len( self.__updates )
+      stats[ 'BufferedUpdates' ] = sum( [ len( updates ) for updates in self.__updates.values() ] )
+      stats[ 'JournalSegments' ] = len( self.__segments )
+    finally:
+      self.__lock.release()
+    return stats
+
+  ############################################################################
+  # Flush
+
+  def flush( self, jobIDs = None ):
+    """
+    Write the buffered updates
+
+    :type jobIDs: list
+    :param jobIDs: Write only the updates of these jobs, all of them if None
+    :return: S_OK( number of jobs written )
+    """
+    self.__flushLock.acquire()
+    try:
+      return self.__flush( jobIDs )
+    finally:
+      self.__flushLock.release()
+
+  def __flush( self, jobIDs = None ):
+    self.__lock.acquire()
+    try:
+      if jobIDs is None:
+        taken = self.__updates
+        self.__updates = {}
+        takenSegments = self.__segments
+        self.__segments = []
+        try:
+          self.__startSegment()
+        except IOError as excp:
+          self.__updates = taken
+          self.__segments = takenSegments
+          return S_ERROR( "Cannot start a journal segment: %s" % excp )
+      else:
+        taken = {}
+        for jobID in jobIDs:
+          if int( jobID ) in self.__updates:
+            taken[ int( jobID ) ] = self.__updates.pop( int( jobID ) )
+        takenSegments = []
+      seq = self.__seq
+    finally:
+      self.__lock.release()
+
+    if not taken:
+      return S_OK( 0 )
+    numUpdates = sum( [ len( updates ) for updates in taken.values() ] )
+    result = self.__write( taken )
+
+    self.__lock.acquire()
+    try:
+      if not result[ 'OK' ]:
+        #Put the updates back, before the ones received since
+        for jobID in taken:
+          self.__updates[ jobID ] = taken[ jobID ] + self.__updates.get( jobID, [] )
+        self.__segments = sorted( set( takenSegments + self.__segments ) )
+        self.__stats[ 'FailedFlushes' ] += 1
+        self.log.error( "Failed to write the buffered job updates", result[ 'Message' ] )
+        return result
+      self.__stats[ 'Flushes' ] += 1
+      self.__stats[ 'FlushedJobs' ] += len( taken )
+      self.__stats[ 'FlushedUpdates' ] += numUpdates
+      if jobIDs is not None:
+        try:
+          self.__journalRecord( { 'Flushed' : list( taken ), 'Seq' : seq } )
+        except IOError as excp:
+          self.log.warn( "Cannot record the flush in the journal", str( excp ) )
+    finally:
+      self.__lock.release()
+    self.__deleteSegments( takenSegments )
+    return S_OK( len( taken ) )
+
+  def __write( self, jobUpdates ):
+    """
+    Merge the updates of each job and write them with multi-row statements
+    """
+    result = self.__jobDB.getAttributesForJobList( list( jobUpdates ), [ 'Status', 'MinorStatus' ] )
+    if not result[ 'OK' ]:
+      return result
+    currentDict = result[ 'Value' ]
+
+    #( attribute names, attribute values, update ) -> list of jobIDs
+    attrGroups = {}
+    endExecTimes = {}
+    startExecTimes = {}
+    heartBeats = {}
+    heartBeatUpdates = []
+    parameters = {}
+    records = []
+    for jobID in jobUpdates:
+      if jobID not in currentDict:
+        self.log.warn( "Dropping the updates of a job not in the JobDB", str( jobID ) )
+        continue
+      current = { 'Status' : currentDict[ jobID ][ 'Status' ], 'MinorStatus' : currentDict[ jobID ][ 'MinorStatus' ] }
+      attrs = {}
+      update = False
+      jobParams = {}
+      heartBeat = None
+      for upd in jobUpdates[ jobID ]:
+        if upd[ 'Op' ] == 'Status':
+          for attrName in ( 'Status', 'MinorStatus' ):
+            if upd[ attrName ]:
+              attrs[ attrName ] = current[ attrName ] = upd[ attrName ]
+          #The LastUpdateTime is not refreshed when setting the Stalled status
+          if upd[ 'Status' ] != 'Stalled':
+            update = True
+          if upd[ 'Status' ] in JOB_FINAL_STATES:
+            endExecTimes.setdefault( jobID, upd[ 'Time' ] )
+          if upd[ 'Status' ] == 'Running' and upd[ 'MinorStatus' ] == 'Application':
+            startExecTimes.setdefault( jobID, upd[ 'Time' ] )
+          records.append( ( jobID, current[ 'Status' ], current[ 'MinorStatus' ], 'idem',
+                            upd[ 'Date' ] or upd[ 'Time' ], upd[ 'Source' ] ) )
+        elif upd[ 'Op' ] == 'Parameters':
+          jobParams.update( dict( upd[ 'Parameters' ] ) )
+        elif upd[ 'Op' ] == 'HeartBeat':
+          attrs.pop( 'Status', None )
+          current[ 'Status' ] = 'Running'
+          #The data of a heart beat is inserted once, even if writing the other updates failed
+          if upd.get( 'Written' ):
+            continue
+          heartBeatUpdates.append( upd )
+          if not heartBeat:
+            heartBeat = [ None, {}, [] ]
+          heartBeat[0] = upd[ 'Time' ]
+          heartBeat[1].update( upd[ 'StaticData' ] )
+          heartBeat[2].extend( [ ( name, value, upd[ 'Time' ] ) for name, value in upd[ 'DynamicData' ].items() ] )
+      if attrs or update:
+        attrNames = tuple( sorted( attrs ) )
+        attrGroups.setdefault( ( attrNames, tuple( [ attrs[ name ] for name in attrNames ] ), update ),
+                               [] ).append( jobID )
+      if jobParams:
+        parameters[ jobID ] = jobParams.items()
+      if heartBeat:
+        heartBeats[ jobID ] = tuple( heartBeat )
+
+    #The heart beats set the jobs Running, the statuses received after them are written next
+    result = self.__jobDB.setJobsHeartBeatData( heartBeats, excludedStatuses = JOB_FROZEN_STATES )
+    if not result[ 'OK' ]:
+      return result
+    for upd in heartBeatUpdates:
+      upd[ 'Written' ] = True
+    for attrNames, attrValues, update in attrGroups:
+      result = self.__jobDB.setJobsAttributes( attrGroups[ ( attrNames, attrValues, update ) ],
+                                               list( attrNames ), list( attrValues ), update = update,
+                                               excludedStatuses = JOB_FROZEN_STATES )
+      if not result[ 'OK' ]:
+        return result
+    for jobID in endExecTimes:
+      result = self.__jobDB.setEndExecTime( jobID, endExecTimes[ jobID ] )
+      if not result[ 'OK' ]:
+        return result
+    for jobID in startExecTimes:
+      result = self.__jobDB.setStartExecTime( jobID, startExecTimes[ jobID ] )
+      if not result[ 'OK' ]:
+        return result
+    if parameters:
+      result = self.__jobDB.setJobsParameters( parameters )
+      if not result[ 'OK' ]:
+        return result
+    return self.__logDB.addLoggingRecordList( records )
@@ -0,0 +1,316 @@
+""" In memory index of the task queue definitions
+
+    It keeps, for every value of the task queue fields, the set of task queues
+    having it, so the task queues a resource can match are found with a few set
+    operations. The conditions are the ones of the match SQL of the TaskQueueDB,
+    which still does the final match on the short list of candidates.
+
+    The values are compared as the case insensitive collation of the DB columns
+    does. Plain ASCII values are compared lower cased and with the spaces around
+    stripped. Any other value may be equal to a different one in the DB, so the
+    task queues having one are always candidates, and a resource giving one
+    isn't looked up at all and goes to the full match SQL.
+
+    The index only knows the task queues it has been told about, the owner has
+    to load the ones created by other processes from time to time. Until then
+    they can't be candidates of a match.
+"""
+
+__RCSID__ = "$Id$"
+
+import bisect
+import threading
+
+#Fields of the match dicts, the task queue definitions use them in plural
+MATCH_FIELDS = ( 'GridCE', 'Site', 'GridMiddleware', 'Platform', 'PilotType', 'SubmitPool', 'JobType', 'Tag' )
+#All the tags of the task queue have to be in the resource
+TAG_FIELDS = ( 'Tag', )
+#The resource can't be in the banned values of the task queue
+BANNED_JOB_FIELDS = ( 'Site', )
+#If the resource doesn't give them, the task queue can't require them
+STRICT_REQUIRE_FIELDS = ( 'SubmitPool', 'Platform', 'PilotType', 'Tag' )
+SINGLE_VALUE_FIELDS = ( 'OwnerDN', 'OwnerGroup', 'Setup' )
+MULTI_VALUE_FIELDS = tuple( [ "%ss" % field for field in MATCH_FIELDS ] +
+                            [ "Banned%ss" % field for field in BANNED_JOB_FIELDS ] )
+
+def _asList( value ):
+  if isinstance( value, ( list, tuple, set ) ):
+    return list( value )
+  return [ value ]
+
+def _normalize( value ):
+  """ Value as compared by the DB collation, None if it can't be told
+  """
+  try:
+    value = str( value ).strip().decode( 'ascii' )
+  except UnicodeError:
+    return None
+  return str( value.lower() )
+
+def _toList( value ):
+  return [ _normalize( v ) for v in _asList( value ) ]
+
+class TaskQueueMatchIndex( object ):
+
+  def __init__( self, isJobSharingGroup = None ):
+    """
+    :type isJobSharingGroup: callable
+    :param isJobSharingGroup: Tells if the jobs of a group can be matched by any DN of the group
+    """
+    if not isJobSharingGroup:
+      isJobSharingGroup = lambda group: False
+    self.__isJobSharingGroup = isJobSharingGroup
+    self.__lock = threading.Lock()
+    self.__lastTQId = 0
+    self.__stats = { 'Lookups' : 0, 'EmptyLookups' : 0, 'UnsureLookups' : 0, 'Candidates' : 0 }
+    self.__clear()
+
+  def __clear( self ):
+    self.__tqDefs = {}
+    #Task queues with values that can't be compared here
+    self.__unsure = set()
+    self.__bySingleValue = dict( [ ( field, {} ) for field in SINGLE_VALUE_FIELDS ] )
+    self.__byOwner = {}
+    self.__byCPUTime = {}
+    self.__cpuSegments = []
+    self.__byValue = dict( [ ( field, {} ) for field in MULTI_VALUE_FIELDS ] )
+    #Task queues with at least one value in the field
+    self.__withValues = dict( [ ( field, set() ) for field in MULTI_VALUE_FIELDS ] )
+
+  def __add( self, tqId, tqDef ):
+    if tqId in self.__tqDefs:
+      self.__remove( tqId )
+    indexedDef = { 'CPUTime' : int( tqDef[ 'CPUTime' ] ) }
+    for field in SINGLE_VALUE_FIELDS:
+      indexedDef[ field ] = _normalize( tqDef[ field ] )
+    for field in MULTI_VALUE_FIELDS:
+      indexedDef[ field ] = frozenset( [ value for value in _toList( tqDef.get( field, [] ) ) if value != '' ] )
+    if None in [ indexedDef[ field ] for field in SINGLE_VALUE_FIELDS ] or \
+       None in [ value for field in MULTI_VALUE_FIELDS for value in indexedDef[ field ] ]:
+      self.__unsure.add( tqId )
+      self.__tqDefs[ tqId ] = None
+      return
+    for field in SINGLE_VALUE_FIELDS:
+      value = indexedDef[ field ]
+      self.__bySingleValue[ field ].setdefault( value, set() ).add( tqId )
+    self.__byOwner.setdefault( ( indexedDef[ 'OwnerDN' ], indexedDef[ 'OwnerGroup' ] ), set() ).add( tqId )
+    cpuTime = indexedDef[ 'CPUTime' ]
+    if cpuTime not in self.__byCPUTime:
+      self.__byCPUTime[ cpuTime ] = set()
+      bisect.insort( self.__cpuSegments, cpuTime )
+    self.__byCPUTime[ cpuTime ].add( tqId )
+    for field in MULTI_VALUE_FIELDS:
+      values = indexedDef[ field ]
+      if not values:
+        continue
+      self.__withValues[ field ].add( tqId )
+      for value in values:
+        self.__byValue[ field ].setdefault( value, set() ).add( tqId )
+    self.__tqDefs[ tqId ] = indexedDef
+
+  def __discard( self, index, key, tqId ):
+    tqIds = index.get( key )
+    if tqIds is None:
+      return
+    tqIds.discard( tqId )
+    if not tqIds:
+      del index[ key ]
+
+  def __remove( self, tqId ):
+    indexedDef = self.__tqDefs.pop( tqId, None )
+    self.__unsure.discard( tqId )
+    if not indexedDef:
+      return
+    for field in SINGLE_VALUE_FIELDS:
+      self.__discard( self.__bySingleValue[ field ], indexedDef[ field ], tqId )
+    self.__discard( self.__byOwner, ( indexedDef[ 'OwnerDN' ], indexedDef[ 'OwnerGroup' ] ), tqId )
+    cpuTime = indexedDef[ 'CPUTime' ]
+    self.__discard( self.__byCPUTime, cpuTime, tqId )
+    if cpuTime not in self.__byCPUTime:
+      self.__cpuSegments.remove( cpuTime )
+    for field in MULTI_VALUE_FIELDS:
+      self.__withValues[ field ].discard( tqId )
+      for value in indexedDef[ field ]:
+        self.__discard( self.__byValue[ field ], value, tqId )
+
+  def addTaskQueue( self, tqId, tqDef ):
+    """
+    Add or replace a task queue
+
+    :type tqDef: dictionary
+    :param tqDef: Definition with the OwnerDN, OwnerGroup, Setup and CPUTime
+                  and the lists of Sites, BannedSites, Platforms, Tags...
+    """
+    self.__lock.acquire()
+    try:
+      self.__add( tqId, tqDef )
+    finally:
+      self.__lock.release()
+
+  def removeTaskQueue( self, tqId ):
+    self.__lock.acquire()
+    try:
+      self.__remove( tqId )
+    finally:
+      self.__lock.release()
+
+  def update( self, tqDefs, lastTQId ):
+    """
+    Add the task queues loaded after lastTQId was the last one known
+    """
+    self.__lock.acquire()
+    try:
+      for tqId in tqDefs:
+        self.__add( tqId, tqDefs[ tqId ] )
+      self.__lastTQId = lastTQId
+    finally:
+      self.__lock.release()
+
+  def reset( self, tqDefs, lastTQId ):
+    """
+    Replace all the task queues by the ones given
+    """
+    self.__lock.acquire()
+    try:
+      self.__clear()
+      for tqId in tqDefs:
+        self.__add( tqId, tqDefs[ tqId ] )
+      self.__lastTQId = lastTQId
+    finally:
+      self.__lock.release()
+
+  def getLastTQId( self ):
+    """
+    Highest task queue id up to which all the task queues have been loaded
+    """
+    return self.__lastTQId
+
+  def getTaskQueueIds( self ):
+    self.__lock.acquire()
+    try:
+      return set( self.__tqDefs )
+    finally:
+      self.__lock.release()
+
+  def getStats( self ):
+    self.__lock.acquire()
+    try:
+      stats = dict( self.__stats )
+      stats[ 'TaskQueues' ] = len( self.__tqDefs )
+    finally:
+      self.__lock.release()
+    stats[ 'MeanCandidates' ] = float( stats[ 'Candidates' ] ) / stats[ 'Lookups' ] if stats[ 'Lookups' ] else 0.
+    return stats
+
+  def __unionOf( self, index, keys ):
+    tqIds = set()
+    for key in keys:
+      tqIds.update( index.get( key, () ) )
+    return tqIds
+
+  def __intersectionOf( self, index, keys ):
+    tqIds = None
+    for key in keys:
+      keyTQIds = index.get( key )
+      if not keyTQIds:
+        return set()
+      if tqIds is None:
+        tqIds = set( keyTQIds )
+      else:
+        tqIds &= keyTQIds
+    return tqIds or set()
+
+  def __ownerCandidates( self, matchDict ):
+    if 'OwnerDN' in matchDict and 'OwnerGroup' in matchDict:
+      dns = _toList( matchDict[ 'OwnerDN' ] )
+      tqIds = set()
+      for group in _asList( matchDict[ 'OwnerGroup' ] ):
+        groupKey = _normalize( group )
+        if self.__isJobSharingGroup( group ):
+          tqIds.update( self.__bySingleValue[ 'OwnerGroup' ].get( groupKey, () ) )
+        else:
+          tqIds.update( self.__unionOf( self.__byOwner, [ ( dn, groupKey ) for dn in dns ] ) )
+      return tqIds
+    tqIds = None
+    for field in ( 'OwnerGroup', 'OwnerDN' ):
+      if field in matchDict:
+        fieldTQIds = self.__unionOf( self.__bySingleValue[ field ], _toList( matchDict[ field ] ) )
+        tqIds = fieldTQIds if tqIds is None else tqIds & fieldTQIds
+    return tqIds
+
+  def __getCandidates( self, matchDict ):
+    candidates = self.__ownerCandidates( matchDict )
+    if candidates is None:
+      candidates = set( self.__tqDefs ) - self.__unsure
+    if 'Setup' in matchDict:
+      candidates &= self.__unionOf( self.__bySingleValue[ 'Setup' ], _toList( matchDict[ 'Setup' ] ) )
+    if 'CPUTime' in matchDict:
+      maxCPUTime = max( [ int( cpuTime ) for cpuTime in _asList( matchDict[ 'CPUTime' ] ) ] )
+      segments = self.__cpuSegments[ :bisect.bisect_right( self.__cpuSegments, maxCPUTime ) ]
+      candidates &= self.__unionOf( self.__byCPUTime, segments )
+    for field in MATCH_FIELDS:
+      if not candidates:
+        break
+      tqField = "%ss" % field
+      if matchDict.get( field ):
+        values = _toList( matchDict[ field ] )
+        if field in TAG_FIELDS:
+          if matchDict[ field ] != 'Any':
+            allowed = set( values )
+            candidates -= set( [ tqId for tqId in candidates & self.__withValues[ tqField ]
+                                 if not self.__tqDefs[ tqId ][ tqField ] <= allowed ] )
+          required = matchDict.get( "Required%s" % field )
+          if required:
+            candidates &= self.__intersectionOf( self.__byValue[ tqField ], _toList( required ) )
+        else:
+          #No values in the task queue or one of the resource values
+          candidates = ( candidates - self.__withValues[ tqField ] ) | \
+                       ( candidates & self.__unionOf( self.__byValue[ tqField ], values ) )
+        if field in BANNED_JOB_FIELDS:
+          candidates -= self.__intersectionOf( self.__byValue[ "Banned%s" % tqField ], values )
+      banned = matchDict.get( "Banned%s" % field )
+      if banned:
+        candidates -= self.__intersectionOf( self.__byValue[ tqField ], _toList( banned ) )
+      if field in STRICT_REQUIRE_FIELDS and field not in matchDict:
+        candidates -= self.__withValues[ tqField ]
+    #The DB tells if they match
+    return candidates | self.__unsure
+
+  def __isUnsure( self, matchDict ):
+    for field in matchDict:
+      if field in SINGLE_VALUE_FIELDS or field in MATCH_FIELDS or \
+         ( field[ :6 ] == 'Banned' and field[ 6: ] in MATCH_FIELDS ) or \
+         ( field[ :8 ] == 'Required' and field[ 8: ] in MATCH_FIELDS ):
+        if None in _toList( matchDict[ field ] ):
+          return True
+    return False
+
+  def getCandidates( self, matchDict ):
+    """
+    Get the ids of the task queues a resource can match
+
+    :type matchDict: dictionary
+    :param matchDict: Resource description, with the values not escaped
+    :return: set of task queue ids, None if the values can't be compared here
+    """
+    matchDict = dict( matchDict )
+    for alias in ( 'LHCbPlatform', 'SystemConfig' ):
+      if alias in matchDict and 'Platform' not in matchDict:
+        matchDict[ 'Platform' ] = matchDict[ alias ]
+    if self.__isUnsure( matchDict ):
+      self.__lock.acquire()
+      try:
+        self.__stats[ 'UnsureLookups' ] += 1
+      finally:
+        self.__lock.release()
+      return None
+    self.__lock.acquire()
+    try:
+      candidates = self.__getCandidates( matchDict )
+      self.__stats[ 'Lookups' ] += 1
+      self.__stats[ 'Candidates' ] += len( candidates )
+      if not candidates:
+        self.__stats[ 'EmptyLookups' ] += 1
+    finally:
+      self.__lock.release()
+    return candidates
@@ -0,0 +1,311 @@
+""" Running sums of the job priorities of the task queues
+
+    The share of an owner (a DN in a group, or the whole group if its jobs are
+    shared) is spread among its task queues proportionally to the mean priority
+    of their jobs. The sums of the job priorities are kept per task queue, and
+    the sums of the means per owner, updated as the jobs come and go, so the
+    priorities of the task queues are computed without aggregating the jobs in
+    the DB. The priorities last written are remembered to only write the ones
+    that change.
+
+    Several processes update the same task queues, so the sums only reflect the
+    jobs of the others after they are reconciled with the DB, which is done for
+    a group when its sums are older than a reconciliation period.
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+
+#Task queues with a lower mean job priority are background ones
+BACKGROUND_PRIORITY = 0.1
+#Relative change of a priority under which it is not written again
+PRIORITY_TOLERANCE = 0.0001
+
+class TaskQueueShares( object ):
+
+  def __init__( self, minShare = 0.001, ignoredFields = () ):
+    """
+    :type minShare: float
+    :param minShare: Lowest priority given to a task queue
+    :type ignoredFields: list
+    :param ignoredFields: Fields of the definitions not making task queues different
+                          when they are grouped to get the same priority
+    """
+    self.__minShare = minShare
+    self.__ignoredFields = ignoredFields
+    self.__lock = threading.Lock()
+    self.__stats = { 'JobUpdates' : 0, 'Calculations' : 0, 'PrioritiesChanged' : 0 }
+    self.__loaded = 0
+    #ownerGroup -> time its sums were loaded alone
+    self.__groupsLoaded = {}
+    self.__clear()
+
+  def __clear( self ):
+    #tqId -> { 'Owner', 'Definition', 'Jobs', 'Sum', 'Priority' }
+    self.__tqs = {}
+    #( ownerDN, ownerGroup ) -> { 'TQs', 'Total', 'Background' }
+    self.__owners = {}
+    #ownerGroup -> set of owner DNs
+    self.__groups = {}
+
+  def __definitionKey( self, tqDef ):
+    """
+    Task queues with the same key get the sum of their priorities
+    """
+    key = []
+    for field in sorted( tqDef ):
+      if field in self.__ignoredFields:
+        continue
+      value = tqDef[ field ]
+      if isinstance( value, ( list, tuple, set ) ):
+        value = sorted( set( [ str( v ).strip() for v in value if str( v ).strip() ] ) )
+        if not value:
+          continue
+        value = ",".join( value )
+      key.append( "%s:%s" % ( field, value ) )
+    return "|".join( key )
+
+  def __contribute( self, tq, sign ):
+    """
+    Add or take out the mean job priority of a task queue from the sums of its owner
+    """
+    if not tq[ 'Jobs' ]:
+      return
+    mean = tq[ 'Sum' ] / tq[ 'Jobs' ]
+    owner = self.__owners[ tq[ 'Owner' ] ]
+    owner[ 'Total' ] += sign * mean
+    if mean <= BACKGROUND_PRIORITY:
+      owner[ 'Background' ] += sign * mean
+
+  def __add( self, tqId, tqDef, numJobs = 0, prioritySum = 0., priority = None ):
+    if tqId in self.__tqs:
+      self.__remove( tqId )
+    ownerKey = ( str( tqDef[ 'OwnerDN' ] ), str( tqDef[ 'OwnerGroup' ] ) )
+    if ownerKey not in self.__owners:
+      self.__owners[ ownerKey ] = { 'TQs' : set(), 'Total' : 0., 'Background' : 0. }
+      self.__groups.setdefault( ownerKey[1], set() ).add( ownerKey[0] )
+    tq = { 'Owner' : ownerKey,
+           'Definition' : self.__definitionKey( tqDef ),
+           'Jobs' : int( numJobs ),
+           'Sum' : float( prioritySum or 0. ),
+           'Priority' : priority }
+    self.__tqs[ tqId ] = tq
+    self.__owners[ ownerKey ][ 'TQs' ].add( tqId )
+    self.__contribute( tq, 1 )
+
+  def __remove( self, tqId ):
+    tq = self.__tqs.get( tqId )
+    if not tq:
+      return
+    self.__contribute( tq, -1 )
+    del self.__tqs[ tqId ]
+    ownerKey = tq[ 'Owner' ]
+    owner = self.__owners[ ownerKey ]
+    owner[ 'TQs' ].discard( tqId )
+    if not owner[ 'TQs' ]:
+      del self.__owners[ ownerKey ]
+      self.__groups[ ownerKey[1] ].discard( ownerKey[0] )
+      if not self.__groups[ ownerKey[1] ]:
+        del self.__groups[ ownerKey[1] ]
+
+  def reset( self, tqData, ownerGroup = None ):
+    """
+    Replace all the task queues by the ones given
+
+    :type tqData: dictionary
+    :param tqData: tqId -> ( definition, number of jobs, sum of the job priorities, priority )
+    :type ownerGroup: string
+    :param ownerGroup: Only replace the task queues of this group
+    """
+    self.__lock.acquire()
+    try:
+      if ownerGroup is None:
+        self.__clear()
+        self.__loaded = time.time()
+        self.__groupsLoaded = {}
+      else:
+        for ownerDN in list( self.__groups.get( ownerGroup, () ) ):
+          for tqId in list( self.__owners[ ( ownerDN, ownerGroup ) ][ 'TQs' ] ):
+            self.__remove( tqId )
+        self.__groupsLoaded[ ownerGroup ] = time.time()
+      for tqId in tqData:
+        tqDef, numJobs, prioritySum, priority = tqData[ tqId ]
+        self.__add( tqId, tqDef, numJobs, prioritySum, priority )
+    finally:
+      self.__lock.release()
+
+  def getLoadTime( self, ownerGroup = None ):
+    """
+    Get when the sums of a group, or of all the groups, were last replaced by the ones of the DB
+    """
+    self.__lock.acquire()
+    try:
+      if ownerGroup is None:
+        return self.__loaded
+      return max( self.__loaded, self.__groupsLoaded.get( ownerGroup, 0 ) )
+    finally:
+      self.__lock.release()
+
+  def addTaskQueue( self, tqId, tqDef, priority = None ):
+    """
+    Add an empty task queue
+
+    :type tqDef: dictionary
+    :param tqDef: Definition with the OwnerDN and OwnerGroup, the values not escaped
+    """
+    self.__lock.acquire()
+    try:
+      self.__add( tqId, tqDef, priority = priority )
+    finally:
+      self.__lock.release()
+
+  def removeTaskQueue( self, tqId ):
+    self.__lock.acquire()
+    try:
+      self.__remove( tqId )
+    finally:
+      self.__lock.release()
+
+  def __updateJobs( self, tqId, numJobs, priority ):
+    self.__lock.acquire()
+    try:
+      tq = self.__tqs.get( tqId )
+      if not tq:
+        return False
+      self.__contribute( tq, -1 )
+      tq[ 'Jobs' ] += numJobs
+      tq[ 'Sum' ] += numJobs * priority
+      if tq[ 'Jobs' ] <= 0:
+        tq[ 'Jobs' ] = 0
+        tq[ 'Sum' ] = 0.
+      self.__contribute( tq, 1 )
+      self.__stats[ 'JobUpdates' ] += 1
+      return True
+    finally:
+      self.__lock.release()
+
+  def addJob( self, tqId, realPriority ):
+    """
+    Account a job inserted in a task queue, False if the task queue is not known
+    """
+    return self.__updateJobs( tqId, 1, realPriority )
+
+  def removeJob( self, tqId, realPriority ):
+    """
+    Account a job taken out of a task queue, False if the task queue is not known
+    """
+    return self.__updateJobs( tqId, -1, realPriority )
+
+  def getGroups( self ):
+    self.__lock.acquire()
+    try:
+      return list( self.__groups )
+    finally:
+      self.__lock.release()
+
+  def getOwners( self, ownerGroup ):
+    """
+    Get the DNs having task queues in a group, with their number of task queues
+    """
+    self.__lock.acquire()
+    try:
+      return dict( [ ( ownerDN, len( self.__owners[ ( ownerDN, ownerGroup ) ][ 'TQs' ] ) )
+                     for ownerDN in self.__groups.get( ownerGroup, () ) ] )
+    finally:
+      self.__lock.release()
+
+  def calculatePriorities( self, ownerGroup, share, ownerDN = None, allowBackground = False ):
+    """
+    Get the priorities of the task queues of an owner, the ones without jobs are left out
+
+    :type share: float
+    :param share: Share of the owner
+    :type ownerDN: string
+    :param ownerDN: None to get the priorities of all the task queues of the group
+    :type allowBackground: boolean
+    :param allowBackground: Give the minimum priority to the background task queues
+    :return: dictionary tqId -> priority
+    """
+    self.__lock.acquire()
+    try:
+      self.__stats[ 'Calculations' ] += 1
+      if ownerDN is None:
+        ownerKeys = [ ( dn, ownerGroup ) for dn in self.__groups.get( ownerGroup, () ) ]
+      else:
+        ownerKeys = [ ( ownerDN, ownerGroup ) ]
+      ownerKeys = [ ownerKey for ownerKey in ownerKeys if ownerKey in self.__owners ]
+      totalPrio = 0.
+      for ownerKey in ownerKeys:
+        owner = self.__owners[ ownerKey ]
+        totalPrio += owner[ 'Total' ]
+        if allowBackground:
+          totalPrio -= owner[ 'Background' ]
+      tqPrios = {}
+      tqGroups = {}
+      for ownerKey in ownerKeys:
+        for tqId in self.__owners[ ownerKey ][ 'TQs' ]:
+          tq = self.__tqs[ tqId ]
+          if not tq[ 'Jobs' ]:
+            continue
+          mean = tq[ 'Sum' ] / tq[ 'Jobs' ]
+          if ( mean > BACKGROUND_PRIORITY or not allowBackground ) and totalPrio > 0:
+            prio = ( share / totalPrio ) * mean
+          else:
+            prio = self.__minShare
+          tqPrios[ tqId ] = max( prio, self.__minShare )
+          tqGroups.setdefault( tq[ 'Definition' ], [] ).append( tqId )
+    finally:
+      self.__lock.release()
+    #Task queues that only differ in the ignored fields share the sum of their priorities
+    for tqGroup in tqGroups.values():
+      if len( tqGroup ) < 2:
+        continue
+      groupPrio = sum( [ tqPrios[ tqId ] for tqId in tqGroup ] )
+      for tqId in tqGroup:
+        tqPrios[ tqId ] = groupPrio
+    return tqPrios
+
+  def getChangedPriorities( self, tqPrios ):
+    """
+    Get the priorities different from the last ones written
+
+    :return: dictionary priority -> list of tqIds
+    """
+    changed = {}
+    self.__lock.acquire()
+    try:
+      for tqId in tqPrios:
+        tq = self.__tqs.get( tqId )
+        prio = round( tqPrios[ tqId ], 4 )
+        if tq and tq[ 'Priority' ] is not None and \
+           abs( prio - tq[ 'Priority' ] ) <= PRIORITY_TOLERANCE * max( prio, self.__minShare ):
+          continue
+        changed.setdefault( prio, [] ).append( tqId )
+    finally:
+      self.__lock.release()
+    return changed
+
+  def setPriority( self, tqIdList, priority ):
+    """
+    Remember the priority written for some task queues
+    """
+    self.__lock.acquire()
+    try:
+      for tqId in tqIdList:
+        if tqId in self.__tqs:
+          self.__tqs[ tqId ][ 'Priority' ] = priority
+          self.__stats[ 'PrioritiesChanged' ] += 1
+    finally:
+      self.__lock.release()
+
+  def getStats( self ):
+    self.__lock.acquire()
+    try:
+      stats = dict( self.__stats )
+      stats[ 'TaskQueues' ] = len( self.__tqs )
+      stats[ 'Owners' ] = len( self.__owners )
+    finally:
+      self.__lock.release()
+    return stats
@@ -0,0 +1,11 @@
+""" Task queue definitions used by the tests of the task queue helpers
+"""
+
+__RCSID__ = "$Id$"
+
+def tqDefinition( **kwargs ):
+  """ Definition of a task queue of /DC=user1 in the user group, changed by the given fields
+  """
+  tqDef = { 'OwnerDN' : '/DC=user1', 'OwnerGroup' : 'user', 'Setup' : 'Production', 'CPUTime' : 3600 }
+  tqDef.update( kwargs )
+  return tqDef
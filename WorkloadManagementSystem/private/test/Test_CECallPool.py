@@ -0,0 +1,106 @@
+""" Test cases for DIRAC.WorkloadManagementSystem.private.CECallPool
+"""
+
+__RCSID__ = "$Id$"
+
+import time
+import threading
+import unittest
+
+from DIRAC import S_OK
+from DIRAC.WorkloadManagementSystem.private.CECallPool import CECallPool
+
+class CECallPoolTestCase( unittest.TestCase ):
+  """ Calls run in parallel, each one waited for at most its timeout
+  """
+
+  def setUp( self ):
+    self.release = threading.Event()
+
+  def tearDown( self ):
+    self.release.set()
+
+  def sleepCall( self, seconds ):
+    time.sleep( seconds )
+    return S_OK( seconds )
+
+  def blockedCall( self ):
+    self.release.wait( 10 )
+    return S_OK( 'late' )
+
+  def testParallel( self ):
+    """ the calls run at the same time
+    """
+    pool = CECallPool( 4 )
+    start = time.time()
+    results = pool.execute( dict( [ ( 'queue%d' % i, ( self.sleepCall, ( 0.3, ), 5 ) ) for i in range( 4 ) ] ) )
+    self.assertTrue( time.time() - start < 1. )
+    for result, seconds in results.values():
+      self.assertEqual( result['Value'], 0.3 )
+      self.assertTrue( seconds >= 0.3 )
+
+  def testTimeout( self ):
+    """ a slow CE is abandoned and stays busy until it answers
+    """
+    pool = CECallPool( 2 )
+    start = time.time()
+    results = pool.execute( { 'slow' : ( self.blockedCall, (), 0.2 ),
+                              'fast' : ( self.sleepCall, ( 0.1, ), 5 ) } )
+    self.assertTrue( time.time() - start < 2. )
+    self.assertTrue( results['fast'][0]['OK'] )
+    self.assertFalse( results['slow'][0]['OK'] )
+    self.assertTrue( pool.isBusy( 'slow' ) )
+
+    results = pool.execute( { 'slow' : ( self.sleepCall, ( 0., ), 5 ) } )
+    self.assertFalse( results['slow'][0]['OK'] )
+    self.assertEqual( results['slow'][1], None )
+
+    self.release.set()
+    time.sleep( 0.2 )
+    self.assertFalse( pool.isBusy( 'slow' ) )
+
+  def chunkedCall( self, pool, key, chunks, seconds ):
+    done = 0
+    for _chunk in range( chunks ):
+      time.sleep( seconds )
+      done += 1
+      if not pool.progress( key, done ):
+        self.lateChunks = done
+        break
+    return S_OK( done )
+
+  def testProgress( self ):
+    """ the timeout applies to each chunk, an abandoned call stops at the next progress
+    """
+    pool = CECallPool( 2 )
+    results = pool.execute( { 'chunks' : ( self.chunkedCall, ( pool, 'chunks', 4, 0.1 ), 0.3 ) } )
+    self.assertEqual( results['chunks'][0]['Value'], 4 )
+
+    self.lateChunks = None
+    results = pool.execute( { 'chunks' : ( self.chunkedCall, ( pool, 'chunks', 4, 0.4 ), 0.3 ) } )
+    self.assertFalse( results['chunks'][0]['OK'] )
+    self.assertEqual( results['chunks'][0]['Progress'], None )
+    time.sleep( 0.3 )
+    self.assertEqual( self.lateChunks, 1 )
+    self.assertFalse( pool.isBusy( 'chunks' ) )
+    #Calls out of the pool always go on
+    self.assertTrue( pool.progress( 'chunks', 1 ) )
+
+  def testCancelled( self ):
+    """ the calls that can not get a thread are cancelled
+    """
+    pool = CECallPool( 1 )
+    results = pool.execute( { 'slow' : ( self.blockedCall, (), 0.2 ) } )
+    self.assertFalse( results['slow'][0]['OK'] )
+    results = pool.execute( { 'other' : ( self.sleepCall, ( 0., ), 5 ) } )
+    self.assertFalse( results['other'][0]['OK'] )
+    self.assertEqual( results['other'][1], None )
+    self.release.set()
+    time.sleep( 0.2 )
+    #The cancelled call is dropped by the thread
+    self.assertFalse( pool.isBusy( 'other' ) )
+    self.assertTrue( pool.execute( { 'other' : ( self.sleepCall, ( 0., ), 5 ) } )['other'][0]['OK'] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( CECallPoolTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,126 @@
+""" Test cases for DIRAC.WorkloadManagementSystem.private.JobStateUpdateBuffer
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.WorkloadManagementSystem.private.JobStateUpdateBuffer import JobStateUpdateBuffer
+
+class JobStateUpdateBufferTestCase( unittest.TestCase ):
+  """ Updates merged per job and written in bulk
+  """
+
+  def setUp( self ):
+    self.journalDir = tempfile.mkdtemp()
+    self.jobDB = MagicMock()
+    self.jobDB.getAttributesForJobList.return_value = S_OK( { 1 : { 'Status' : 'Matched', 'MinorStatus' : 'Assigned' },
+                                                              2 : { 'Status' : 'Running', 'MinorStatus' : 'Application' } } )
+    for method in ( 'setJobsAttributes', 'setEndExecTime', 'setStartExecTime', 'setJobsHeartBeatData',
+                    'setJobsParameters' ):
+      getattr( self.jobDB, method ).return_value = S_OK()
+    self.logDB = MagicMock()
+    self.logDB.addLoggingRecordList.return_value = S_OK()
+
+  def tearDown( self ):
+    shutil.rmtree( self.journalDir )
+
+  def newBuffer( self ):
+    updateBuffer = JobStateUpdateBuffer( self.jobDB, self.logDB, self.journalDir )
+    self.assertTrue( updateBuffer.loadJournal()['OK'] )
+    return updateBuffer
+
+  def testMerge( self ):
+    """ last status wins, parameters merged, every logging record kept
+    """
+    updateBuffer = self.newBuffer()
+    updateBuffer.setJobStatus( 1, 'Running', 'Job Initialization', 'JobWrapper' )
+    updateBuffer.setJobParameters( 1, [ ( 'CPU', '1' ), ( 'Node', 'a' ) ] )
+    updateBuffer.setJobStatus( 1, '', 'Application', 'JobWrapper' )
+    updateBuffer.setJobParameters( 1, [ ( 'CPU', '2' ) ] )
+    updateBuffer.setJobStatus( 2, 'Done', 'Execution Complete', 'JobWrapper' )
+    updateBuffer.setJobStatus( 3, 'Done', 'Execution Complete', 'JobWrapper' )
+    self.assertEqual( updateBuffer.getNumberOfJobs(), 3 )
+
+    result = updateBuffer.flush()
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value'], 3 )
+    self.assertEqual( updateBuffer.getNumberOfJobs(), 0 )
+
+    attrCalls = sorted( [ ( args[2], args[0] ) for args, _kwargs in self.jobDB.setJobsAttributes.call_args_list ] )
+    self.assertEqual( attrCalls, [ ( [ 'Application', 'Running' ], [ 1 ] ),
+                                   ( [ 'Execution Complete', 'Done' ], [ 2 ] ) ] )
+    self.assertEqual( self.jobDB.setEndExecTime.call_args[0][0], 2 )
+    self.assertEqual( sorted( self.jobDB.setJobsParameters.call_args[0][0][1] ), [ ( 'CPU', '2' ), ( 'Node', 'a' ) ] )
+    records = self.logDB.addLoggingRecordList.call_args[0][0]
+    self.assertEqual( [ record[:3] for record in records if record[0] == 1 ],
+                      [ ( 1, 'Running', 'Job Initialization' ), ( 1, 'Running', 'Application' ) ] )
+    #Job 3 is not in the JobDB
+    self.assertEqual( len( records ), 3 )
+
+  def testHeartBeat( self ):
+    """ a status received after a heart beat is written after it
+    """
+    updateBuffer = self.newBuffer()
+    updateBuffer.setHeartBeatData( 2, { 'Node' : 'a' }, { 'LoadAverage' : 1.5 } )
+    updateBuffer.setJobStatus( 2, 'Completed', 'Application Finished Successfully', 'JobWrapper' )
+    updateBuffer.setJobStatus( 1, 'Running', '', 'JobAgent' )
+    updateBuffer.setHeartBeatData( 1, {}, { 'LoadAverage' : 0.5 } )
+    self.assertTrue( updateBuffer.flush()['OK'] )
+    heartBeats = self.jobDB.setJobsHeartBeatData.call_args[0][0]
+    self.assertEqual( sorted( heartBeats ), [ 1, 2 ] )
+    self.assertEqual( heartBeats[2][2][0][:2], ( 'LoadAverage', 1.5 ) )
+    attrCalls = dict( [ ( args[0][0], ( args[1], kwargs[ 'update' ] ) )
+                        for args, kwargs in self.jobDB.setJobsAttributes.call_args_list ] )
+    self.assertEqual( attrCalls, { 1 : ( [], True ),
+                                   2 : ( [ 'MinorStatus', 'Status' ], True ) } )
+
+  def testFailedFlush( self ):
+    """ the heart beat data is not inserted again when the rest of a flush fails,
+        the final statuses are not overwritten
+    """
+    updateBuffer = self.newBuffer()
+    updateBuffer.setHeartBeatData( 2, {}, { 'LoadAverage' : 1.5 } )
+    updateBuffer.setJobStatus( 2, 'Completed', 'Application Finished Successfully', 'JobWrapper' )
+    self.jobDB.setJobsAttributes.return_value = S_ERROR( 'DB down' )
+    self.assertFalse( updateBuffer.flush()['OK'] )
+    self.assertEqual( sorted( self.jobDB.setJobsHeartBeatData.call_args[0][0] ), [ 2 ] )
+    self.jobDB.setJobsAttributes.return_value = S_OK()
+    self.assertTrue( updateBuffer.flush()['OK'] )
+    self.assertEqual( self.jobDB.setJobsHeartBeatData.call_args[0][0], {} )
+    args, kwargs = self.jobDB.setJobsAttributes.call_args
+    self.assertEqual( ( args[0], args[2] ), ( [ 2 ], [ 'Application Finished Successfully', 'Completed' ] ) )
+    self.assertTrue( 'Killed' in kwargs[ 'excludedStatuses' ] )
+    self.assertTrue( 'Killed' in self.jobDB.setJobsHeartBeatData.call_args[1][ 'excludedStatuses' ] )
+
+  def testJournal( self ):
+    """ updates not written are replayed, failed and partial flushes are handled
+    """
+    updateBuffer = self.newBuffer()
+    updateBuffer.setJobStatus( 1, 'Running', 'Job Initialization', 'JobWrapper' )
+    updateBuffer.setJobStatus( 2, 'Done', 'Execution Complete', 'JobWrapper' )
+    self.jobDB.setJobsAttributes.return_value = S_ERROR( 'DB down' )
+    self.assertFalse( updateBuffer.flush()['OK'] )
+    self.assertEqual( updateBuffer.getNumberOfJobs(), 2 )
+    self.jobDB.setJobsAttributes.return_value = S_OK()
+    result = updateBuffer.flush( [ 2 ] )
+    self.assertEqual( result['Value'], 1 )
+    updateBuffer.setJobParameters( 2, [ ( 'CPU', '3' ) ] )
+
+    #The service dies: job 1 and the last parameter of job 2 are replayed
+    replayBuffer = JobStateUpdateBuffer( self.jobDB, self.logDB, self.journalDir )
+    result = replayBuffer.loadJournal()
+    self.assertEqual( result['Value'], 2 )
+    self.assertEqual( replayBuffer.getNumberOfJobs(), 2 )
+    self.assertTrue( replayBuffer.flush()['OK'] )
+    self.assertEqual( os.listdir( self.journalDir ), [ '%010d.journal' % 4 ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( JobStateUpdateBufferTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
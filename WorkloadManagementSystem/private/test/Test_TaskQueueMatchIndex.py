@@ -0,0 +1,90 @@
+""" Test cases for DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex import TaskQueueMatchIndex
+from DIRAC.WorkloadManagementSystem.private.test.TaskQueueDefinitions import tqDefinition
+
+class TaskQueueMatchIndexTestCase( unittest.TestCase ):
+  """ Candidates found for several resources
+  """
+
+  def setUp( self ):
+    self.index = TaskQueueMatchIndex( lambda group: group == 'prod' )
+    self.index.reset( { 1 : tqDefinition(),
+                        2 : tqDefinition( Sites = [ 'Site.A', 'Site.B' ], CPUTime = 86400 ),
+                        3 : tqDefinition( BannedSites = [ 'Site.A' ] ),
+                        4 : tqDefinition( Platforms = [ 'x86_64-slc6' ] ),
+                        5 : tqDefinition( Tags = [ '4Processors' ] ),
+                        6 : tqDefinition( OwnerDN = '/DC=user2', OwnerGroup = 'prod' ),
+                        7 : tqDefinition( Setup = 'Certification' ) }, 7 )
+    self.resource = { 'OwnerDN' : '/DC=user1', 'OwnerGroup' : [ 'user', 'prod' ],
+                      'Setup' : 'Production', 'CPUTime' : 100000 }
+
+  def __getCandidates( self, **kwargs ):
+    resource = dict( self.resource )
+    resource.update( kwargs )
+    return self.index.getCandidates( resource )
+
+  def testSingleValues( self ):
+    """ owner, setup and CPU time
+    """
+    self.assertEqual( self.__getCandidates(), set( [ 1, 2, 3, 6 ] ) )
+    self.assertEqual( self.__getCandidates( CPUTime = 7200 ), set( [ 1, 3, 6 ] ) )
+    self.assertEqual( self.__getCandidates( OwnerGroup = 'user' ), set( [ 1, 2, 3 ] ) )
+    self.assertEqual( self.__getCandidates( Setup = 'Certification' ), set( [ 7 ] ) )
+
+  def testSites( self ):
+    """ required and banned sites
+    """
+    self.assertEqual( self.__getCandidates( Site = 'Site.A' ), set( [ 1, 2, 6 ] ) )
+    self.assertEqual( self.__getCandidates( Site = 'Site.C' ), set( [ 1, 3, 6 ] ) )
+    self.assertEqual( self.__getCandidates( Site = 'Site.C', BannedSite = 'Site.A' ), set( [ 1, 3, 6 ] ) )
+    self.assertEqual( self.__getCandidates( Site = 'Site.B', BannedSite = [ 'Site.A', 'Site.B' ] ), set( [ 1, 3, 6 ] ) )
+
+  def testStrictFields( self ):
+    """ platforms and tags can only be matched by resources giving them
+    """
+    self.assertEqual( self.__getCandidates( Platform = 'x86_64-slc6' ), set( [ 1, 2, 3, 4, 6 ] ) )
+    self.assertEqual( self.__getCandidates( LHCbPlatform = 'x86_64-slc6' ), set( [ 1, 2, 3, 4, 6 ] ) )
+    self.assertEqual( self.__getCandidates( Tag = [ '1Processors', '4Processors' ] ), set( [ 1, 2, 3, 5, 6 ] ) )
+    self.assertEqual( self.__getCandidates( Tag = [ '1Processors' ] ), set( [ 1, 2, 3, 6 ] ) )
+    self.assertEqual( self.__getCandidates( Tag = 'Any' ), set( [ 1, 2, 3, 5, 6 ] ) )
+    self.assertEqual( self.__getCandidates( Tag = [ '4Processors' ], RequiredTag = [ '4Processors' ] ), set( [ 5 ] ) )
+
+  def testCase( self ):
+    """ values compared as the case insensitive DB collation does
+    """
+    self.assertEqual( self.__getCandidates( Site = 'site.a' ), set( [ 1, 2, 6 ] ) )
+    self.assertEqual( self.__getCandidates( Platform = 'X86_64-SLC6 ' ), set( [ 1, 2, 3, 4, 6 ] ) )
+    self.assertEqual( self.__getCandidates( OwnerDN = '/dc=user1', Setup = 'production' ), set( [ 1, 2, 3, 6 ] ) )
+    self.assertEqual( self.__getCandidates( OwnerGroup = 'USER' ), set( [ 1, 2, 3 ] ) )
+    #Only the DB can compare them
+    self.assertEqual( self.__getCandidates( Site = 'Sit\xc3\xa9.A' ), None )
+    self.index.addTaskQueue( 8, tqDefinition( Sites = [ u'Sit\xe9.A' ] ) )
+    self.assertEqual( self.__getCandidates( Site = 'Site.C' ), set( [ 1, 3, 6, 8 ] ) )
+    self.index.removeTaskQueue( 8 )
+    self.assertEqual( self.__getCandidates( Site = 'Site.C' ), set( [ 1, 3, 6 ] ) )
+    self.assertEqual( self.index.getStats()[ 'UnsureLookups' ], 1 )
+
+  def testEvents( self ):
+    """ created and deleted task queues
+    """
+    self.index.addTaskQueue( 8, tqDefinition( Sites = [ 'Site.C' ] ) )
+    self.assertEqual( self.__getCandidates( Site = 'Site.C' ), set( [ 1, 3, 6, 8 ] ) )
+    self.index.removeTaskQueue( 8 )
+    self.index.removeTaskQueue( 3 )
+    self.assertEqual( self.__getCandidates( Site = 'Site.C' ), set( [ 1, 6 ] ) )
+    self.index.update( { 9 : tqDefinition( CPUTime = 60 ) }, 9 )
+    self.assertEqual( self.__getCandidates( CPUTime = 60 ), set( [ 9 ] ) )
+    self.assertEqual( self.index.getLastTQId(), 9 )
+    stats = self.index.getStats()
+    self.assertEqual( stats[ 'TaskQueues' ], 7 )
+    self.assertEqual( stats[ 'Lookups' ], 3 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( TaskQueueMatchIndexTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
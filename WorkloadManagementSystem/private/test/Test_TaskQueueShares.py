@@ -0,0 +1,86 @@
+""" Test cases for DIRAC.WorkloadManagementSystem.private.TaskQueueShares
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+
+from DIRAC.WorkloadManagementSystem.private.TaskQueueShares import TaskQueueShares
+from DIRAC.WorkloadManagementSystem.private.test.TaskQueueDefinitions import tqDefinition
+
+class TaskQueueSharesTestCase( unittest.TestCase ):
+  """ Priorities calculated from the running sums
+  """
+
+  def setUp( self ):
+    self.shares = TaskQueueShares( 0.001, ( 'Sites', 'BannedSites' ) )
+    self.shares.reset( { 1 : ( tqDefinition(), 2, 2., 1. ),
+                         2 : ( tqDefinition( CPUTime = 86400 ), 1, 3., 1. ),
+                         3 : ( tqDefinition( OwnerDN = '/DC=user2' ), 1, 1., 1. ),
+                         4 : ( tqDefinition( OwnerGroup = 'prod' ), 0, None, 1. ) } )
+
+  def testPriorities( self ):
+    """ share spread by mean job priority
+    """
+    self.assertEqual( self.shares.getOwners( 'user' ), { '/DC=user1' : 2, '/DC=user2' : 1 } )
+    self.assertEqual( self.shares.calculatePriorities( 'user', 400., ownerDN = '/DC=user1' ), { 1 : 100., 2 : 300. } )
+    self.assertEqual( self.shares.calculatePriorities( 'user', 500. ), { 1 : 100., 2 : 300., 3 : 100. } )
+    self.assertEqual( self.shares.calculatePriorities( 'prod', 500. ), {} )
+
+  def testJobs( self ):
+    """ running sums updated by the jobs inserted and deleted
+    """
+    self.assertTrue( self.shares.addJob( 1, 4. ) )
+    self.assertTrue( self.shares.removeJob( 2, 3. ) )
+    self.assertFalse( self.shares.addJob( 5, 1. ) )
+    self.assertEqual( self.shares.calculatePriorities( 'user', 400., ownerDN = '/DC=user1' ), { 1 : 400. } )
+    self.shares.removeTaskQueue( 1 )
+    self.shares.addTaskQueue( 5, tqDefinition() )
+    self.shares.addJob( 5, 1. )
+    self.assertEqual( self.shares.calculatePriorities( 'user', 400., ownerDN = '/DC=user1' ), { 5 : 400. } )
+    self.assertEqual( self.shares.getStats()[ 'JobUpdates' ], 3 )
+
+  def testBackgroundAndGroups( self ):
+    """ background task queues and task queues only differing in the sites
+    """
+    self.shares.addTaskQueue( 5, tqDefinition( Sites = [ 'Site.A' ] ) )
+    self.shares.addJob( 5, 0.00001 )
+    prios = self.shares.calculatePriorities( 'user', 400., ownerDN = '/DC=user1', allowBackground = True )
+    self.assertEqual( dict( [ ( tqId, round( prios[ tqId ], 4 ) ) for tqId in prios ] ),
+                      { 1 : 100.001, 2 : 300., 5 : 100.001 } )
+
+  def testGroupReload( self ):
+    """ the sums of a group are replaced by the ones read from the DB
+    """
+    self.shares.addJob( 1, 4. )
+    self.shares.reset( { 1 : ( tqDefinition(), 1, 2., 100. ),
+                         5 : ( tqDefinition( OwnerDN = '/DC=user3' ), 1, 1., 1. ) }, 'user' )
+    self.assertEqual( self.shares.getOwners( 'user' ), { '/DC=user1' : 1, '/DC=user3' : 1 } )
+    self.assertEqual( self.shares.calculatePriorities( 'user', 300. ), { 1 : 200., 5 : 100. } )
+    self.assertEqual( self.shares.getChangedPriorities( { 1 : 200., 5 : 100. } ), { 200. : [ 1 ], 100. : [ 5 ] } )
+    self.assertEqual( self.shares.getChangedPriorities( { 1 : 100. } ), {} )
+    self.assertEqual( self.shares.getOwners( 'prod' ), { '/DC=user1' : 1 } )
+
+  def testLoadTime( self ):
+    """ the sums of a group are as recent as the last full or group reload
+    """
+    loaded = self.shares.getLoadTime()
+    self.assertTrue( loaded > 0 )
+    self.assertEqual( self.shares.getLoadTime( 'user' ), loaded )
+    self.shares.reset( { 1 : ( tqDefinition(), 1, 2., 1. ) }, 'user' )
+    self.assertTrue( self.shares.getLoadTime( 'user' ) >= loaded )
+    self.assertEqual( self.shares.getLoadTime( 'prod' ), loaded )
+    self.assertEqual( self.shares.getLoadTime(), loaded )
+    self.assertEqual( TaskQueueShares().getLoadTime( 'user' ), 0 )
+
+  def testChangedPriorities( self ):
+    """ only the priorities that changed are written again
+    """
+    changed = self.shares.getChangedPriorities( { 1 : 1.00001, 2 : 300., 3 : 300. } )
+    self.assertEqual( changed, { 300. : [ 2, 3 ] } )
+    self.shares.setPriority( [ 2, 3 ], 300. )
+    self.assertEqual( self.shares.getChangedPriorities( { 2 : 300., 3 : 300. } ), {} )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( TaskQueueSharesTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,3 @@
+"""
+   DIRAC.WorkloadManagementSystem.private test package
+"""
@@ -74,7 +74,46 @@ class JobSubmissionCase( JobDBTestCase ):
     res = self.jobDB.getJobOptParameters( jobID )
     self.assert_( res['OK'] )
     self.assertEqual( res['Value'], {} )
-    
+
+  def test_insertNewJobsIntoDB( self ):
+
+    jdlList = [ jdl.replace( 'helloWorld', 'helloWorld_%s' % n ) for n in range( 5 ) ]
+    res = self.jobDB.insertNewJobsIntoDB( jdlList, 'owner', '/DN/OF/owner', 'ownerGroup', 'someSetup' )
+    self.assert_( res['OK'] )
+    self.assertEqual( len( res['Value'] ), 5 )
+    jobIDs = [ jobDict['JobID'] for jobDict in res['Value'] ]
+    self.assertEqual( len( set( jobIDs ) ), 5 )
+    for n, jobID in enumerate( jobIDs ):
+      res = self.jobDB.getJobAttributes( jobID, ['Status', 'JobName'] )
+      self.assert_( res['OK'] )
+      self.assertEqual( res['Value'], {'Status': 'Received', 'JobName': 'helloWorld_%s' % n} )
+      res = self.jobDB.getJobJDL( jobID )
+      self.assert_( res['OK'] )
+      self.assert_( 'helloWorld_%s' % n in res['Value'] )
+
+  def test_getJobAttributesColumns( self ):
+
+    jdlList = [ jdl.replace( 'helloWorld', 'helloWorld_%s' % n ) for n in range( 3 ) ]
+    res = self.jobDB.insertNewJobsIntoDB( jdlList, 'columnsOwner', '/DN/OF/owner', 'ownerGroup', 'someSetup' )
+    self.assert_( res['OK'] )
+    jobIDs = sorted( [ jobDict['JobID'] for jobDict in res['Value'] ] )
+    res = self.jobDB.setJobParameter( jobIDs[1], 'CPUNormalizationFactor', '10.0' )
+    self.assert_( res['OK'] )
+
+    res = self.jobDB.getJobAttributesColumns( { 'Owner' : 'columnsOwner' }, [ 'JobName', 'RescheduleCounter' ],
+                                              maxJobs = 2 )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value']['JobID'], jobIDs[:2] )
+    self.assertEqual( res['Value']['JobName'], [ 'helloWorld_0', 'helloWorld_1' ] )
+    self.assertEqual( res['Value']['RescheduleCounter'], [ 0, 0 ] )
+    res = self.jobDB.getJobAttributesColumns( { 'Owner' : 'columnsOwner' }, [ 'JobName' ], startJobID = jobIDs[1] )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value']['JobID'], jobIDs[2:] )
+
+    res = self.jobDB.getJobParametersColumns( jobIDs, [ 'CPUNormalizationFactor' ] )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value'], { 'CPUNormalizationFactor' : [ None, '10.0', None ] } )
+
 class JobRescheduleCase(JobDBTestCase):  
   
   def test_rescheduleJob(self):
@@ -100,6 +139,35 @@ class CountJobsCase(JobDBTestCase):
   
     result = self.jobDB.getCounters( 'Jobs', ['Status', 'MinorStatus'], {}, '2007-04-22 00:00:00' )
     self.assert_( result['OK'],'Status after getCounters') 
+
+  def test_getJobCounters( self ):
+
+    jobIDs = []
+    for _i in range( 2 ):
+      res = self.jobDB.insertNewJobIntoDB( jdl, 'summaryOwner', '/DN/OF/summaryOwner', 'ownerGroup', 'someSetup' )
+      self.assert_( res['OK'] )
+      jobIDs.append( res['JobID'] )
+    res = self.jobDB.getJobCounters( ['Status'], { 'Owner' : 'summaryOwner' } )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value'], [ ( { 'Status' : 'Received' }, 2 ) ] )
+
+    res = self.jobDB.setJobStatus( jobIDs[0], 'Checking', 'JobSanity' )
+    self.assert_( res['OK'] )
+    res = self.jobDB.getJobCounters( ['Status', 'MinorStatus'], { 'Owner' : 'summaryOwner' } )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value'], [ ( { 'Status' : 'Checking', 'MinorStatus' : 'JobSanity' }, 1 ),
+                                      ( { 'Status' : 'Received', 'MinorStatus' : 'Job accepted' }, 1 ) ] )
+
+    res = self.jobDB.removeJobFromDB( jobIDs[1] )
+    self.assert_( res['OK'] )
+    res = self.jobDB.getJobCounters( ['Status'], { 'Owner' : 'summaryOwner' } )
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value'], [ ( { 'Status' : 'Checking' }, 1 ) ] )
+
+    # The counters kept by the triggers are the ones of the Jobs table
+    res = self.jobDB.checkJobsSummary()
+    self.assert_( res['OK'] )
+    self.assertEqual( res['Value'], 0 )
        
       
 if __name__ == '__main__':
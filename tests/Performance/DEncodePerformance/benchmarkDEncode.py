@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+""" Benchmark of the DEncode encoding and decoding speed.
+
+    It builds payloads shaped like the biggest replies the services send
+    (replica dictionaries, job attribute tables, accounting buckets), encodes
+    and decodes each of them several times, and prints the throughput in
+    MB/s and in objects/s for both directions.
+
+    It does not need any DIRAC installation or service, just run it:
+
+      python benchmarkDEncode.py [numberOfEntries] [repetitions]
+"""
+
+import sys
+import time
+import datetime
+
+from DIRAC.Core.Utilities import DEncode
+
+def getReplicaPayload( nEntries ):
+  """ Reply of a getReplicas call
+  """
+  successful = {}
+  for i in xrange( nEntries ):
+    lfn = '/lhcb/LHCb/Collision15/DIMUON.DST/00048000/0000/00048000_%08d_1.dimuon.dst' % i
+    successful[lfn] = { 'CERN-DST-EOS' : 'root://eoslhcb.cern.ch//eos/lhcb/grid/prod%s' % lfn,
+                        'IN2P3-DST' : 'srm://ccsrm.in2p3.fr:8443/srm/managerv2?SFN=/pnfs/in2p3.fr/data%s' % lfn }
+  return { 'OK' : True, 'Value' : { 'Successful' : successful, 'Failed' : {} } }
+
+def getJobAttributesPayload( nEntries ):
+  """ Reply of a getJobsAttributes call
+  """
+  jobs = {}
+  submission = datetime.datetime( 2015, 6, 1, 12, 0, 0 )
+  for jobID in xrange( nEntries ):
+    jobs[jobID] = { 'JobID' : str( jobID ),
+                    'Status' : 'Running',
+                    'MinorStatus' : 'Application',
+                    'ApplicationStatus' : 'DaVinci step 1',
+                    'Site' : 'LCG.CERN.ch',
+                    'Owner' : 'someuser',
+                    'OwnerGroup' : 'lhcb_user',
+                    'JobGroup' : '00048000',
+                    'JobType' : 'User',
+                    'SubmissionTime' : submission,
+                    'LastUpdateTime' : submission + datetime.timedelta( seconds = jobID ),
+                    'CPUTime' : 0.1 * jobID,
+                    'RescheduleCounter' : 0,
+                    'VerifiedFlag' : True }
+  return { 'OK' : True, 'Value' : jobs }
+
+def getAccountingPayload( nEntries ):
+  """ Buckets as sent by the accounting clients
+  """
+  records = []
+  for i in xrange( nEntries ):
+    records.append( ( 'Job', 1433160000 + i * 900, 1433160000 + ( i + 1 ) * 900,
+                      [ 'lhcb_user', 'LCG.CERN.ch', 'User', 'DaVinci', 'Done', 'x86_64-slc6' ],
+                      [ 3600.5, 3700.1, 1024 * 1024, 12, 1, 0, i ] ) )
+  return { 'OK' : True, 'Value' : records }
+
+def countObjects( uObject ):
+  """ Number of python objects in the payload, containers included
+  """
+  if type( uObject ) == dict:
+    return 1 + sum( countObjects( k ) + countObjects( v ) for k, v in uObject.iteritems() )
+  if type( uObject ) in ( list, tuple ):
+    return 1 + sum( countObjects( v ) for v in uObject )
+  return 1
+
+def runBenchmark( name, payload, repetitions ):
+  """ Encode and decode the payload and print the figures
+  """
+  nObjects = countObjects( payload )
+  start = time.time()
+  for _i in xrange( repetitions ):
+    data = DEncode.encode( payload )
+  encodeTime = ( time.time() - start ) / repetitions
+  start = time.time()
+  for _i in xrange( repetitions ):
+    DEncode.decode( data )
+  decodeTime = ( time.time() - start ) / repetitions
+  size = len( data ) / 1024. / 1024.
+  print "%-15s %8.2f MB %10d objects" % ( name, size, nObjects )
+  print "  encode: %8.2f MB/s %12.0f objects/s" % ( size / encodeTime, nObjects / encodeTime )
+  print "  decode: %8.2f MB/s %12.0f objects/s" % ( size / decodeTime, nObjects / decodeTime )
+
+if __name__ == "__main__":
+  nEntries = 10000
+  repetitions = 5
+  if len( sys.argv ) > 1:
+    nEntries = int( sys.argv[1] )
+  if len( sys.argv ) > 2:
+    repetitions = int( sys.argv[2] )
+  runBenchmark( 'getReplicas', getReplicaPayload( nEntries ), repetitions )
+  runBenchmark( 'getJobsAttributes', getJobAttributesPayload( nEntries ), repetitions )
+  runBenchmark( 'accounting', getAccountingPayload( nEntries ), repetitions )
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+""" Rate of the resolution of LFNs in bulk by the FileCatalogDB
+
+    It fills a test FileCatalogDB with files spread over directories, each
+    with one replica, then times exists, getFileMetadata and getReplicas for
+    all of them at once, and for comparison the resolution directory by
+    directory with FileManager._getDirectoryFiles. It prints the LFNs
+    resolved per second and the number of queries of each call. The files
+    are added only if they are not in the catalog yet, so the script can be
+    run again on the same DB.
+
+      python benchmarkBulkResolution.py [numberOfDirectories] [filesPerDirectory]
+
+    It uses the FileCatalogDB configured for this installation with the
+    FileManager and DirectoryLevelTree managers, use a test one.
+"""
+
+import sys
+import time
+
+from DIRAC.Core.Base import Script
+Script.parseCommandLine()
+
+from DIRAC import S_ERROR
+from DIRAC.Core.Security.Properties import FC_MANAGEMENT
+from DIRAC.Core.Utilities.List import breakListIntoChunks
+from DIRAC.DataManagementSystem.DB.FileCatalogDB import FileCatalogDB
+
+BASE_PATH = '/benchmark/bulkResolution'
+SE_NAME = 'BenchmarkSE'
+DATABASE_CONFIG = { 'UserGroupManager' : 'UserAndGroupManagerDB',
+                    'SEManager' : 'SEManagerDB',
+                    'SecurityManager' : 'NoSecurityManager',
+                    'DirectoryManager' : 'DirectoryLevelTree',
+                    'FileManager' : 'FileManager',
+                    'DirectoryMetadata' : 'DirectoryMetadata',
+                    'FileMetadata' : 'FileMetadata',
+                    'DatasetManager' : 'DatasetManager',
+                    'UniqueGUID' : False,
+                    'GlobalReadAccess' : True,
+                    'LFNPFNConvention' : 'Strong',
+                    'ResolvePFN' : True,
+                    'DefaultUmask' : 0775,
+                    'ValidFileStatus' : [ 'AprioriGood', 'Trash', 'Removing', 'Probing' ],
+                    'ValidReplicaStatus' : [ 'AprioriGood', 'Trash', 'Removing', 'Probing' ],
+                    'VisibleFileStatus' : [ 'AprioriGood' ],
+                    'VisibleReplicaStatus' : [ 'AprioriGood' ] }
+CRED_DICT = { 'username' : 'anonymous', 'group' : 'visitor', 'properties' : [ FC_MANAGEMENT ] }
+
+def getLFNs( numDirs, filesPerDir ):
+  return [ '%s/dir%05d/file%05d' % ( BASE_PATH, dirIndex, fileIndex )
+           for dirIndex in xrange( numDirs ) for fileIndex in xrange( filesPerDir ) ]
+
+def populate( db, lfns ):
+  """ Add the files not in the catalog yet
+  """
+  result = db.exists( lfns, CRED_DICT )
+  if not result['OK']:
+    return result
+  missing = [ lfn for lfn, exists in result['Value']['Successful'].items() if not exists ]
+  start = time.time()
+  for chunk in breakListIntoChunks( missing, 1000 ):
+    lfnDict = dict( [ ( lfn, { 'PFN' : lfn, 'SE' : SE_NAME, 'Size' : 1000, 'Checksum' : '12345678' } )
+                      for lfn in chunk ] )
+    result = db.addFile( lfnDict, CRED_DICT )
+    if not result['OK']:
+      return result
+    if result['Value']['Failed']:
+      return S_ERROR( 'Failed to add %d files' % len( result['Value']['Failed'] ) )
+  if missing:
+    print 'Added %d files in %.1f s' % ( len( missing ), time.time() - start )
+  return result
+
+class QueryCounter( object ):
+  """ Count the queries done through the DB object
+  """
+  def __init__( self, db ):
+    self.db = db
+    self.query = db._query
+    self.count = 0
+    db._query = self
+
+  def __call__( self, *args, **kwargs ):
+    self.count += 1
+    return self.query( *args, **kwargs )
+
+def timeCall( name, counter, numLFNs, function, *args ):
+  counter.count = 0
+  start = time.time()
+  result = function( *args )
+  elapsed = time.time() - start
+  if not result['OK']:
+    print '%-20s failed: %s' % ( name, result['Message'] )
+    return
+  print '%-20s %8.0f LFNs/s %8d queries' % ( name, numLFNs / elapsed, counter.count )
+
+def perDirectory( db, lfns ):
+  """ Resolution of the files directory by directory
+  """
+  dirDict = db.fileManager._getFileDirectories( lfns )
+  result = db.dtree.findDirs( dirDict.keys() )
+  if not result['OK']:
+    return result
+  for dirPath, dirID in result['Value'].items():
+    res = db.fileManager._getDirectoryFiles( dirID, dirDict[dirPath], [ 'FileID', 'Size', 'Checksum' ] )
+    if not res['OK']:
+      return res
+  return res
+
+def main():
+  args = Script.getPositionalArgs()
+  numDirs = int( args[0] ) if args else 2000
+  filesPerDir = int( args[1] ) if len( args ) > 1 else 25
+
+  db = FileCatalogDB()
+  result = db.setConfig( DATABASE_CONFIG )
+  if not result['OK']:
+    print result['Message']
+    sys.exit( 1 )
+  lfns = getLFNs( numDirs, filesPerDir )
+  result = populate( db, lfns )
+  if not result['OK']:
+    print result['Message']
+    sys.exit( 1 )
+
+  print '%d LFNs in %d directories' % ( len( lfns ), numDirs )
+  counter = QueryCounter( db )
+  #The first call fills the directory cache
+  db.dirCache.clear()
+  timeCall( 'exists (cold)', counter, len( lfns ), db.exists, lfns, CRED_DICT )
+  timeCall( 'exists', counter, len( lfns ), db.exists, lfns, CRED_DICT )
+  timeCall( 'getFileMetadata', counter, len( lfns ), db.getFileMetadata, lfns, CRED_DICT )
+  timeCall( 'getReplicas', counter, len( lfns ), db.getReplicas, lfns, False, CRED_DICT )
+  timeCall( 'per directory', counter, len( lfns ), perDirectory, db, lfns )
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+""" Benchmark of the compression codecs of the DISET bulk transfers.
+
+    It builds a directory looking like a job sandbox (text log files and some
+    already compressed data), starts a PlainTransport server on localhost
+    which extracts the bulks it receives with a FileHelper, and sends it the
+    directory with each available codec and with the one chosen automatically.
+    For each codec it prints the throughput in MB/s of sandbox data, the
+    bytes sent on the wire and the CPU time used by the whole process
+    (compression and decompression, both ends run here).
+
+    It does not need any DIRAC installation or service, just run it:
+
+      python benchmarkBulkCodecs.py [textSizeInMB] [compressedSizeInMB] [repetitions] [port]
+"""
+
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import threading
+
+from DIRAC.Core.DISET.private.FileHelper import FileHelper
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+from DIRAC.Core.Utilities import Compression
+
+def createSandbox( textSize, compressedSize ):
+  """ Directory with log files and already compressed files
+  """
+  sandboxDir = tempfile.mkdtemp()
+  line = 0
+  for logFile in xrange( textSize ):
+    with open( os.path.join( sandboxDir, "std%s.log" % logFile ), "w" ) as fd:
+      written = 0
+      while written < 1048576:
+        text = "%s INFO: event %s processed, %s tracks in %s ms\n" % ( time.ctime( line ), line,
+                                                                      line % 97, line % 13 )
+        fd.write( text )
+        written += len( text )
+        line += 1
+  for dataFile in xrange( compressedSize ):
+    with open( os.path.join( sandboxDir, "histos%s.root" % dataFile ), "wb" ) as fd:
+      fd.write( os.urandom( 1048576 ) )
+  return sandboxDir
+
+def serve( serverTransport, transfers ):
+  """ Extract the bulks, each one in a new connection
+  """
+  for _i in xrange( transfers ):
+    result = serverTransport.acceptConnection()
+    if not result[ 'OK' ]:
+      print result[ 'Message' ]
+      return
+    clientTransport = result[ 'Value' ]
+    fileHelper = FileHelper( clientTransport )
+    fileHelper.setRawTransfer( True )
+    destDir = tempfile.mkdtemp()
+    try:
+      result = fileHelper.networkToBulk( destDir )
+    finally:
+      shutil.rmtree( destDir )
+    clientTransport.sendData( result )
+    clientTransport.close()
+
+def sendBulk( sandboxDir, port, codec ):
+  """ Send the sandbox with a codec, or the one chosen for it if None
+  """
+  transport = PlainTransport( ( "localhost", port ) )
+  result = transport.initAsClient()
+  if not result[ 'OK' ]:
+    return result
+  fileHelper = FileHelper( transport )
+  fileHelper.setRawTransfer( True )
+  fileHelper.setPeerCodecs( Compression.getAvailableCodecs() )
+  result = fileHelper.bulkToNetwork( [ sandboxDir ], codec = codec )
+  if result[ 'OK' ]:
+    result = fileHelper.receiveResult()
+    if result[ 'OK' ]:
+      result[ 'Value' ] = fileHelper.getTransferedBytes()
+  transport.close()
+  return result
+
+def getCPUTime():
+  usage = resource.getrusage( resource.RUSAGE_SELF )
+  return usage.ru_utime + usage.ru_stime
+
+if __name__ == "__main__":
+  textSize = 64
+  compressedSize = 8
+  repetitions = 3
+  port = 9998
+  if len( sys.argv ) > 1:
+    textSize = int( sys.argv[1] )
+  if len( sys.argv ) > 2:
+    compressedSize = int( sys.argv[2] )
+  if len( sys.argv ) > 3:
+    repetitions = int( sys.argv[3] )
+  if len( sys.argv ) > 4:
+    port = int( sys.argv[4] )
+
+  sandboxDir = createSandbox( textSize, compressedSize )
+  sandboxSize = textSize + compressedSize
+  codecs = Compression.getAvailableCodecs() + [ None ]
+  print "Sandbox of %s MB, %s cores, codecs %s" % ( sandboxSize, Compression.getCPUCount(),
+                                                    ", ".join( Compression.getAvailableCodecs() ) )
+  print "Automatic choice: %s level %s" % Compression.chooseCodec( [ sandboxDir ], Compression.getAvailableCodecs() )
+
+  serverTransport = PlainTransport( ( "", port ), bServerMode = True )
+  serverTransport.initAsServer()
+  server = threading.Thread( target = serve, args = ( serverTransport, len( codecs ) * repetitions ) )
+  server.setDaemon( 1 )
+  server.start()
+
+  try:
+    for codec in codecs:
+      start = time.time()
+      startCPU = getCPUTime()
+      for _i in xrange( repetitions ):
+        result = sendBulk( sandboxDir, port, codec )
+        if not result[ 'OK' ]:
+          print "Transfer failed: %s" % result[ 'Message' ]
+          sys.exit( 1 )
+      elapsed = ( time.time() - start ) / repetitions
+      cpuTime = ( getCPUTime() - startCPU ) / repetitions
+      print "%-5s %8.1f MB/s %8.1f MB sent %7.2f s CPU %7.3f s CPU/MB" % ( codec or "auto", sandboxSize / elapsed,
+                                                                          result[ 'Value' ] / 1048576.,
+                                                                          cpuTime, cpuTime / sandboxSize )
+  finally:
+    shutil.rmtree( sandboxDir )
+    serverTransport.close()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+""" Benchmark of the DISET file transfer throughput.
+
+    It starts a PlainTransport server on localhost which receives files with
+    a FileHelper and writes them to /dev/null, and sends it a file several
+    times with the classic transfer (one encoded message and one
+    acknowledgement per packet) and with the raw transfer, both with and
+    without checksum. It prints the throughput of each mode in MB/s.
+
+    It does not need any DIRAC installation or service, just run it:
+
+      python benchmarkFileTransfer.py [fileSizeInMB] [repetitions] [port]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+
+from DIRAC.Core.DISET.private.FileHelper import FileHelper
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+def serve( serverTransport, transfers ):
+  """ Receive the transfers, each one in a new connection
+  """
+  for rawTransfer, checkSum in transfers:
+    result = serverTransport.acceptConnection()
+    if not result[ 'OK' ]:
+      print result[ 'Message' ]
+      return
+    clientTransport = result[ 'Value' ]
+    fileHelper = FileHelper( clientTransport, checkSum )
+    fileHelper.setRawTransfer( rawTransfer )
+    devNull = open( os.devnull, "wb" )
+    result = fileHelper.networkToDataSink( devNull )
+    devNull.close()
+    clientTransport.sendData( result )
+    clientTransport.close()
+
+def sendFile( filePath, port, rawTransfer, checkSum ):
+  """ Send the file and wait for the result of the server
+  """
+  transport = PlainTransport( ( "localhost", port ) )
+  result = transport.initAsClient()
+  if not result[ 'OK' ]:
+    return result
+  fileHelper = FileHelper( transport, checkSum )
+  fileHelper.setRawTransfer( rawTransfer )
+  fd = os.open( filePath, os.O_RDONLY )
+  try:
+    result = fileHelper.FDToNetwork( fd )
+  finally:
+    os.close( fd )
+  if result[ 'OK' ]:
+    result = fileHelper.receiveResult()
+  transport.close()
+  return result
+
+if __name__ == "__main__":
+  fileSize = 256
+  repetitions = 3
+  port = 9999
+  if len( sys.argv ) > 1:
+    fileSize = int( sys.argv[1] )
+  if len( sys.argv ) > 2:
+    repetitions = int( sys.argv[2] )
+  if len( sys.argv ) > 3:
+    port = int( sys.argv[3] )
+
+  fd, filePath = tempfile.mkstemp()
+  for _i in xrange( fileSize ):
+    os.write( fd, os.urandom( 1048576 ) )
+  os.close( fd )
+
+  modes = [ ( rawTransfer, checkSum ) for rawTransfer in ( False, True ) for checkSum in ( True, False ) ]
+  transfers = []
+  for mode in modes:
+    transfers.extend( [ mode ] * repetitions )
+  serverTransport = PlainTransport( ( "", port ), bServerMode = True )
+  serverTransport.initAsServer()
+  server = threading.Thread( target = serve, args = ( serverTransport, transfers ) )
+  server.setDaemon( 1 )
+  server.start()
+
+  try:
+    for rawTransfer, checkSum in modes:
+      start = time.time()
+      for _i in xrange( repetitions ):
+        result = sendFile( filePath, port, rawTransfer, checkSum )
+        if not result[ 'OK' ]:
+          print "Transfer failed: %s" % result[ 'Message' ]
+          sys.exit( 1 )
+      elapsed = ( time.time() - start ) / repetitions
+      print "%-8s checksum %-3s %8.1f MB/s" % ( "raw" if rawTransfer else "classic", "on" if checkSum else "off",
+                                                fileSize / elapsed )
+  finally:
+    os.unlink( filePath )
+    serverTransport.close()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+""" Storage size and insertion rate of the heart beat data in the JobDB
+
+    It generates the heart beat data the Watchdog of a job sends every
+    HeartBeat period (load average, memory, CPU consumed, disk space...) for
+    a number of jobs, and compares the Rows storage of the HeartBeatLoggingInfo
+    table with the time series of the HeartBeatSeries table: the bytes per
+    point of the raw and of the compacted and downsampled blocks are printed
+    without any DB. With --db the heart beats are also inserted in the JobDB
+    with both storages, printing the heart beats inserted per second and the
+    size of the tables, and the jobs used are removed at the end.
+
+      python benchmarkHeartBeatStorage.py [--db] [numberOfJobs] [heartBeatsPerJob]
+
+    With --db it needs the JobDB configured for this installation, use a test one.
+"""
+
+import sys
+import time
+import random
+import datetime
+
+from DIRAC.Core.Base import Script
+Script.registerSwitch( '', 'db', 'Insert the heart beats in the JobDB' )
+Script.parseCommandLine()
+
+from DIRAC.WorkloadManagementSystem.Utilities.HeartBeatSeries import packRawPoints, encodeBlock, downsample
+
+HEARTBEAT_PERIOD = 300
+START_TIME = 1400000000
+#Bytes of a HeartBeatLoggingInfo row besides the name and the value: JobID, HeartBeatTime, lengths
+ROW_OVERHEAD = 4 + 8 + 1 + 2
+NAMES = [ 'LoadAverage', 'MemoryUsed', 'Vsize', 'AvailableDiskSpace', 'CPUConsumed', 'WallClockTime' ]
+
+def generateHeartBeats( numBeats ):
+  """ The dynamic data of the heart beats of a job as { name : [ ( epoch, value ) ] }
+  """
+  series = dict( [ ( name, [] ) for name in NAMES ] )
+  memory = random.uniform( 200., 2000. )
+  disk = random.uniform( 1e4, 1e5 )
+  for beat in xrange( numBeats ):
+    beatTime = START_TIME + beat * HEARTBEAT_PERIOD
+    memory = max( 100., memory + random.gauss( 0., 20. ) )
+    disk -= random.uniform( 0., 10. )
+    values = { 'LoadAverage' : round( random.uniform( 0.8, 1.2 ), 2 ),
+               'MemoryUsed' : round( memory, 1 ),
+               'Vsize' : round( memory * 1.6, 1 ),
+               'AvailableDiskSpace' : round( disk, 1 ),
+               'CPUConsumed' : round( beat * HEARTBEAT_PERIOD * 0.95, 1 ),
+               'WallClockTime' : float( beat * HEARTBEAT_PERIOD ) }
+    for name in NAMES:
+      series[ name ].append( ( beatTime, values[ name ] ) )
+  return series
+
+def storageSizes( jobSeries, blockSize, interval ):
+  """ Bytes used by each storage for the data of all the jobs, without the indexes
+  """
+  sizes = { 'Rows' : 0, 'Raw' : 0, 'Blocks' : 0, 'Downsampled' : 0 }
+  for series in jobSeries:
+    for name, points in series.items():
+      sizes[ 'Rows' ] += sum( [ ROW_OVERHEAD + len( name ) + len( str( value ) ) for _t, value in points ] )
+      sizes[ 'Raw' ] += len( packRawPoints( points ) )
+      for i in xrange( 0, len( points ), blockSize ):
+        block = points[i:i + blockSize]
+        sizes[ 'Blocks' ] += len( encodeBlock( block ) )
+        sizes[ 'Downsampled' ] += len( encodeBlock( downsample( block, interval ) ) )
+  return sizes
+
+def insertHeartBeats( jobDB, jobIDs, jobSeries ):
+  """ Insert the heart beats as the JobStateUpdate service writes them behind, all the jobs of a period at once
+  """
+  numBeats = len( jobSeries[0][ NAMES[0] ] )
+  start = time.time()
+  for beat in xrange( numBeats ):
+    beatTime = str( datetime.datetime.utcfromtimestamp( START_TIME + beat * HEARTBEAT_PERIOD ) )
+    heartBeatDict = {}
+    for jobID, series in zip( jobIDs, jobSeries ):
+      heartBeatDict[ jobID ] = ( beatTime, {}, [ ( name, series[ name ][ beat ][1], beatTime ) for name in NAMES ] )
+    result = jobDB.setJobsHeartBeatData( heartBeatDict )
+    if not result[ 'OK' ]:
+      print "Insertion failed: %s" % result[ 'Message' ]
+      return None
+  return time.time() - start
+
+def tableSize( jobDB, table ):
+  result = jobDB._query( "SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+                         "WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='%s'" % table )
+  if not result[ 'OK' ] or not result[ 'Value' ]:
+    return 0, 0
+  return result[ 'Value' ][0]
+
+if __name__ == "__main__":
+  useDB = ( 'db', '' ) in Script.getUnprocessedSwitches()
+  args = Script.getPositionalArgs()
+  numJobs = int( args[0] ) if args else 100
+  numBeats = int( args[1] ) if len( args ) > 1 else 288
+  jobSeries = [ generateHeartBeats( numBeats ) for _i in xrange( numJobs ) ]
+  numPoints = numJobs * numBeats * len( NAMES )
+
+  print "%d jobs, %d heart beats per job, %d points" % ( numJobs, numBeats, numPoints )
+  sizes = storageSizes( jobSeries, 60, 1800 )
+  for storage in ( 'Rows', 'Raw', 'Blocks', 'Downsampled' ):
+    print "%-12s %12d bytes: %6.2f bytes/point" % ( storage, sizes[ storage ], float( sizes[ storage ] ) / numPoints )
+
+  if not useDB:
+    sys.exit( 0 )
+
+  from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
+  jobDB = JobDB()
+  jdl = '[ Executable = "/bin/true"; JobName = "heartbeat_benchmark"; JobGroup = "benchmark"; ]'
+  result = jobDB.insertNewJobsIntoDB( [ jdl ] * numJobs, 'benchmark', '/DC=org/CN=benchmark',
+                                      'benchmark_user', 'Benchmark' )
+  if not result[ 'OK' ]:
+    print "Could not insert the jobs: %s" % result[ 'Message' ]
+    sys.exit( 1 )
+  jobIDs = [ jobDict[ 'JobID' ] for jobDict in result[ 'Value' ] ]
+
+  for storage, table in ( ( 'Rows', 'HeartBeatLoggingInfo' ), ( 'Series', 'HeartBeatSeries' ) ):
+    jobDB.heartBeatStorage = storage
+    before = tableSize( jobDB, table )
+    elapsed = insertHeartBeats( jobDB, jobIDs, jobSeries )
+    if elapsed is None:
+      break
+    if storage == 'Series':
+      #Compact everything, the jobs are put in a final state
+      jobDB.setJobsAttributes( jobIDs, [ 'Status' ], [ 'Done' ] )
+      result = jobDB.compactHeartBeatData( maxSeries = numJobs * len( NAMES ) )
+      if not result[ 'OK' ]:
+        print "Compaction failed: %s" % result[ 'Message' ]
+    jobDB._update( "ANALYZE TABLE %s" % table )
+    after = tableSize( jobDB, table )
+    print "%-7s %8.1f heart beats/s, %12d bytes of data, %12d bytes of index" % \
+          ( storage, numJobs * numBeats / elapsed, after[0] - before[0], after[1] - before[1] )
+    result = jobDB.getHeartBeatData( jobIDs[0] )
+    if result[ 'OK' ]:
+      print "%-7s %8d points read back for job %s" % ( storage, len( result[ 'Value' ] ), jobIDs[0] )
+
+  result = jobDB.removeJobFromDB( jobIDs )
+  if not result[ 'OK' ]:
+    print "Could not remove the jobs inserted: %s" % result[ 'Message' ]
+    sys.exit( 1 )
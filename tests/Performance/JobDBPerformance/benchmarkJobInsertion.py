@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+""" Throughput of the insertion of new jobs in the JobDB
+
+    It inserts the jobs of a parametric submission one by one, as the
+    JobManager did for every job, and then all at once with the bulk
+    insertion, and prints the jobs inserted per second and the DB statements
+    run per job for both. The jobs inserted are removed at the end.
+
+      python benchmarkJobInsertion.py [numberOfJobs] [bulkInsertionSize]
+
+    It needs the JobDB configured for this installation, use a test one.
+"""
+
+import sys
+import time
+
+from DIRAC.Core.Base import Script
+Script.parseCommandLine()
+
+from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
+
+JDL = """
+[
+    Executable = "$DIRACROOT/scripts/dirac-jobexec";
+    Arguments = "jobDescription.xml -o LogLevel=info -p Parameter=%s";
+    JobName = "benchmark_%n";
+    JobGroup = "benchmark";
+    JobType = "User";
+    Priority = "1";
+    Site = "ANY";
+    InputData = { "/vo/benchmark/file_%s.dst" };
+    Parameters = [ Counter = "%s"; ];
+    OutputSandbox = { "std.out", "std.err" };
+    StdOutput = "std.out";
+    StdError = "std.err";
+]
+"""
+
+OWNER = ( 'benchmark', '/DC=org/CN=benchmark', 'benchmark_user', 'Benchmark' )
+
+def generateJDLs( numJobs ):
+  return [ JDL.replace( '%s', str( n ) ).replace( '%n', str( n ).zfill( len( str( numJobs ) ) ) )
+           for n in xrange( numJobs ) ]
+
+def countStatements( jobDB ):
+  """ Count the statements run by the JobDB
+  """
+  counter = [ 0 ]
+  def counting( dbMethod ):
+    def countingMethod( cmd, *args, **kwargs ):
+      counter[0] += 1
+      return dbMethod( cmd, *args, **kwargs )
+    return countingMethod
+  for method in ( '_query', '_update' ):
+    setattr( jobDB, method, counting( getattr( jobDB, method ) ) )
+  dbTransaction = jobDB._transaction
+  def countingTransaction( cmdList, *args, **kwargs ):
+    counter[0] += len( cmdList )
+    return dbTransaction( cmdList, *args, **kwargs )
+  jobDB._transaction = countingTransaction
+  return counter
+
+def insertOneByOne( jobDB, jdlList ):
+  jobIDs = []
+  for jdl in jdlList:
+    result = jobDB.insertNewJobIntoDB( jdl, *OWNER )
+    if not result[ 'OK' ]:
+      print "Insertion failed: %s" % result[ 'Message' ]
+      break
+    jobIDs.append( result[ 'JobID' ] )
+  return jobIDs
+
+def insertBulk( jobDB, jdlList ):
+  result = jobDB.insertNewJobsIntoDB( jdlList, *OWNER )
+  if not result[ 'OK' ]:
+    print "Bulk insertion failed: %s" % result[ 'Message' ]
+    return []
+  return [ jobDict[ 'JobID' ] for jobDict in result[ 'Value' ] ]
+
+if __name__ == "__main__":
+  args = Script.getPositionalArgs()
+  numJobs = int( args[0] ) if args else 1000
+  jobDB = JobDB()
+  if len( args ) > 1:
+    jobDB.bulkInsertionSize = int( args[1] )
+  counter = countStatements( jobDB )
+  jdlList = generateJDLs( numJobs )
+
+  for title, insertJobs in ( ( "One by one", insertOneByOne ), ( "Bulk", insertBulk ) ):
+    counter[0] = 0
+    start = time.time()
+    jobIDs = insertJobs( jobDB, jdlList )
+    elapsed = time.time() - start
+    statements = counter[0]
+    if jobIDs:
+      print "%-10s %6d jobs in %8.2f s: %8.1f jobs/s, %6.2f statements/job" % ( title, len( jobIDs ), elapsed,
+                                                                               len( jobIDs ) / elapsed,
+                                                                               float( statements ) / len( jobIDs ) )
+      result = jobDB.removeJobFromDB( jobIDs )
+      if not result[ 'OK' ]:
+        print "Could not remove the jobs inserted: %s" % result[ 'Message' ]
+        sys.exit( 1 )
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+""" Replay benchmark of the task queue match index of the Matcher.
+
+    It replays resource descriptions against a set of task queue definitions
+    and prints, with and without the match index, the match latency and the
+    number of DB queries done per match.
+
+    Without the index every match runs the match SQL, which evaluates the
+    conditions of all the task queues of the setup. With it, the matches
+    without candidates don't touch the DB and the SQL only evaluates the
+    candidates. Offline, the benchmark times the index lookups and counts the
+    queries and task queues the SQL would evaluate:
+
+      python benchmarkMatchIndex.py [taskQueuesFile|numberOfTaskQueues] [resourcesFile|numberOfResources]
+
+    The task queues file holds in JSON the output of the getActiveTaskQueues
+    call of the Matcher, and the resources file one JSON resource description
+    per line, as received by requestJob. Without files, a population of task
+    queues and pilots is generated (5000 and 20000 by default).
+
+    With --db, the resources are replayed against the
+    TaskQueueDB configured for this installation with matchAndGetTaskQueue,
+    which doesn't take jobs out of the task queues, and the DB queries are
+    actually counted.
+"""
+
+import sys
+import json
+import time
+import random
+
+from DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex import TaskQueueMatchIndex
+
+SITES = [ 'LCG.Site%s.org' % i for i in xrange( 120 ) ]
+PLATFORMS = [ 'x86_64-slc6', 'x86_64-centos7', 'ANY' ]
+CPU_SEGMENTS = [ 360, 1800, 3600, 21600, 43200, 86400, 172800, 259200 ]
+GROUPS = [ 'user', 'prod', 'sgm' ]
+
+def generateTaskQueues( numTQs ):
+  """ Task queues of a busy setup: most of them of users, sent anywhere or to a few sites
+  """
+  tqDefs = {}
+  for tqId in xrange( 1, numTQs + 1 ):
+    group = random.choice( GROUPS )
+    tqDef = { 'OwnerDN' : '/DC=org/CN=user%s' % random.randint( 0, numTQs / 10 ),
+              'OwnerGroup' : group,
+              'Setup' : 'Production',
+              'CPUTime' : random.choice( CPU_SEGMENTS ),
+              'Platforms' : [ random.choice( PLATFORMS ) ] }
+    if random.random() < 0.6:
+      tqDef[ 'Sites' ] = random.sample( SITES, random.randint( 1, 3 ) )
+    if random.random() < 0.1:
+      tqDef[ 'BannedSites' ] = random.sample( SITES, 2 )
+    if random.random() < 0.05:
+      tqDef[ 'Tags' ] = [ '%sProcessors' % random.choice( ( 2, 4, 8 ) ) ]
+    tqDefs[ tqId ] = tqDef
+  return tqDefs
+
+def generateResources( numResources ):
+  """ Pilots of all the sites, matching for the VO
+  """
+  resources = []
+  for _i in xrange( numResources ):
+    resources.append( { 'Setup' : 'Production',
+                        'OwnerGroup' : GROUPS,
+                        'Site' : random.choice( SITES ),
+                        'CPUTime' : random.choice( CPU_SEGMENTS ),
+                        'Platform' : random.choice( PLATFORMS[:2] ),
+                        'Tag' : [ '1Processors' ] } )
+  return resources
+
+def loadTaskQueues( arg ):
+  try:
+    return generateTaskQueues( int( arg ) )
+  except ValueError:
+    with open( arg ) as fd:
+      return dict( [ ( int( tqId ), tqDef ) for tqId, tqDef in json.load( fd ).items() ] )
+
+def loadResources( arg ):
+  try:
+    return generateResources( int( arg ) )
+  except ValueError:
+    with open( arg ) as fd:
+      return [ json.loads( line ) for line in fd if line.strip() ]
+
+def percentile( values, fraction ):
+  values = sorted( values )
+  return values[ min( len( values ) - 1, int( fraction * len( values ) ) ) ]
+
+def printStats( title, latencies, queries, tqs, tqsLabel ):
+  print "%-14s latency mean %7.3f ms p50 %7.3f ms p95 %7.3f ms, %5.2f queries/match, %8.1f %s/match" % \
+        ( title, 1000 * sum( latencies ) / len( latencies ), 1000 * percentile( latencies, 0.5 ),
+          1000 * percentile( latencies, 0.95 ), float( sum( queries ) ) / len( queries ),
+          float( sum( tqs ) ) / len( tqs ), tqsLabel )
+
+def replayOffline( tqDefs, resources ):
+  """ Time the index lookups, the match SQL is only counted
+  """
+  index = TaskQueueMatchIndex()
+  start = time.time()
+  index.reset( tqDefs, max( tqDefs ) )
+  print "Indexed %s task queues in %.3f s" % ( len( tqDefs ), time.time() - start )
+  tqsPerSetup = {}
+  for tqDef in tqDefs.values():
+    tqsPerSetup[ tqDef[ 'Setup' ] ] = tqsPerSetup.get( tqDef[ 'Setup' ], 0 ) + 1
+  latencies = []
+  queries = []
+  evaluatedTQs = []
+  for resource in resources:
+    start = time.time()
+    candidates = index.getCandidates( resource )
+    latencies.append( time.time() - start )
+    queries.append( 1 if candidates else 0 )
+    evaluatedTQs.append( len( candidates ) )
+  print "Without index  1.00 queries/match, %8.1f TQs evaluated by the match SQL/match" % \
+        ( float( sum( [ tqsPerSetup.get( resource.get( 'Setup' ), 0 ) for resource in resources ] ) ) / len( resources ) )
+  printStats( "With index", latencies, queries, evaluatedTQs, "TQs evaluated by the match SQL" )
+  print "%s of %s matches without any candidate, the match SQL is not run for them" % ( queries.count( 0 ),
+                                                                                       len( resources ) )
+
+def replayDB( resources ):
+  """ Replay the resources against the TaskQueueDB, counting the queries
+  """
+  from DIRAC.Core.Base import Script
+  Script.parseCommandLine()
+  from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import TaskQueueDB
+
+  for useIndex in ( False, True ):
+    tqDB = TaskQueueDB()
+    queryCounter = [ 0 ]
+    dbQuery = tqDB._query
+    def countingQuery( *args, **kwargs ):
+      queryCounter[0] += 1
+      return dbQuery( *args, **kwargs )
+    tqDB._query = countingQuery
+    if useIndex:
+      result = tqDB.enableMatchIndex()
+      if not result[ 'OK' ]:
+        print "Cannot enable the match index: %s" % result[ 'Message' ]
+        sys.exit( 1 )
+    latencies = []
+    queries = []
+    matchedTQs = []
+    for resource in resources:
+      queryCounter[0] = 0
+      start = time.time()
+      result = tqDB.matchAndGetTaskQueue( resource, numQueuesToGet = 10 )
+      latencies.append( time.time() - start )
+      queries.append( queryCounter[0] )
+      if not result[ 'OK' ]:
+        print "Match failed: %s" % result[ 'Message' ]
+        sys.exit( 1 )
+      matchedTQs.append( len( result[ 'Value' ] ) )
+    printStats( "With index" if useIndex else "Without index", latencies, queries, matchedTQs, "TQs matched" )
+    if useIndex:
+      print "Match index: %s" % tqDB.getMatchIndexStats()[ 'Value' ]
+
+if __name__ == "__main__":
+  args = [ arg for arg in sys.argv[1:] if arg != '--db' ]
+  if '--db' in sys.argv:
+    sys.argv = sys.argv[:1]
+    replayDB( loadResources( args[0] if args else 20000 ) )
+  else:
+    replayOffline( loadTaskQueues( args[0] if args else 5000 ),
+                   loadResources( args[1] if len( args ) > 1 else 20000 ) )
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+""" Micro-benchmark of the DISET connection establishment.
+
+    It connects to a dips service over and over, doing only the TCP connection
+    and the SSL handshake, and prints the handshakes/s with and without SSL
+    session resumption, and how many of the connections were resumed.
+    Nothing is sent to the service, so any dips service can be used.
+
+    Tunable parameters (positional arguments):
+      * serviceURL: URL of the service, ie dips://yourmachine:9135/Framework/Test
+      * connections: number of connections done in each mode (default 200)
+
+    Set the PeerCredentialsCacheTime option of the service to 0 to measure
+    the server side cost of analyzing the client proxy in every handshake.
+"""
+
+import sys
+import time
+
+from DIRAC.Core.Base import Script
+Script.parseCommandLine()
+
+from DIRAC.Core.DISET.private.Transports.SSLTransport import SSLTransport
+from DIRAC.Core.Utilities import Network
+
+args = Script.getPositionalArgs()
+if not args:
+  Script.showHelp()
+  sys.exit( 1 )
+serviceURL = args[0]
+connections = int( args[1] ) if len( args ) > 1 else 200
+
+result = Network.splitURL( serviceURL )
+if not result[ 'OK' ]:
+  print result[ 'Message' ]
+  sys.exit( 1 )
+_proto, host, port, _path = result[ 'Value' ]
+
+def runBenchmark( enableSessions ):
+  """ Connect and close the given number of times
+  """
+  resumed = 0
+  errors = 0
+  start = time.time()
+  for _i in xrange( connections ):
+    transport = SSLTransport( ( host, port ), enableSessions = enableSessions )
+    result = transport.initAsClient()
+    if not result[ 'OK' ]:
+      errors += 1
+      continue
+    if transport.getSocket().session_reused():
+      resumed += 1
+    transport.close()
+  elapsed = time.time() - start
+  print "Sessions %-8s %8.1f handshakes/s, %s resumed, %s errors" % ( "enabled" if enableSessions else "disabled",
+                                                                       ( connections - errors ) / elapsed,
+                                                                       resumed, errors )
+
+runBenchmark( False )
+runBenchmark( True )
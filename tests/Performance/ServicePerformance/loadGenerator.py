@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+""" Load generator for a DIRAC service.
+
+    It opens a number of idle connections to the service, which stay open
+    like the ones of pilots waiting between two calls, and at the same time
+    hammers the service with ping RPC calls from several threads.
+    At the end it prints the number of concurrent connections the service
+    kept, the requests/s served and the call latencies.
+
+    Tunable parameters (positional arguments):
+      * serviceURL: URL of the service, ie dips://yourmachine:9135/Framework/Test
+      * idleConnections: number of idle connections to open (default 1000)
+      * clientThreads: number of threads doing RPC calls (default 20)
+      * duration: time in seconds it will run (default 60)
+
+    Compare the figures with the EventLoop option of the service set to
+    epoll and left to its default, select.
+"""
+
+import sys
+import time
+import socket
+import threading
+
+from DIRAC.Core.Base import Script
+Script.parseCommandLine()
+
+from DIRAC.Core.DISET.RPCClient import RPCClient
+from DIRAC.Core.Utilities import Network
+
+args = Script.getPositionalArgs()
+if not args:
+  Script.showHelp()
+  sys.exit( 1 )
+serviceURL = args[0]
+idleConnections = int( args[1] ) if len( args ) > 1 else 1000
+clientThreads = int( args[2] ) if len( args ) > 2 else 20
+duration = int( args[3] ) if len( args ) > 3 else 60
+
+result = Network.splitURL( serviceURL )
+if not result[ 'OK' ]:
+  print result[ 'Message' ]
+  sys.exit( 1 )
+_proto, host, port, _path = result[ 'Value' ]
+
+def openIdleConnections( number ):
+  """ Open connections that don't send anything
+  """
+  sockets = []
+  for _i in xrange( number ):
+    try:
+      sock = socket.create_connection( ( host, port ), 10 )
+    except socket.error as e:
+      print "Could only open %s idle connections: %s" % ( len( sockets ), e )
+      break
+    sockets.append( sock )
+  return sockets
+
+def countAliveConnections( sockets ):
+  """ Connections closed by the service are readable with no data
+  """
+  alive = 0
+  for sock in sockets:
+    sock.setblocking( 0 )
+    try:
+      if sock.recv( 1, socket.MSG_PEEK ):
+        alive += 1
+    except socket.error:
+      #Nothing to read, still open
+      alive += 1
+  return alive
+
+class Caller( threading.Thread ):
+  """ Call ping in a loop until the end time
+  """
+
+  def __init__( self, endTime ):
+    threading.Thread.__init__( self )
+    self.endTime = endTime
+    self.latencies = []
+    self.errors = 0
+
+  def run( self ):
+    rpcClient = RPCClient( serviceURL )
+    while time.time() < self.endTime:
+      start = time.time()
+      result = rpcClient.ping()
+      if result[ 'OK' ]:
+        self.latencies.append( time.time() - start )
+      else:
+        self.errors += 1
+
+idleSockets = openIdleConnections( idleConnections )
+print "Opened %s idle connections" % len( idleSockets )
+
+startTime = time.time()
+callers = [ Caller( startTime + duration ) for _i in xrange( clientThreads ) ]
+for caller in callers:
+  caller.start()
+for caller in callers:
+  caller.join()
+elapsed = time.time() - startTime
+
+latencies = sorted( sum( [ caller.latencies for caller in callers ], [] ) )
+errors = sum( [ caller.errors for caller in callers ] )
+print "Idle connections still open: %s/%s" % ( countAliveConnections( idleSockets ), len( idleSockets ) )
+print "Requests: %s OK, %s errors in %.1f s" % ( len( latencies ), errors, elapsed )
+print "Requests/s: %.1f" % ( len( latencies ) / elapsed )
+if latencies:
+  print "Latency: mean %.3f s, median %.3f s, 95%% %.3f s, max %.3f s" % ( sum( latencies ) / len( latencies ),
+                                                                           latencies[ len( latencies ) / 2 ],
+                                                                           latencies[ int( len( latencies ) * 0.95 ) ],
+                                                                           latencies[-1] )
+for sock in idleSockets:
+  sock.close()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+""" Overhead of the resource checks of the Watchdog on deep process trees
+
+    It starts a tree of sleeping processes of the given depth and fan out,
+    and times the sampling of the CPU and memory of the whole tree, load
+    average and memory of the node, as done at each check of the Watchdog:
+    first the way it was done before, listing /proc and calling ps for the
+    process group, walking the tree once for the CPU and once for the memory,
+    and calling cat and free, then with the single pass over /proc of the
+    ProcessMonitor. It prints the wall clock and the CPU time, of this process
+    and of the commands it spawned, per check.
+
+      python benchmarkProcessSampling.py [depth] [fanOut] [checks]
+"""
+
+import os
+import sys
+import time
+import signal
+import subprocess
+
+from DIRAC import gLogger
+from DIRAC.Core.Utilities.Subprocess import shellCall
+from DIRAC.Core.Utilities.ProcessMonitor import ProcessMonitor
+
+def startTree( depth, fanOut ):
+  """ A session of depth levels of shells with fanOut children each, the leaves sleeping
+  """
+  command = 'sleep 600'
+  for _level in xrange( depth ):
+    command = 'for i in %s; do sh -c %s & done; wait' % ( ' '.join( [ '1' ] * fanOut ), quote( command ) )
+  process = subprocess.Popen( [ 'sh', '-c', command ], preexec_fn = os.setsid )
+  expected = sum( [ fanOut ** level for level in xrange( depth + 1 ) ] )
+  for _i in xrange( 100 ):
+    time.sleep( 0.1 )
+    result = ProcessMonitor().getResourceConsumed( process.pid )
+    if result['OK'] and result['Value']['Processes'] >= expected:
+      break
+  return process
+
+def quote( command ):
+  return "'%s'" % command.replace( "'", "'\"'\"'" )
+
+def legacyTreeResources( pid ):
+  """ The walk of the process tree as done before, with ls and ps
+  """
+  pid = str( pid )
+  result = shellCall( 10, 'ls -d /proc/[0-9]*' )
+  pidList = result['Value'][1].replace( '/proc/', '' ).split( '\n' )
+  infoDict = {}
+  for pidCheck in pidList:
+    try:
+      with open( '/proc/%s/stat' % pidCheck, 'r' ) as statFile:
+        infoDict[pidCheck] = statFile.readline().split( ' ' )
+    except Exception:
+      pass
+  return legacyChildResources( pid, infoDict )
+
+def legacyChildResources( pid, infoDict ):
+  cpu = vsize = rss = 0.
+  procGroup = shellCall( 10, 'ps --no-headers -o pgrp -p %s' % pid )['Value'][1].strip()
+  for pidCheck, info in infoDict.items():
+    if pidCheck in infoDict and info[3] == pid:
+      cpu += sum( [ float( field ) / 100 for field in info[13:17] ] )
+      vsize += float( info[22] )
+      rss += float( info[23] )
+      del infoDict[pidCheck]
+      result = legacyChildResources( pidCheck, infoDict )
+      cpu += result[0]
+      vsize += result[1]
+      rss += result[2]
+  for pidCheck, info in infoDict.items():
+    if pidCheck in infoDict and info[3] == 1 and info[4] == procGroup:
+      del infoDict[pidCheck]
+  if pid in infoDict:
+    info = infoDict.pop( pid )
+    cpu += sum( [ float( field ) / 100 for field in info[13:17] ] )
+  return cpu, vsize, rss
+
+def legacyCheck( pid ):
+  shellCall( 5, '/bin/cat /proc/loadavg' )
+  shellCall( 5, '/usr/bin/free' )
+  legacyTreeResources( pid )
+  legacyTreeResources( pid )
+
+def procCheck( pid, monitor = ProcessMonitor() ):
+  with open( '/proc/loadavg', 'r' ) as loadAvgFile:
+    loadAvgFile.read()
+  with open( '/proc/meminfo', 'r' ) as memInfoFile:
+    memInfoFile.read()
+  monitor.getResourceConsumed( pid )
+
+def timeChecks( check, pid, checks ):
+  startTimes = os.times()
+  start = time.time()
+  for _i in xrange( checks ):
+    check( pid )
+  elapsed = time.time() - start
+  endTimes = os.times()
+  cpu = sum( endTimes[:4] ) - sum( startTimes[:4] )
+  return elapsed / checks, cpu / checks
+
+if __name__ == "__main__":
+  depth = int( sys.argv[1] ) if len( sys.argv ) > 1 else 4
+  fanOut = int( sys.argv[2] ) if len( sys.argv ) > 2 else 3
+  checks = int( sys.argv[3] ) if len( sys.argv ) > 3 else 20
+  #The sleeping processes do not consume any CPU
+  gLogger.setLevel( 'FATAL' )
+  process = startTree( depth, fanOut )
+  try:
+    processes = ProcessMonitor().getResourceConsumed( process.pid )['Value']['Processes']
+    print "Tree of %d processes, %d processes on the node" % ( processes,
+                                                                len( [ p for p in os.listdir( '/proc' ) if p.isdigit() ] ) )
+    for title, check in ( ( 'ls/ps/free', legacyCheck ), ( '/proc', procCheck ) ):
+      elapsed, cpu = timeChecks( check, process.pid, checks )
+      print "%-10s %8.2f ms/check wall clock, %8.2f ms/check CPU" % ( title, elapsed * 1000, cpu * 1000 )
+  finally:
+    os.killpg( process.pid, signal.SIGKILL )
+    process.wait()